@@ -0,0 +1,95 @@
+import asyncio  # Import asyncio for the event loop the chunks are fetched on
+import logging  # Import logging to report worker stats
+import os  # Import the os library for environment variable handling
+import threading  # Import threading to run the event loop next to the handler pool
+import time  # Import time to wait before a failed chunk is requeued
+from typing import Optional
+
+from consumer import ConsumerWorker, RejectMessage  # Queue consumption, acks and reconnection
+from services.api.core.backfill import BACKFILL_QUEUE, decode_chunk, get_backfill_jobs
+from services.api.models.public_data import run_backfill_chunk
+
+# Chunks fetched at the same time by one worker, and the unacknowledged chunks it may hold
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "8"))
+BACKFILL_PREFETCH = int(os.getenv("BACKFILL_PREFETCH", str(BACKFILL_WORKERS * 2)))
+
+# Delay in seconds before a failed chunk is requeued, doubled on every attempt up to the maximum
+BACKFILL_RETRY_DELAY = float(os.getenv("BACKFILL_RETRY_DELAY", "1"))
+BACKFILL_MAX_RETRY_DELAY = float(os.getenv("BACKFILL_MAX_RETRY_DELAY", "30"))
+
+logger = logging.getLogger("backfill_worker")
+
+# Event loop shared by the handler threads, so they share one upstream client and rate limit
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the event loop chunks are fetched on, starting it in a thread on first use.
+
+    Returns:
+        asyncio.AbstractEventLoop: The running loop of this process.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="backfill-loop", daemon=True).start()
+    return _loop
+
+
+def handle_chunk(body: bytes, routing_key: str):
+    """
+    Message handler: fetch one backfill chunk into the candle store.
+
+    Handler threads block on the shared event loop, where the chunks being handled
+    run concurrently under the upstream scheduler. A failed chunk is requeued after a
+    backoff delay until it has used the attempts allowed by the job registry; it is then
+    discarded and its job reports the failure.
+
+    Args:
+        body (bytes): The chunk, as encoded by encode_chunk.
+        routing_key (str): The routing key the message was published with.
+
+    Raises:
+        RejectMessage: If the body is not a backfill chunk, or the chunk failed its last attempt.
+        Exception: If the chunk could not be fetched; the message is then requeued.
+    """
+    try:
+        chunk = decode_chunk(body)
+    except ValueError as e:
+        raise RejectMessage(str(e)) from e
+    try:
+        asyncio.run_coroutine_threadsafe(run_backfill_chunk(chunk), get_loop()).result()
+    except Exception as e:
+        jobs = get_backfill_jobs()
+        attempts = jobs.attempts(chunk["job_id"], chunk["chunk"])
+        if attempts is None or attempts >= jobs.max_attempts:  # Unknown to the registry, or out of attempts
+            logger.error(f"Giving up chunk {chunk['chunk']} of job {chunk['job_id']} after {attempts} attempts")
+            raise RejectMessage(str(e)) from e
+        time.sleep(min(BACKFILL_MAX_RETRY_DELAY, BACKFILL_RETRY_DELAY * 2 ** max(0, attempts - 1)))
+        raise
+
+
+def backfill_worker(**options) -> ConsumerWorker:
+    """
+    Build a worker consuming the backfill queue.
+
+    Chunks are independent, so they are not ordered by key and run in parallel. Failed
+    chunks are requeued, see handle_chunk.
+
+    Args:
+        **options: Overrides of the ConsumerWorker arguments.
+
+    Returns:
+        ConsumerWorker: The worker, to be run.
+    """
+    settings = {"handler": handle_chunk, "pool": "thread", "workers": BACKFILL_WORKERS,
+                "prefetch": BACKFILL_PREFETCH, "ordering_key": "none", "requeue_on_error": True, **options}
+    return ConsumerWorker(BACKFILL_QUEUE, **settings)
+
+# Entry point for running the backfill worker
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    backfill_worker().run()
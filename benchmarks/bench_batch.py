@@ -0,0 +1,78 @@
+"""
+Compare one request per product with the streaming batch endpoint.
+
+The API is served by uvicorn in the benchmark process, so the time to the first
+NDJSON line is measured over a real socket; the fake upstream is in-process and
+answers every request after a fixed latency.
+
+Usage:
+    python -m benchmarks.bench_batch --products 200 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+import uvicorn
+
+from services.api.core import http_client
+from services.api.core.scheduler import UpstreamScheduler, set_scheduler
+from services.api.main import app
+
+from .bench_upstream_client import free_port
+from .fake_upstream import FakeUpstream
+
+
+async def run(products: int, latency: float) -> dict:
+    """
+    Fetch market trades for every product sequentially, then through the batch endpoint.
+    """
+    pairs = [(f"C{i}", "USD") for i in range(products)]
+    http_client.set_transport(httpx.ASGITransport(app=FakeUpstream(latency=latency, pairs=pairs)))
+    set_scheduler(UpstreamScheduler(rate=0))  # The local upstream has no rate limit to respect
+    product_ids = [f"{base}-{quote}" for base, quote in pairs]
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error"))
+    serving = asyncio.ensure_future(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as api:
+        began = time.perf_counter()
+        for product_id in product_ids:
+            (await api.get(f"/public/market-trades/{product_id}")).raise_for_status()
+        sequential = time.perf_counter() - began
+
+        began = time.perf_counter()
+        first_line = None
+        lines = 0
+        async with api.stream("GET", "/public/batch/market-trades",
+                              params={"product_ids": ",".join(product_ids)}) as response:
+            async for _ in response.aiter_lines():
+                if first_line is None:
+                    first_line = time.perf_counter() - began
+                lines += 1
+        batch = time.perf_counter() - began
+    server.should_exit = True
+    await serving
+    return {
+        "products": products,
+        "upstream_latency_s": latency,
+        "sequential_s": round(sequential, 3),
+        "batch_s": round(batch, 3),
+        "batch_first_line_s": round(first_line, 3),
+        "batch_lines": lines,
+        "speedup": round(sequential / batch, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=200, help="Number of products to fetch")
+    parser.add_argument("--latency", type=float, default=0.05, help="Per-request upstream latency in seconds")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.products, args.latency)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Compare the JSON candles response with the Arrow, NumPy and CSV formats over a large range.
+
+The candle store is filled beforehand so every request is served locally. For each
+format the script reports the request time, the body size and the time a client takes
+to turn the body into float64 close prices.
+
+Usage:
+    python -m benchmarks.bench_columnar --candles 100000 --requests 5
+"""
+import argparse
+import asyncio
+import io
+import json
+import time
+
+import httpx
+import numpy as np
+import orjson
+
+from services.api.core.candle_store import CandleStore, set_store
+from services.api.core.columnar import (
+    ARROW_AVAILABLE, ARROW_MEDIA_TYPE, CSV_MEDIA_TYPE, JSON_MEDIA_TYPE, NPY_MEDIA_TYPE
+)
+from services.api.main import app
+
+# First candle start of the benchmark range (2024-01-01T00:00:00Z)
+START = 1704067200
+
+
+def decode_json(body: bytes) -> np.ndarray:
+    return np.array([candle["close"] for candle in orjson.loads(body)], dtype=np.float64)
+
+
+def decode_arrow(body: bytes) -> np.ndarray:
+    import pyarrow as pa
+    return pa.ipc.open_stream(body).read_all().column("close").to_numpy()
+
+
+def decode_npy(body: bytes) -> np.ndarray:
+    return np.load(io.BytesIO(body))["close"]
+
+
+def decode_csv(body: bytes) -> np.ndarray:
+    return np.loadtxt(io.BytesIO(body), delimiter=",", skiprows=1, usecols=4)
+
+
+# Formats measured, with the client-side decoder of each
+FORMATS = {
+    JSON_MEDIA_TYPE: decode_json,
+    ARROW_MEDIA_TYPE: decode_arrow,
+    NPY_MEDIA_TYPE: decode_npy,
+    CSV_MEDIA_TYPE: decode_csv,
+}
+
+
+def fill_store(candles: int) -> CandleStore:
+    """
+    Build an in-memory store holding one-minute candles, all marked as complete.
+    """
+    store = CandleStore(":memory:")
+    rows = [
+        {"start": str(START + 60 * i), "low": f"{100 + i % 7:.2f}", "high": f"{110 + i % 5:.2f}",
+         "open": f"{105 + i % 3:.2f}", "close": f"{104 + i % 11 * 0.37:.2f}", "volume": f"{i % 97 * 1.5:.8f}"}
+        for i in range(candles)
+    ]
+    store.write("BTC-USD", 60, rows, (START, START + 60 * (candles - 1)))
+    return store
+
+
+async def run(candles: int, requests: int) -> list:
+    set_store(fill_store(candles))
+    params = {
+        "start": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(START)),
+        "end": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(START + 60 * (candles - 1))),
+        "granularity": "ONE_MINUTE",
+    }
+    results = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://api") as client:
+        for media_type, decode in FORMATS.items():
+            if media_type == ARROW_MEDIA_TYPE and not ARROW_AVAILABLE:
+                continue
+            elapsed = 0.0
+            for _ in range(requests):
+                began = time.perf_counter()
+                response = await client.get("/public/candles/BTC-USD", params=params, headers={"Accept": media_type})
+                elapsed += time.perf_counter() - began
+                response.raise_for_status()
+            began = time.perf_counter()
+            close = decode(response.content)
+            decoded = time.perf_counter() - began
+            assert len(close) == candles
+            results.append({"format": media_type, "request_ms": round(elapsed / requests * 1e3, 1),
+                            "bytes": len(response.content), "decode_ms": round(decoded * 1e3, 1)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--candles", type=int, default=100000, help="Number of candles in the requested range")
+    parser.add_argument("--requests", type=int, default=5, help="Requests per format")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.candles, args.requests)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
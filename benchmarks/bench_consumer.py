@@ -0,0 +1,104 @@
+"""
+Compare the legacy auto-ack consumer with the consumer worker runtime.
+
+Both consume a queue prefilled on the fake broker (running in a separate process)
+with a handler that simulates I/O-bound work. The worker uses a prefetch limit,
+batched acks and a thread pool with per-key ordering.
+
+Usage:
+    python -m benchmarks.bench_consumer --messages 5000 --keys 64 --work 0.002 --workers 16
+"""
+import argparse
+import json
+import multiprocessing
+import threading
+import time
+
+import pika
+
+from consumer import ConsumerWorker
+
+from .bench_publisher import parameters, serve_broker
+from .bench_upstream_client import free_port
+
+# Seconds of simulated I/O per message, set from the command line
+WORK = 0.002
+
+
+def simulated_io(body: bytes, routing_key: str):
+    time.sleep(WORK)
+
+
+def prefill(port: int, queue: str, total: int, keys: int):
+    # Publish the messages to consume, spread over the ordering keys
+    connection = pika.BlockingConnection(parameters(port))
+    channel = connection.channel()
+    channel.queue_declare(queue=queue, durable=True)
+    for i in range(total):
+        channel.basic_publish(exchange="", routing_key=queue, body=f"m{i}".encode(),
+                              properties=pika.BasicProperties(delivery_mode=2, headers={"key": f"k{i % keys}"}))
+    connection.close()
+
+
+def run_legacy(port: int, total: int) -> dict:
+    """
+    Consume like the former consumer.py: auto_ack, no prefetch limit, handler in the callback.
+    """
+    connection = pika.BlockingConnection(parameters(port))
+    channel = connection.channel()
+    received = 0
+
+    def callback(ch, method, properties, body):
+        nonlocal received
+        simulated_io(body, method.routing_key)
+        received += 1
+        if received == total:
+            ch.stop_consuming()
+
+    channel.basic_consume(queue="legacy", on_message_callback=callback, auto_ack=True)
+    began = time.perf_counter()
+    channel.start_consuming()
+    elapsed = time.perf_counter() - began
+    connection.close()
+    return {"consumer": "legacy auto-ack callback", "messages": total, "msgs_per_s": round(total / elapsed)}
+
+
+def run_worker(port: int, total: int, workers: int) -> dict:
+    """
+    Consume with ConsumerWorker and per-key ordering on the "key" header.
+    """
+    worker = ConsumerWorker("worker", handler=simulated_io, parameters=parameters(port), workers=workers,
+                            ordering_key="header:key")
+    thread = threading.Thread(target=worker.run)
+    began = time.perf_counter()
+    thread.start()
+    while worker.processed < total:
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - began
+    worker.stop()
+    thread.join()
+    return {"consumer": f"ConsumerWorker, {workers} threads, per-key ordering", "messages": total,
+            "msgs_per_s": round(total / elapsed)}
+
+
+def main():
+    global WORK
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=5000, help="Messages per run")
+    parser.add_argument("--keys", type=int, default=64, help="Distinct ordering keys")
+    parser.add_argument("--work", type=float, default=0.002, help="Seconds of simulated I/O per message")
+    parser.add_argument("--workers", type=int, default=16, help="Handler threads of the worker")
+    args = parser.parse_args()
+    WORK = args.work
+
+    port = free_port()
+    multiprocessing.Process(target=serve_broker, args=(port,), daemon=True).start()
+    time.sleep(0.5)  # Let the broker start listening
+    prefill(port, "legacy", args.messages, args.keys)
+    prefill(port, "worker", args.messages, args.keys)
+    results = [run_legacy(port, args.messages), run_worker(port, args.messages, args.workers)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Measure fan-out throughput and memory with many concurrent stream subscribers.
+
+Every subscriber runs its own consumer task, as a WebSocket or SSE connection
+would, and the hub is fed directly with market_trades events.
+
+Usage:
+    python -m benchmarks.bench_fanout --subscribers 10000 --messages 200
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+from services.api.core.fanout import FanoutHub
+
+
+class StubFeed:
+    """
+    Feed stand-in that accepts subscriptions and lets the benchmark push events.
+    """
+
+    def __init__(self):
+        self.handlers = {}
+        self.subscriptions = 0
+
+    def add_handler(self, channel, handler):
+        self.handlers[channel] = handler
+
+    async def subscribe(self, channel, product_ids):
+        self.subscriptions += 1
+
+    async def unsubscribe(self, channel, product_ids):
+        pass
+
+
+async def run(subscribers: int, messages: int, products: int) -> dict:
+    """
+    Subscribe, publish a burst of trade events and wait until every subscriber has read them.
+    """
+    feed = StubFeed()
+    hub = FanoutHub(feed)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    received = 0
+    done = asyncio.Event()
+    expected = subscribers * messages
+
+    async def consume(subscriber):
+        nonlocal received
+        while await subscriber.get() is not None:
+            received += 1
+            if received == expected:
+                done.set()
+
+    subs = [await hub.subscribe("market_trades", f"P{i % products}-USD", maxsize=messages)
+            for i in range(subscribers)]
+    tasks = [asyncio.ensure_future(consume(sub)) for sub in subs]
+    await asyncio.sleep(0)
+    memory_per_subscriber = (tracemalloc.get_traced_memory()[0] - baseline) / subscribers
+    tracemalloc.stop()  # Tracing allocations would dominate the delivery timing
+
+    began = time.perf_counter()
+    for n in range(messages):
+        for p in range(products):
+            feed.handlers["market_trades"]({"type": "update", "trades": [{
+                "trade_id": str(n), "product_id": f"P{p}-USD", "price": "100.00", "size": "0.1",
+                "side": "BUY", "time": "2024-01-01T00:00:00Z",
+            }]}, "2024-01-01T00:00:00Z")
+        await asyncio.sleep(0)  # Let consumers drain between bursts
+    await done.wait()
+    elapsed = time.perf_counter() - began
+
+    for sub in subs:
+        await hub.unsubscribe(sub)
+    await asyncio.gather(*tasks)
+    return {
+        "subscribers": subscribers,
+        "products": products,
+        "upstream_subscriptions": feed.subscriptions,
+        "messages_per_product": messages,
+        "deliveries": received,
+        "deliveries_per_s": round(received / elapsed),
+        "frames_serialized": hub.published,
+        "bytes_per_subscriber": round(memory_per_subscriber),
+        "elapsed_s": round(elapsed, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=10000, help="Number of concurrent subscribers")
+    parser.add_argument("--messages", type=int, default=200, help="Messages published per product")
+    parser.add_argument("--products", type=int, default=10, help="Number of products the subscribers spread over")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.subscribers, args.messages, args.products)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Compare per-row candle processing with the vectorized resampling and indicator path.
+
+The per-row baseline is what clients did before the resampling endpoint existed:
+validate every candle as a ``Candle`` model, then resample and compute indicators
+in Python loops.
+
+Usage:
+    python -m benchmarks.bench_indicators --rows 1000000 --interval 4h
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from services.api.core.indicators import (
+    candles_to_arrays, compute_indicators, parse_indicators, parse_interval, resample
+)
+from services.api.schemas.public_data import Candle
+
+# Indicators computed by both paths
+INDICATORS = "ema:20,rsi:14,atr:14,vwap"
+
+
+def make_candles(rows: int) -> list:
+    """
+    Build a synthetic one-minute candle series as returned by Coinbase (newest first).
+
+    Args:
+        rows (int): Number of candles.
+
+    Returns:
+        list: Candle dicts with string fields.
+    """
+    rng = np.random.default_rng(7)
+    close = 100 + np.cumsum(rng.normal(0, 0.1, rows))
+    open_ = np.r_[close[:1], close[:-1]]
+    high = np.maximum(open_, close) + rng.random(rows) * 0.05
+    low = np.minimum(open_, close) - rng.random(rows) * 0.05
+    volume = rng.random(rows) * 10
+    return [
+        {"start": str(1_600_000_000 + 60 * i), "low": f"{low[i]:.2f}", "high": f"{high[i]:.2f}",
+         "open": f"{open_[i]:.2f}", "close": f"{close[i]:.2f}", "volume": f"{volume[i]:.8f}"}
+        for i in range(rows - 1, -1, -1)
+    ]
+
+
+def per_row(candles: list, interval: int) -> dict:
+    """
+    Resample and compute indicators one row at a time, as clients used to.
+    """
+    timings = {}
+    began = time.perf_counter()
+    rows = sorted((Candle(**c) for c in candles), key=lambda c: int(c.start))
+    timings["parse_s"] = time.perf_counter() - began
+
+    began = time.perf_counter()
+    bars = []
+    for c in rows:
+        bucket = int(c.start) // interval * interval
+        o, h, l, cl, v = float(c.open), float(c.high), float(c.low), float(c.close), float(c.volume)
+        if bars and bars[-1][0] == bucket:
+            bar = bars[-1]
+            bar[2], bar[3], bar[4], bar[5] = max(bar[2], h), min(bar[3], l), cl, bar[5] + v
+        else:
+            bars.append([bucket, o, h, l, cl, v])
+    timings["resample_s"] = time.perf_counter() - began
+
+    began = time.perf_counter()
+    closes = [b[4] for b in bars]
+    ema, alpha = [], 2 / 21
+    for i, value in enumerate(closes):
+        ema.append(sum(closes[:20]) / 20 if i == 19 else (None if i < 19 else (1 - alpha) * ema[-1] + alpha * value))
+    gain = loss = 0.0
+    rsi, atr, vwap = [None], [], []
+    true_ranges, cum_pv, cum_v = [], 0.0, 0.0
+    for i in range(1, len(closes)):
+        delta = closes[i] - closes[i - 1]
+        up, down = max(delta, 0.0), max(-delta, 0.0)
+        if i <= 14:
+            gain, loss = gain + up / 14, loss + down / 14
+        else:
+            gain, loss = (gain * 13 + up) / 14, (loss * 13 + down) / 14
+        rsi.append(None if i < 14 else (100.0 if loss == 0 else 100 - 100 / (1 + gain / loss)))
+    for i, (_, _, h, l, c, v) in enumerate(bars):
+        previous = bars[i - 1][4] if i else c
+        true_ranges.append(max(h - l, abs(h - previous), abs(l - previous)))
+        atr.append(None if i < 13 else (sum(true_ranges[:14]) / 14 if i == 13 else (atr[-1] * 13 + true_ranges[-1]) / 14))
+        cum_pv, cum_v = cum_pv + (h + l + c) / 3 * v, cum_v + v
+        vwap.append(cum_pv / cum_v if cum_v else None)
+    timings["indicators_s"] = time.perf_counter() - began
+    timings["bars"] = len(bars)
+    return timings
+
+
+def vectorized(candles: list, interval: int) -> dict:
+    """
+    Resample and compute indicators with the NumPy path used by the API.
+    """
+    timings = {}
+    began = time.perf_counter()
+    columns = candles_to_arrays(candles)
+    timings["parse_s"] = time.perf_counter() - began
+
+    began = time.perf_counter()
+    bars = resample(columns, interval)
+    timings["resample_s"] = time.perf_counter() - began
+
+    began = time.perf_counter()
+    compute_indicators(bars, parse_indicators(INDICATORS))
+    timings["indicators_s"] = time.perf_counter() - began
+    timings["bars"] = len(bars["start"])
+
+    # Indicators on the full-resolution series show the cost independent of resampling
+    began = time.perf_counter()
+    compute_indicators(columns, parse_indicators(INDICATORS))
+    timings["indicators_full_series_s"] = time.perf_counter() - began
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of one-minute candles")
+    parser.add_argument("--interval", default="4h", help="Resampling interval")
+    args = parser.parse_args()
+
+    candles = make_candles(args.rows)
+    interval = parse_interval(args.interval)
+    results = {"rows": args.rows, "interval": args.interval, "per_row": per_row(candles, interval),
+               "vectorized": vectorized(candles, interval)}
+    for name in ("per_row", "vectorized"):
+        timings = results[name]
+        timings["total_s"] = timings["parse_s"] + timings["resample_s"] + timings["indicators_s"]
+        for key, value in timings.items():
+            if key.endswith("_s"):
+                timings[key] = round(value, 4)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Compare the JSON message envelope with the compact market event frames.
+
+Synthetic market trades are encoded the way the publish endpoint wraps messages (one
+{"message": ...} JSON envelope per event) and as micro-batched event frames in the
+JSON, msgpack (when installed) and binary encodings. Encoding throughput and bytes per
+event are measured in-process; end-to-end events per second are measured by publishing
+through the fake broker, which runs in a separate process.
+
+Usage:
+    python -m benchmarks.bench_market_events --events 100000 --batch 256
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+from typing import Callable, List, Tuple
+
+import orjson
+
+from publisher import Publisher, encode_message
+from services.api.core.market_events import MSGPACK_AVAILABLE, encode_frame, normalize_trades
+
+from .bench_publisher import parameters, serve_broker
+from .bench_upstream_client import free_port
+
+
+def make_trades(total: int) -> List[dict]:
+    """
+    Build market trades of one product with realistic field values.
+    """
+    return [{"trade_id": str(100000000 + i), "product_id": "BTC-USD", "price": f"{42000 + (i % 500) * 0.01:.2f}",
+             "size": f"{0.0001 * (1 + i % 97):.8f}", "side": "BUY" if i % 2 else "SELL",
+             "time": f"2024-01-01T00:{(i // 60000) % 60:02d}:{(i // 1000) % 60:02d}.{i % 1000:03d}123Z"}
+            for i in range(total)]
+
+
+def envelope_messages(trades: List[dict], batch: int) -> List[Tuple[str, bytes]]:
+    # One JSON envelope per event, as POST /public/publish/{queue_name} sends them
+    return [("trades.BTC-USD", encode_message(orjson.dumps(trade).decode())) for trade in trades]
+
+
+def frame_messages(encoding: str) -> Callable[[List[dict], int], List[Tuple[str, bytes]]]:
+    # Normalized events batched into frames of the given size
+    def encode(trades: List[dict], batch: int) -> List[Tuple[str, bytes]]:
+        messages = []
+        for offset in range(0, len(trades), batch):
+            for product_id, records in normalize_trades(trades[offset:offset + batch]).items():
+                messages.append((f"trades.{product_id}", encode_frame("trades", product_id, records, encoding)))
+        return messages
+    return encode
+
+
+def run_encoding(name: str, encode: Callable, trades: List[dict], batch: int) -> dict:
+    """
+    Measure the encoding throughput and size of one encoding.
+    """
+    began = time.perf_counter()
+    messages = encode(trades, batch)
+    elapsed = time.perf_counter() - began
+    size = sum(len(body) for _, body in messages)
+    return {"encoding": name, "events": len(trades), "messages": len(messages),
+            "encode_events_per_s": round(len(trades) / elapsed), "bytes_per_event": round(size / len(trades), 1)}
+
+
+async def run_publish(port: int, messages: List[Tuple[str, bytes]], events: int, chunk: int) -> float:
+    """
+    Publish encoded messages to the topic exchange and return the events confirmed per second.
+    """
+    publisher = Publisher(parameters(port))
+    await publisher.publish_to_exchange("bench_market_data", messages[:1])  # Warm-up
+    began = time.perf_counter()
+    await asyncio.gather(*(publisher.publish_to_exchange("bench_market_data", messages[i:i + chunk])
+                           for i in range(0, len(messages), chunk)))
+    elapsed = time.perf_counter() - began
+    await publisher.close()
+    return events / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=100000, help="Trades encoded and published per encoding")
+    parser.add_argument("--batch", type=int, default=256, help="Events per frame")
+    parser.add_argument("--chunk", type=int, default=500, help="Messages per publish call")
+    args = parser.parse_args()
+
+    trades = make_trades(args.events)
+    encodings = [("json envelope per event", envelope_messages), ("json frames", frame_messages("json"))]
+    if MSGPACK_AVAILABLE:
+        encodings.append(("msgpack frames", frame_messages("msgpack")))
+    encodings.append(("binary frames", frame_messages("binary")))
+
+    port = free_port()
+    multiprocessing.Process(target=serve_broker, args=(port,), daemon=True).start()
+    time.sleep(0.5)  # Let the broker start listening
+    results = []
+    for name, encode in encodings:
+        result = run_encoding(name, encode, trades, args.batch)
+        messages = encode(trades, args.batch)
+        result["publish_events_per_s"] = round(asyncio.run(run_publish(port, messages, len(trades), args.chunk)))
+        results.append(result)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
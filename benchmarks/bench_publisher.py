@@ -0,0 +1,108 @@
+"""
+Compare the legacy connection-per-message publisher with the persistent publisher.
+
+The fake broker runs in a separate process and confirms messages the way RabbitMQ
+does, so the numbers reflect AMQP round trips and framing rather than broker work.
+
+Usage:
+    python -m benchmarks.bench_publisher --messages 20000 --legacy-messages 500 --concurrency 200 --batch 500
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+
+import pika
+
+from publisher import Publisher, encode_message
+
+from .bench_upstream_client import free_port
+from .fake_broker import FakeBroker
+
+
+def serve_broker(port: int):
+    """
+    Run the fake broker forever (target of the broker process).
+    """
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(FakeBroker().start(port=port))
+    loop.run_forever()
+
+
+def parameters(port: int) -> pika.ConnectionParameters:
+    return pika.ConnectionParameters(host="127.0.0.1", port=port, credentials=pika.PlainCredentials("user", "password"))
+
+
+def run_legacy(port: int, total: int) -> dict:
+    """
+    Publish like the former publish_message: connect, declare, publish and close per message.
+    """
+    began = time.perf_counter()
+    for i in range(total):
+        connection = pika.BlockingConnection(parameters(port))
+        channel = connection.channel()
+        channel.queue_declare(queue="bench", durable=True)
+        channel.basic_publish(exchange="", routing_key="bench", body=encode_message(f"m{i}"),
+                              properties=pika.BasicProperties(delivery_mode=2))
+        connection.close()
+    elapsed = time.perf_counter() - began
+    return {"client": "legacy connection per message", "messages": total, "msgs_per_s": round(total / elapsed)}
+
+
+async def run_single(port: int, total: int, concurrency: int) -> dict:
+    """
+    Publish one message per call over the persistent publisher, awaiting each confirm.
+    """
+    publisher = Publisher(parameters(port))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def publish(i):
+        async with semaphore:
+            await publisher.publish("bench", encode_message(f"m{i}"))
+
+    await publisher.publish("bench", encode_message("warm-up"))
+    began = time.perf_counter()
+    await asyncio.gather(*(publish(i) for i in range(total)))
+    elapsed = time.perf_counter() - began
+    await publisher.close()
+    return {"client": f"persistent publisher, {concurrency} concurrent publishes", "messages": total,
+            "msgs_per_s": round(total / elapsed)}
+
+
+async def run_batch(port: int, total: int, batch: int) -> dict:
+    """
+    Publish through publish_many, as the batch endpoint does.
+    """
+    publisher = Publisher(parameters(port))
+    bodies = [encode_message(f"m{i}") for i in range(total)]
+    await publisher.publish("bench", encode_message("warm-up"))
+    began = time.perf_counter()
+    await asyncio.gather(*(publisher.publish_many("bench", bodies[i:i + batch]) for i in range(0, total, batch)))
+    elapsed = time.perf_counter() - began
+    await publisher.close()
+    return {"client": f"persistent publisher, batches of {batch}", "messages": total,
+            "msgs_per_s": round(total / elapsed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000, help="Messages per persistent-publisher run")
+    parser.add_argument("--legacy-messages", type=int, default=500, help="Messages for the legacy run")
+    parser.add_argument("--concurrency", type=int, default=200, help="Concurrent single publishes")
+    parser.add_argument("--batch", type=int, default=500, help="Messages per batch")
+    args = parser.parse_args()
+
+    port = free_port()
+    multiprocessing.Process(target=serve_broker, args=(port,), daemon=True).start()
+    time.sleep(0.5)  # Let the broker start listening
+    results = [
+        run_legacy(port, args.legacy_messages),
+        asyncio.run(run_single(port, args.messages, args.concurrency)),
+        asyncio.run(run_batch(port, args.messages, args.batch)),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Compare the memory held by recent trades kept as dicts, as MarketTrade models and in ring buffers.
+
+Each representation holds the same trades for every product; the memory retained is
+measured with tracemalloc once the trades are stored, along with the time to read the
+newest trades of every product back.
+
+Usage:
+    python -m benchmarks.bench_ring_buffer --products 500 --trades 2000 --read 100
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from typing import Callable, List
+
+from services.api.core.ring_buffer import MarketDataStore
+from services.api.schemas.public_data import MarketTrade
+
+# Time of the first generated trade (2024-01-01T00:00:00Z), in seconds
+START = 1704067200
+
+
+def make_trades(product_id: str, count: int) -> List[dict]:
+    """
+    Build trades shaped like the Coinbase market trades response, oldest first.
+    """
+    return [
+        {"trade_id": str(10_000_000 + i), "product_id": product_id, "price": f"{60000 + i % 500 * 0.01:.2f}",
+         "size": f"{0.001 * (1 + i % 97):.8f}", "side": "BUY" if i % 2 else "SELL",
+         "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(START + i)) + f".{i % 1000000:06d}Z",
+         "bid": f"{59999 + i % 500 * 0.01:.2f}", "ask": f"{60001 + i % 500 * 0.01:.2f}"}
+        for i in range(count)
+    ]
+
+
+def measure(name: str, products: List[str], trades: int, build: Callable, read: Callable) -> dict:
+    # Retained memory of a representation and the time to read the newest trades of every product
+    gc.collect()
+    tracemalloc.start()
+    began = time.perf_counter()
+    held = build(products, trades)
+    built = time.perf_counter() - began
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    reading = float("inf")
+    for _ in range(5):  # Best of five, away from the allocator work that follows tracing
+        began = time.perf_counter()
+        read(held, products)
+        reading = min(reading, time.perf_counter() - began)
+    return {"representation": name, "bytes": retained, "bytes_per_trade": round(retained / (len(products) * trades), 1),
+            "build_s": round(built, 3), "read_ms": round(reading * 1e3, 2)}
+
+
+def run(product_count: int, trades: int, newest: int) -> list:
+    products = [f"P{i:04d}-USD" for i in range(product_count)]
+
+    def build_dicts(products, trades):
+        return {product_id: make_trades(product_id, trades) for product_id in products}
+
+    def build_models(products, trades):
+        return {product_id: [MarketTrade(**trade) for trade in make_trades(product_id, trades)] for product_id in products}
+
+    def build_ring(products, trades):
+        store = MarketDataStore(trades_capacity=trades, budget=1 << 40)
+        for product_id in products:
+            store.add_trades(product_id, make_trades(product_id, trades))
+        return store
+
+    def read_lists(held, products):
+        return [held[product_id][-newest:] for product_id in products]
+
+    def read_ring(held, products):
+        return [held.trades(product_id, newest) for product_id in products]
+
+    return [
+        measure("dict", products, trades, build_dicts, read_lists),
+        measure("pydantic", products, trades, build_models, read_lists),
+        measure("ring_buffer", products, trades, build_ring, read_ring),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=500, help="Number of products")
+    parser.add_argument("--trades", type=int, default=2000, help="Trades kept per product")
+    parser.add_argument("--read", type=int, default=100, help="Newest trades read back per product")
+    args = parser.parse_args()
+    print(json.dumps(run(args.products, args.trades, args.read), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Measure per-endpoint CPU time of FastAPI's response_model path against the response encoders.
+
+Both apps call the same model functions against the in-process fake upstream with
+warm caches; the baseline app declares the routes the way they were written before
+(returning dicts through response_model), the other one is the real application.
+
+Usage:
+    python -m benchmarks.bench_serialization --products 500 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import List
+
+import httpx
+from fastapi import FastAPI
+
+from services.api.core import http_client
+from services.api.core.candle_store import CandleStore, set_store
+from services.api.core.cache import clear_caches
+from services.api.core.scheduler import UpstreamScheduler, set_scheduler
+from services.api.main import app
+from services.api.models import public_data as models
+from services.api.schemas.public_data import Candle, MarketTrade, Product, ProductBook
+
+from .fake_upstream import FakeUpstream
+
+# Endpoints measured, with their query parameters
+ENDPOINTS = {
+    "products": ("/public/products", None),
+    "product": ("/public/product/P0-USD", None),
+    "product-book": ("/public/product-book/P0-USD", None),
+    "candles": ("/public/candles/P0-USD", {"start": "2024-01-01T00:00:00", "end": "2024-01-13T11:00:00",
+                                          "granularity": "ONE_HOUR"}),
+    "market-trades": ("/public/market-trades/P0-USD", None),
+}
+
+
+def response_model_app() -> FastAPI:
+    """
+    Build the baseline app: the same routes validated and serialized through response_model.
+    """
+    baseline = FastAPI()
+
+    @baseline.get("/public/products", response_model=List[Product])
+    async def products():
+        return await models.get_products()
+
+    @baseline.get("/public/product/{product_id}", response_model=Product)
+    async def product(product_id: str):
+        return await models.get_product(product_id)
+
+    @baseline.get("/public/product-book/{product_id}", response_model=ProductBook)
+    async def product_book(product_id: str):
+        return await models.get_live_product_book(product_id)
+
+    @baseline.get("/public/candles/{product_id}", response_model=List[Candle])
+    async def candles(product_id: str, start: str, end: str, granularity: str = "ONE_HOUR"):
+        return await models.get_candles(product_id, start, end, granularity)
+
+    @baseline.get("/public/market-trades/{product_id}", response_model=List[MarketTrade])
+    async def market_trades(product_id: str):
+        return await models.get_market_trades(product_id)
+
+    return baseline
+
+
+async def measure(target: FastAPI, path: str, params, requests: int) -> float:
+    """
+    Return the CPU time per request in microseconds after one warm-up request.
+    """
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=target), base_url="http://api") as client:
+        (await client.get(path, params=params)).raise_for_status()
+        began = time.process_time()
+        for _ in range(requests):
+            await client.get(path, params=params)
+        return (time.process_time() - began) / requests * 1e6
+
+
+async def run(products: int, requests: int) -> list:
+    models.LIVE_ORDER_BOOKS = False  # Serve the cached REST snapshot in both apps
+    pairs = [(f"P{i}", "USD") for i in range(products)]
+    http_client.set_transport(httpx.ASGITransport(app=FakeUpstream(pairs=pairs)))
+    set_scheduler(UpstreamScheduler(rate=0))
+    set_store(CandleStore(":memory:"))
+    clear_caches()
+    baseline = response_model_app()
+    results = []
+    for name, (path, params) in ENDPOINTS.items():
+        before = await measure(baseline, path, params, requests)
+        after = await measure(app, path, params, requests)
+        results.append({"endpoint": name, "response_model_us": round(before), "encoder_us": round(after),
+                        "speedup": round(before / after, 1)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=500, help="Number of products served by the fake upstream")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and app")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.products, args.requests)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Compare the legacy per-call ``requests.get`` path with the shared async client.
+
+The legacy path is driven from a 40-thread pool, the default size of the
+threadpool that runs sync FastAPI endpoints, so it reproduces the old
+behaviour of one blocked worker and one fresh connection per upstream call.
+
+Usage:
+    python -m benchmarks.bench_upstream_client --requests 1000 --concurrency 100 --latency 0.1
+"""
+import argparse
+import asyncio
+import json
+import os
+import multiprocessing
+import socket
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import uvicorn
+
+from .fake_upstream import BASE_PATH, FakeUpstream
+
+# Size of the threadpool that served the former sync endpoints
+LEGACY_THREADPOOL_SIZE = 40
+
+
+def free_port() -> int:
+    """
+    Find a free TCP port on localhost.
+
+    Returns:
+        int: A port number that is currently unused.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_upstream(port: int, latency: float, options: dict = None):
+    """
+    Run the fake upstream with uvicorn (target of the upstream process).
+    """
+    upstream = FakeUpstream(latency=latency, **(options or {}))
+    uvicorn.run(upstream, host="127.0.0.1", port=port, log_level="error", backlog=4096)
+
+
+def wait_for_port(port: int):
+    """
+    Block until a local server accepts connections on the given port.
+    """
+    while True:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                return
+        except OSError:
+            time.sleep(0.05)
+
+
+def start_upstream(latency: float, **options) -> str:
+    """
+    Serve the fake upstream from a separate process so it does not share the GIL with the client.
+
+    Args:
+        latency (float): Per-request latency of the fake upstream, in seconds.
+        **options: Further FakeUpstream arguments, e.g. jitter or error_rate.
+
+    Returns:
+        str: The base URL of the running fake upstream.
+    """
+    port = free_port()
+    multiprocessing.Process(target=serve_upstream, args=(port, latency, options), daemon=True).start()
+    wait_for_port(port)
+    return f"http://127.0.0.1:{port}{BASE_PATH}"
+
+
+def summarize(name: str, latencies: list, elapsed: float) -> dict:
+    """
+    Build the result record for one run.
+
+    Args:
+        name (str): The name of the run.
+        latencies (list): Per-call latencies in seconds.
+        elapsed (float): Wall-clock duration of the run in seconds.
+
+    Returns:
+        dict: Throughput and latency percentiles in milliseconds.
+    """
+    ordered = sorted(latencies)
+    return {
+        "name": name,
+        "requests": len(ordered),
+        "rps": round(len(ordered) / elapsed, 1),
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p99_ms": round(ordered[int(len(ordered) * 0.99) - 1] * 1000, 2),
+    }
+
+
+def run_legacy(url: str, total: int) -> dict:
+    """
+    Issue calls the way the old models did: a bare requests.get on a worker thread.
+    """
+    def call():
+        began = time.perf_counter()
+        response = requests.get(url)
+        response.raise_for_status()
+        response.json()
+        return time.perf_counter() - began
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=LEGACY_THREADPOOL_SIZE) as pool:
+        latencies = list(pool.map(lambda _: call(), range(total)))
+    return summarize("legacy requests.get", latencies, time.perf_counter() - began)
+
+
+async def run_async(total: int, concurrency: int) -> dict:
+    """
+    Issue calls through the model layer and its shared pooled async client.
+    """
+    from services.api.core.http_client import close_client
+    from services.api.models.public_data import get_products
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with semaphore:
+            began = time.perf_counter()
+            await get_products()
+            return time.perf_counter() - began
+
+    await get_products()  # Warm up the connection pool
+    began = time.perf_counter()
+    latencies = await asyncio.gather(*(call() for _ in range(total)))
+    elapsed = time.perf_counter() - began
+    await close_client()
+    return summarize("shared httpx.AsyncClient", latencies, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000, help="Number of upstream calls per run")
+    parser.add_argument("--concurrency", type=int, default=100, help="Concurrent in-flight calls for the async run")
+    parser.add_argument("--latency", type=float, default=0.1, help="Fake upstream latency in seconds")
+    args = parser.parse_args()
+
+    base_url = start_upstream(args.latency)
+    os.environ["COINBASE_BASE_URL"] = base_url  # Must be set before the models are imported
+    os.environ["UPSTREAM_RATE_LIMIT"] = "0"  # The local upstream has no rate limit to respect
+
+    results = [
+        run_legacy(f"{base_url}/market/products", args.requests),
+        asyncio.run(run_async(args.requests, args.concurrency)),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
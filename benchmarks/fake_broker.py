@@ -0,0 +1,447 @@
+import asyncio
+import itertools
+import threading
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from pika import frame, spec
+
+# Largest frame the fake broker negotiates, matching the RabbitMQ default
+FRAME_MAX = 131072
+
+# A queued message: properties, body, routing key and whether it was delivered before
+Message = Tuple[spec.BasicProperties, bytes, str, bool]
+
+
+def topic_matches(pattern: str, routing_key: str) -> bool:
+    """
+    Match a routing key against a topic binding pattern.
+
+    Words are separated by dots; "*" matches exactly one word and "#" zero or more.
+
+    Args:
+        pattern (str): The binding pattern, e.g. "trades.*" or "#".
+        routing_key (str): The routing key of a message, e.g. "trades.BTC-USD".
+
+    Returns:
+        bool: True if the message is routed to the binding.
+    """
+    def match(words: List[str], keys: List[str]) -> bool:
+        if not words:
+            return not keys
+        if words[0] == "#":
+            return any(match(words[1:], keys[i:]) for i in range(len(keys) + 1))
+        return bool(keys) and words[0] in ("*", keys[0]) and match(words[1:], keys[1:])
+
+    return match(pattern.split("."), routing_key.split("."))
+
+
+class FakeBroker:
+    """
+    In-process stand-in for a RabbitMQ broker speaking enough AMQP 0-9-1 for pika clients.
+
+    Supports connection and channel setup, queue and exchange declaration, queue
+    bindings, publisher confirms, publishing through the default exchange or direct,
+    fanout and topic exchanges, and consuming with prefetch limits, acks, nacks and
+    cancellation.
+    Messages are kept in memory per queue. Like RabbitMQ, confirms for the messages read
+    in one batch from the socket are sent as a single multiple ack, and unacknowledged
+    deliveries are requeued when their channel or connection closes.
+
+    Args:
+        nack_queues (set): Queues whose published messages are nacked instead of acked.
+    """
+
+    def __init__(self, nack_queues: Optional[set] = None):
+        self.nack_queues = nack_queues or set()
+        self.queues: Dict[str, Deque[Message]] = defaultdict(deque)
+        self.consumers: Dict[str, List["_Consumer"]] = defaultdict(list)
+        self.exchanges: Dict[str, str] = {}  # Declared exchange -> type
+        self.bindings: Dict[str, List[Tuple[str, str]]] = defaultdict(list)  # Exchange -> (routing key, queue)
+        self.connections = 0  # Connections opened so far
+        self.declares = 0  # Queue.Declare methods received
+        self.published = 0  # Messages received
+        self.unroutable = 0  # Messages published to an exchange with no matching binding
+        self.delivered = 0  # Messages delivered to consumers
+        self.acked = 0  # Deliveries acknowledged
+        self.ack_frames = 0  # Basic.Ack methods received from consumers
+        self.rejected = 0  # Deliveries nacked or rejected
+        self.channel_errors = 0  # Channels closed on a protocol error, e.g. an unknown delivery tag
+        self.port: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._consumer_tags = itertools.count(1)
+        self._queue_names = itertools.count(1)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """
+        Start listening for connections on the running event loop.
+
+        Returns:
+            int: The port the broker listens on.
+        """
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        """
+        Stop listening for new connections.
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def start_in_thread(self) -> int:
+        """
+        Run the broker on its own event loop in a daemon thread.
+
+        Returns:
+            int: The port the broker listens on.
+        """
+        started = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        started.wait()
+        return self.port
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Serve one client connection until it closes
+        self.connections += 1
+        connection = _Connection(self, writer)
+        buffer = b""
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                buffer += data
+                while True:
+                    consumed, received = frame.decode_frame(buffer)
+                    if received is None:
+                        break
+                    buffer = buffer[consumed:]
+                    if isinstance(received, frame.ProtocolHeader):
+                        connection.send(0, spec.Connection.Start(server_properties={"capabilities": {
+                            "publisher_confirms": True, "basic.nack": True, "consumer_cancel_notify": True,
+                        }}))
+                    elif isinstance(received, frame.Method):
+                        if connection.on_method(received.channel_number, received.method):
+                            await writer.drain()
+                            return
+                    elif isinstance(received, frame.Header) and received.channel_number in connection.channels:
+                        connection.channels[received.channel_number].header(received)
+                    elif isinstance(received, frame.Body) and received.channel_number in connection.channels:
+                        connection.channels[received.channel_number].body(received.fragment)
+                connection.flush_confirms()
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return
+        finally:
+            connection.close()
+            writer.close()
+
+    def route(self, exchange: str, routing_key: str) -> List[str]:
+        """
+        Return the queues a message published to an exchange is routed to.
+
+        Args:
+            exchange (str): The name of the exchange, "" for the default exchange.
+            routing_key (str): The routing key of the message.
+
+        Returns:
+            List[str]: The matching queues, each listed once.
+        """
+        if not exchange:
+            return [routing_key]
+        kind = self.exchanges.get(exchange, "direct")
+        queues = []
+        for binding, queue in self.bindings.get(exchange, ()):
+            if queue in queues:
+                continue
+            if (kind == "fanout" or (kind == "topic" and topic_matches(binding, routing_key))
+                    or binding == routing_key):
+                queues.append(queue)
+        return queues
+
+    def enqueue(self, queue: str, message: Message, front: bool = False):
+        """
+        Add a message to a queue and deliver it if a consumer has room.
+
+        Args:
+            queue (str): The name of the queue.
+            message (Message): The message.
+            front (bool): Put the message first, as done for requeued deliveries.
+        """
+        if front:
+            self.queues[queue].appendleft(message)
+        else:
+            self.queues[queue].append(message)
+        self.dispatch(queue)
+
+    def dispatch(self, queue: str):
+        """
+        Deliver queued messages round-robin to the consumers of a queue that have room.
+
+        Args:
+            queue (str): The name of the queue.
+        """
+        messages = self.queues[queue]
+        consumers = self.consumers.get(queue)
+        while messages and consumers:
+            ready = [consumer for consumer in consumers if consumer.channel.has_room()]
+            if not ready:
+                return
+            for consumer in ready:
+                if not messages or not consumer.channel.has_room():
+                    continue
+                consumer.deliver(queue, messages.popleft())
+                self.delivered += 1
+
+
+class _Consumer:
+    """
+    A Basic.Consume subscription of one channel to one queue.
+    """
+
+    def __init__(self, channel: "_ChannelState", queue: str, tag: str):
+        self.channel = channel
+        self.queue = queue
+        self.tag = tag
+
+    def deliver(self, queue: str, message: Message):
+        properties, body, routing_key, redelivered = message
+        self.channel.deliver(self, queue, message)
+        number = self.channel.number
+        self.channel.connection.send(number, spec.Basic.Deliver(
+            consumer_tag=self.tag, delivery_tag=self.channel.delivery_tag, redelivered=redelivered,
+            exchange="", routing_key=routing_key,
+        ))
+        writer = self.channel.connection.writer
+        writer.write(frame.Header(number, len(body), properties).marshal())
+        for offset in range(0, len(body), FRAME_MAX - 8):
+            writer.write(frame.Body(number, body[offset:offset + FRAME_MAX - 8]).marshal())
+
+
+class _Connection:
+    """
+    State of one client connection of the fake broker.
+    """
+
+    def __init__(self, broker: FakeBroker, writer: asyncio.StreamWriter):
+        self.broker = broker
+        self.writer = writer
+        self.channels: Dict[int, "_ChannelState"] = {}
+
+    def send(self, channel_number: int, method):
+        self.writer.write(frame.Method(channel_number, method).marshal())
+
+    def flush_confirms(self):
+        for channel in self.channels.values():
+            channel.flush_confirms()
+
+    def close(self):
+        # Requeue the unacknowledged deliveries of every channel
+        for channel in list(self.channels.values()):
+            channel.close()
+        self.channels.clear()
+
+    def on_method(self, channel_number: int, method) -> bool:
+        # Answer one method frame; returns True once the connection is closed
+        broker = self.broker
+        channel = self.channels.get(channel_number)
+        if channel is None and channel_number and not isinstance(method, (spec.Channel.Open, spec.Channel.Close)):
+            return False  # Closed by a channel error; CloseOk and frames already in flight are dropped
+        if isinstance(method, spec.Connection.StartOk):
+            self.send(0, spec.Connection.Tune(channel_max=2047, frame_max=FRAME_MAX, heartbeat=0))
+        elif isinstance(method, spec.Connection.Open):
+            self.send(0, spec.Connection.OpenOk())
+        elif isinstance(method, spec.Connection.Close):
+            self.send(0, spec.Connection.CloseOk())
+            return True
+        elif isinstance(method, spec.Channel.Open):
+            self.channels[channel_number] = _ChannelState(self, channel_number)
+            self.send(channel_number, spec.Channel.OpenOk())
+        elif isinstance(method, spec.Channel.Close):
+            if channel is not None:
+                channel.close()
+                del self.channels[channel_number]
+            self.send(channel_number, spec.Channel.CloseOk())
+        elif isinstance(method, spec.Confirm.Select):
+            channel.confirming = True
+            if not method.nowait:
+                self.send(channel_number, spec.Confirm.SelectOk())
+        elif isinstance(method, spec.Queue.Declare):
+            broker.declares += 1
+            name = method.queue or f"amq.gen-{next(broker._queue_names)}"  # Server-named queue
+            queue = broker.queues[name]
+            if not method.nowait:
+                consumers = len(broker.consumers.get(name, ()))
+                self.send(channel_number, spec.Queue.DeclareOk(name, len(queue), consumers))
+        elif isinstance(method, spec.Exchange.Declare):
+            broker.exchanges.setdefault(method.exchange, method.type)
+            if not method.nowait:
+                self.send(channel_number, spec.Exchange.DeclareOk())
+        elif isinstance(method, spec.Queue.Bind):
+            binding = (method.routing_key, method.queue)
+            if binding not in broker.bindings[method.exchange]:
+                broker.bindings[method.exchange].append(binding)
+            if not method.nowait:
+                self.send(channel_number, spec.Queue.BindOk())
+        elif isinstance(method, spec.Basic.Publish):
+            channel.publish(method)
+        elif isinstance(method, spec.Basic.Qos):
+            channel.prefetch = method.prefetch_count
+            self.send(channel_number, spec.Basic.QosOk())
+        elif isinstance(method, spec.Basic.Consume):
+            tag = method.consumer_tag or f"ctag-{next(broker._consumer_tags)}"
+            consumer = _Consumer(channel, method.queue, tag)
+            channel.consumers[tag] = consumer
+            broker.consumers[method.queue].append(consumer)
+            if not method.nowait:
+                self.send(channel_number, spec.Basic.ConsumeOk(consumer_tag=tag))
+            broker.dispatch(method.queue)
+        elif isinstance(method, spec.Basic.Cancel):
+            channel.cancel(method.consumer_tag)
+            if not method.nowait:
+                self.send(channel_number, spec.Basic.CancelOk(consumer_tag=method.consumer_tag))
+        elif isinstance(method, (spec.Basic.Ack, spec.Basic.Nack, spec.Basic.Reject)):
+            if isinstance(method, spec.Basic.Ack):
+                broker.ack_frames += 1
+            requeue = None if isinstance(method, spec.Basic.Ack) else method.requeue
+            multiple = getattr(method, "multiple", False)
+            if not channel.settle(method.delivery_tag, multiple, requeue):
+                self.fail_channel(channel_number, f"PRECONDITION_FAILED - unknown delivery tag {method.delivery_tag}",
+                                  method)
+        return False
+
+    def fail_channel(self, channel_number: int, reason: str, method):
+        # Close a channel on a protocol error, as RabbitMQ does, requeueing its deliveries
+        self.broker.channel_errors += 1
+        self.channels.pop(channel_number).close()
+        self.send(channel_number, spec.Channel.Close(reply_code=406, reply_text=reason,
+                                                     class_id=method.INDEX >> 16, method_id=method.INDEX & 0xFFFF))
+
+
+class _ChannelState:
+    """
+    Per-channel state of the fake broker: the message being received, pending confirms
+    and unacknowledged deliveries.
+    """
+
+    def __init__(self, connection: _Connection, number: int):
+        self.connection = connection
+        self.broker = connection.broker
+        self.number = number
+        self.confirming = False
+        self.publish_tag = 0  # Sequence number of the last message published on this channel
+        self.confirmed = 0  # Sequence number of the last message confirmed
+        self.nacks = []  # Sequence numbers to nack individually
+        self.prefetch = 0  # Maximum unacknowledged deliveries, 0 for unlimited
+        self.delivery_tag = 0  # Tag of the last delivery to this channel
+        self.unacked: Dict[int, Tuple[str, Message]] = {}  # Delivery tag -> (queue, message)
+        self.consumers: Dict[str, _Consumer] = {}
+        self._publish = None
+        self._properties = None
+        self._size = 0
+        self._fragments = []
+
+    def has_room(self) -> bool:
+        return not self.prefetch or len(self.unacked) < self.prefetch
+
+    def deliver(self, consumer: _Consumer, queue: str, message: Message):
+        self.delivery_tag += 1
+        self.unacked[self.delivery_tag] = (queue, message)
+
+    def settle(self, delivery_tag: int, multiple: bool, requeue: Optional[bool]) -> bool:
+        # Ack (requeue None), or nack with or without requeueing, one or many deliveries;
+        # like RabbitMQ, an unknown or already settled tag is a channel error (returns False)
+        if multiple and delivery_tag == 0:
+            tags = list(self.unacked)  # Every outstanding delivery
+        elif delivery_tag not in self.unacked:
+            return False
+        else:
+            tags = [tag for tag in self.unacked if tag <= delivery_tag] if multiple else [delivery_tag]
+        queues = set()
+        for tag in tags:
+            queue, (properties, body, routing_key, _) = self.unacked.pop(tag)
+            queues.add(queue)
+            if requeue is None:
+                self.broker.acked += 1
+            else:
+                self.broker.rejected += 1
+                if requeue:
+                    self.broker.queues[queue].appendleft((properties, body, routing_key, True))
+        for queue in queues:
+            self.broker.dispatch(queue)
+        return True
+
+    def cancel(self, consumer_tag: str):
+        consumer = self.consumers.pop(consumer_tag, None)
+        if consumer is not None:
+            self.broker.consumers[consumer.queue].remove(consumer)
+
+    def close(self):
+        # Cancel the consumers and requeue every unacknowledged delivery, oldest first
+        for tag in list(self.consumers):
+            self.cancel(tag)
+        queues = set()
+        for queue, (properties, body, routing_key, _) in reversed(list(self.unacked.values())):
+            self.broker.queues[queue].appendleft((properties, body, routing_key, True))
+            queues.add(queue)
+        self.unacked.clear()
+        for queue in queues:
+            self.broker.dispatch(queue)
+
+    def publish(self, method: spec.Basic.Publish):
+        self._publish = method
+
+    def header(self, header: frame.Header):
+        self._properties = header.properties
+        self._size = header.body_size
+        self._fragments = []
+        if self._size == 0:
+            self._complete()
+
+    def body(self, fragment: bytes):
+        self._fragments.append(fragment)
+        self._size -= len(fragment)
+        if self._size <= 0:
+            self._complete()
+
+    def _complete(self):
+        # Store a fully received message in the queues it is routed to and remember its confirm
+        routing_key = self._publish.routing_key
+        queues = self.broker.route(self._publish.exchange, routing_key)
+        self.broker.published += 1
+        self.publish_tag += 1
+        if any(queue in self.broker.nack_queues for queue in queues):
+            self.nacks.append(self.publish_tag)
+        else:
+            if not queues:
+                self.broker.unroutable += 1  # Dropped and still confirmed, as RabbitMQ does
+            body = b"".join(self._fragments)
+            for queue in queues:
+                self.broker.enqueue(queue, (self._properties, body, routing_key, False))
+        self._publish = None
+
+    def flush_confirms(self):
+        # Send the confirms of every message published since the last flush
+        if not self.confirming:
+            return
+        send = self.connection.send
+        if not self.nacks:
+            if self.publish_tag > self.confirmed:
+                send(self.number, spec.Basic.Ack(delivery_tag=self.publish_tag, multiple=True))
+        else:
+            nacks = set(self.nacks)
+            for tag in range(self.confirmed + 1, self.publish_tag + 1):
+                method = spec.Basic.Nack if tag in nacks else spec.Basic.Ack
+                send(self.number, method(delivery_tag=tag, multiple=False))
+        self.confirmed = self.publish_tag
+        self.nacks = []
@@ -0,0 +1,157 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+Value = Union[bytes, str, int, float]
+
+
+def _bytes(value: Value) -> bytes:
+    return value if isinstance(value, bytes) else str(value).encode()
+
+
+def _score(bound: Union[str, float]) -> float:
+    return float(bound)  # Also parses the "-inf" and "+inf" bounds
+
+
+class FakeRedisServer:
+    """
+    In-process stand-in for a Redis server, shared by the FakeRedis clients of several workers.
+
+    Holds strings with millisecond expiry, sorted sets and pub/sub channels. Setting
+    available to False makes every command raise ConnectionError, like an unreachable
+    server.
+
+    Args:
+        clock (Callable[[], float]): Time source used for key expiry.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.available = True
+        self.strings: Dict[str, Tuple[bytes, Optional[float]]] = {}  # key -> (value, expires at)
+        self.sorted_sets: Dict[str, Dict[bytes, float]] = {}
+        self.subscribers: Dict[str, Set["FakePubSub"]] = {}
+        self.commands = 0  # Commands received from every client
+
+    def command(self):
+        # Count a command, failing when the server is unreachable
+        if not self.available:
+            raise ConnectionError("Fake Redis server is unavailable")
+        self.commands += 1
+
+    def lookup(self, key: str) -> Optional[bytes]:
+        # Return a live string value, dropping it once expired
+        entry = self.strings.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and self.clock() >= entry[1]:
+            del self.strings[key]
+            return None
+        return entry[0]
+
+
+class FakeRedis:
+    """
+    Client of a FakeRedisServer implementing the subset of the redis.asyncio API used by the
+    snapshot tier: strings, sorted sets and pub/sub.
+
+    Args:
+        server (FakeRedisServer, optional): Server shared with other clients; a new one by default.
+    """
+
+    def __init__(self, server: Optional[FakeRedisServer] = None):
+        self.server = server or FakeRedisServer()
+
+    async def get(self, name: str) -> Optional[bytes]:
+        self.server.command()
+        return self.server.lookup(name)
+
+    async def set(self, name: str, value: Value, px: Optional[int] = None, nx: bool = False,
+                  xx: bool = False) -> Optional[bool]:
+        self.server.command()
+        exists = self.server.lookup(name) is not None
+        if (nx and exists) or (xx and not exists):
+            return None
+        expires = self.server.clock() + px / 1000 if px is not None else None
+        self.server.strings[name] = (_bytes(value), expires)
+        return True
+
+    async def pexpire(self, name: str, time: int) -> bool:
+        self.server.command()
+        value = self.server.lookup(name)
+        if value is None:
+            return False
+        self.server.strings[name] = (value, self.server.clock() + time / 1000)
+        return True
+
+    async def delete(self, *names: str) -> int:
+        self.server.command()
+        deleted = 0
+        for name in names:
+            deleted += self.server.lookup(name) is not None
+            self.server.strings.pop(name, None)
+            deleted += self.server.sorted_sets.pop(name, None) is not None
+        return deleted
+
+    async def zadd(self, name: str, mapping: Dict[Value, float]) -> int:
+        self.server.command()
+        members = self.server.sorted_sets.setdefault(name, {})
+        added = sum(_bytes(member) not in members for member in mapping)
+        members.update({_bytes(member): float(score) for member, score in mapping.items()})
+        return added
+
+    async def zrangebyscore(self, name: str, min: Union[str, float], max: Union[str, float]) -> List[bytes]:
+        self.server.command()
+        low, high = _score(min), _score(max)
+        members = self.server.sorted_sets.get(name, {})
+        return [member for member, score in sorted(members.items(), key=lambda item: (item[1], item[0]))
+                if low <= score <= high]
+
+    async def zremrangebyscore(self, name: str, min: Union[str, float], max: Union[str, float]) -> int:
+        self.server.command()
+        low, high = _score(min), _score(max)
+        members = self.server.sorted_sets.get(name, {})
+        removed = [member for member, score in members.items() if low <= score <= high]
+        for member in removed:
+            del members[member]
+        return len(removed)
+
+    async def publish(self, channel: str, message: Value) -> int:
+        self.server.command()
+        subscribers = list(self.server.subscribers.get(channel, ()))
+        for pubsub in subscribers:
+            pubsub.messages.put_nowait({"type": "message", "channel": channel.encode(), "data": _bytes(message)})
+        return len(subscribers)
+
+    def pubsub(self) -> "FakePubSub":
+        return FakePubSub(self.server)
+
+    async def aclose(self):
+        pass
+
+
+class FakePubSub:
+    """
+    Subscription of a FakeRedis client, delivering messages in publish order.
+    """
+
+    def __init__(self, server: FakeRedisServer):
+        self.server = server
+        self.channels: List[str] = []
+        self.messages: asyncio.Queue = asyncio.Queue()
+
+    async def subscribe(self, *channels: str):
+        self.server.command()
+        for channel in channels:
+            self.server.subscribers.setdefault(channel, set()).add(self)
+            self.channels.append(channel)
+            self.messages.put_nowait({"type": "subscribe", "channel": channel.encode(), "data": len(self.channels)})
+
+    async def listen(self):
+        while True:
+            yield await self.messages.get()
+
+    async def aclose(self):
+        for channel in self.channels:
+            self.server.subscribers.get(channel, set()).discard(self)
+        self.channels = []
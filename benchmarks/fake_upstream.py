@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+
+# Path prefix of the brokerage API, mirrored so BASE_URL only needs a new host
+BASE_PATH = "/api/v3/brokerage"
+
+# Products served by the fake upstream, as (base, quote) pairs
+DEFAULT_PAIRS = [
+    ("BTC", "USD"), ("ETH", "USD"), ("SOL", "USD"), ("ADA", "USD"), ("DOGE", "USD"),
+    ("ETH", "BTC"), ("SOL", "BTC"), ("LTC", "USD"), ("XRP", "USD"), ("AVAX", "USD"),
+]
+
+# Seconds per candle for every granularity accepted by Coinbase
+GRANULARITY_SECONDS = {
+    "ONE_MINUTE": 60,
+    "FIVE_MINUTE": 300,
+    "FIFTEEN_MINUTE": 900,
+    "THIRTY_MINUTE": 1800,
+    "ONE_HOUR": 3600,
+    "TWO_HOUR": 7200,
+    "SIX_HOUR": 21600,
+    "ONE_DAY": 86400,
+}
+
+# Maximum number of candles returned by a single candles request
+MAX_CANDLES = 350
+
+
+def make_product(base: str, quote: str, price: float) -> dict:
+    """
+    Build a product payload with every field of the Coinbase products response.
+
+    Args:
+        base (str): The base currency symbol.
+        quote (str): The quote currency symbol.
+        price (float): The current price of the product.
+
+    Returns:
+        dict: A product object.
+    """
+    return {
+        "product_id": f"{base}-{quote}",
+        "price": f"{price:.2f}",
+        "price_percentage_change_24h": "1.25",
+        "volume_24h": "12345.678",
+        "volume_percentage_change_24h": "-3.5",
+        "base_increment": "0.00000001",
+        "quote_increment": "0.01",
+        "quote_min_size": "1",
+        "quote_max_size": "150000000",
+        "base_min_size": "0.00000001",
+        "base_max_size": "3400",
+        "base_name": base,
+        "quote_name": quote,
+        "watched": False,
+        "is_disabled": False,
+        "new": False,
+        "status": "online",
+        "cancel_only": False,
+        "limit_only": False,
+        "post_only": False,
+        "trading_disabled": False,
+        "auction_mode": False,
+        "product_type": "SPOT",
+        "quote_currency_id": quote,
+        "base_currency_id": base,
+        "fcm_trading_session_details": None,
+        "mid_market_price": "",
+        "alias": "",
+        "alias_to": [],
+        "base_display_symbol": base,
+        "quote_display_symbol": quote,
+        "view_only": False,
+        "price_increment": "0.01",
+        "display_name": f"{base}/{quote}",
+        "product_venue": "CBE",
+        "approximate_quote_24h_volume": "98765432.10",
+    }
+
+
+class FakeUpstream:
+    """
+    In-process stand-in for the public Coinbase brokerage API.
+
+    Every request waits for the configured latency plus a uniformly distributed
+    jitter. A share of the requests can then be answered with an injected 429 (with
+    a Retry-After header) or 500 instead of the real response.
+
+    Args:
+        latency (float): Seconds to wait before answering each request.
+        pairs (List[tuple]): The (base, quote) pairs to serve as products.
+        jitter (float): Maximum extra seconds added to the latency of each request.
+        error_rate (float): Share of requests answered with 500.
+        throttle_rate (float): Share of requests answered with 429.
+        retry_after (float): Retry-After seconds sent with injected 429 responses.
+        seed (int, optional): Seed of the jitter and injection draws, for reproducible runs.
+    """
+
+    def __init__(self, latency: float = 0.0, pairs: List[tuple] = None, jitter: float = 0.0,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, retry_after: float = 1.0,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.request_count = 0  # Number of requests served so far
+        self.errors = 0  # Requests answered with an injected 500
+        self.throttled = 0  # Requests answered with an injected 429
+        self.products = {}
+        for index, (base, quote) in enumerate(pairs or DEFAULT_PAIRS):
+            product = make_product(base, quote, 100.0 * (index + 1))
+            self.products[product["product_id"]] = product
+        self.app = Starlette(routes=[Mount(BASE_PATH, routes=[
+            Route("/time", self.server_time),
+            Route("/market/products", self.list_products),
+            Route("/market/products/{product_id}", self.product),
+            Route("/market/products/{product_id}/candles", self.candles),
+            Route("/market/products/{product_id}/ticker", self.ticker),
+            Route("/market/product_book", self.product_book),
+        ])])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            failure = await self._wait()
+            if failure is not None:
+                await failure(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+    async def _wait(self) -> Optional[Response]:
+        # Count the request, simulate network and processing latency and draw an injected failure
+        self.request_count += 1
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        draw = self.random.random()
+        if draw < self.throttle_rate:
+            self.throttled += 1
+            return JSONResponse({"error": "RATE_LIMIT_EXCEEDED", "message": "Too many requests"}, status_code=429,
+                                headers={"Retry-After": f"{self.retry_after:g}"})
+        if draw < self.throttle_rate + self.error_rate:
+            self.errors += 1
+            return JSONResponse({"error": "INTERNAL", "message": "Injected failure"}, status_code=500)
+        return None
+
+    def _price(self, product_id: str) -> float:
+        return float(self.products[product_id]["price"])
+
+    async def server_time(self, request: Request):
+        now = time.time()
+        return JSONResponse({
+            "iso": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)),
+            "epochSeconds": str(int(now)),
+            "epochMillis": str(int(now * 1000)),
+        })
+
+    async def list_products(self, request: Request):
+        return JSONResponse({"products": list(self.products.values()), "num_products": len(self.products)})
+
+    async def product(self, request: Request):
+        product = self.products.get(request.path_params["product_id"])
+        if product is None:
+            return JSONResponse({"error": "NOT_FOUND"}, status_code=404)
+        return JSONResponse(product)
+
+    async def product_book(self, request: Request):
+        product_id = request.query_params.get("product_id", "")
+        if product_id not in self.products:
+            return JSONResponse({"error": "NOT_FOUND"}, status_code=404)
+        limit = int(request.query_params.get("limit", "50"))
+        mid = self._price(product_id)
+        bids = [{"price": f"{mid - 0.01 * (i + 1):.2f}", "size": f"{0.5 + i * 0.1:.8f}"} for i in range(limit)]
+        asks = [{"price": f"{mid + 0.01 * (i + 1):.2f}", "size": f"{0.5 + i * 0.1:.8f}"} for i in range(limit)]
+        return JSONResponse({"pricebook": {
+            "product_id": product_id,
+            "bids": bids,
+            "asks": asks,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }})
+
+    async def candles(self, request: Request):
+        product_id = request.path_params["product_id"]
+        if product_id not in self.products:
+            return JSONResponse({"error": "NOT_FOUND"}, status_code=404)
+        step = GRANULARITY_SECONDS.get(request.query_params.get("granularity", "ONE_HOUR"))
+        if step is None:
+            return JSONResponse({"error": "INVALID_ARGUMENT"}, status_code=400)
+        start = int(request.query_params["start"])
+        end = int(request.query_params["end"])
+        first = -(-start // step) * step  # First bucket boundary at or after start
+        starts = list(range(first, end + 1, step))
+        if len(starts) > MAX_CANDLES:
+            return JSONResponse({"error": "INVALID_ARGUMENT", "message": "too many candles"}, status_code=400)
+        base = self._price(product_id)
+        candles = []
+        for ts in reversed(starts):  # Coinbase returns the newest candle first
+            rnd = random.Random(f"{product_id}:{step}:{ts}")  # Deterministic per bucket
+            open_ = base * (1 + rnd.uniform(-0.02, 0.02))
+            close = open_ * (1 + rnd.uniform(-0.01, 0.01))
+            candles.append({
+                "start": str(ts),
+                "low": f"{min(open_, close) * 0.995:.2f}",
+                "high": f"{max(open_, close) * 1.005:.2f}",
+                "open": f"{open_:.2f}",
+                "close": f"{close:.2f}",
+                "volume": f"{rnd.uniform(1, 100):.8f}",
+            })
+        return JSONResponse({"candles": candles})
+
+    async def ticker(self, request: Request):
+        product_id = request.path_params["product_id"]
+        if product_id not in self.products:
+            return JSONResponse({"error": "NOT_FOUND"}, status_code=404)
+        limit = int(request.query_params.get("limit", "10"))
+        price = self._price(product_id)
+        now = time.time()
+        trades = []
+        for i in range(limit):
+            trades.append({
+                "trade_id": str(int(now * 1000) - i),
+                "product_id": product_id,
+                "price": f"{price + 0.01 * (i % 5):.2f}",
+                "size": "0.01000000",
+                "time": datetime.fromtimestamp(now - i * 0.137, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+                "side": "BUY" if i % 2 else "SELL",
+                "bid": "",
+                "ask": "",
+            })
+        return JSONResponse({"trades": trades, "best_bid": f"{price - 0.01:.2f}", "best_ask": f"{price + 0.01:.2f}"})
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the fake Coinbase upstream")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8081, help="Port to listen on")
+    parser.add_argument("--latency", type=float, default=0.0, help="Per-request latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Maximum extra latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds of injected 429s")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the latency and injection draws")
+    args = parser.parse_args()
+    upstream = FakeUpstream(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                            throttle_rate=args.throttle_rate, retry_after=args.retry_after, seed=args.seed)
+    print(f"Serving the fake upstream at http://{args.host}:{args.port}{BASE_PATH}")
+    uvicorn.run(upstream, host=args.host, port=args.port, log_level="warning", backlog=4096)
+
+
+if __name__ == "__main__":
+    main()
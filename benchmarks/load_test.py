@@ -0,0 +1,374 @@
+"""
+Drive every public route and the publish path against a local stack and save the results as JSON.
+
+The API runs in its own uvicorn process, pointed at the fake upstream and the fake
+broker, each in a separate process as well. The fake upstream can add latency,
+jitter and injected 500/429 responses. Each scenario sends a fixed number of
+requests from a fixed number of concurrent clients and reports throughput, latency
+percentiles, status codes and the resident memory of the API process.
+
+Passing a previous results file with --compare lists the scenarios whose p95
+latency rose, or whose throughput fell, by more than the tolerance.
+
+Usage:
+    python -m benchmarks.load_test --requests 300 --concurrency 16 --latency 0.02 --jitter 0.01 --output results.json
+    python -m benchmarks.load_test --compare baseline.json --output results.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional
+
+import httpx
+
+from services.api.core.backfill import job_id_for
+
+from .bench_publisher import serve_broker
+from .bench_upstream_client import free_port, start_upstream, wait_for_port
+from .fake_upstream import DEFAULT_PAIRS
+
+
+class Scenario(NamedTuple):
+    """
+    One request repeated by the load generator.
+    """
+    name: str
+    route: str  # Route path as declared in endpoints/public_data.py
+    method: str
+    path: str
+    params: Optional[dict] = None
+    headers: Optional[dict] = None
+    body: Optional[dict] = None
+
+
+def scenarios(product_ids: List[str]) -> List[Scenario]:
+    """
+    Build the scenarios covering every route of the public router and the publish path.
+
+    Args:
+        product_ids (List[str]): Products served by the fake upstream.
+
+    Returns:
+        List[Scenario]: The scenarios, in the order they are run.
+    """
+    product = product_ids[0]
+    ids = ",".join(product_ids)
+    end = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    week = {"start": (end - timedelta(days=7)).strftime("%Y-%m-%dT%H:%M:%S"), "end": end.strftime("%Y-%m-%dT%H:%M:%S")}
+    # A backfill of the week, queued but never fetched, and one holding no candle start, done at once
+    backfill = dict(week, product_ids=product_ids, granularity="ONE_HOUR")
+    empty = {"product_ids": [product], "start": (end + timedelta(minutes=10)).strftime("%Y-%m-%dT%H:%M:%S"),
+             "end": (end + timedelta(minutes=20)).strftime("%Y-%m-%dT%H:%M:%S"), "granularity": "ONE_HOUR"}
+
+    def job_id(job: dict) -> str:
+        # Job IDs derive from the timestamps the API parses from the same strings
+        start, stop = (int(datetime.fromisoformat(job[key]).timestamp()) for key in ("start", "end"))
+        return job_id_for(job["product_ids"], job["granularity"], start, stop)
+
+    return [
+        Scenario("products", "/products", "GET", "/public/products"),
+        Scenario("products_filtered", "/products", "GET", "/public/products",
+                 {"quote_currency_id": "USD", "fields": "product_id,price", "limit": 5}),
+        Scenario("server_time", "/server-time", "GET", "/public/server-time"),
+        Scenario("product", "/product/{product_id}", "GET", f"/public/product/{product}"),
+        Scenario("product_book", "/product-book/{product_id}", "GET", f"/public/product-book/{product}", {"depth": 10}),
+        Scenario("book_analytics", "/product-book/{product_id}/analytics", "GET",
+                 f"/public/product-book/{product}/analytics", {"sizes": "0.1,1,10", "depth_bps": "10,50,100"}),
+        Scenario("candles", "/candles/{product_id}", "GET", f"/public/candles/{product}",
+                 dict(week, granularity="ONE_HOUR")),
+        Scenario("candles_npy", "/candles/{product_id}", "GET", f"/public/candles/{product}",
+                 dict(week, granularity="ONE_HOUR"), {"Accept": "application/x-npy"}),
+        Scenario("candles_resampled", "/candles/{product_id}/resampled", "GET", f"/public/candles/{product}/resampled",
+                 dict(week, interval="4h", indicators="ema:20,rsi:14")),
+        Scenario("market_trades", "/market-trades/{product_id}", "GET", f"/public/market-trades/{product}"),
+        Scenario("recent_trades", "/recent-trades/{product_id}", "GET", f"/public/recent-trades/{product}"),
+        Scenario("recent_candles", "/recent-candles/{product_id}", "GET", f"/public/recent-candles/{product}",
+                 {"granularity": "ONE_HOUR"}),
+        Scenario("tape_trades", "/trades/{product_id}", "GET", f"/public/trades/{product}", dict(week, limit=1000)),
+        Scenario("tape_candles", "/trades/{product_id}/candles", "GET", f"/public/trades/{product}/candles",
+                 dict(week, interval="1m")),
+        Scenario("batch_candles", "/batch/candles", "GET", "/public/batch/candles",
+                 dict(week, product_ids=ids, granularity="ONE_HOUR")),
+        Scenario("batch_market_trades", "/batch/market-trades", "GET", "/public/batch/market-trades",
+                 {"product_ids": ids}),
+        Scenario("batch_product_book", "/batch/product-book", "GET", "/public/batch/product-book",
+                 {"product_ids": ids, "depth": 10}),
+        Scenario("batch_book_analytics", "/batch/product-book/analytics", "GET", "/public/batch/product-book/analytics",
+                 {"product_ids": ids, "sizes": "0.1,1,10"}),
+        Scenario("backfill", "/backfill", "POST", "/public/backfill", body=backfill),
+        Scenario("backfill_empty", "/backfill", "POST", "/public/backfill", body=empty),
+        Scenario("backfill_job", "/backfill/{job_id}", "GET", f"/public/backfill/{job_id(backfill)}"),
+        Scenario("backfill_result", "/backfill/{job_id}/result", "GET", f"/public/backfill/{job_id(empty)}/result"),
+        Scenario("publish", "/publish/{queue_name}", "POST", "/public/publish/load_test",
+                 body={"message": "load test message"}),
+        Scenario("publish_batch", "/publish/{queue_name}/batch", "POST", "/public/publish/load_test/batch",
+                 body={"messages": [f"load test message {i}" for i in range(100)]}),
+    ]
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """
+    Return the nearest-rank percentile of sorted values.
+
+    Args:
+        ordered (List[float]): The values, sorted ascending.
+        q (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The value at that rank, or 0.0 when there are no values.
+    """
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * q // 100))  # ceil(n * q / 100), at least the first value
+    return ordered[int(rank) - 1]
+
+
+def process_memory(pid: int) -> Dict[str, float]:
+    """
+    Read the current and peak resident memory of a process from /proc.
+
+    Args:
+        pid (int): The process ID.
+
+    Returns:
+        Dict[str, float]: "rss_mb" and "peak_rss_mb", or an empty dict where /proc is unavailable.
+    """
+    fields = {"VmRSS:": "rss_mb", "VmHWM:": "peak_rss_mb"}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            return {fields[line.split()[0]]: round(int(line.split()[1]) / 1024, 1)
+                    for line in status if line.split() and line.split()[0] in fields}
+    except OSError:
+        return {}
+
+
+def summarize(scenario: Scenario, latencies: List[float], statuses: Counter, sizes: int, elapsed: float) -> dict:
+    """
+    Build the result record of one scenario.
+
+    Args:
+        scenario (Scenario): The scenario.
+        latencies (List[float]): Per-request latencies in seconds.
+        statuses (Counter): Responses per status code; failed requests count as "error".
+        sizes (int): Total bytes received.
+        elapsed (float): Wall-clock duration of the scenario in seconds.
+
+    Returns:
+        dict: Throughput, latency percentiles in milliseconds and status counts.
+    """
+    ordered = sorted(latencies)
+    failures = sum(count for status, count in statuses.items() if status == "error" or int(status) >= 400)
+    return {
+        "name": scenario.name,
+        "route": scenario.route,
+        "requests": len(ordered),
+        "rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+        "error_rate": round(failures / len(ordered), 4) if ordered else 0.0,
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        "bytes_per_request": round(sizes / len(ordered)) if ordered else 0,
+    }
+
+
+async def drive(client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int) -> dict:
+    """
+    Send a scenario's request `requests` times from `concurrency` concurrent clients.
+
+    Args:
+        client (httpx.AsyncClient): Client bound to the API.
+        scenario (Scenario): The request to send.
+        requests (int): Number of requests.
+        concurrency (int): Number of requests in flight.
+
+    Returns:
+        dict: The summary built by summarize.
+    """
+    remaining = iter(range(requests))
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    sizes = 0
+
+    async def worker():
+        nonlocal sizes
+        for _ in remaining:
+            began = time.perf_counter()
+            try:
+                response = await client.request(scenario.method, scenario.path, params=scenario.params,
+                                                headers=scenario.headers, json=scenario.body)
+                sizes += len(response.content)
+                statuses[response.status_code] += 1
+            except httpx.HTTPError:
+                statuses["error"] += 1
+            latencies.append(time.perf_counter() - began)
+
+    began = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return summarize(scenario, latencies, statuses, sizes, time.perf_counter() - began)
+
+
+def start_api(upstream_url: str, broker_port: int, data_dir: str, rate_limit: float) -> (subprocess.Popen, str):
+    """
+    Start the API with uvicorn in a child process wired to the fake services.
+
+    Returns:
+        Tuple[subprocess.Popen, str]: The API process and its base URL.
+    """
+    port = free_port()
+    env = dict(
+        os.environ,
+        COINBASE_BASE_URL=upstream_url,
+        UPSTREAM_RATE_LIMIT=str(rate_limit),
+        LIVE_ORDER_BOOKS="0",  # The fake upstream has no WebSocket feed
+        CANDLE_STORE_PATH=os.path.join(data_dir, "candles.sqlite3"),
+        BACKFILL_DB_PATH=os.path.join(data_dir, "backfill.sqlite3"),
+        RABBITMQ_HOST="127.0.0.1",
+        RABBITMQ_PORT=str(broker_port),
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "services.api.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "error"],
+        env=env,
+    )
+    wait_for_port(port)
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def run(args) -> dict:
+    """
+    Start the stack, warm every scenario up and run them one after the other.
+    """
+    upstream_url = start_upstream(args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                  throttle_rate=args.throttle_rate, retry_after=args.retry_after, seed=args.seed)
+    broker_port = free_port()
+    multiprocessing.Process(target=serve_broker, args=(broker_port,), daemon=True).start()
+    wait_for_port(broker_port)
+    product_ids = [f"{base}-{quote}" for base, quote in DEFAULT_PAIRS]
+    selected = [s for s in scenarios(product_ids) if not args.only or s.name in args.only]
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        process, base_url = start_api(upstream_url, broker_port, data_dir, args.upstream_rate)
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+                for scenario in selected:  # Fill caches, the candle store and the publisher connection
+                    await client.request(scenario.method, scenario.path, params=scenario.params,
+                                         headers=scenario.headers, json=scenario.body)
+                memory_start = process_memory(process.pid)
+                results = []
+                for scenario in selected:
+                    result = await drive(client, scenario, args.requests, args.concurrency)
+                    result.update(process_memory(process.pid))
+                    results.append(result)
+                    print(f"{result['name']:>20}: {result['rps']:>8} req/s  p50 {result['p50_ms']:>8} ms  "
+                          f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  "
+                          f"errors {result['error_rate']:.2%}", file=sys.stderr)
+                memory_end = process_memory(process.pid)
+        finally:
+            process.terminate()
+            process.wait()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": {
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "latency": args.latency,
+                "jitter": args.jitter,
+                "error_rate": args.error_rate,
+                "throttle_rate": args.throttle_rate,
+                "upstream_rate": args.upstream_rate,
+            },
+        },
+        "memory": {"start": memory_start, "end": memory_end},
+        "scenarios": results,
+    }
+
+
+def git_commit() -> Optional[str]:
+    """
+    Return the commit the benchmark runs on, when run from a git checkout.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> List[dict]:
+    """
+    List the scenarios that regressed between two result files.
+
+    Args:
+        baseline (dict): Results of the reference run.
+        current (dict): Results of the new run.
+        tolerance (float): Allowed relative change, e.g. 0.1 for 10%.
+
+    Returns:
+        List[dict]: One entry per regressed metric, with both values and the change.
+    """
+    before = {result["name"]: result for result in baseline["scenarios"]}
+    regressions = []
+    for result in current["scenarios"]:
+        reference = before.get(result["name"])
+        if reference is None:
+            continue
+        for metric, worse in (("p95_ms", 1), ("rps", -1), ("error_rate", 1)):
+            old, new = reference[metric], result[metric]
+            change = (new - old) / old if old else (1.0 if new > old else 0.0)
+            if change * worse > tolerance:
+                regressions.append({"name": result["name"], "metric": metric, "baseline": old, "current": new,
+                                    "change": round(change, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent requests per scenario")
+    parser.add_argument("--latency", type=float, default=0.02, help="Fake upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Maximum extra upstream latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of upstream requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of upstream requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds of injected 429s")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the upstream latency and injection draws")
+    parser.add_argument("--upstream-rate", type=float, default=0, help="UPSTREAM_RATE_LIMIT of the API, 0 for none")
+    parser.add_argument("--only", nargs="*", help="Names of the scenarios to run (default: all)")
+    parser.add_argument("--output", help="File to write the JSON results to (default: stdout)")
+    parser.add_argument("--compare", help="Results file of a previous run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative regression (default: 0.1)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.compare:
+        with open(args.compare) as baseline:
+            results["regressions"] = compare(json.load(baseline), results, args.tolerance)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if results.get("regressions"):
+        for regression in results["regressions"]:
+            print(f"regression: {regression}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
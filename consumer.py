@@ -1,47 +1,429 @@
 import pika  # Import the Pika library for RabbitMQ
 import os  # Import the os library for environment variable handling
+import functools  # Import functools to bind completion callbacks
+import importlib  # Import importlib to load the configured message handler
+import logging  # Import logging to report consumer stats
+import random  # Import random to jitter reconnection delays
+import signal  # Import signal for graceful shutdown on SIGINT/SIGTERM
+import threading  # Import threading for the stop event
+import time  # Import time for rates and ack intervals
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Optional, Set, Tuple
 
 # Get RabbitMQ connection details from environment variables, with default values
 rabbitmq_host = os.getenv("RABBITMQ_HOST", "rabbitmq")
+rabbitmq_port = int(os.getenv("RABBITMQ_PORT", "5672"))
 rabbitmq_user = os.getenv("RABBITMQ_DEFAULT_USER", "user")
 rabbitmq_pass = os.getenv("RABBITMQ_DEFAULT_PASS", "password")
 
-def callback(ch, method, properties, body):
+# Queue consumed by the worker
+CONSUMER_QUEUE = os.getenv("CONSUMER_QUEUE", "test_queue")
+
+# Maximum number of unacknowledged messages the broker sends to the worker
+CONSUMER_PREFETCH = int(os.getenv("CONSUMER_PREFETCH", "200"))
+
+# Acks are sent with multiple=True once this many messages are settled, or after the interval (seconds)
+CONSUMER_ACK_BATCH = int(os.getenv("CONSUMER_ACK_BATCH", "50"))
+CONSUMER_ACK_INTERVAL = float(os.getenv("CONSUMER_ACK_INTERVAL", "0.1"))
+
+# Handler pool: "thread" or "process", its size and the handler as "module:function"
+CONSUMER_POOL = os.getenv("CONSUMER_POOL", "thread")
+CONSUMER_WORKERS = int(os.getenv("CONSUMER_WORKERS", "4"))
+CONSUMER_HANDLER = os.getenv("CONSUMER_HANDLER", "consumer:print_message")
+
+# Messages with the same key are handled one at a time, in delivery order:
+# "routing_key", "header:<name>" (falling back to the routing key) or "none"
+CONSUMER_ORDERING_KEY = os.getenv("CONSUMER_ORDERING_KEY", "routing_key")
+
+# Requeue messages whose handler failed instead of discarding them
+CONSUMER_REQUEUE_ON_ERROR = os.getenv("CONSUMER_REQUEUE_ON_ERROR", "0") == "1"
+
+# Initial and maximum delay in seconds between reconnection attempts
+CONSUMER_RECONNECT_DELAY = float(os.getenv("CONSUMER_RECONNECT_DELAY", "1"))
+CONSUMER_MAX_RECONNECT_DELAY = float(os.getenv("CONSUMER_MAX_RECONNECT_DELAY", "30"))
+
+# Seconds to wait for in-flight messages on shutdown, and between stats reports
+CONSUMER_SHUTDOWN_TIMEOUT = float(os.getenv("CONSUMER_SHUTDOWN_TIMEOUT", "30"))
+CONSUMER_STATS_INTERVAL = float(os.getenv("CONSUMER_STATS_INTERVAL", "10"))
+
+logger = logging.getLogger("consumer")
+
+
+class RejectMessage(Exception):
+    """
+    Raised by a handler to discard its message even when failed messages are requeued.
+    """
+
+
+def print_message(body: bytes, routing_key: str):
     """
-    Callback function to process received messages.
-    
+    Default message handler: print the received message.
+
     Args:
-        ch: The channel object.
-        method: Method frame with delivery tag and other metadata.
-        properties: Properties of the message.
-        body: The actual message body.
+        body (bytes): The actual message body.
+        routing_key (str): The routing key the message was published with.
     """
     print(f" [x] Received {body}")
 
-def consume_messages(queue_name: str):
+
+def load_handler(path: str) -> Callable[[bytes, str], None]:
+    """
+    Import a message handler given as "module:function".
+
+    Args:
+        path (str): The handler location, e.g. "consumer:print_message".
+
+    Returns:
+        Callable[[bytes, str], None]: The handler, called with the body and routing key.
+
+    Raises:
+        ValueError: If the path is not of the form "module:function".
     """
-    Consume messages from a specified RabbitMQ queue.
-    
+    module_name, _, function_name = path.partition(":")
+    if not module_name or not function_name:
+        raise ValueError(f"Handler must be given as module:function, got {path!r}")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def ordering_key_function(spec: str) -> Callable[[object, object], Optional[str]]:
+    """
+    Build the function extracting the ordering key of a delivery.
+
     Args:
-        queue_name (str): The name of the queue to consume messages from.
+        spec (str): "routing_key", "header:<name>" or "none".
+
+    Returns:
+        Callable: Function of (method, properties) returning the key, or None for no ordering.
+
+    Raises:
+        ValueError: If the spec is not recognised.
+    """
+    if spec == "routing_key":
+        return lambda method, properties: method.routing_key
+    if spec == "none":
+        return lambda method, properties: None
+    if spec.startswith("header:"):
+        name = spec[len("header:"):]
+        return lambda method, properties: str((properties.headers or {}).get(name, method.routing_key))
+    raise ValueError(f"Unsupported ordering key: {spec!r}")
+
+
+class AckTracker:
     """
-    # Set up credentials for connecting to RabbitMQ
-    credentials = pika.PlainCredentials(rabbitmq_user, rabbitmq_pass)
-    # Establish a blocking connection to RabbitMQ
-    connection = pika.BlockingConnection(pika.ConnectionParameters(host=rabbitmq_host, credentials=credentials))
-    # Create a channel for communication
-    channel = connection.channel()
+    Tracks which delivery tags are settled so acks can be sent with multiple=True.
+
+    Handlers finish out of order, so only the longest run of settled tags starting at
+    the oldest delivery can be acknowledged with a single multiple ack. Nacked tags are
+    settled with the broker already: a multiple ack never names one (the broker would
+    close the channel on an unknown delivery tag), it names the highest acked tag of the
+    run, which settles every delivery still outstanding below it.
+    """
+
+    def __init__(self):
+        self.acked = 0  # Highest tag of the contiguous run settled so far
+        self._next = 1  # Lowest tag not settled yet
+        self._settled: Set[int] = set()  # Settled tags above the contiguous run
+        self._nacked: Set[int] = set()  # Nacked tags not passed by the acknowledged run yet
+
+    def settle(self, delivery_tag: int, nacked: bool = False):
+        """
+        Mark a delivery as handled.
 
-    # Declare a queue to ensure it exists
-    channel.queue_declare(queue=queue_name, durable=True)
-    # Set up consumption of messages from the queue with a callback function
-    channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=True)
+        Args:
+            delivery_tag (int): The delivery tag.
+            nacked (bool): Whether the delivery was nacked, so it must not be acked.
+        """
+        if nacked:
+            self._nacked.add(delivery_tag)
+        self._settled.add(delivery_tag)
+        while self._next in self._settled:
+            self._settled.remove(self._next)
+            self._next += 1
 
+    def pending(self) -> int:
+        """
+        Return how many settled deliveries a multiple ack would acknowledge now.
+
+        Returns:
+            int: Number of deliveries covered by the next multiple ack, nacked ones included.
+        """
+        return self._next - 1 - self.acked
+
+    def take(self) -> Optional[int]:
+        """
+        Return the tag to acknowledge with multiple=True, if any, and record the run as settled.
+
+        Returns:
+            int: The highest contiguous settled tag that was not nacked, or None if nothing
+            new is settled or every new tag was nacked.
+        """
+        if self.pending() <= 0:
+            return None
+        last = self._next - 1
+        tag = last
+        while tag > self.acked and tag in self._nacked:
+            tag -= 1
+        previous, self.acked = self.acked, last
+        self._nacked = {nacked for nacked in self._nacked if nacked > last}
+        return tag if tag > previous else None
+
+    def take_out_of_order(self) -> Set[int]:
+        """
+        Return the acked tags above the contiguous run, to acknowledge one by one on shutdown.
+
+        Returns:
+            Set[int]: The tags, nacked ones excluded; every settled tag is forgotten.
+        """
+        tags = self._settled - self._nacked
+        self._settled, self._nacked = set(), set()
+        return tags
+
+
+class ConsumerWorker:
+    """
+    Consumes a queue with a prefetch limit and hands messages to a pool of handlers.
+
+    Messages are acknowledged manually once handled, in batches using multiple=True.
+    Messages sharing an ordering key are handled sequentially in delivery order while
+    other keys run in parallel. Failed messages are nacked, and requeued when
+    requeue_on_error is set unless the handler raised RejectMessage. The worker
+    reconnects with jittered exponential backoff and, when stopped, stops consuming,
+    waits for the messages being handled and acks them before closing the connection.
+
+    Args:
+        queue_name (str): The queue to consume.
+        handler (Callable[[bytes, str], None]): Called with the body and routing key of each message.
+        parameters (pika.ConnectionParameters, optional): Broker address and credentials.
+        prefetch (int): Maximum number of unacknowledged messages.
+        pool (str): "thread" or "process".
+        workers (int): Size of the handler pool.
+        ordering_key (str): How messages are grouped for ordering, see CONSUMER_ORDERING_KEY.
+    """
+
+    def __init__(self, queue_name: str = CONSUMER_QUEUE, handler: Optional[Callable[[bytes, str], None]] = None,
+                 parameters: Optional[pika.ConnectionParameters] = None, prefetch: int = CONSUMER_PREFETCH,
+                 pool: str = CONSUMER_POOL, workers: int = CONSUMER_WORKERS,
+                 ordering_key: str = CONSUMER_ORDERING_KEY, ack_batch: int = CONSUMER_ACK_BATCH,
+                 ack_interval: float = CONSUMER_ACK_INTERVAL, requeue_on_error: bool = CONSUMER_REQUEUE_ON_ERROR,
+                 reconnect_delay: float = CONSUMER_RECONNECT_DELAY,
+                 max_reconnect_delay: float = CONSUMER_MAX_RECONNECT_DELAY,
+                 shutdown_timeout: float = CONSUMER_SHUTDOWN_TIMEOUT, stats_interval: float = CONSUMER_STATS_INTERVAL):
+        if pool not in ("thread", "process"):
+            raise ValueError(f"Unsupported pool: {pool!r}")
+        self.queue_name = queue_name
+        self.handler = handler or load_handler(CONSUMER_HANDLER)
+        self.parameters = parameters or pika.ConnectionParameters(
+            host=rabbitmq_host,
+            port=rabbitmq_port,
+            credentials=pika.PlainCredentials(rabbitmq_user, rabbitmq_pass),
+        )
+        self.prefetch = max(1, prefetch)
+        self.pool = pool
+        self.workers = max(1, workers)
+        self.key = ordering_key_function(ordering_key)
+        # Keep the batch below the prefetch so the broker never waits on our acks
+        self.ack_batch = max(1, min(ack_batch, self.prefetch // 2))
+        self.ack_interval = ack_interval
+        self.requeue_on_error = requeue_on_error
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.shutdown_timeout = shutdown_timeout
+        self.stats_interval = stats_interval
+        self._stop = threading.Event()
+        self._executor: Optional[Executor] = None
+        self._connection: Optional[pika.BlockingConnection] = None
+        self._channel = None
+        self._generation = 0  # Incremented per connection; completions of older ones are ignored
+        self._acks = AckTracker()
+        self._waiting: Dict[Optional[str], Deque[Tuple[int, bytes, str]]] = {}  # Keys in flight -> queued messages
+        self._inflight = 0  # Messages submitted to the pool and not finished yet
+        self._last_flush = time.monotonic()
+        self.received = 0  # Messages delivered by the broker
+        self.processed = 0  # Messages handled successfully
+        self.failed = 0  # Messages whose handler raised
+        self.reconnects = 0  # Connection attempts after a failure
+        self.lag = 0  # Messages ready in the queue at the last report
+        self.rate = 0.0  # Messages handled per second over the last report interval
+        self._report_at = time.monotonic()
+        self._report_count = 0
+
+    def stop(self, *_):
+        """
+        Ask the worker to stop; usable as a signal handler.
+        """
+        self._stop.set()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop.is_set()
+
+    def _create_executor(self) -> Executor:
+        if self.pool == "process":
+            return ProcessPoolExecutor(max_workers=self.workers)
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="consumer-handler")
+
+    def run(self):
+        """
+        Consume until stopped, reconnecting with jittered exponential backoff.
+        """
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+        self._executor = self._create_executor()
+        delay = self.reconnect_delay
+        try:
+            while not self.stopping:
+                try:
+                    self._consume()
+                    delay = self.reconnect_delay
+                except (pika.exceptions.AMQPError, OSError) as e:
+                    if self.stopping:
+                        break
+                    self.reconnects += 1
+                    wait = random.uniform(delay / 2, delay)  # Jitter so workers do not reconnect in lockstep
+                    logger.warning(f"Consumer connection lost ({e!r}), reconnecting in {wait:.1f}s")
+                    self._stop.wait(wait)
+                    delay = min(delay * 2, self.max_reconnect_delay)
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def _consume(self):
+        # Consume over one connection until stopped or disconnected
+        self._connection = connection = pika.BlockingConnection(self.parameters)
+        try:
+            self._channel = channel = connection.channel()
+            channel.queue_declare(queue=self.queue_name, durable=True)
+            channel.basic_qos(prefetch_count=self.prefetch)
+            self._generation += 1
+            self._acks = AckTracker()  # Delivery tags restart on every channel
+            self._waiting = {}
+            self._inflight = 0
+            consumer_tag = channel.basic_consume(queue=self.queue_name, on_message_callback=self._on_message)
+            logger.info(f"Consuming {self.queue_name} with prefetch {self.prefetch} and {self.workers} {self.pool} workers")
+            while not self.stopping:
+                connection.process_data_events(time_limit=self.ack_interval)
+                self._flush_acks()
+                self._report()
+
+            # Graceful shutdown: no new deliveries, finish the messages being handled, ack them
+            channel.basic_cancel(consumer_tag)
+            deadline = time.monotonic() + self.shutdown_timeout
+            while self._inflight and time.monotonic() < deadline:
+                connection.process_data_events(time_limit=0.1)
+            self._flush_acks(final=True)
+        finally:
+            if connection.is_open:
+                connection.close()  # Unacknowledged messages are requeued by the broker
+            self._connection = None
+
+    def _on_message(self, channel, method, properties, body: bytes):
+        # Hand a delivery to the pool, or queue it behind the in-flight message with the same key
+        self.received += 1
+        key = self.key(method, properties)
+        message = (method.delivery_tag, body, method.routing_key)
+        if key is not None:
+            waiting = self._waiting.get(key)
+            if waiting is not None:
+                waiting.append(message)
+                return
+            self._waiting[key] = deque()
+        self._submit(key, message)
+
+    def _submit(self, key: Optional[str], message: Tuple[int, bytes, str]):
+        # Run the handler on the pool; completion is processed on the connection thread
+        delivery_tag, body, routing_key = message
+        self._inflight += 1
+        future = self._executor.submit(self.handler, body, routing_key)
+        done = functools.partial(self._on_done, self._generation, key, delivery_tag)
+        connection = self._connection
+        future.add_done_callback(lambda f: self._call_threadsafe(connection, functools.partial(done, f)))
+
+    @staticmethod
+    def _call_threadsafe(connection: pika.BlockingConnection, callback: Callable[[], None]):
+        try:
+            connection.add_callback_threadsafe(callback)
+        except Exception:
+            pass  # The connection is gone; the broker will redeliver the message
+
+    def _on_done(self, generation: int, key: Optional[str], delivery_tag: int, future: Future):
+        # Settle a finished message and start the next one queued behind the same key
+        if generation != self._generation:
+            return
+        self._inflight -= 1
+        error = future.exception()
+        if error is None:
+            self.processed += 1
+        else:
+            self.failed += 1
+            logger.error(f"Handler failed for delivery {delivery_tag}: {error!r}")
+            requeue = self.requeue_on_error and not isinstance(error, RejectMessage)
+            self._channel.basic_nack(delivery_tag=delivery_tag, requeue=requeue)
+        self._acks.settle(delivery_tag, nacked=error is not None)
+        if key is not None:
+            waiting = self._waiting[key]
+            if waiting and not self.stopping:
+                self._submit(key, waiting.popleft())
+            elif not waiting:
+                del self._waiting[key]
+        if self._acks.pending() >= self.ack_batch:
+            self._flush_acks()
+
+    def _flush_acks(self, final: bool = False):
+        # Acknowledge every contiguous settled delivery with one multiple ack
+        now = time.monotonic()
+        if not final and self._acks.pending() < self.ack_batch and now - self._last_flush < self.ack_interval:
+            return
+        self._last_flush = now
+        delivery_tag = self._acks.take()
+        if delivery_tag is not None:
+            self._channel.basic_ack(delivery_tag=delivery_tag, multiple=True)
+        if final:
+            for tag in sorted(self._acks.take_out_of_order()):
+                self._channel.basic_ack(delivery_tag=tag)
+
+    def _report(self):
+        # Refresh lag and throughput and log them every stats interval
+        now = time.monotonic()
+        if now - self._report_at < self.stats_interval:
+            return
+        handled = self.processed + self.failed
+        self.rate = (handled - self._report_count) / (now - self._report_at)
+        self._report_at, self._report_count = now, handled
+        self.lag = self._channel.queue_declare(queue=self.queue_name, passive=True).method.message_count
+        logger.info(f"Consumer stats: {self.stats()}")
+
+    def stats(self) -> dict:
+        """
+        Return the counters of the worker.
+
+        Returns:
+            dict: Received, processed and failed counts, messages in flight, the queue lag
+            and the handling rate measured at the last report.
+        """
+        return {
+            "queue": self.queue_name,
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "in_flight": self._inflight,
+            "lag": self.lag,
+            "msgs_per_s": round(self.rate, 1),
+            "reconnects": self.reconnects,
+        }
+
+
+def consume_messages(queue_name: str):
+    """
+    Consume messages from a specified RabbitMQ queue until SIGINT or SIGTERM.
+
+    Args:
+        queue_name (str): The name of the queue to consume messages from.
+    """
     print(' [*] Waiting for messages. To exit press CTRL+C')
-    # Start consuming messages
-    channel.start_consuming()
+    ConsumerWorker(queue_name).run()
 
 # Entry point for running the consumer
 if __name__ == "__main__":
-    while True:  # Run the consumer in an infinite loop
-        consume_messages('test_queue')
+    logging.basicConfig(level=logging.INFO)
+    consume_messages(CONSUMER_QUEUE)
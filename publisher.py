@@ -1,39 +1,458 @@
-import pika  # Import the Pika library for RabbitMQ
+import asyncio  # Import asyncio for the event loop the connection runs on
 import json  # Import the json library for JSON handling
 import os  # Import the os library for environment variable handling
+import time  # Import time to measure publish latency
+from typing import Dict, List, Optional, Set, Tuple
+
+import pika  # Import the Pika library for RabbitMQ
+from pika.adapters.asyncio_connection import AsyncioConnection  # Pika connection driven by asyncio
+
+from services.api.core.metrics import PUBLISHED_MESSAGES, PUBLISH_FAILURES, PUBLISH_LATENCY  # Publish metrics
 
 # Get RabbitMQ connection details from environment variables, with default values
 rabbitmq_host = os.getenv("RABBITMQ_HOST", "rabbitmq")
+rabbitmq_port = int(os.getenv("RABBITMQ_PORT", "5672"))
 rabbitmq_user = os.getenv("RABBITMQ_USER", "user")
 rabbitmq_pass = os.getenv("RABBITMQ_PASS", "password")
 
-def publish_message(queue_name: str, message: str):
+# Number of channels kept open on the publisher connection
+PUBLISHER_CHANNELS = int(os.getenv("PUBLISHER_CHANNELS", "4"))
+
+# Seconds to wait for the broker to confirm a message
+PUBLISH_CONFIRM_TIMEOUT = float(os.getenv("PUBLISH_CONFIRM_TIMEOUT", "10"))
+
+# Maximum number of messages accepted by one batch publish request
+PUBLISH_MAX_BATCH = int(os.getenv("PUBLISH_MAX_BATCH", "1000"))
+
+# Properties of every published message: persistent delivery
+PERSISTENT = pika.BasicProperties(delivery_mode=2)
+
+
+class PublishError(Exception):
+    """
+    Raised when a message could not be published or was rejected by the broker.
+    """
+
+
+def encode_message(message: str) -> bytes:
+    """
+    Encode a message in the JSON envelope expected by the consumers.
+
+    Args:
+        message (str): The message to be published.
+
+    Returns:
+        bytes: The message body.
+    """
+    return json.dumps({'message': message}).encode()
+
+
+class ConfirmChannel:
+    """
+    A channel in confirm mode that resolves one future per published message.
+
+    The broker confirms messages by delivery tag, possibly several at once with the
+    'multiple' flag; each confirm resolves the matching futures, in publish order.
+
+    Args:
+        channel (pika.channel.Channel): An open channel with confirms enabled.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.closed = False
+        self._next_tag = 1  # Delivery tag the broker will assign to the next message
+        self._pending: Dict[int, asyncio.Future] = {}  # Unconfirmed messages, oldest first
+        channel.add_on_close_callback(self._on_close)
+
+    def publish(self, routing_key: str, body: bytes, exchange: str = '',
+                properties: pika.BasicProperties = PERSISTENT) -> asyncio.Future:
+        """
+        Publish a message, by default to a queue through the default exchange.
+
+        Args:
+            routing_key (str): The name of the queue, or the routing key for an exchange.
+            body (bytes): The message body.
+            exchange (str): The name of the exchange, '' for the default exchange.
+            properties (pika.BasicProperties): The message properties.
+
+        Returns:
+            asyncio.Future: Resolved when the broker confirms the message.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.channel.basic_publish(exchange=exchange, routing_key=routing_key, body=body, properties=properties)
+        self._pending[self._next_tag] = future
+        self._next_tag += 1
+        return future
+
+    def on_confirm(self, method_frame):
+        # Resolve the futures covered by a Basic.Ack or Basic.Nack
+        method = method_frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        if method.multiple:
+            tags = []
+            for tag in self._pending:
+                if tag > method.delivery_tag:
+                    break
+                tags.append(tag)
+        else:
+            tags = [method.delivery_tag]
+        for tag in tags:
+            future = self._pending.pop(tag, None)
+            if future is None or future.done():
+                continue
+            if acked:
+                future.set_result(None)
+            else:
+                future.set_exception(PublishError("Message was rejected by the broker"))
+
+    def _on_close(self, channel, reason):
+        # Fail every unconfirmed message: the broker will not confirm them anymore
+        self.closed = True
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(PublishError(f"Channel closed before confirming: {reason}"))
+        self._pending.clear()
+
+
+class Publisher:
+    """
+    Long-lived RabbitMQ publisher with a pool of confirm channels and a declared-queue cache.
+
+    One connection is opened on first use and kept for the life of the process, with a
+    fixed number of channels used in turn. Each queue and exchange is declared once per
+    connection.
+    Publishing returns as soon as the message is written; the broker confirms are
+    awaited asynchronously, so many messages can be in flight on each channel.
+
+    Args:
+        parameters (pika.ConnectionParameters, optional): Broker address and credentials.
+        channels (int): Number of channels in the pool.
+        confirm_timeout (float): Seconds to wait for the broker to confirm a message.
+    """
+
+    def __init__(self, parameters: Optional[pika.ConnectionParameters] = None, channels: int = PUBLISHER_CHANNELS,
+                 confirm_timeout: float = PUBLISH_CONFIRM_TIMEOUT):
+        self.parameters = parameters or pika.ConnectionParameters(
+            host=rabbitmq_host,
+            port=rabbitmq_port,
+            credentials=pika.PlainCredentials(rabbitmq_user, rabbitmq_pass),
+        )
+        self.size = max(1, channels)
+        self.confirm_timeout = confirm_timeout
+        self._connection: Optional[AsyncioConnection] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connecting: Optional[asyncio.Future] = None
+        self._channels: List[ConfirmChannel] = []
+        self._next_channel = 0
+        self._declared: Set[str] = set()  # Queues declared on the current connection
+        self._exchanges: Set[str] = set()  # Exchanges declared on the current connection
+        self._declaring: Dict[Tuple[str, str], asyncio.Future] = {}  # ("queue" or "exchange", name) in flight
+        self.connects = 0  # Connections opened so far
+        self.published = 0  # Messages published
+        self.confirmed = 0  # Messages confirmed by the broker
+        self.failed = 0  # Messages nacked, unconfirmed or not sent
+
+    def _is_connected(self) -> bool:
+        return (self._connection is not None and self._connection.is_open
+                and self._loop is asyncio.get_running_loop())
+
+    async def _connect(self):
+        # Open the connection and the channel pool on the running event loop
+        loop = asyncio.get_running_loop()
+        opened = loop.create_future()
+
+        def on_open(connection):
+            if not opened.done():
+                opened.set_result(connection)
+
+        def on_open_error(connection, error):
+            if not opened.done():
+                opened.set_exception(PublishError(f"Could not connect to RabbitMQ: {error}"))
+
+        connection = AsyncioConnection(
+            self.parameters,
+            on_open_callback=on_open,
+            on_open_error_callback=on_open_error,
+            custom_ioloop=loop,
+        )
+        await opened
+        channels = await asyncio.gather(*(self._open_channel(connection) for _ in range(self.size)))
+        self._declared.clear()  # Declarations are re-checked on a new connection
+        self._exchanges.clear()
+        self._channels = list(channels)
+        self._connection = connection  # Published last: callers now see a fully open pool
+        self._loop = loop
+        self.connects += 1
+
+    async def _open_channel(self, connection: AsyncioConnection) -> ConfirmChannel:
+        # Open one channel and enable publisher confirms on it
+        loop = asyncio.get_running_loop()
+        opened = loop.create_future()
+        connection.channel(on_open_callback=opened.set_result)
+        channel = await opened
+        selected = loop.create_future()
+        confirm_channel = ConfirmChannel(channel)
+        channel.confirm_delivery(ack_nack_callback=confirm_channel.on_confirm,
+                                 callback=lambda frame: selected.set_result(None))
+        await selected
+        return confirm_channel
+
+    async def _ensure_connected(self):
+        # Connect once, sharing the attempt between concurrent callers
+        if self._is_connected():
+            return
+        if self._connecting is None or self._connecting.get_loop() is not asyncio.get_running_loop():
+            self._connecting = asyncio.ensure_future(self._connect())
+        connecting = self._connecting
+        try:
+            await asyncio.shield(connecting)
+        finally:
+            if connecting.done() and self._connecting is connecting:
+                self._connecting = None
+
+    async def _channel(self) -> ConfirmChannel:
+        # Return the next channel of the pool, reopening it if the broker closed it
+        await self._ensure_connected()
+        index = self._next_channel % self.size
+        self._next_channel += 1
+        if self._channels[index].closed:
+            self._channels[index] = await self._open_channel(self._connection)
+        return self._channels[index]
+
+    async def _declare(self, kind: str, name: str, exchange_type: str):
+        # Send Queue.Declare or Exchange.Declare and wait for the DeclareOk
+        channel = await self._channel()
+        declared = asyncio.get_running_loop().create_future()
+
+        def callback(frame):
+            if not declared.done():
+                declared.set_result(None)
+
+        if kind == "queue":
+            channel.channel.queue_declare(queue=name, durable=True, callback=callback)
+        else:
+            channel.channel.exchange_declare(exchange=name, exchange_type=exchange_type, durable=True,
+                                             callback=callback)
+        try:
+            await asyncio.wait_for(declared, self.confirm_timeout)
+        except asyncio.TimeoutError:
+            raise PublishError(f"{kind.capitalize()} {name} could not be declared within {self.confirm_timeout}s")
+        (self._declared if kind == "queue" else self._exchanges).add(name)
+
+    async def _declare_once(self, kind: str, name: str, exchange_type: str = ""):
+        # Declare unless already declared on this connection, sharing concurrent declarations
+        if name in (self._declared if kind == "queue" else self._exchanges) and self._is_connected():
+            return
+        key = (kind, name)
+        declaring = self._declaring.get(key)
+        if declaring is None or declaring.get_loop() is not asyncio.get_running_loop():
+            declaring = asyncio.ensure_future(self._declare(kind, name, exchange_type))
+            self._declaring[key] = declaring
+            declaring.add_done_callback(lambda task: self._declaring.pop(key, None)
+                                        if self._declaring.get(key) is task else None)
+        await asyncio.shield(declaring)
+
+    async def declare(self, queue_name: str):
+        """
+        Declare a durable queue unless it was already declared on this connection.
+
+        Concurrent calls for the same queue share one declaration.
+
+        Args:
+            queue_name (str): The name of the queue.
+
+        Raises:
+            PublishError: If the broker did not answer the declaration in time.
+        """
+        await self._declare_once("queue", queue_name)
+
+    async def declare_exchange(self, exchange: str, exchange_type: str = "topic"):
+        """
+        Declare a durable exchange unless it was already declared on this connection.
+
+        Concurrent calls for the same exchange share one declaration.
+
+        Args:
+            exchange (str): The name of the exchange.
+            exchange_type (str): The type of the exchange, e.g. "topic" or "fanout".
+
+        Raises:
+            PublishError: If the broker did not answer the declaration in time.
+        """
+        await self._declare_once("exchange", exchange, exchange_type)
+
+    async def publish(self, queue_name: str, body: bytes):
+        """
+        Publish one message and wait for the broker to confirm it.
+
+        Args:
+            queue_name (str): The name of the queue.
+            body (bytes): The message body.
+
+        Raises:
+            PublishError: If the broker rejected the message or did not confirm it in time.
+        """
+        await self.publish_many(queue_name, [body])
+
+    async def publish_many(self, queue_name: str, bodies: List[bytes]) -> int:
+        """
+        Publish several messages back to back and wait for all of their confirms.
+
+        The time from publishing to the last confirm is recorded, with confirmed
+        messages and failed calls, under the "single" or "batch" operation label.
+
+        Args:
+            queue_name (str): The name of the queue.
+            bodies (List[bytes]): The message bodies, published in order on one channel.
+
+        Returns:
+            int: The number of messages confirmed.
+
+        Raises:
+            PublishError: If any message was rejected or not confirmed in time.
+        """
+        operation = "single" if len(bodies) == 1 else "batch"
+        return await self._publish_confirmed(operation, self.declare(queue_name), '',
+                                             [(queue_name, body) for body in bodies], PERSISTENT)
+
+    async def publish_to_exchange(self, exchange: str, messages: List[Tuple[str, bytes]],
+                                  properties: pika.BasicProperties = PERSISTENT,
+                                  exchange_type: str = "topic") -> int:
+        """
+        Publish messages to an exchange back to back and wait for all of their confirms.
+
+        The exchange is declared first if needed. Messages go out in order on one channel,
+        so consumers of a routing key receive them in publish order. Latency and counters
+        are recorded under the "exchange" operation label.
+
+        Args:
+            exchange (str): The name of the exchange.
+            messages (List[Tuple[str, bytes]]): (routing key, body) of every message.
+            properties (pika.BasicProperties): The properties of every message.
+            exchange_type (str): The type the exchange is declared with.
+
+        Returns:
+            int: The number of messages confirmed.
+
+        Raises:
+            PublishError: If any message was rejected or not confirmed in time.
+        """
+        return await self._publish_confirmed("exchange", self.declare_exchange(exchange, exchange_type), exchange,
+                                             messages, properties)
+
+    async def _publish_confirmed(self, operation: str, declaration, exchange: str,
+                                 messages: List[Tuple[str, bytes]], properties: pika.BasicProperties) -> int:
+        # Declare the destination, publish on one channel and await every confirm, recording metrics
+        began = time.perf_counter()
+        try:
+            await declaration
+            channel = await self._channel()
+        except Exception:
+            PUBLISH_FAILURES.labels(operation).inc()
+            raise
+        confirms = [channel.publish(routing_key, body, exchange, properties) for routing_key, body in messages]
+        self.published += len(confirms)
+        try:
+            await asyncio.wait_for(asyncio.gather(*confirms), self.confirm_timeout)
+        except asyncio.TimeoutError:
+            raise PublishError(f"Broker did not confirm {len(confirms)} message(s) within {self.confirm_timeout}s")
+        finally:
+            confirmed = sum(1 for confirm in confirms if confirm.done() and not confirm.cancelled()
+                            and confirm.exception() is None)
+            self.confirmed += confirmed
+            self.failed += len(confirms) - confirmed
+            PUBLISHED_MESSAGES.labels(operation).inc(confirmed)
+            if confirmed < len(confirms):
+                PUBLISH_FAILURES.labels(operation).inc()
+            PUBLISH_LATENCY.labels(operation).observe(time.perf_counter() - began)
+        return len(confirms)
+
+    async def close(self):
+        """
+        Close the connection and every pooled channel.
+        """
+        connection, self._connection = self._connection, None
+        self._channels = []
+        if connection is not None and connection.is_open and self._loop is asyncio.get_running_loop():
+            closed = self._loop.create_future()
+            connection.add_on_close_callback(lambda conn, reason: closed.done() or closed.set_result(None))
+            connection.close()
+            await closed
+
+    def stats(self) -> dict:
+        """
+        Return the counters of the publisher.
+
+        Returns:
+            dict: Connection state, pool size, declared queues and exchanges and message counters.
+        """
+        return {
+            "connected": self._connection is not None and self._connection.is_open,
+            "channels": self.size,
+            "connects": self.connects,
+            "declared_queues": sorted(self._declared),
+            "declared_exchanges": sorted(self._exchanges),
+            "published": self.published,
+            "confirmed": self.confirmed,
+            "failed": self.failed,
+        }
+
+
+# Shared publisher, created on first use
+_publisher: Optional[Publisher] = None
+
+
+def get_publisher() -> Publisher:
+    """
+    Return the shared publisher, creating it on first use.
+
+    Returns:
+        Publisher: The publisher used by the publish endpoints.
+    """
+    global _publisher
+    if _publisher is None:
+        _publisher = Publisher()
+    return _publisher
+
+
+def set_publisher(publisher: Optional[Publisher]):
+    """
+    Replace the shared publisher (used by tests and benchmarks).
+
+    Args:
+        publisher (Publisher, optional): The new publisher, or None to create one on next use.
+    """
+    global _publisher
+    _publisher = publisher
+
+
+async def publish_message(queue_name: str, message: str):
     """
     Publish a message to a specified RabbitMQ queue.
-    
+
     Args:
         queue_name (str): The name of the queue to publish the message to.
         message (str): The message to be published.
+
+    Raises:
+        PublishError: If the broker did not confirm the message.
     """
-    # Set up credentials for connecting to RabbitMQ
-    credentials = pika.PlainCredentials(rabbitmq_user, rabbitmq_pass)
-    # Establish a blocking connection to RabbitMQ
-    connection = pika.BlockingConnection(pika.ConnectionParameters(host=rabbitmq_host, credentials=credentials))
-    # Create a channel for communication
-    channel = connection.channel()
-    
-    # Declare a queue to ensure it exists and is durable
-    channel.queue_declare(queue=queue_name, durable=True)
-    
-    # Publish the message to the specified queue with persistence properties
-    channel.basic_publish(
-        exchange='',
-        routing_key=queue_name,
-        body=json.dumps({'message': message}),  # Convert the message to JSON format
-        properties=pika.BasicProperties(
-            delivery_mode=2,  # Make message persistent
-        )
-    )
-    
-    # Close the connection to RabbitMQ
-    connection.close()
+    await get_publisher().publish(queue_name, encode_message(message))
+
+
+async def publish_messages(queue_name: str, messages: List[str]) -> int:
+    """
+    Publish a batch of messages to a specified RabbitMQ queue.
+
+    Args:
+        queue_name (str): The name of the queue to publish the messages to.
+        messages (List[str]): The messages to be published, in order.
+
+    Returns:
+        int: The number of messages confirmed by the broker.
+
+    Raises:
+        PublishError: If any message was not confirmed.
+    """
+    return await get_publisher().publish_many(queue_name, [encode_message(message) for message in messages])
@@ -0,0 +1,361 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import orjson
+
+from .candle_store import CANDLES_PER_REQUEST, granularity_seconds, split_pages
+
+# Location of the SQLite database holding backfill jobs and the progress of their chunks
+BACKFILL_DB_PATH = os.getenv("BACKFILL_DB_PATH", "data/backfill.sqlite3")
+
+# Queue the chunks of backfill jobs are published to and consumed from
+BACKFILL_QUEUE = os.getenv("BACKFILL_QUEUE", "backfill_chunks")
+
+# Candles fetched by one chunk; a chunk spans several upstream pages
+BACKFILL_CHUNK_CANDLES = int(os.getenv("BACKFILL_CHUNK_CANDLES", str(CANDLES_PER_REQUEST * 10)))
+
+# Maximum number of chunks of one job
+BACKFILL_MAX_CHUNKS = int(os.getenv("BACKFILL_MAX_CHUNKS", "10000"))
+
+# Attempts at a chunk before it is given up until the job is submitted again
+BACKFILL_MAX_ATTEMPTS = int(os.getenv("BACKFILL_MAX_ATTEMPTS", "6"))
+
+# Job states reported to clients
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    product_ids TEXT NOT NULL,
+    granularity TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    created REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS chunks (
+    job_id TEXT NOT NULL,
+    chunk INTEGER NOT NULL,
+    product_id TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    candles INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    PRIMARY KEY (job_id, chunk)
+) WITHOUT ROWID;
+"""
+
+
+def plan_chunks(product_ids: List[str], granularity: str, start: int, end: int,
+                chunk_candles: int = BACKFILL_CHUNK_CANDLES) -> List[Tuple[str, int, int]]:
+    """
+    Split a backfill into chunks of at most chunk_candles candles per product.
+
+    Args:
+        product_ids (List[str]): The IDs of the products.
+        granularity (str): The Coinbase granularity name.
+        start (int): Start of the range as a UNIX timestamp.
+        end (int): End of the range as a UNIX timestamp.
+        chunk_candles (int): Maximum number of candles per chunk.
+
+    Returns:
+        List[Tuple[str, int, int]]: (product_id, first, last) candle starts of every
+        chunk, product by product.
+
+    Raises:
+        ValueError: If the granularity is unsupported.
+    """
+    step = granularity_seconds(granularity)
+    first = -(-start // step) * step  # First candle start at or after start
+    last = end // step * step  # Last candle start at or before end
+    if first > last:
+        return []
+    pages = split_pages(first, last, step, chunk_candles)
+    return [(product_id, page_start, page_end) for product_id in product_ids for page_start, page_end in pages]
+
+
+def job_id_for(product_ids: List[str], granularity: str, start: int, end: int) -> str:
+    """
+    Derive the ID of a backfill job from what it fetches.
+
+    Submitting the same backfill again yields the same job, so it resumes instead of
+    fetching everything twice.
+
+    Args:
+        product_ids (List[str]): The IDs of the products.
+        granularity (str): The Coinbase granularity name.
+        start (int): Start of the range as a UNIX timestamp.
+        end (int): End of the range as a UNIX timestamp.
+
+    Returns:
+        str: A 16-character hexadecimal ID.
+    """
+    spec = f"{','.join(sorted(product_ids))}|{granularity}|{start}|{end}"
+    return hashlib.sha1(spec.encode()).hexdigest()[:16]
+
+
+def encode_chunk(job_id: str, chunk: int, product_id: str, granularity: str, start: int, end: int) -> bytes:
+    """
+    Encode a chunk as the body of a backfill message.
+
+    Args:
+        job_id (str): The ID of the job.
+        chunk (int): The index of the chunk within the job.
+        product_id (str): The ID of the product.
+        granularity (str): The Coinbase granularity name.
+        start (int): First candle start of the chunk.
+        end (int): Last candle start of the chunk.
+
+    Returns:
+        bytes: The JSON message body.
+    """
+    return orjson.dumps({"job_id": job_id, "chunk": chunk, "product_id": product_id,
+                         "granularity": granularity, "start": start, "end": end})
+
+
+def decode_chunk(body: bytes) -> dict:
+    """
+    Decode the body of a backfill message.
+
+    Args:
+        body (bytes): The message body.
+
+    Returns:
+        dict: The job_id, chunk, product_id, granularity, start and end of the chunk.
+
+    Raises:
+        ValueError: If the body is not a backfill chunk.
+    """
+    try:
+        chunk = orjson.loads(body)
+        return {key: chunk[key] for key in ("job_id", "chunk", "product_id", "granularity", "start", "end")}
+    except (orjson.JSONDecodeError, KeyError, TypeError):
+        raise ValueError(f"Invalid backfill message: {body[:100]!r}")
+
+
+class BackfillJobs:
+    """
+    Persistent SQLite registry of backfill jobs and the progress of their chunks.
+
+    The API records jobs and publishes their chunks; workers mark chunks done as they
+    fetch them. Marking a chunk is idempotent, so redelivered messages and jobs
+    submitted twice do not count anything twice. A chunk that failed max_attempts times
+    is given up; once every unfinished chunk of a job is, the job is reported failed
+    until it is submitted again. The database is shared by the API and the workers
+    through its path.
+
+    Args:
+        path (str): Path of the SQLite database, or ":memory:".
+        chunk_candles (int): Maximum number of candles per chunk.
+        max_chunks (int): Maximum number of chunks of one job.
+        max_attempts (int): Failed attempts after which a chunk is given up.
+        clock (Callable[[], float]): Wall-clock time source, replaceable in tests.
+    """
+
+    def __init__(self, path: str = BACKFILL_DB_PATH, chunk_candles: int = BACKFILL_CHUNK_CANDLES,
+                 max_chunks: int = BACKFILL_MAX_CHUNKS, max_attempts: int = BACKFILL_MAX_ATTEMPTS,
+                 clock: Callable[[], float] = time.time):
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.chunk_candles = chunk_candles
+        self.max_chunks = max_chunks
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self._lock = threading.Lock()  # sqlite3 connections must not be used concurrently
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        """
+        Close the underlying database connection.
+        """
+        with self._lock:
+            self._db.close()
+
+    def submit(self, product_ids: List[str], granularity: str, start: int, end: int) -> Tuple[str, List[bytes]]:
+        """
+        Record a backfill job, or find the same job submitted before.
+
+        Args:
+            product_ids (List[str]): The IDs of the products.
+            granularity (str): The Coinbase granularity name.
+            start (int): Start of the range as a UNIX timestamp.
+            end (int): End of the range as a UNIX timestamp.
+
+        Returns:
+            Tuple[str, List[bytes]]: The job ID and the messages of its chunks not done yet,
+            to be published. Chunks that were given up get max_attempts new attempts.
+
+        Raises:
+            ValueError: If the granularity or a product ID is invalid, no product is given
+            or the job has too many chunks.
+        """
+        product_ids = list(dict.fromkeys(product_id.strip() for product_id in product_ids if product_id.strip()))
+        if not product_ids:
+            raise ValueError("At least one product ID is required")
+        for product_id in product_ids:
+            if "," in product_id:
+                raise ValueError(f"Invalid product ID: {product_id}")
+        chunks = plan_chunks(product_ids, granularity, start, end, self.chunk_candles)
+        if len(chunks) > self.max_chunks:
+            raise ValueError(f"Backfill would need {len(chunks)} chunks, at most {self.max_chunks} are allowed")
+        job_id = job_id_for(product_ids, granularity, start, end)
+        with self._lock, self._db:
+            self._db.execute("INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, ?, ?, ?)",
+                             (job_id, ",".join(product_ids), granularity, start, end, self.clock()))
+            self._db.executemany(
+                "INSERT OR IGNORE INTO chunks (job_id, chunk, product_id, start, end) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, index, product_id, first, last) for index, (product_id, first, last) in enumerate(chunks)],
+            )
+            self._db.execute("UPDATE chunks SET attempts = 0 WHERE job_id = ? AND done = 0 AND attempts >= ?",
+                             (job_id, self.max_attempts))
+            pending = self._db.execute(
+                "SELECT chunk, product_id, start, end FROM chunks WHERE job_id = ? AND done = 0 ORDER BY chunk",
+                (job_id,),
+            ).fetchall()
+        return job_id, [encode_chunk(job_id, index, product_id, granularity, first, last)
+                        for index, product_id, first, last in pending]
+
+    def is_done(self, job_id: str, chunk: int) -> bool:
+        """
+        Tell whether a chunk was already fetched.
+
+        Args:
+            job_id (str): The ID of the job.
+            chunk (int): The index of the chunk.
+
+        Returns:
+            bool: True when the chunk is done.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT done FROM chunks WHERE job_id = ? AND chunk = ?", (job_id, chunk)).fetchone()
+        return bool(row and row[0])
+
+    def complete(self, job_id: str, chunk: int, candles: int):
+        """
+        Mark a chunk as fetched.
+
+        Args:
+            job_id (str): The ID of the job.
+            chunk (int): The index of the chunk.
+            candles (int): Candles stored for the range of the chunk.
+        """
+        with self._lock, self._db:
+            self._db.execute("UPDATE chunks SET done = 1, candles = ?, attempts = attempts + 1, error = NULL "
+                             "WHERE job_id = ? AND chunk = ?", (candles, job_id, chunk))
+
+    def fail(self, job_id: str, chunk: int, error: str):
+        """
+        Record a failed attempt at a chunk, which stays to be done.
+
+        Args:
+            job_id (str): The ID of the job.
+            chunk (int): The index of the chunk.
+            error (str): Description of the failure.
+        """
+        with self._lock, self._db:
+            self._db.execute("UPDATE chunks SET attempts = attempts + 1, error = ? "
+                             "WHERE job_id = ? AND chunk = ? AND done = 0", (error, job_id, chunk))
+
+    def attempts(self, job_id: str, chunk: int) -> Optional[int]:
+        """
+        Return the number of attempts at a chunk.
+
+        Args:
+            job_id (str): The ID of the job.
+            chunk (int): The index of the chunk.
+
+        Returns:
+            int, optional: The attempts recorded, or None if the chunk is unknown.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT attempts FROM chunks WHERE job_id = ? AND chunk = ?",
+                                   (job_id, chunk)).fetchone()
+        return row[0] if row else None
+
+    def job(self, job_id: str) -> Optional[dict]:
+        """
+        Return a job and its progress.
+
+        Args:
+            job_id (str): The ID of the job.
+
+        Returns:
+            dict, optional: The job parameters, its status ("queued", "running", "done" or "failed"),
+            chunk and candle counts and the latest chunk errors; None if the job is unknown.
+        """
+        with self._lock:
+            job = self._db.execute("SELECT product_ids, granularity, start, end, created FROM jobs WHERE job_id = ?",
+                                   (job_id,)).fetchone()
+            if job is None:
+                return None
+            chunks, done, candles, attempts = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(done), 0), COALESCE(SUM(candles), 0), COALESCE(SUM(attempts), 0) "
+                "FROM chunks WHERE job_id = ?", (job_id,),
+            ).fetchone()
+            exhausted = self._db.execute(
+                "SELECT COUNT(*) FROM chunks WHERE job_id = ? AND done = 0 AND attempts >= ?",
+                (job_id, self.max_attempts),
+            ).fetchone()[0]
+            errors = self._db.execute(
+                "SELECT chunk, product_id, error FROM chunks WHERE job_id = ? AND done = 0 AND error IS NOT NULL "
+                "ORDER BY chunk LIMIT 10", (job_id,),
+            ).fetchall()
+        product_ids, granularity, start, end, created = job
+        if done == chunks:
+            status = DONE
+        elif done + exhausted == chunks:
+            status = FAILED  # Every unfinished chunk was given up; submitting the job again retries them
+        else:
+            status = RUNNING if attempts else QUEUED
+        return {
+            "job_id": job_id,
+            "status": status,
+            "product_ids": product_ids.split(","),
+            "granularity": granularity,
+            "start": start,
+            "end": end,
+            "created": created,
+            "chunks": chunks,
+            "chunks_done": done,
+            "progress": done / chunks if chunks else 1.0,
+            "candles": candles,
+            "errors": [{"chunk": chunk, "product_id": product_id, "error": error} for chunk, product_id, error in errors],
+        }
+
+
+# Shared registry, opened on first use
+_jobs: Optional[BackfillJobs] = None
+
+
+def get_backfill_jobs() -> BackfillJobs:
+    """
+    Return the shared backfill job registry, opening it on first use.
+
+    Returns:
+        BackfillJobs: The registry at BACKFILL_DB_PATH.
+    """
+    global _jobs
+    if _jobs is None:
+        _jobs = BackfillJobs()
+    return _jobs
+
+
+def set_backfill_jobs(jobs: Optional[BackfillJobs]):
+    """
+    Replace the shared backfill job registry (used by tests).
+
+    Args:
+        jobs (BackfillJobs, optional): The registry to use, or None to reopen the default one.
+    """
+    global _jobs
+    _jobs = jobs
@@ -0,0 +1,94 @@
+import asyncio
+import os
+from typing import AsyncIterator, Awaitable, Callable, List
+
+import httpx
+
+from .scheduler import error_status
+
+# Maximum number of products fetched from upstream at the same time for one batch request
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+
+# Maximum number of products accepted in one batch request
+BATCH_MAX_PRODUCTS = int(os.getenv("BATCH_MAX_PRODUCTS", "200"))
+
+
+def parse_product_ids(value: str, limit: int = BATCH_MAX_PRODUCTS) -> List[str]:
+    """
+    Parse a comma-separated list of product IDs, dropping blanks and duplicates.
+
+    Args:
+        value (str): The product IDs, e.g. "BTC-USD,ETH-USD".
+        limit (int): Maximum number of distinct products allowed.
+
+    Returns:
+        List[str]: The product IDs in request order.
+
+    Raises:
+        ValueError: If the list is empty or longer than the limit.
+    """
+    product_ids = list(dict.fromkeys(p.strip() for p in value.split(",") if p.strip()))
+    if not product_ids:
+        raise ValueError("At least one product_id is required")
+    if len(product_ids) > limit:
+        raise ValueError(f"At most {limit} product_ids are allowed per batch, got {len(product_ids)}")
+    return product_ids
+
+
+def error_result(product_id: str, error: Exception) -> dict:
+    """
+    Describe a failed product fetch so it can be reported inline.
+
+    Args:
+        product_id (str): The ID of the product.
+        error (Exception): The exception raised while fetching it.
+
+    Returns:
+        dict: The product ID, an error message, the status code of the upstream error
+        (or the one we would answer with) and, when throttled, the seconds to wait.
+    """
+    status, retry_after = error_status(error)
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+    result = {"product_id": product_id, "error": str(error) or type(error).__name__, "status": status}
+    if retry_after is not None:
+        result["retry_after"] = retry_after
+    return result
+
+
+async def fan_out(
+        product_ids: List[str],
+        fetch: Callable[[str], Awaitable],
+        concurrency: int = BATCH_CONCURRENCY,
+) -> AsyncIterator[dict]:
+    """
+    Fetch every product concurrently and yield each result as soon as it completes.
+
+    At most `concurrency` fetches run at once. A failing product yields an error
+    result instead of aborting the batch. If the consumer stops iterating (for example
+    because the client disconnected) the fetches still running are cancelled.
+
+    Args:
+        product_ids (List[str]): The products to fetch.
+        fetch (Callable): Coroutine function taking a product ID and returning its data.
+        concurrency (int): Maximum number of fetches in flight.
+
+    Yields:
+        dict: {"product_id", "data"} on success or {"product_id", "error", "status"} on failure.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(product_id: str) -> dict:
+        async with semaphore:
+            try:
+                return {"product_id": product_id, "data": await fetch(product_id)}
+            except Exception as e:
+                return error_result(product_id, e)
+
+    tasks = [asyncio.ensure_future(run(product_id)) for product_id in product_ids]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()  # No-op for finished tasks, stops the rest if the consumer went away
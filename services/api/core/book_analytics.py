@@ -0,0 +1,152 @@
+import os
+from typing import Dict, List
+
+import numpy as np
+
+# Maximum number of order sizes, and of depth bands, accepted in one analytics request
+ANALYTICS_MAX_SIZES = int(os.getenv("ANALYTICS_MAX_SIZES", "100"))
+
+# Depth bands (basis points around the mid price) reported when none are requested
+DEFAULT_DEPTH_BPS = (10.0, 50.0, 100.0)
+
+
+def parse_numbers(spec: str, name: str, limit: int = ANALYTICS_MAX_SIZES) -> List[float]:
+    """
+    Parse a comma-separated list of positive numbers, such as order sizes or depth bands.
+
+    Args:
+        spec (str): The numbers, e.g. "0.1,1,10".
+        name (str): Name of the parameter, used in error messages.
+        limit (int): Maximum number of values allowed.
+
+    Returns:
+        List[float]: The distinct values in request order.
+
+    Raises:
+        ValueError: If a value is not a positive finite number or there are too many values.
+    """
+    values = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        try:
+            value = float(item)
+        except ValueError:
+            raise ValueError(f"Invalid {name}: {item.strip()}")
+        if not np.isfinite(value) or value <= 0:
+            raise ValueError(f"Invalid {name}: {item.strip()}")
+        values.append(value)
+    values = list(dict.fromkeys(values))
+    if len(values) > limit:
+        raise ValueError(f"At most {limit} {name} values are allowed, got {len(values)}")
+    return values
+
+
+def pricebook_to_arrays(pricebook: dict) -> Dict[str, np.ndarray]:
+    """
+    Parse the levels of a product book into NumPy columns, best price first.
+
+    Args:
+        pricebook (dict): The "pricebook" object of a product book, with price and size strings.
+
+    Returns:
+        Dict[str, np.ndarray]: float64 "bid_price", "bid_size", "ask_price" and "ask_size"
+        columns; bids in descending and asks in ascending price order.
+    """
+    columns = {}
+    for side, key, sign in (("bid", "bids", -1), ("ask", "asks", 1)):
+        levels = pricebook.get(key) or []
+        prices = np.array([level["price"] for level in levels], dtype=np.float64)
+        sizes = np.array([level["size"] for level in levels], dtype=np.float64)
+        order = np.argsort(sign * prices, kind="stable")
+        columns[f"{side}_price"], columns[f"{side}_size"] = prices[order], sizes[order]
+    return columns
+
+
+def _fill(prices: np.ndarray, sizes: np.ndarray, amounts: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Walk one side of the book for every order size at once.
+
+    Args:
+        prices (np.ndarray): Level prices, best first.
+        sizes (np.ndarray): Level sizes.
+        amounts (np.ndarray): Order sizes in base currency.
+
+    Returns:
+        Dict[str, np.ndarray]: Per order size, the "filled" size (less than requested when
+        the book is too thin), the "vwap" of the fill and the "worst_price" reached.
+    """
+    if len(prices) == 0:
+        nan = np.full(len(amounts), np.nan)
+        return {"filled": np.zeros(len(amounts)), "vwap": nan, "worst_price": nan}
+    cum_size = np.cumsum(sizes)
+    cum_notional = np.cumsum(prices * sizes)
+    filled = np.minimum(amounts, cum_size[-1])
+    last = np.minimum(np.searchsorted(cum_size, filled, side="left"), len(prices) - 1)  # Level completing the fill
+    before = np.where(last > 0, cum_size[last - 1], 0.0)  # Size taken from the levels ahead of it
+    notional = np.where(last > 0, cum_notional[last - 1], 0.0) + (filled - before) * prices[last]
+    return {"filled": filled, "vwap": notional / filled, "worst_price": prices[last]}
+
+
+def analyze_book(columns: Dict[str, np.ndarray], sizes: List[float], depth_bps: List[float]) -> dict:
+    """
+    Compute spread, depth, imbalance and the cost of market orders from order book columns.
+
+    Depth within N basis points is the cumulative size of the levels priced within N bps
+    of the mid, found with searchsorted on the sorted prices. Imbalance is
+    (bid depth - ask depth) / (bid depth + ask depth), from -1 (only asks) to 1 (only
+    bids). Market orders are filled level by level from the cumulative sizes and
+    notionals; slippage is the distance between their VWAP and the mid, in bps,
+    positive when the order pays more (buys) or receives less (sells) than the mid.
+
+    Args:
+        columns (Dict[str, np.ndarray]): Book columns as returned by pricebook_to_arrays.
+        sizes (List[float]): Market order sizes, in base currency.
+        depth_bps (List[float]): Depth bands, in basis points around the mid.
+
+    Returns:
+        dict: Top of book, per-band "depth" columns and per-size "buy" and "sell" columns.
+        Values that cannot be computed on an empty side are NaN.
+    """
+    bid_price, bid_size = columns["bid_price"], columns["bid_size"]
+    ask_price, ask_size = columns["ask_price"], columns["ask_size"]
+    best_bid = bid_price[0] if len(bid_price) else np.nan
+    best_ask = ask_price[0] if len(ask_price) else np.nan
+    mid = (best_bid + best_ask) / 2
+
+    bands = np.asarray(depth_bps, dtype=np.float64)
+    if np.isnan(mid):
+        bid_depth = ask_depth = np.full(len(bands), np.nan)  # No mid to measure depth from
+    else:
+        cum_bid = np.r_[0.0, np.cumsum(bid_size)]
+        cum_ask = np.r_[0.0, np.cumsum(ask_size)]
+        # Bids are sorted descending, so they are searched on their negated prices
+        bid_depth = cum_bid[np.searchsorted(-bid_price, -mid * (1 - bands / 10_000), side="right")]
+        ask_depth = cum_ask[np.searchsorted(ask_price, mid * (1 + bands / 10_000), side="right")]
+    total = bid_depth + ask_depth
+    with np.errstate(invalid="ignore", divide="ignore"):
+        imbalance = np.where(total > 0, (bid_depth - ask_depth) / total, np.nan)
+    top_bid = float(bid_size[0]) if len(bid_size) else 0.0
+    top_ask = float(ask_size[0]) if len(ask_size) else 0.0
+    top_imbalance = (top_bid - top_ask) / (top_bid + top_ask) if top_bid + top_ask > 0 else np.nan
+
+    amounts = np.asarray(sizes, dtype=np.float64)
+    buy = _fill(ask_price, ask_size, amounts)
+    sell = _fill(bid_price, bid_size, amounts)
+    buy["slippage_bps"] = (buy["vwap"] - mid) / mid * 10_000
+    sell["slippage_bps"] = (mid - sell["vwap"]) / mid * 10_000
+
+    return {
+        "best_bid": float(best_bid),
+        "best_ask": float(best_ask),
+        "mid": float(mid),
+        "spread": float(best_ask - best_bid),
+        "spread_bps": float((best_ask - best_bid) / mid * 10_000),
+        "bid_levels": len(bid_price),
+        "ask_levels": len(ask_price),
+        "top_imbalance": float(top_imbalance),
+        "depth": {"bps": bands, "bid": bid_depth, "ask": ask_depth, "imbalance": imbalance},
+        "sizes": amounts,
+        "buy": buy,
+        "sell": sell,
+    }
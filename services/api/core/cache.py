@@ -0,0 +1,259 @@
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from .resilience import is_upstream_failure, mark_stale
+from .scheduler import BACKGROUND, upstream_priority
+
+# Registry of every cache created, used to expose their counters
+_caches: Dict[str, "TTLCache"] = {}
+
+
+class CacheEntry:
+    """
+    A cached value along with the times at which it goes stale and expires.
+    """
+    __slots__ = ("value", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, fresh_until: float, stale_until: float):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with per-entry TTL, stale-while-revalidate and single-flight fetching.
+
+    Fresh entries are returned directly. Entries past their TTL but still within the
+    stale window are returned immediately while one background refresh runs. Concurrent
+    misses for the same key share a single upstream fetch. When a fetch fails because
+    the upstream is unhealthy (timeout, 5xx, open circuit), the last good value is
+    served instead, however old, and the response is marked stale.
+
+    Args:
+        name (str): Name of the cache, used when reporting stats.
+        ttl (float): Seconds an entry is considered fresh.
+        stale_ttl (float): Extra seconds a stale entry may be served while it is refreshed.
+        maxsize (int): Maximum number of entries kept before evicting the least recently used.
+        clock (Callable[[], float]): Monotonic time source, replaceable in tests.
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float = 0.0, maxsize: int = 1024,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}  # Keys currently being fetched
+        self.hits = 0  # Fresh entries served
+        self.stale_hits = 0  # Stale entries served while revalidating
+        self.misses = 0  # Requests that triggered an upstream fetch
+        self.coalesced = 0  # Requests that joined a fetch already in flight
+        self.evictions = 0  # Entries dropped to respect maxsize
+        self.refresh_errors = 0  # Background refreshes that failed
+        self.fallbacks = 0  # Expired values served because the upstream failed
+        _caches[name] = self
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store(self, key: Hashable, value: Any):
+        # Insert or replace an entry and evict the least recently used ones beyond maxsize
+        now = self.clock()
+        self._entries[key] = CacheEntry(value, now + self.ttl, now + self.ttl + self.stale_ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        # Start a fetch for the key unless one is already running on this event loop
+        task = self._inflight.get(key)
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            return task
+
+        async def run():
+            try:
+                value = await fetch()
+                self._store(key, value)
+                return value
+            finally:
+                self._inflight.pop(key, None)
+
+        task = asyncio.ensure_future(run())
+        self._inflight[key] = task
+        return task
+
+    def _on_refresh_done(self, task: asyncio.Task):
+        # Background refresh failures keep the stale value and are only counted
+        if not task.cancelled() and task.exception() is not None:
+            self.refresh_errors += 1
+
+    def peek(self, key: Hashable, fresh_only: bool = False) -> Optional[Any]:
+        """
+        Return the cached value for a key without fetching.
+
+        Args:
+            key (Hashable): The cache key.
+            fresh_only (bool): Ignore entries past their TTL.
+
+        Returns:
+            Any: The cached value, or None if the key is not cached (or not fresh).
+        """
+        entry = self._entries.get(key)
+        if entry is None or (fresh_only and self.clock() >= entry.fresh_until):
+            return None
+        return entry.value
+
+    def fresh_for(self, key: Hashable) -> Optional[float]:
+        """
+        Return how long the entry of a key stays fresh.
+
+        Args:
+            key (Hashable): The cache key.
+
+        Returns:
+            float, optional: Seconds until the entry goes stale (negative once stale), or
+            None if the key is not cached.
+        """
+        entry = self._entries.get(key)
+        return entry.fresh_until - self.clock() if entry is not None else None
+
+    async def refresh(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Fetch the value of a key now and store it, whatever the state of its entry.
+
+        Joins the fetch already in flight for the key, if any.
+
+        Args:
+            key (Hashable): The cache key.
+            fetch (Callable[[], Awaitable[Any]]): Coroutine factory that loads the value.
+
+        Returns:
+            Any: The fetched value.
+        """
+        return await asyncio.shield(self._fetch(key, fetch))
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached value for a key, fetching it when missing or expired.
+
+        Args:
+            key (Hashable): The cache key.
+            fetch (Callable[[], Awaitable[Any]]): Coroutine factory that loads the value.
+
+        Returns:
+            Any: The cached or freshly fetched value.
+
+        Raises:
+            Exception: Whatever the fetch raised, unless it is an upstream failure and a
+            previous value of the key is still held.
+        """
+        now = self.clock()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if now < entry.fresh_until:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry.value
+            if now < entry.stale_until:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                if key not in self._inflight:
+                    with upstream_priority(BACKGROUND):  # Refreshes yield to requests without a cached value
+                        self._fetch(key, fetch).add_done_callback(self._on_refresh_done)
+                return entry.value
+
+        if key in self._inflight:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+        try:
+            # Shield the shared fetch so a cancelled caller does not cancel it for the others
+            return await asyncio.shield(self._fetch(key, fetch))
+        except Exception as e:
+            entry = self._entries.get(key)  # Expired entries are kept until evicted
+            if entry is None or not is_upstream_failure(e):
+                raise
+            self.fallbacks += 1
+            mark_stale(self.name, self.clock() - (entry.fresh_until - self.ttl))
+            return entry.value
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """
+        Drop one entry, or every entry when no key is given.
+
+        Args:
+            key (Hashable, optional): The key to drop.
+        """
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        """
+        Return the counters of this cache.
+
+        Returns:
+            dict: Hit, miss, coalescing and eviction counters plus the current size.
+        """
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "refresh_errors": self.refresh_errors,
+            "fallbacks": self.fallbacks,
+        }
+
+
+def cached(cache: TTLCache):
+    """
+    Decorate an async function so its results are served through the given cache.
+
+    The positional arguments of the call form the cache key.
+
+    Args:
+        cache (TTLCache): The cache to use.
+
+    Returns:
+        Callable: The decorator.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args):
+            return await cache.get_or_fetch(args, lambda: func(*args))
+
+        wrapper.cache = cache  # Expose the cache for invalidation and stats
+        return wrapper
+
+    return decorator
+
+
+def cache_stats() -> dict:
+    """
+    Return the counters of every registered cache.
+
+    Returns:
+        dict: Stats keyed by cache name.
+    """
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+def clear_caches():
+    """
+    Drop every entry of every registered cache.
+    """
+    for cache in _caches.values():
+        cache.invalidate()
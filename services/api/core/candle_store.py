@@ -0,0 +1,413 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+# Seconds per candle for every granularity accepted by Coinbase
+GRANULARITY_SECONDS = {
+    "ONE_MINUTE": 60,
+    "FIVE_MINUTE": 300,
+    "FIFTEEN_MINUTE": 900,
+    "THIRTY_MINUTE": 1800,
+    "ONE_HOUR": 3600,
+    "TWO_HOUR": 7200,
+    "SIX_HOUR": 21600,
+    "ONE_DAY": 86400,
+}
+
+# Location of the SQLite database holding the candles
+CANDLE_STORE_PATH = os.getenv("CANDLE_STORE_PATH", "data/candles.sqlite3")
+
+# Maximum number of candles Coinbase returns for a single candles request
+CANDLES_PER_REQUEST = int(os.getenv("CANDLES_PER_REQUEST", "350"))
+
+# Maximum number of candle pages fetched from upstream at the same time
+CANDLE_FETCH_CONCURRENCY = int(os.getenv("CANDLE_FETCH_CONCURRENCY", "4"))
+
+# Maximum number of missing candle pages a single request may fetch; larger ranges need a backfill job
+CANDLE_MAX_PAGES = int(os.getenv("CANDLE_MAX_PAGES", "100"))
+
+# Columns of a candle as stored and returned, in schema order
+CANDLE_FIELDS = ("start", "low", "high", "open", "close", "volume")
+
+# Signature of the function fetching one page of candles: (product_id, granularity, start, end) -> candles
+FetchPage = Callable[[str, str, int, int], Awaitable[List[dict]]]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS candles (
+    product_id TEXT NOT NULL,
+    granularity INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    low TEXT NOT NULL,
+    high TEXT NOT NULL,
+    open TEXT NOT NULL,
+    close TEXT NOT NULL,
+    volume TEXT NOT NULL,
+    PRIMARY KEY (product_id, granularity, start)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS coverage (
+    product_id TEXT NOT NULL,
+    granularity INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    PRIMARY KEY (product_id, granularity, start)
+) WITHOUT ROWID;
+"""
+
+
+class RangeTooLarge(ValueError):
+    """
+    Raised when filling a range would fetch more candle pages than one request may.
+    """
+
+
+def granularity_seconds(granularity: str) -> int:
+    """
+    Convert a Coinbase granularity name to its length in seconds.
+
+    Args:
+        granularity (str): The granularity name, e.g. "ONE_HOUR".
+
+    Returns:
+        int: The candle length in seconds.
+
+    Raises:
+        ValueError: If the granularity is not supported by Coinbase.
+    """
+    try:
+        return GRANULARITY_SECONDS[granularity]
+    except KeyError:
+        raise ValueError(f"Unsupported granularity: {granularity}")
+
+
+def subtract_intervals(start: int, end: int, covered: List[Tuple[int, int]], step: int) -> List[Tuple[int, int]]:
+    """
+    Return the parts of [start, end] not covered by any of the given intervals.
+
+    All bounds are candle start times and are inclusive.
+
+    Args:
+        start (int): First candle start of the requested range.
+        end (int): Last candle start of the requested range.
+        covered (List[Tuple[int, int]]): Known intervals, sorted by start.
+        step (int): Candle length in seconds.
+
+    Returns:
+        List[Tuple[int, int]]: The missing intervals, sorted by start.
+    """
+    missing = []
+    cursor = start
+    for covered_start, covered_end in covered:
+        if covered_end < cursor:
+            continue
+        if covered_start > end:
+            break
+        if covered_start > cursor:
+            missing.append((cursor, covered_start - step))
+        cursor = max(cursor, covered_end + step)
+    if cursor <= end:
+        missing.append((cursor, end))
+    return missing
+
+
+def split_pages(start: int, end: int, step: int, per_page: int) -> List[Tuple[int, int]]:
+    """
+    Split an interval into pages no larger than the upstream candle limit.
+
+    Args:
+        start (int): First candle start of the interval.
+        end (int): Last candle start of the interval.
+        step (int): Candle length in seconds.
+        per_page (int): Maximum number of candles per page.
+
+    Returns:
+        List[Tuple[int, int]]: Inclusive (start, end) pairs covering the interval.
+    """
+    span = step * per_page
+    return [(page_start, min(page_start + span - step, end)) for page_start in range(start, end + 1, span)]
+
+
+class CandleStore:
+    """
+    Persistent SQLite store of candles keyed by (product_id, granularity).
+
+    Besides the candles themselves the store records which intervals are known to be
+    complete, so empty periods are not fetched again. Only closed candles are recorded
+    as complete: they are immutable and kept forever, while the candle still in progress
+    is refreshed on every request that covers it.
+
+    Args:
+        path (str): Path of the SQLite database, or ":memory:".
+        per_page (int): Maximum number of candles requested per upstream call.
+        concurrency (int): Maximum number of upstream calls in flight per request.
+        max_pages (int): Maximum number of missing pages one capped fill may fetch.
+        clock (Callable[[], float]): Wall-clock time source, replaceable in tests.
+    """
+
+    def __init__(self, path: str = CANDLE_STORE_PATH, per_page: int = CANDLES_PER_REQUEST,
+                 concurrency: int = CANDLE_FETCH_CONCURRENCY, max_pages: int = CANDLE_MAX_PAGES,
+                 clock: Callable[[], float] = time.time):
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.per_page = per_page
+        self.concurrency = concurrency
+        self.max_pages = max_pages
+        self.clock = clock
+        self._lock = threading.Lock()  # sqlite3 connections must not be used concurrently
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        """
+        Close the underlying database connection.
+        """
+        with self._lock:
+            self._db.close()
+
+    def covered_intervals(self, product_id: str, step: int) -> List[Tuple[int, int]]:
+        """
+        Return the intervals known to be complete for a product and granularity.
+
+        Args:
+            product_id (str): The ID of the product.
+            step (int): Candle length in seconds.
+
+        Returns:
+            List[Tuple[int, int]]: Inclusive (start, end) candle starts, sorted by start.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT start, end FROM coverage WHERE product_id = ? AND granularity = ? ORDER BY start",
+                (product_id, step),
+            ).fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+    def write(self, product_id: str, step: int, candles: List[dict], covered: Optional[Tuple[int, int]]):
+        """
+        Upsert candles and extend the complete coverage, merging adjacent intervals.
+
+        Args:
+            product_id (str): The ID of the product.
+            step (int): Candle length in seconds.
+            candles (List[dict]): Candles as returned by Coinbase.
+            covered (Tuple[int, int], optional): Closed interval now known to be complete.
+        """
+        rows = [
+            (product_id, step, int(c["start"]), c["low"], c["high"], c["open"], c["close"], c["volume"])
+            for c in candles
+        ]
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO candles VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            if covered is None:
+                return
+            # Absorb every interval that overlaps or touches the new one
+            touching = "product_id = ? AND granularity = ? AND start <= ? AND end >= ?"
+            params = (product_id, step, covered[1] + step, covered[0] - step)
+            start, end = covered
+            for other_start, other_end in self._db.execute(f"SELECT start, end FROM coverage WHERE {touching}", params):
+                start, end = min(start, other_start), max(end, other_end)
+            self._db.execute(f"DELETE FROM coverage WHERE {touching}", params)
+            self._db.execute("INSERT INTO coverage VALUES (?, ?, ?, ?)", (product_id, step, start, end))
+
+    def read_rows(self, product_id: str, step: int, start: int, end: int, limit: int = -1,
+                  typed: bool = False) -> List[tuple]:
+        """
+        Read stored candles as tuples in CANDLE_FIELDS order, newest first.
+
+        Args:
+            product_id (str): The ID of the product.
+            step (int): Candle length in seconds.
+            start (int): First candle start to include.
+            end (int): Last candle start to include.
+            limit (int): Maximum number of candles to return; -1 for all of them.
+            typed (bool): Return prices and volume as floats instead of the stored strings.
+
+        Returns:
+            List[tuple]: The candles, with an integer start.
+        """
+        columns = "start, " + ", ".join(
+            f"CAST({field} AS REAL)" if typed else field for field in CANDLE_FIELDS[1:]
+        )
+        with self._lock:
+            return self._db.execute(
+                f"SELECT {columns} FROM candles "
+                "WHERE product_id = ? AND granularity = ? AND start BETWEEN ? AND ? ORDER BY start DESC LIMIT ?",
+                (product_id, step, start, end, limit),
+            ).fetchall()
+
+    def read(self, product_id: str, step: int, start: int, end: int) -> List[dict]:
+        """
+        Read stored candles, newest first like the Coinbase API.
+
+        Args:
+            product_id (str): The ID of the product.
+            step (int): Candle length in seconds.
+            start (int): First candle start to include.
+            end (int): Last candle start to include.
+
+        Returns:
+            List[dict]: Candle objects with string fields.
+        """
+        rows = self.read_rows(product_id, step, start, end)
+        return [dict(zip(CANDLE_FIELDS, (str(row[0]),) + row[1:])) for row in rows]
+
+    def count(self, product_id: str, step: int, start: int, end: int) -> int:
+        """
+        Count the stored candles within a range.
+
+        Args:
+            product_id (str): The ID of the product.
+            step (int): Candle length in seconds.
+            start (int): First candle start to include.
+            end (int): Last candle start to include.
+
+        Returns:
+            int: The number of candles.
+        """
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM candles WHERE product_id = ? AND granularity = ? AND start BETWEEN ? AND ?",
+                (product_id, step, start, end),
+            ).fetchone()[0]
+
+    async def iter_chunks(self, product_id: str, step: int, start: int, end: int, chunk_size: int,
+                          limit: int = -1, typed: bool = False) -> AsyncIterator[List[tuple]]:
+        """
+        Read stored candles in chunks, newest first, without loading the whole range.
+
+        Each chunk is a separate query continuing below the oldest candle of the
+        previous one, so the store is not locked while the caller sends a chunk.
+
+        Args:
+            product_id (str): The ID of the product.
+            step (int): Candle length in seconds.
+            start (int): First candle start to include.
+            end (int): Last candle start to include.
+            chunk_size (int): Maximum number of candles per chunk.
+            limit (int): Maximum number of candles in total; -1 for all of them.
+            typed (bool): Return prices and volume as floats instead of the stored strings.
+
+        Yields:
+            List[tuple]: Candles in CANDLE_FIELDS order, as returned by read_rows.
+        """
+        while limit:
+            size = chunk_size if limit < 0 else min(chunk_size, limit)
+            chunk = await asyncio.to_thread(self.read_rows, product_id, step, start, end, size, typed)
+            if not chunk:
+                return
+            yield chunk
+            end = chunk[-1][0] - step
+            limit = limit - len(chunk) if limit > 0 else limit
+
+    async def _fetch_page(self, fetch_page: FetchPage, semaphore: asyncio.Semaphore, product_id: str,
+                          granularity: str, step: int, page: Tuple[int, int], last_closed: int):
+        # Fetch one page under the concurrency bound and persist it
+        async with semaphore:
+            candles = await fetch_page(product_id, granularity, page[0], page[1] + step - 1)
+        covered = (page[0], min(page[1], last_closed)) if page[0] <= last_closed else None
+        await asyncio.to_thread(self.write, product_id, step, candles, covered)
+
+    async def fill(self, product_id: str, granularity: str, start: int, end: int,
+                   fetch_page: FetchPage, capped: bool = True) -> Optional[Tuple[int, int, int]]:
+        """
+        Make sure the store holds every candle of a range, fetching the missing intervals.
+
+        Missing intervals are split into pages of at most ``per_page`` candles which are
+        fetched in parallel, at most ``concurrency`` at a time. Capped fills refuse to
+        fetch more than ``max_pages`` pages, before any of them is requested.
+
+        Args:
+            product_id (str): The ID of the product.
+            granularity (str): The Coinbase granularity name.
+            start (int): Start of the range as a UNIX timestamp.
+            end (int): End of the range as a UNIX timestamp.
+            fetch_page (FetchPage): Coroutine function fetching one page from upstream.
+            capped (bool): Whether the ``max_pages`` limit applies (backfill jobs lift it).
+
+        Returns:
+            Tuple[int, int, int], optional: The candle length and the first and last candle
+            starts of the range, or None if the range holds no candle start.
+
+        Raises:
+            ValueError: If the granularity is unsupported.
+            RangeTooLarge: If a capped fill is missing more than ``max_pages`` pages.
+        """
+        step = granularity_seconds(granularity)
+        first = -(-start // step) * step  # First candle start at or after start
+        current = int(self.clock()) // step * step  # Start of the candle still in progress
+        last = min(end // step * step, current)  # Last candle start at or before end, never in the future
+        if first > last:
+            return None
+        last_closed = current - step  # Start of the newest closed candle
+
+        covered = await asyncio.to_thread(self.covered_intervals, product_id, step)
+        pages = [
+            page
+            for gap_start, gap_end in subtract_intervals(first, last, covered, step)
+            for page in split_pages(gap_start, gap_end, step, self.per_page)
+        ]
+        if capped and len(pages) > self.max_pages:
+            raise RangeTooLarge(f"Range needs {len(pages)} candle pages from upstream, more than the {self.max_pages} "
+                                f"allowed per request; load it with a backfill job (POST /public/backfill)")
+        if pages:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            await asyncio.gather(*(
+                self._fetch_page(fetch_page, semaphore, product_id, granularity, step, page, last_closed)
+                for page in pages
+            ))
+        return step, first, last
+
+    async def get_candles(self, product_id: str, granularity: str, start: int, end: int,
+                          fetch_page: FetchPage) -> List[dict]:
+        """
+        Return candles for a range, fetching only the intervals missing from the store.
+
+        Args:
+            product_id (str): The ID of the product.
+            granularity (str): The Coinbase granularity name.
+            start (int): Start of the range as a UNIX timestamp.
+            end (int): End of the range as a UNIX timestamp.
+            fetch_page (FetchPage): Coroutine function fetching one page from upstream.
+
+        Returns:
+            List[dict]: Candles whose start lies within the range, newest first.
+
+        Raises:
+            ValueError: If the granularity is unsupported.
+            RangeTooLarge: If the range is missing more than ``max_pages`` pages.
+        """
+        span = await self.fill(product_id, granularity, start, end, fetch_page)
+        if span is None:
+            return []
+        return await asyncio.to_thread(self.read, product_id, *span)
+
+
+# Shared store, opened on first use
+_store: Optional[CandleStore] = None
+
+
+def get_store() -> CandleStore:
+    """
+    Return the shared candle store, opening it on first use.
+
+    Returns:
+        CandleStore: The store at CANDLE_STORE_PATH.
+    """
+    global _store
+    if _store is None:
+        _store = CandleStore()
+    return _store
+
+
+def set_store(store: Optional[CandleStore]):
+    """
+    Replace the shared candle store (used by tests and benchmarks).
+
+    Args:
+        store (CandleStore, optional): The store to use, or None to reopen the default one.
+    """
+    global _store
+    _store = store
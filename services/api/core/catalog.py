@@ -0,0 +1,229 @@
+import base64
+import binascii
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import orjson
+from pydantic import TypeAdapter
+
+from ..schemas.public_data import Product
+from .profiling import phase
+
+# Product fields with a secondary index, usable as /public/products filters
+INDEXED_FIELDS = ("quote_currency_id", "base_currency_id", "product_type", "status", "product_venue")
+
+# Fields that can be selected with the fields= projection
+PRODUCT_FIELDS = tuple(Product.model_fields)
+
+# Number of encoded filtered, projected or paginated responses kept per catalog
+CATALOG_RESPONSE_ENTRIES = int(os.getenv("CATALOG_RESPONSE_ENTRIES", "256"))
+
+_products_adapter = TypeAdapter(List[Product])
+
+
+def parse_fields(value: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """
+    Parse a comma-separated fields projection.
+
+    Args:
+        value (str, optional): The field names, e.g. "product_id,price".
+
+    Returns:
+        Tuple[str, ...], optional: The distinct field names in request order, or None
+        when no projection was requested.
+
+    Raises:
+        ValueError: If a field is not a product field.
+    """
+    if value is None:
+        return None
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in PRODUCT_FIELDS]
+    if not fields or unknown:
+        raise ValueError(f"Unknown product fields: {', '.join(unknown) or value!r}")
+    return fields
+
+
+def encode_cursor(product_id: str) -> str:
+    """
+    Build the opaque cursor pointing after a product.
+
+    Args:
+        product_id (str): The last product of the current page.
+
+    Returns:
+        str: A URL-safe cursor.
+    """
+    return base64.urlsafe_b64encode(product_id.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    """
+    Return the product ID a cursor points after.
+
+    Args:
+        cursor (str): A cursor returned by encode_cursor.
+
+    Returns:
+        str: The product ID.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check an If-None-Match header against an entity tag, using weak comparison.
+
+    Args:
+        if_none_match (str, optional): The header value.
+        etag (str): The current entity tag.
+
+    Returns:
+        bool: True if the client already holds the current representation.
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+class ProductCatalog:
+    """
+    Indexed, immutable snapshot of the products response.
+
+    Products are validated once, when the snapshot is built, and kept in upstream
+    order. Secondary indexes map each value of the INDEXED_FIELDS to the positions of
+    the products holding it, so filters are answered by set intersections instead of
+    scanning every product. The entity tag is a hash of the products, so it only
+    changes when the upstream data does.
+
+    Args:
+        products (List[dict]): The products as returned by the Coinbase API.
+        max_responses (int): Number of encoded query responses to keep.
+    """
+
+    def __init__(self, products: List[dict], max_responses: int = CATALOG_RESPONSE_ENTRIES):
+        self.source = products  # Upstream list the catalog was built from, used to detect refreshes
+        with phase("validate"):
+            self.products: List[dict] = _products_adapter.dump_python(_products_adapter.validate_python(products))
+        self.positions: Dict[str, int] = {p["product_id"]: i for i, p in enumerate(self.products)}
+        self.indexes: Dict[str, Dict[str, List[int]]] = {field: {} for field in INDEXED_FIELDS}
+        for position, product in enumerate(self.products):
+            for field, index in self.indexes.items():
+                index.setdefault(product[field], []).append(position)
+        self.etag = '"' + hashlib.blake2b(orjson.dumps(self.products), digest_size=16).hexdigest() + '"'
+        self.max_responses = max_responses
+        self._responses: "OrderedDict[Hashable, Tuple[bytes, Optional[str]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def get(self, product_id: str) -> Optional[dict]:
+        """
+        Return a product by ID.
+
+        Args:
+            product_id (str): The ID of the product.
+
+        Returns:
+            dict, optional: The validated product, or None if it is not listed.
+        """
+        position = self.positions.get(product_id)
+        return self.products[position] if position is not None else None
+
+    def select(self, filters: Dict[str, Sequence[str]]) -> List[int]:
+        """
+        Return the positions of the products matching every filter.
+
+        Args:
+            filters (Dict[str, Sequence[str]]): Accepted values per indexed field; a product
+                matches a field when it holds any of the values.
+
+        Returns:
+            List[int]: Matching positions in catalog order.
+        """
+        selected = None
+        for field, values in filters.items():
+            index = self.indexes[field]
+            matches = {position for value in values for position in index.get(value, ())}
+            selected = matches if selected is None else selected & matches
+            if not selected:
+                return []
+        return list(range(len(self.products))) if selected is None else sorted(selected)
+
+    def query(self, filters: Dict[str, Sequence[str]], fields: Optional[Tuple[str, ...]] = None,
+              cursor: Optional[str] = None, limit: Optional[int] = None) -> Tuple[bytes, Optional[str]]:
+        """
+        Encode the products matching a query, one page at a time.
+
+        Encoded responses are kept per query, so repeated queries against the same
+        snapshot cost a dictionary lookup.
+
+        Args:
+            filters (Dict[str, Sequence[str]]): Accepted values per indexed field.
+            fields (Tuple[str, ...], optional): Fields to keep in each product.
+            cursor (str, optional): Cursor returned with the previous page.
+            limit (int, optional): Maximum number of products per page.
+
+        Returns:
+            Tuple[bytes, Optional[str]]: The JSON list of products and the cursor of the
+            next page, or None on the last page.
+
+        Raises:
+            ValueError: If the cursor is malformed or its product is no longer listed.
+        """
+        key = (tuple(sorted((field, tuple(values)) for field, values in filters.items())), fields, cursor, limit)
+        response = self._responses.get(key)
+        if response is not None:
+            self._responses.move_to_end(key)
+            return response
+
+        positions = self.select(filters)
+        if cursor is not None:
+            after = self.positions.get(decode_cursor(cursor))
+            if after is None:
+                raise ValueError("Cursor refers to a product that is no longer listed")
+            positions = [position for position in positions if position > after]
+        next_cursor = None
+        if limit is not None and len(positions) > limit:
+            positions = positions[:limit]
+            next_cursor = encode_cursor(self.products[positions[-1]]["product_id"])
+        rows = [self.products[position] for position in positions]
+        if fields is not None:
+            rows = [{field: row[field] for field in fields} for row in rows]
+        with phase("serialize"):
+            response = (orjson.dumps(rows), next_cursor)
+
+        if self.max_responses:
+            self._responses[key] = response
+            while len(self._responses) > self.max_responses:
+                self._responses.popitem(last=False)
+        return response
+
+
+# Catalog built from the latest products response
+_catalog: Optional[ProductCatalog] = None
+
+
+def catalog_for(products: List[dict]) -> ProductCatalog:
+    """
+    Return the catalog of a products response, building it when the response changed.
+
+    Args:
+        products (List[dict]): The products list held by the products cache.
+
+    Returns:
+        ProductCatalog: The catalog of that list.
+    """
+    global _catalog
+    if _catalog is None or _catalog.source is not products:
+        _catalog = ProductCatalog(products)
+    return _catalog
@@ -0,0 +1,306 @@
+import csv
+import io
+import os
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib import format as npy_format
+
+# Media types offered by the row endpoints, in order of preference on ties
+JSON_MEDIA_TYPE = "application/json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+NPY_MEDIA_TYPE = "application/x-npy"
+CSV_MEDIA_TYPE = "text/csv"
+
+# Number of rows converted and sent at a time by the streaming formats
+COLUMNAR_CHUNK_ROWS = int(os.getenv("COLUMNAR_CHUNK_ROWS", "10000"))
+
+# Arrow IPC is only offered when the optional 'pyarrow' package is installed
+try:
+    import pyarrow as pa
+    ARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    ARROW_AVAILABLE = False
+
+# End-of-stream marker of the Arrow IPC streaming format
+_ARROW_EOS = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+# Trade sides encoded as int8 in the binary formats; anything else is 0
+TRADE_SIDES = {"BUY": 1, "SELL": -1}
+
+
+def offered_media_types() -> List[str]:
+    """
+    Return the media types the row endpoints can produce, in order of preference.
+
+    Returns:
+        List[str]: JSON first, then Arrow (when available), NumPy and CSV.
+    """
+    offered = [JSON_MEDIA_TYPE]
+    if ARROW_AVAILABLE:
+        offered.append(ARROW_MEDIA_TYPE)
+    return offered + [NPY_MEDIA_TYPE, CSV_MEDIA_TYPE]
+
+
+def negotiate(accept: Optional[str], offered: List[str]) -> Optional[str]:
+    """
+    Pick the media type to answer with from an Accept header.
+
+    Each offered type gets the quality of the most specific matching range (exact,
+    then "type/*", then "*/*"). The highest quality wins and ties go to the type
+    offered first, so browsers sending "*/*" still receive JSON.
+
+    Args:
+        accept (str, optional): The Accept header; missing or empty accepts anything.
+        offered (List[str]): The media types available, in order of preference.
+
+    Returns:
+        str, optional: The chosen media type, or None if nothing offered is acceptable.
+    """
+    if not accept or not accept.strip():
+        return offered[0]
+    ranges = {}
+    for part in accept.split(","):
+        media_range, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_range:
+            ranges[media_range.lower()] = max(quality, ranges.get(media_range.lower(), 0.0))
+    best, best_quality = None, 0.0
+    for media_type in offered:
+        for candidate in (media_type, media_type.split("/")[0] + "/*", "*/*"):
+            if candidate in ranges:
+                if ranges[candidate] > best_quality:
+                    best, best_quality = media_type, ranges[candidate]
+                break
+    return best
+
+
+async def chunked(rows: List[dict], chunk_size: int = COLUMNAR_CHUNK_ROWS) -> AsyncIterator[List[dict]]:
+    """
+    Yield an in-memory list of rows in chunks.
+
+    Args:
+        rows (List[dict]): The rows.
+        chunk_size (int): Maximum number of rows per chunk.
+
+    Yields:
+        List[dict]: Consecutive slices of the rows.
+    """
+    for offset in range(0, len(rows), chunk_size):
+        yield rows[offset:offset + chunk_size]
+
+
+def _floats(values: List[str]) -> np.ndarray:
+    # Coinbase sends blanks for missing prices; they become NaN
+    return np.array([value or "nan" for value in values], dtype=np.float64)
+
+
+def trades_to_columns(trades: List[dict]) -> Dict[str, np.ndarray]:
+    """
+    Parse market trade objects into typed columns, keeping their order.
+
+    Args:
+        trades (List[dict]): Trades as returned by the Coinbase API.
+
+    Returns:
+        Dict[str, np.ndarray]: int64 "trade_id" and "time" (microseconds since the epoch)
+        columns, an int8 "side" column (1 buy, -1 sell) and float64 price columns.
+    """
+    times = np.array([t["time"].rstrip("Z") for t in trades], dtype="datetime64[us]")
+    return {
+        "trade_id": np.array([t["trade_id"] for t in trades], dtype=np.int64),
+        "time": times.astype(np.int64),
+        "side": np.array([TRADE_SIDES.get(t["side"], 0) for t in trades], dtype=np.int8),
+        "price": _floats([t["price"] for t in trades]),
+        "size": _floats([t["size"] for t in trades]),
+        "bid": _floats([t.get("bid", "") for t in trades]),
+        "ask": _floats([t.get("ask", "") for t in trades]),
+    }
+
+
+class ColumnarTable:
+    """
+    Typed columnar layout of a row resource, encodable as Arrow IPC, NumPy or CSV.
+
+    Each chunk of rows is packed into a structured array: Arrow sends its columns as
+    one record batch of an IPC stream, NumPy sends its records as the body of a .npy
+    file (a packed little-endian structured array). CSV writes the rows as received,
+    so no precision is lost. All three are produced chunk by chunk while streaming.
+
+    Rows are either tuples in column order, whose values numpy converts directly, or
+    objects parsed by ``to_columns``.
+
+    Args:
+        columns (List[Tuple[str, str]]): Column names and NumPy dtypes.
+        to_columns (Callable, optional): Parser turning a chunk of row objects into a
+            dict of arrays.
+        arrow_types (Dict[str, Callable], optional): Arrow type factories overriding the
+            type derived from the dtype, e.g. timestamps stored as int64.
+    """
+
+    def __init__(self, columns: List[Tuple[str, str]],
+                 to_columns: Optional[Callable[[List[dict]], Dict[str, np.ndarray]]] = None,
+                 arrow_types: Optional[Dict[str, Callable]] = None):
+        self.dtype = np.dtype(columns)
+        self.to_columns = to_columns
+        self.arrow_types = arrow_types or {}
+        self._arrow_schema = None
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        """
+        Column names, in layout order.
+        """
+        return self.dtype.names
+
+    def arrow_schema(self):
+        """
+        Return the Arrow schema of the table, built on first use.
+
+        Returns:
+            pyarrow.Schema: One non-nullable field per column.
+        """
+        if self._arrow_schema is None:
+            self._arrow_schema = pa.schema([
+                pa.field(name, self.arrow_types[name]() if name in self.arrow_types
+                         else pa.from_numpy_dtype(self.dtype[name]), nullable=False)
+                for name in self.names
+            ])
+        return self._arrow_schema
+
+    def npy_header(self, rows: int) -> bytes:
+        """
+        Build the header of a .npy file holding the given number of rows.
+
+        Args:
+            rows (int): The total number of rows that will follow.
+
+        Returns:
+            bytes: The magic string and header, padded as numpy expects.
+        """
+        header = io.BytesIO()
+        npy_format.write_array_header_1_0(header, {
+            "descr": npy_format.dtype_to_descr(self.dtype),
+            "fortran_order": False,
+            "shape": (rows,),
+        })
+        return header.getvalue()
+
+    def records(self, rows: list) -> np.ndarray:
+        """
+        Pack a chunk of rows into a structured array.
+
+        Args:
+            rows (list): Tuples in column order, objects when the table has a parser, or
+                records of the table dtype, which are used as they are.
+
+        Returns:
+            np.ndarray: One record per row.
+        """
+        if isinstance(rows, np.ndarray):
+            return rows
+        if self.to_columns is None:
+            return np.array(rows, dtype=self.dtype)
+        columns = self.to_columns(rows)
+        records = np.empty(len(rows), dtype=self.dtype)
+        for name in self.names:
+            records[name] = columns[name]
+        return records
+
+    def arrow_chunk(self, records: np.ndarray) -> bytes:
+        """
+        Serialize records as an Arrow IPC record batch message.
+
+        Args:
+            records (np.ndarray): The records of one chunk.
+
+        Returns:
+            bytes: The encapsulated record batch.
+        """
+        schema = self.arrow_schema()
+        arrays = [pa.array(np.ascontiguousarray(records[field.name]), type=field.type) for field in schema]
+        return pa.record_batch(arrays, schema=schema).serialize().to_pybytes()
+
+    def csv_chunk(self, rows: list, header: bool = False) -> bytes:
+        """
+        Write rows as CSV lines.
+
+        Args:
+            rows (list): The rows of one chunk, tuples in column order, objects or records.
+            header (bool): Whether to start with the header line.
+
+        Returns:
+            bytes: UTF-8 encoded CSV.
+        """
+        text = io.StringIO()
+        writer = csv.writer(text, lineterminator="\n")
+        if header:
+            writer.writerow(self.names)
+        if isinstance(rows, np.ndarray):
+            rows = rows.tolist()
+        if rows and isinstance(rows[0], dict):
+            rows = [[row.get(name, "") for name in self.names] for row in rows]
+        writer.writerows(rows)
+        return text.getvalue().encode()
+
+    async def stream(self, media_type: str, rows: int, chunks: AsyncIterator[list]) -> AsyncIterator[bytes]:
+        """
+        Encode chunks of rows into one of the columnar formats as they arrive.
+
+        Args:
+            media_type (str): ARROW_MEDIA_TYPE, NPY_MEDIA_TYPE or CSV_MEDIA_TYPE.
+            rows (int): Total number of rows, written in the .npy header.
+            chunks (AsyncIterator[list]): The rows, chunk by chunk.
+
+        Yields:
+            bytes: Consecutive parts of the body.
+
+        Raises:
+            ValueError: If the media type is not a columnar format.
+        """
+        if media_type == CSV_MEDIA_TYPE:
+            yield self.csv_chunk([], header=True)
+            async for chunk in chunks:
+                yield self.csv_chunk(chunk)
+            return
+        if media_type == ARROW_MEDIA_TYPE:
+            encode = self.arrow_chunk
+            yield self.arrow_schema().serialize().to_pybytes()
+        elif media_type == NPY_MEDIA_TYPE:
+            encode = np.ndarray.tobytes
+            yield self.npy_header(rows)
+        else:
+            raise ValueError(f"Unsupported columnar media type: {media_type}")
+        async for chunk in chunks:
+            if len(chunk):
+                yield encode(self.records(chunk))
+        if media_type == ARROW_MEDIA_TYPE:
+            yield _ARROW_EOS
+
+
+# Typed layout of candles, read from the candle store as tuples: start time in seconds and float64 prices
+CANDLE_TABLE = ColumnarTable(
+    [("start", "<i8"), ("low", "<f8"), ("high", "<f8"), ("open", "<f8"), ("close", "<f8"), ("volume", "<f8")],
+)
+
+# Typed layout of market trades; Arrow exposes the time column as a UTC timestamp
+TRADE_TABLE = ColumnarTable(
+    [("trade_id", "<i8"), ("time", "<i8"), ("side", "i1"), ("price", "<f8"), ("size", "<f8"),
+     ("bid", "<f8"), ("ask", "<f8")],
+    trades_to_columns,
+    arrow_types={"time": lambda: pa.timestamp("us", tz="UTC")},
+)
+
+# Typed layout of the trade tape, read back as tuples; Arrow exposes the time column as a UTC timestamp
+TAPE_TABLE = ColumnarTable(
+    [("time", "<i8"), ("trade_id", "<i8"), ("price", "<f8"), ("size", "<f8"), ("side", "i1")],
+    arrow_types={"time": lambda: pa.timestamp("us", tz="UTC")},
+)
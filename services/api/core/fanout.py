@@ -0,0 +1,252 @@
+import asyncio
+import os
+from collections import defaultdict, deque
+from typing import Dict, Optional, Set, Tuple
+
+import orjson
+
+from .ring_buffer import get_market_store
+from .ws_feed import CoinbaseFeed, get_feed
+
+# Channels that can be streamed to downstream subscribers
+STREAM_CHANNELS = ("market_trades", "ticker")
+
+# Default number of messages buffered per subscriber
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "256"))
+
+# What to do when a subscriber's queue is full: "drop_oldest" or "disconnect"
+STREAM_SLOW_CONSUMER_POLICY = os.getenv("STREAM_SLOW_CONSUMER_POLICY", "drop_oldest")
+
+# Accepted slow-consumer policies
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "disconnect")
+
+
+class Frame:
+    """
+    One message serialized once and shared by every subscriber.
+
+    The JSON bytes are produced when the frame is created; the text and Server-Sent
+    Events encodings are derived on first use and then cached on the frame.
+    """
+    __slots__ = ("data", "_text", "_sse")
+
+    def __init__(self, message: dict):
+        self.data = orjson.dumps(message)
+        self._text = None
+        self._sse = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.data.decode()
+        return self._text
+
+    @property
+    def sse(self) -> bytes:
+        if self._sse is None:
+            self._sse = b"data: " + self.data + b"\n\n"
+        return self._sse
+
+
+class Subscriber:
+    """
+    A downstream consumer with a bounded queue of frames.
+
+    Args:
+        maxsize (int): Maximum number of frames buffered.
+        policy (str): "drop_oldest" to discard the oldest frame when full, "disconnect" to close.
+    """
+    __slots__ = ("topic", "maxsize", "policy", "closed", "dropped", "_queue", "_ready")
+
+    def __init__(self, topic: Tuple[str, str], maxsize: int, policy: str):
+        self.topic = topic
+        self.maxsize = maxsize
+        self.policy = policy
+        self.closed = False
+        self.dropped = 0  # Frames discarded because the subscriber was too slow
+        self._queue = deque()
+        self._ready = asyncio.Event()
+
+    def push(self, frame: Frame) -> bool:
+        """
+        Queue a frame, applying the slow-consumer policy when the queue is full.
+
+        Args:
+            frame (Frame): The frame to deliver.
+
+        Returns:
+            bool: False if the subscriber is closed and should be removed.
+        """
+        if self.closed:
+            return False
+        if len(self._queue) >= self.maxsize:
+            if self.policy == "disconnect":
+                self.close()
+                return False
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append(frame)
+        self._ready.set()
+        return True
+
+    async def get(self) -> Optional[Frame]:
+        """
+        Wait for the next frame.
+
+        Returns:
+            Frame: The next frame, or None once the subscriber is closed.
+        """
+        while not self._queue:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        if self.closed and self.policy == "disconnect":
+            return None
+        return self._queue.popleft()
+
+    def close(self):
+        """
+        Close the subscriber and wake up its reader.
+        """
+        self.closed = True
+        self._ready.set()
+
+
+class FanoutHub:
+    """
+    Multiplexes downstream subscribers onto one upstream subscription per (channel, product).
+
+    The upstream subscription is opened with the first subscriber of a topic and closed
+    with the last one. Every upstream message is serialized once into a Frame and the same
+    frame is queued to each subscriber.
+
+    Args:
+        feed (CoinbaseFeed): The market data feed to subscribe through.
+    """
+
+    def __init__(self, feed: CoinbaseFeed):
+        self.feed = feed
+        self.topics: Dict[Tuple[str, str], Set[Subscriber]] = defaultdict(set)
+        self.published = 0  # Frames published
+        self.delivered = 0  # Frames queued to subscribers
+        self.disconnected = 0  # Subscribers closed by the slow-consumer policy
+        feed.add_handler("market_trades", self._on_trades)
+        feed.add_handler("ticker", self._on_tickers)
+
+    async def subscribe(self, channel: str, product_id: str, maxsize: int = STREAM_QUEUE_SIZE,
+                        policy: str = STREAM_SLOW_CONSUMER_POLICY) -> Subscriber:
+        """
+        Add a subscriber to a topic, opening the upstream subscription if it is the first.
+
+        Args:
+            channel (str): "market_trades" or "ticker".
+            product_id (str): The ID of the product.
+            maxsize (int): Queue size of the subscriber.
+            policy (str): Slow-consumer policy of the subscriber.
+
+        Returns:
+            Subscriber: The new subscriber.
+
+        Raises:
+            ValueError: If the channel or policy is not supported.
+        """
+        if channel not in STREAM_CHANNELS:
+            raise ValueError(f"Unsupported channel: {channel}")
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unsupported slow consumer policy: {policy}")
+        topic = (channel, product_id)
+        subscriber = Subscriber(topic, maxsize, policy)
+        first = not self.topics[topic]
+        self.topics[topic].add(subscriber)
+        if first:
+            await self.feed.subscribe(channel, [product_id])
+        return subscriber
+
+    async def unsubscribe(self, subscriber: Subscriber):
+        """
+        Remove a subscriber, closing the upstream subscription if it was the last.
+
+        Args:
+            subscriber (Subscriber): The subscriber to remove.
+        """
+        subscriber.close()
+        subscribers = self.topics.get(subscriber.topic)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self.topics[subscriber.topic]
+            await self.feed.unsubscribe(subscriber.topic[0], [subscriber.topic[1]])
+
+    def publish(self, channel: str, product_id: str, message: dict):
+        """
+        Serialize a message once and queue it to every subscriber of the topic.
+
+        Args:
+            channel (str): The channel of the message.
+            product_id (str): The product the message is about.
+            message (dict): The message to deliver.
+        """
+        subscribers = self.topics.get((channel, product_id))
+        if not subscribers:
+            return
+        frame = Frame(message)
+        self.published += 1
+        closed = [subscriber for subscriber in subscribers if not subscriber.push(frame)]
+        self.delivered += len(subscribers) - len(closed)
+        for subscriber in closed:
+            subscribers.discard(subscriber)
+            self.disconnected += 1
+
+    def _on_trades(self, event: dict, timestamp: str):
+        # Split a market_trades event per product, keep it in the recent trades and publish it
+        by_product = defaultdict(list)
+        for trade in event.get("trades", ()):
+            by_product[trade.get("product_id")].append(trade)
+        for product_id, trades in by_product.items():
+            get_market_store().ingest_trades(product_id, trades)
+            self.publish("market_trades", product_id, {
+                "channel": "market_trades", "type": event.get("type"), "product_id": product_id,
+                "timestamp": timestamp, "trades": trades,
+            })
+
+    def _on_tickers(self, event: dict, timestamp: str):
+        # Publish each ticker of a ticker event to its product's subscribers
+        for ticker in event.get("tickers", ()):
+            self.publish("ticker", ticker.get("product_id"), {
+                "channel": "ticker", "type": event.get("type"), "timestamp": timestamp, **ticker,
+            })
+
+    def stats(self) -> dict:
+        """
+        Return the counters of the hub.
+
+        Returns:
+            dict: Subscriber counts per topic and publish, delivery and disconnect counters.
+        """
+        return {
+            "subscribers": sum(len(subscribers) for subscribers in self.topics.values()),
+            "topics": {f"{channel}:{product_id}": len(subscribers)
+                       for (channel, product_id), subscribers in self.topics.items()},
+            "published": self.published,
+            "delivered": self.delivered,
+            "disconnected": self.disconnected,
+        }
+
+
+# Shared hub, created on first use
+_hub: Optional[FanoutHub] = None
+
+
+def get_hub() -> FanoutHub:
+    """
+    Return the shared fan-out hub, creating it on first use.
+
+    Returns:
+        FanoutHub: The hub attached to the shared market data feed.
+    """
+    global _hub
+    if _hub is None:
+        _hub = FanoutHub(get_feed())
+    return _hub
@@ -0,0 +1,185 @@
+import asyncio
+import os
+import time
+from typing import Any, Optional
+
+import httpx
+
+from .metrics import UPSTREAM_LATENCY
+from .profiling import add_phase, phase
+from .resilience import HEDGE_ENABLED, UPSTREAM_DEADLINE, get_breaker, get_latency, hedged
+from .scheduler import get_scheduler
+
+# Connection pool limits for upstream calls, overridable through environment variables
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+
+# Timeouts (in seconds) applied to every upstream call
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "10"))
+UPSTREAM_WRITE_TIMEOUT = float(os.getenv("UPSTREAM_WRITE_TIMEOUT", "10"))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "5"))
+
+# HTTP/2 is only negotiated when requested and the optional 'h2' package is installed
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "1") == "1"
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Shared client state: the client, the event loop it belongs to and an optional transport override
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_transport: Optional[httpx.AsyncBaseTransport] = None
+
+
+def create_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """
+    Build a new pooled async HTTP client using the configured limits and timeouts.
+
+    Args:
+        transport (httpx.AsyncBaseTransport, optional): Transport to use instead of the network.
+
+    Returns:
+        httpx.AsyncClient: A client with keep-alive pooling and, when available, HTTP/2.
+    """
+    limits = httpx.Limits(
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=UPSTREAM_CONNECT_TIMEOUT,
+        read=UPSTREAM_READ_TIMEOUT,
+        write=UPSTREAM_WRITE_TIMEOUT,
+        pool=UPSTREAM_POOL_TIMEOUT,
+    )
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=timeout,
+        http2=UPSTREAM_HTTP2 and HTTP2_AVAILABLE,
+        transport=transport,
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the shared upstream client, creating it on first use.
+
+    A new client is created if the previous one was closed or belongs to another
+    event loop, since pooled connections cannot be shared across loops.
+
+    Returns:
+        httpx.AsyncClient: The shared client for the running event loop.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = create_client(_transport)
+        _client_loop = loop
+    return _client
+
+
+def set_transport(transport: Optional[httpx.AsyncBaseTransport]):
+    """
+    Route all upstream calls through the given transport (used by tests and benchmarks).
+
+    Args:
+        transport (httpx.AsyncBaseTransport, optional): The transport, or None to use the network.
+    """
+    global _client, _client_loop, _transport
+    _transport = transport
+    _client = None  # Force the next call to build a client with the new transport
+    _client_loop = None
+
+
+async def close_client():
+    """
+    Close the shared upstream client and release its pooled connections.
+    """
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+
+async def upstream_get(url: str, params: Optional[dict] = None, endpoint: str = "other") -> httpx.Response:
+    """
+    Perform a GET request against the upstream API using the shared client.
+
+    The request goes through the shared scheduler, which enforces the upstream rate
+    limit, orders queued requests by priority class and retries 429 responses. The
+    duration of each HTTP exchange is recorded per upstream endpoint and status code.
+
+    Each upstream endpoint has a circuit breaker: while it is open the call fails at
+    once with CircuitOpenError. Every exchange is bounded by UPSTREAM_DEADLINE on top of
+    the client's connect and read timeouts, and a call still unanswered after the p95
+    latency of its endpoint is hedged with a second attempt, the first response winning.
+    The whole call, queueing and hedging included, is timed as the "upstream_wait"
+    phase of the request being served.
+
+    Args:
+        url (str): The absolute URL to request.
+        params (dict, optional): Query string parameters.
+        endpoint (str): Name of the upstream endpoint, used as the metrics label.
+
+    Returns:
+        httpx.Response: The upstream response with its status already checked.
+
+    Raises:
+        httpx.HTTPStatusError: If the upstream answered with an error status.
+        httpx.RequestError: If the request could not be completed.
+        asyncio.TimeoutError: If the exchange outlasted UPSTREAM_DEADLINE.
+        SchedulerTimeout: If the request could not be sent before its deadline.
+        CircuitOpenError: If the circuit of the endpoint is open.
+    """
+    breaker = get_breaker(endpoint)
+    latency = get_latency(endpoint)
+    breaker.before_call()
+    called = time.perf_counter()
+
+    async def send() -> httpx.Response:
+        began = time.perf_counter()  # Measured per attempt, excluding the time queued for a token
+        status = "error"
+        try:
+            response = await asyncio.wait_for(get_client().get(url, params=params), UPSTREAM_DEADLINE)
+            status = str(response.status_code)
+            return response
+        finally:
+            elapsed = time.perf_counter() - began
+            UPSTREAM_LATENCY.labels(endpoint, status).observe(elapsed)
+            if status != "error":  # Cancelled hedges and failed exchanges would skew the quantile
+                latency.observe(elapsed)
+
+    async def attempt() -> httpx.Response:
+        return await get_scheduler().send(send)
+
+    try:
+        response = await hedged(attempt, latency.delay() if HEDGE_ENABLED else None, endpoint)
+        response.raise_for_status()  # Raise an exception if the request was unsuccessful
+    except BaseException as e:
+        breaker.record(e)
+        raise
+    finally:
+        add_phase("upstream_wait", time.perf_counter() - called)
+    breaker.record(None)
+    return response
+
+
+def read_json(response: httpx.Response) -> Any:
+    """
+    Decode the JSON body of an upstream response.
+
+    The decoding is timed as the "parse" phase of the request being served.
+
+    Args:
+        response (httpx.Response): The upstream response.
+
+    Returns:
+        Any: The decoded body.
+    """
+    with phase("parse"):
+        return response.json()
@@ -0,0 +1,288 @@
+import re
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .candle_store import GRANULARITY_SECONDS
+
+# Length in seconds of each unit accepted in resampling intervals
+INTERVAL_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+# Numeric candle columns, in schema order
+PRICE_FIELDS = ("low", "high", "open", "close", "volume")
+
+# Default period of every indicator that takes one
+DEFAULT_PERIODS = {"sma": 20, "ema": 20, "rsi": 14, "atr": 14}
+
+# Largest factor a block of the vectorized recursion may scale values by
+_MAX_SCALE = 1e150
+
+
+def parse_interval(interval: str) -> int:
+    """
+    Parse a resampling interval such as "15m", "4h", "2d" or "1w".
+
+    Args:
+        interval (str): The interval, as a number of minutes, hours, days or weeks.
+
+    Returns:
+        int: The interval length in seconds.
+
+    Raises:
+        ValueError: If the interval is malformed or not a positive number of minutes.
+    """
+    match = re.fullmatch(r"(\d+)([mhdw])", interval.strip().lower())
+    if match is None or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid interval: {interval}")
+    return int(match.group(1)) * INTERVAL_UNITS[match.group(2)]
+
+
+def base_granularity(interval: int) -> str:
+    """
+    Pick the coarsest Coinbase granularity that evenly divides an interval.
+
+    Args:
+        interval (int): The target interval in seconds.
+
+    Returns:
+        str: The Coinbase granularity name to fetch before resampling.
+    """
+    candidates = [(seconds, name) for name, seconds in GRANULARITY_SECONDS.items() if interval % seconds == 0]
+    return max(candidates)[1]
+
+
+def candles_to_arrays(candles: List[dict]) -> Dict[str, np.ndarray]:
+    """
+    Parse candle objects into NumPy columns, oldest first.
+
+    Args:
+        candles (List[dict]): Candles as returned by the Coinbase API.
+
+    Returns:
+        Dict[str, np.ndarray]: An int64 "start" column and float64 price and volume columns.
+    """
+    columns = {"start": np.array([c["start"] for c in candles], dtype=np.int64)}
+    for field in PRICE_FIELDS:
+        columns[field] = np.array([c[field] for c in candles], dtype=np.float64)
+    order = np.argsort(columns["start"], kind="stable")
+    return {name: column[order] for name, column in columns.items()}
+
+
+def rows_to_arrays(rows: List[tuple]) -> Dict[str, np.ndarray]:
+    """
+    Load typed candle rows from the candle store into NumPy columns, oldest first.
+
+    Args:
+        rows (List[tuple]): Candles as (start, low, high, open, close, volume) numbers, newest first.
+
+    Returns:
+        Dict[str, np.ndarray]: An int64 "start" column and float64 price and volume columns.
+    """
+    table = np.array(rows, dtype=np.float64).reshape(-1, 1 + len(PRICE_FIELDS))[::-1]
+    columns = {"start": table[:, 0].astype(np.int64)}
+    for index, field in enumerate(PRICE_FIELDS, 1):
+        columns[field] = np.ascontiguousarray(table[:, index])
+    return columns
+
+
+def resample(columns: Dict[str, np.ndarray], interval: int) -> Dict[str, np.ndarray]:
+    """
+    Aggregate sorted candles into epoch-aligned buckets of the given interval.
+
+    Args:
+        columns (Dict[str, np.ndarray]): Candle columns sorted by start.
+        interval (int): The bucket length in seconds.
+
+    Returns:
+        Dict[str, np.ndarray]: One row per non-empty bucket.
+    """
+    if len(columns["start"]) == 0:
+        return {name: column[:0] for name, column in columns.items()}
+    buckets = columns["start"] // interval * interval
+    first = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])  # First row of each bucket
+    last = np.r_[first[1:] - 1, len(buckets) - 1]  # Last row of each bucket
+    return {
+        "start": buckets[first],
+        "low": np.minimum.reduceat(columns["low"], first),
+        "high": np.maximum.reduceat(columns["high"], first),
+        "open": columns["open"][first],
+        "close": columns["close"][last],
+        "volume": np.add.reduceat(columns["volume"], first),
+    }
+
+
+def _smooth(values: np.ndarray, alpha: float, period: int) -> np.ndarray:
+    """
+    Exponential smoothing seeded with the simple average of the first period.
+
+    The recursion y[t] = (1 - alpha) * y[t - 1] + alpha * x[t] is evaluated in closed form
+    with cumulative sums, block by block so the scaling factors stay within float range.
+
+    Args:
+        values (np.ndarray): The input series.
+        alpha (float): The smoothing factor in (0, 1].
+        period (int): Number of values averaged for the seed.
+
+    Returns:
+        np.ndarray: The smoothed series, NaN until the seed is available.
+    """
+    out = np.full(len(values), np.nan)
+    if len(values) < period:
+        return out
+    out[period - 1] = values[:period].mean()
+    decay = 1.0 - alpha
+    if decay == 0.0:
+        out[period:] = values[period:]
+        return out
+    block = max(1, int(np.log(_MAX_SCALE) / -np.log(decay)))
+    for begin in range(period, len(values), block):
+        chunk = values[begin:begin + block]
+        powers = decay ** np.arange(1, len(chunk) + 1)
+        # y[begin + j] = decay^(j+1) * y[begin - 1] + alpha * sum_i decay^(j-i) * x[begin + i]
+        out[begin:begin + len(chunk)] = powers * (out[begin - 1] + alpha * np.cumsum(chunk / powers))
+    return out
+
+
+def sma(values: np.ndarray, period: int) -> np.ndarray:
+    """
+    Simple moving average.
+
+    Args:
+        values (np.ndarray): The input series.
+        period (int): The window length.
+
+    Returns:
+        np.ndarray: The average of each window, NaN for the first period - 1 rows.
+    """
+    out = np.full(len(values), np.nan)
+    if len(values) >= period:
+        sums = np.cumsum(np.r_[0.0, values])
+        out[period - 1:] = (sums[period:] - sums[:-period]) / period
+    return out
+
+
+def ema(values: np.ndarray, period: int) -> np.ndarray:
+    """
+    Exponential moving average with smoothing factor 2 / (period + 1).
+
+    Args:
+        values (np.ndarray): The input series.
+        period (int): The EMA period.
+
+    Returns:
+        np.ndarray: The EMA, NaN for the first period - 1 rows.
+    """
+    return _smooth(values, 2.0 / (period + 1), period)
+
+
+def rsi(close: np.ndarray, period: int) -> np.ndarray:
+    """
+    Relative Strength Index with Wilder's smoothing.
+
+    Args:
+        close (np.ndarray): Closing prices.
+        period (int): The RSI period.
+
+    Returns:
+        np.ndarray: RSI values between 0 and 100, NaN until enough data is available and 50
+        while prices do not move at all.
+    """
+    if len(close) == 0:
+        return np.empty(0)
+    delta = np.diff(close)
+    average_gain = _smooth(np.clip(delta, 0, None), 1.0 / period, period)
+    average_loss = _smooth(np.clip(-delta, 0, None), 1.0 / period, period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = 100.0 - 100.0 / (1.0 + average_gain / average_loss)
+    values[(average_loss == 0) & (average_gain > 0)] = 100.0
+    values[(average_loss == 0) & (average_gain == 0)] = 50.0  # A flat series is neither overbought nor oversold
+    return np.r_[np.nan, values]
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int) -> np.ndarray:
+    """
+    Average True Range with Wilder's smoothing.
+
+    Args:
+        high (np.ndarray): High prices.
+        low (np.ndarray): Low prices.
+        close (np.ndarray): Closing prices.
+        period (int): The ATR period.
+
+    Returns:
+        np.ndarray: The ATR, NaN for the first period - 1 rows.
+    """
+    previous_close = np.r_[close[:1], close[:-1]]
+    true_range = np.maximum(high - low, np.maximum(np.abs(high - previous_close), np.abs(low - previous_close)))
+    return _smooth(true_range, 1.0 / period, period)
+
+
+def vwap(high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    """
+    Volume-weighted average price anchored at the first candle.
+
+    Args:
+        high (np.ndarray): High prices.
+        low (np.ndarray): Low prices.
+        close (np.ndarray): Closing prices.
+        volume (np.ndarray): Traded volume.
+
+    Returns:
+        np.ndarray: The cumulative VWAP of the typical price, NaN while no volume has traded.
+    """
+    cumulative_volume = np.cumsum(volume)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = np.cumsum((high + low + close) / 3.0 * volume) / cumulative_volume
+    values[cumulative_volume == 0] = np.nan
+    return values
+
+
+def parse_indicators(spec: str) -> List[Tuple[str, int]]:
+    """
+    Parse a comma-separated indicator list such as "ema:20,rsi,vwap".
+
+    Args:
+        spec (str): Indicator names, each optionally followed by ":period".
+
+    Returns:
+        List[Tuple[str, int]]: (name, period) pairs; the period is 0 for VWAP.
+
+    Raises:
+        ValueError: If an indicator is unknown or its period is invalid.
+    """
+    parsed = []
+    for item in filter(None, (part.strip().lower() for part in spec.split(","))):
+        name, _, period = item.partition(":")
+        if name == "vwap" and not period:
+            parsed.append((name, 0))
+        elif name in DEFAULT_PERIODS and (not period or (period.isdigit() and int(period) > 0)):
+            parsed.append((name, int(period) if period else DEFAULT_PERIODS[name]))
+        else:
+            raise ValueError(f"Invalid indicator: {item}")
+    return parsed
+
+
+def compute_indicators(columns: Dict[str, np.ndarray], indicators: List[Tuple[str, int]]) -> Dict[str, np.ndarray]:
+    """
+    Compute the requested indicators over candle columns.
+
+    Args:
+        columns (Dict[str, np.ndarray]): Candle columns sorted by start.
+        indicators (List[Tuple[str, int]]): (name, period) pairs from parse_indicators.
+
+    Returns:
+        Dict[str, np.ndarray]: One series per indicator, keyed like "ema_20" or "vwap".
+    """
+    results = {}
+    for name, period in indicators:
+        if name == "sma":
+            results[f"sma_{period}"] = sma(columns["close"], period)
+        elif name == "ema":
+            results[f"ema_{period}"] = ema(columns["close"], period)
+        elif name == "rsi":
+            results[f"rsi_{period}"] = rsi(columns["close"], period)
+        elif name == "atr":
+            results[f"atr_{period}"] = atr(columns["high"], columns["low"], columns["close"], period)
+        elif name == "vwap":
+            results["vwap"] = vwap(columns["high"], columns["low"], columns["close"], columns["volume"])
+    return results
@@ -0,0 +1,542 @@
+import asyncio
+import os
+import struct
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
+import pika
+from fastapi.logger import logger
+
+from publisher import Publisher, get_publisher
+
+from .columnar import TAPE_TABLE, _floats, trades_to_columns
+from .fanout import FanoutHub, Subscriber, get_hub
+from .metrics import Counter
+from .ws_feed import CoinbaseFeed, get_feed
+
+# Products whose trades, tickers and book deltas are distributed; distribution is disabled when empty
+MARKET_EVENTS_PRODUCTS = [p.strip() for p in os.getenv("MARKET_EVENTS_PRODUCTS", "").split(",") if p.strip()]
+
+# Kinds of events distributed for each product, among "trades", "ticker" and "book"
+MARKET_EVENTS_KINDS = [k.strip() for k in os.getenv("MARKET_EVENTS_KINDS", "trades,ticker,book").split(",") if k.strip()]
+
+# Topic exchange the events are published to, with routing keys "<kind>.<product_id>"
+MARKET_EVENTS_EXCHANGE = os.getenv("MARKET_EVENTS_EXCHANGE", "market_data")
+
+# Encoding of the event frames: "binary" (fixed-width records), "msgpack" or "json"
+MARKET_EVENTS_ENCODING = os.getenv("MARKET_EVENTS_ENCODING", "binary")
+
+# Maximum number of events in one frame
+MARKET_EVENTS_MAX_BATCH = int(os.getenv("MARKET_EVENTS_MAX_BATCH", "256"))
+
+# Seconds an event may wait for its frame to be published
+MARKET_EVENTS_MAX_DELAY = float(os.getenv("MARKET_EVENTS_MAX_DELAY", "0.05"))
+
+# Maximum number of events waiting to be published; newer events are dropped beyond it
+MARKET_EVENTS_MAX_PENDING = int(os.getenv("MARKET_EVENTS_MAX_PENDING", "100000"))
+
+# The msgpack encoding is only available when the optional 'msgpack' package is installed
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+# Fixed-width little-endian record of each kind of event; times are microseconds since the epoch,
+# sides are 1 for buys and bids and -1 for sells and asks
+EVENT_LAYOUTS = {
+    "trades": TAPE_TABLE.dtype,
+    "ticker": np.dtype([("time", "<i8"), ("price", "<f8"), ("best_bid", "<f8"), ("best_bid_quantity", "<f8"),
+                        ("best_ask", "<f8"), ("best_ask_quantity", "<f8"), ("volume_24h", "<f8")]),
+    "book": np.dtype([("time", "<i8"), ("side", "i1"), ("price", "<f8"), ("size", "<f8")]),
+}
+
+# Feed channel each kind of event is read from
+FEED_CHANNELS = {"trades": "market_trades", "ticker": "ticker", "book": "level2"}
+
+# Content type of the frames of each encoding
+CONTENT_TYPES = {
+    "binary": "application/x-market-events",
+    "msgpack": "application/msgpack",
+    "json": "application/json",
+}
+
+# Binary frame header: magic, version, kind code, flags, product ID length and event count,
+# followed by the product ID and the packed records
+FRAME_MAGIC = b"ME"
+FRAME_VERSION = 1
+_HEADER = struct.Struct("<2sBBBBI")
+_KIND_CODES = {"trades": 1, "ticker": 2, "book": 3}
+_KINDS = {code: kind for kind, code in _KIND_CODES.items()}
+
+# Frame flag of book frames that replace the whole book instead of updating it
+SNAPSHOT = 1
+
+# Book sides of level2 updates
+BOOK_SIDES = {"bid": 1, "offer": -1, "ask": -1}
+
+# Events by kind and outcome: "published", "failed" (not confirmed) or "dropped" (buffer full)
+MARKET_EVENTS = Counter("market_events_total", "Market data events distributed to the exchange.", ("kind", "outcome"))
+
+
+def _micros(values: List[str]) -> np.ndarray:
+    # Parse ISO 8601 timestamps to microseconds since the epoch
+    return np.array([value.rstrip("Z") for value in values], dtype="datetime64[us]").astype(np.int64)
+
+
+def normalize_trades(trades: List[dict]) -> Dict[str, np.ndarray]:
+    """
+    Normalize the trades of a market_trades event into records, product by product.
+
+    Args:
+        trades (List[dict]): The trades of the event.
+
+    Returns:
+        Dict[str, np.ndarray]: "trades" records of every product, in event order.
+    """
+    by_product = defaultdict(list)
+    for trade in trades:
+        by_product[trade.get("product_id")].append(trade)
+    layout = EVENT_LAYOUTS["trades"]
+    result = {}
+    for product_id, rows in by_product.items():
+        columns = trades_to_columns(rows)
+        records = np.empty(len(rows), dtype=layout)
+        for name in layout.names:
+            records[name] = columns[name]
+        result[product_id] = records
+    return result
+
+
+def normalize_tickers(tickers: List[dict], timestamp: str) -> Dict[str, np.ndarray]:
+    """
+    Normalize the tickers of a ticker event into records, product by product.
+
+    Args:
+        tickers (List[dict]): The tickers of the event.
+        timestamp (str): The timestamp of the message, used as the time of every ticker.
+
+    Returns:
+        Dict[str, np.ndarray]: "ticker" records of every product.
+    """
+    by_product = defaultdict(list)
+    for ticker in tickers:
+        by_product[ticker.get("product_id")].append(ticker)
+    layout = EVENT_LAYOUTS["ticker"]
+    result = {}
+    for product_id, rows in by_product.items():
+        records = np.empty(len(rows), dtype=layout)
+        records["time"] = _micros([timestamp] * len(rows))
+        records["volume_24h"] = _floats([row.get("volume_24_h", "") for row in rows])
+        for name in layout.names[1:-1]:
+            records[name] = _floats([row.get(name, "") for row in rows])
+        result[product_id] = records
+    return result
+
+
+def normalize_book(updates: List[dict], timestamp: str) -> np.ndarray:
+    """
+    Normalize the updates of a level2 event into book delta records.
+
+    Args:
+        updates (List[dict]): Level2 updates with side, event_time, price_level and new_quantity.
+        timestamp (str): The timestamp of the message, used for updates without an event time.
+
+    Returns:
+        np.ndarray: "book" records, a size of 0 removing the level.
+    """
+    records = np.empty(len(updates), dtype=EVENT_LAYOUTS["book"])
+    records["time"] = _micros([update.get("event_time") or timestamp for update in updates])
+    records["side"] = [BOOK_SIDES.get(update["side"], 0) for update in updates]
+    records["price"] = _floats([update["price_level"] for update in updates])
+    records["size"] = _floats([update["new_quantity"] for update in updates])
+    return records
+
+
+def encode_frame(kind: str, product_id: str, records: np.ndarray, encoding: str = MARKET_EVENTS_ENCODING,
+                 snapshot: bool = False) -> bytes:
+    """
+    Encode events of one kind and product as the body of one message.
+
+    The binary encoding writes a 10-byte header, the product ID and the records as
+    packed little-endian structs; msgpack writes the header fields followed by one
+    array per event; JSON writes one object per event, for consumers that need it.
+
+    Args:
+        kind (str): The kind of the events.
+        product_id (str): The ID of the product.
+        records (np.ndarray): The events, in the layout of the kind.
+        encoding (str): "binary", "msgpack" or "json".
+        snapshot (bool): Whether the frame replaces the whole book.
+
+    Returns:
+        bytes: The message body.
+
+    Raises:
+        ValueError: If the encoding is not supported.
+    """
+    flags = SNAPSHOT if snapshot else 0
+    if encoding == "binary":
+        product = product_id.encode()
+        header = _HEADER.pack(FRAME_MAGIC, FRAME_VERSION, _KIND_CODES[kind], flags, len(product), len(records))
+        return header + product + records.tobytes()
+    if encoding == "msgpack" and MSGPACK_AVAILABLE:
+        return msgpack.packb([FRAME_VERSION, kind, product_id, flags, records.tolist()])
+    if encoding == "json":
+        names = records.dtype.names
+        return orjson.dumps({"version": FRAME_VERSION, "kind": kind, "product_id": product_id, "snapshot": snapshot,
+                             "events": [dict(zip(names, row)) for row in records.tolist()]})
+    raise ValueError(f"Unsupported market event encoding: {encoding}")
+
+
+def decode_frame(body: bytes, encoding: str = MARKET_EVENTS_ENCODING) -> dict:
+    """
+    Decode the body of a market event message.
+
+    Args:
+        body (bytes): The message body.
+        encoding (str): The encoding it was produced with.
+
+    Returns:
+        dict: The "kind", "product_id" and "snapshot" flag of the frame, and its "events"
+        as records in the layout of the kind.
+
+    Raises:
+        ValueError: If the body is not a frame of a supported version and encoding.
+    """
+    try:
+        if encoding == "binary":
+            magic, version, code, flags, length, count = _HEADER.unpack_from(body)
+            if magic != FRAME_MAGIC:
+                raise ValueError("bad magic")
+            kind = _KINDS[code]
+            offset = _HEADER.size + length
+            product_id = body[_HEADER.size:offset].decode()
+            events = np.frombuffer(body, dtype=EVENT_LAYOUTS[kind], count=count, offset=offset)
+        elif encoding == "msgpack" and MSGPACK_AVAILABLE:
+            version, kind, product_id, flags, rows = msgpack.unpackb(body)
+            events = np.array([tuple(row) for row in rows], dtype=EVENT_LAYOUTS[kind])
+        elif encoding == "json":
+            frame = orjson.loads(body)
+            version, kind, product_id = frame["version"], frame["kind"], frame["product_id"]
+            flags = SNAPSHOT if frame["snapshot"] else 0
+            names = EVENT_LAYOUTS[kind].names
+            events = np.array([tuple(np.nan if event[name] is None else event[name] for name in names)
+                               for event in frame["events"]], dtype=EVENT_LAYOUTS[kind])
+        else:
+            raise ValueError(f"Unsupported market event encoding: {encoding}")
+    except (struct.error, KeyError, TypeError, UnicodeDecodeError, orjson.JSONDecodeError) as e:
+        raise ValueError(f"Invalid market event frame: {e}")
+    if version != FRAME_VERSION:
+        raise ValueError(f"Unsupported market event frame version: {version}")
+    return {"kind": kind, "product_id": product_id, "snapshot": bool(flags & SNAPSHOT), "events": events}
+
+
+class EventBatcher:
+    """
+    Buffers normalized events per routing key and encodes them into frames.
+
+    Events of one kind and product are concatenated until they fill a frame of
+    max_batch events or the frames are drained, whichever comes first. A book snapshot
+    first seals the deltas buffered before it, so frames keep the feed order of their
+    routing key. The buffer holds at most max_pending events; events arriving beyond
+    that are dropped and counted.
+
+    Args:
+        encoding (str): Encoding of the frames.
+        max_batch (int): Maximum number of events per frame.
+        max_pending (int): Maximum number of events buffered.
+    """
+
+    def __init__(self, encoding: str = MARKET_EVENTS_ENCODING, max_batch: int = MARKET_EVENTS_MAX_BATCH,
+                 max_pending: int = MARKET_EVENTS_MAX_PENDING):
+        self.encoding = encoding
+        self.max_batch = max(1, max_batch)
+        self.max_pending = max_pending
+        self._buffers: Dict[Tuple[str, str], List[np.ndarray]] = {}  # (kind, product) -> record chunks
+        self._sizes: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._ready: List[Tuple[str, str, bytes, int]] = []  # Sealed frames: kind, routing key, body, events
+        self.pending = 0  # Events buffered or in sealed frames
+        self.events = 0  # Events encoded into frames
+        self.frames = 0  # Frames encoded
+        self.bytes = 0  # Bytes of the encoded frames
+        self.dropped = 0  # Events dropped because the buffer was full
+
+    def add(self, kind: str, product_id: str, records: np.ndarray, snapshot: bool = False) -> bool:
+        """
+        Buffer the events of one kind and product.
+
+        Args:
+            kind (str): The kind of the events.
+            product_id (str): The ID of the product.
+            records (np.ndarray): The events, in the layout of the kind.
+            snapshot (bool): Whether the events replace the whole book.
+
+        Returns:
+            bool: True when a full frame is ready to be published.
+        """
+        if not len(records):
+            return bool(self._ready)
+        if self.pending + len(records) > self.max_pending:
+            self.dropped += len(records)
+            MARKET_EVENTS.labels(kind, "dropped").inc(len(records))
+            return bool(self._ready)
+        key = (kind, product_id)
+        self.pending += len(records)
+        if snapshot:
+            self._seal(key)
+            self._encode(kind, product_id, records, snapshot=True)
+            return True
+        self._buffers.setdefault(key, []).append(records)
+        self._sizes[key] += len(records)
+        if self._sizes[key] >= self.max_batch:
+            self._seal(key)
+        return bool(self._ready)
+
+    def drain(self) -> List[Tuple[str, str, bytes, int]]:
+        """
+        Seal every buffered event into frames and hand the frames over.
+
+        Returns:
+            List[Tuple[str, str, bytes, int]]: Kind, routing key, body and event count of
+            every frame, in the order they must be published.
+        """
+        for key in list(self._buffers):
+            self._seal(key)
+        frames, self._ready = self._ready, []
+        self.pending = 0
+        return frames
+
+    def _seal(self, key: Tuple[str, str]):
+        # Encode the buffered events of a routing key into frames of at most max_batch events
+        chunks = self._buffers.pop(key, None)
+        self._sizes.pop(key, None)
+        if chunks:
+            self._encode(key[0], key[1], np.concatenate(chunks) if len(chunks) > 1 else chunks[0])
+
+    def _encode(self, kind: str, product_id: str, records: np.ndarray, snapshot: bool = False):
+        # Split records into frames; only the first frame of a snapshot resets the book
+        routing_key = f"{kind}.{product_id}"
+        for offset in range(0, len(records), self.max_batch):
+            chunk = records[offset:offset + self.max_batch]
+            body = encode_frame(kind, product_id, chunk, self.encoding, snapshot and offset == 0)
+            self._ready.append((kind, routing_key, body, len(chunk)))
+            self.events += len(chunk)
+            self.frames += 1
+            self.bytes += len(body)
+
+
+class MarketEventDistributor:
+    """
+    Publishes normalized trades, tickers and book deltas of selected products to a topic exchange.
+
+    Events are read from the shared market data feed, normalized into fixed layouts and
+    micro-batched per routing key ("trades.BTC-USD", "ticker.BTC-USD", "book.BTC-USD"),
+    so downstream services bind queues to exactly the products and kinds they need. The
+    buffered frames are published every max_delay seconds, or as soon as a frame is full,
+    in order on one channel with publisher confirms. Market data is transient: messages
+    are not persisted and frames the broker did not confirm are counted and dropped.
+
+    Args:
+        feed (CoinbaseFeed): The market data feed to read events from.
+        product_ids (List[str]): The products to distribute.
+        kinds (List[str]): The kinds of events to distribute.
+        publisher (Publisher, optional): The publisher to use instead of the shared one.
+        exchange (str): The topic exchange to publish to.
+        encoding (str): "binary", "msgpack" or "json"; msgpack falls back to binary when
+            the package is not installed.
+        max_batch (int): Maximum number of events per frame.
+        max_delay (float): Seconds an event may wait before its frame is published.
+        max_pending (int): Maximum number of events buffered while publishing lags.
+        stream (bool): Whether to open the upstream subscriptions of the products.
+        hub (FanoutHub, optional): The hub holding the trade and ticker subscriptions.
+
+    Raises:
+        ValueError: If the encoding or a kind is not supported.
+    """
+
+    def __init__(self, feed: CoinbaseFeed, product_ids: List[str], kinds: List[str] = MARKET_EVENTS_KINDS,
+                 publisher: Optional[Publisher] = None, exchange: str = MARKET_EVENTS_EXCHANGE,
+                 encoding: str = MARKET_EVENTS_ENCODING, max_batch: int = MARKET_EVENTS_MAX_BATCH,
+                 max_delay: float = MARKET_EVENTS_MAX_DELAY, max_pending: int = MARKET_EVENTS_MAX_PENDING,
+                 stream: bool = True, hub: Optional[FanoutHub] = None):
+        if encoding not in CONTENT_TYPES:
+            raise ValueError(f"Unsupported market event encoding: {encoding}")
+        if encoding == "msgpack" and not MSGPACK_AVAILABLE:
+            logger.warning("msgpack is not installed, market events are encoded as binary frames")
+            encoding = "binary"
+        unknown = set(kinds) - set(FEED_CHANNELS)
+        if unknown:
+            raise ValueError(f"Unsupported market event kinds: {', '.join(sorted(unknown))}")
+        self.feed = feed
+        self.product_ids = list(product_ids)
+        self.kinds = list(kinds)
+        self.publisher = publisher
+        self.exchange = exchange
+        self.encoding = encoding
+        self.max_delay = max_delay
+        self.stream = stream
+        self.hub = hub
+        self.batcher = EventBatcher(encoding, max_batch, max_pending)
+        self.properties = pika.BasicProperties(content_type=CONTENT_TYPES[encoding], delivery_mode=1)
+        self._products = set(self.product_ids)
+        self._full: Optional[asyncio.Event] = None  # Created on start, set when a frame is full
+        self._tasks: List[asyncio.Task] = []
+        self._pins: List[Subscriber] = []
+        self._level2: List[str] = []  # Products this distributor subscribed to on the level2 channel
+        self.published = 0  # Frames confirmed by the broker
+        self.failed = 0  # Frames not confirmed
+        handlers = {"trades": self._on_trades, "ticker": self._on_tickers, "book": self._on_book}
+        for kind in self.kinds:
+            feed.add_handler(FEED_CHANNELS[kind], handlers[kind])
+
+    def _add(self, kind: str, product_id: str, records: np.ndarray, snapshot: bool = False):
+        # Buffer events of a distributed product and wake the flusher when a frame is full
+        if self._full is None or product_id not in self._products:
+            return
+        if self.batcher.add(kind, product_id, records, snapshot):
+            self._full.set()
+
+    def _on_trades(self, event: dict, timestamp: str):
+        # Distribute the trades of a market_trades event
+        if self._full is None:
+            return
+        trades = [trade for trade in event.get("trades", ()) if trade.get("product_id") in self._products]
+        for product_id, records in normalize_trades(trades).items():
+            self._add("trades", product_id, records)
+
+    def _on_tickers(self, event: dict, timestamp: str):
+        # Distribute the tickers of a ticker event
+        if self._full is None:
+            return
+        tickers = [ticker for ticker in event.get("tickers", ()) if ticker.get("product_id") in self._products]
+        for product_id, records in normalize_tickers(tickers, timestamp).items():
+            self._add("ticker", product_id, records)
+
+    def _on_book(self, event: dict, timestamp: str):
+        # Distribute a level2 snapshot or update as book deltas
+        if self._full is None or event.get("product_id") not in self._products:
+            return
+        records = normalize_book(event.get("updates", ()), timestamp)
+        self._add("book", event["product_id"], records, snapshot=event.get("type") == "snapshot")
+
+    async def flush(self) -> int:
+        """
+        Publish every buffered event now.
+
+        Returns:
+            int: The number of frames confirmed by the broker.
+        """
+        frames = self.batcher.drain()
+        if not frames:
+            return 0
+        publisher = self.publisher or get_publisher()
+        try:
+            await publisher.publish_to_exchange(self.exchange, [(key, body) for _, key, body, _ in frames],
+                                                self.properties)
+            outcome = "published"
+            self.published += len(frames)
+        except Exception as e:
+            outcome = "failed"
+            self.failed += len(frames)
+            logger.warning(f"Could not publish {len(frames)} market event frame(s): {e}")
+        for kind, _, _, count in frames:
+            MARKET_EVENTS.labels(kind, outcome).inc(count)
+        return len(frames) if outcome == "published" else 0
+
+    async def _run(self):
+        # Publish the buffered frames at least every max_delay seconds, sooner when one is full
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    async def _subscribe(self):
+        # Open the upstream subscriptions; trades and tickers are held through the hub, so they
+        # stay open when the last stream client of a product leaves
+        hub = self.hub or get_hub()
+        for kind in self.kinds:
+            if kind == "book":
+                self._level2 = list(self.product_ids)  # Recorded first so a cancelled subscribe is still released
+                await self.feed.subscribe("level2", self._level2)
+                continue
+            for product_id in self.product_ids:
+                self._pins.append(await hub.subscribe(FEED_CHANNELS[kind], product_id, maxsize=1,
+                                                      policy="drop_oldest"))
+
+    def start(self):
+        """
+        Start distributing on the running event loop.
+        """
+        if self._tasks:
+            return
+        self._full = asyncio.Event()
+        self._tasks.append(asyncio.create_task(self._run()))
+        if self.stream:
+            self._tasks.append(asyncio.create_task(self._subscribe()))
+
+    async def stop(self):
+        """
+        Stop distributing, releasing the upstream subscriptions and publishing the events
+        still buffered.
+        """
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._full = None
+        pins, self._pins = self._pins, []
+        for pin in pins:
+            await (self.hub or get_hub()).unsubscribe(pin)
+        level2, self._level2 = self._level2, []
+        if level2:
+            await self.feed.unsubscribe("level2", level2)
+        await self.flush()
+
+    def stats(self) -> dict:
+        """
+        Return the state of the distributor.
+
+        Returns:
+            dict: Distributed products and kinds, exchange and encoding, and event, frame,
+            byte, drop and publish counters.
+        """
+        batcher = self.batcher
+        return {
+            "products": self.product_ids,
+            "kinds": self.kinds,
+            "exchange": self.exchange,
+            "encoding": self.encoding,
+            "running": bool(self._tasks),
+            "pending": batcher.pending,
+            "events": batcher.events,
+            "frames": batcher.frames,
+            "bytes": batcher.bytes,
+            "bytes_per_event": round(batcher.bytes / batcher.events, 2) if batcher.events else 0.0,
+            "dropped": batcher.dropped,
+            "published_frames": self.published,
+            "failed_frames": self.failed,
+        }
+
+
+# Shared distributor, created on first use
+_distributor: Optional[MarketEventDistributor] = None
+
+
+def get_distributor() -> MarketEventDistributor:
+    """
+    Return the shared distributor of the MARKET_EVENTS_PRODUCTS, creating it on first use.
+
+    Returns:
+        MarketEventDistributor: The distributor attached to the shared market data feed.
+    """
+    global _distributor
+    if _distributor is None:
+        _distributor = MarketEventDistributor(get_feed(), MARKET_EVENTS_PRODUCTS)
+    return _distributor
@@ -0,0 +1,342 @@
+import asyncio
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds between two event loop lag probes
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+
+# Default latency buckets in seconds, from 1 ms to 10 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Buckets for CPU-bound work such as serialization, from 10 µs to 1 s
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.1, 1.0)
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Every metric created, in creation order, rendered by /metrics
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """
+    Base of the metric families: a name, help text, label names and one child per label set.
+
+    Children are created on first use and kept, so recording a sample on a known label
+    set costs a dictionary lookup and an addition.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        _registry.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """
+        Return the child holding the samples of a label set.
+
+        Args:
+            *values (str): One value per label name, in order.
+
+        Returns:
+            The child for those values, created on first use.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _label_text(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """
+        Render the family in the Prometheus text format.
+
+        Returns:
+            str: HELP and TYPE lines followed by one line per sample.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing count, e.g. requests served or failures.
+    """
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{self._label_text(values)} {_format(child.value)}"
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down. With a callback the value is sampled when scraped.
+
+    Args:
+        callback (Callable[[], Dict[Tuple[str, ...], float]], optional): Function returning
+            the current value per label set, called at scrape time on the event loop.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def _samples(self):
+        if self.callback is not None:
+            for values, value in self.callback().items():
+                self.labels(*values).set(value)
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{self._label_text(values)} {_format(child.value)}"
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Per bucket, the last one being +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values in fixed buckets, e.g. latencies.
+
+    Observations only increment one bucket; buckets are made cumulative when rendered.
+
+    Args:
+        buckets (Sequence[float]): Upper bounds of the buckets, ascending; +Inf is implied.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), child.counts):
+                cumulative += count
+                le = 'le="' + _format(bound) + '"'
+                yield f"{self.name}_bucket{self._label_text(values, le)} {cumulative}"
+            yield f"{self.name}_sum{self._label_text(values)} {_format(child.sum)}"
+            yield f"{self.name}_count{self._label_text(values)} {cumulative}"
+
+
+def render() -> str:
+    """
+    Render every registered metric in the Prometheus text format.
+
+    Returns:
+        str: The exposition, ending with a newline.
+    """
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# Requests served by the API, per route template
+REQUESTS = Counter("http_requests_total", "HTTP requests served.", ("method", "route", "status"))
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Time to serve an HTTP request, body included.",
+                            ("method", "route"))
+REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests being served.")
+
+# Calls to the Coinbase API, per upstream endpoint
+UPSTREAM_LATENCY = Histogram("upstream_request_duration_seconds",
+                             "Time of one Coinbase HTTP exchange, excluding rate-limit queueing.",
+                             ("endpoint", "status"))
+
+# Response validation and encoding
+SERIALIZATION_LATENCY = Histogram("serialization_duration_seconds", "Time to validate and encode a response body.",
+                                  ("encoder",), buckets=FAST_BUCKETS)
+SERIALIZATION_CACHE_HITS = Counter("serialization_cache_hits_total",
+                                   "Responses served from previously encoded bytes.", ("encoder",))
+
+# RabbitMQ publishing
+PUBLISH_LATENCY = Histogram("rabbitmq_publish_duration_seconds",
+                            "Time from publishing messages to receiving their broker confirms.", ("operation",))
+PUBLISHED_MESSAGES = Counter("rabbitmq_published_messages_total", "Messages confirmed by the broker.", ("operation",))
+PUBLISH_FAILURES = Counter("rabbitmq_publish_failures_total", "Publish calls that failed.", ("operation",))
+
+# Event loop responsiveness
+LOOP_LAG = Histogram("event_loop_lag_seconds", "Delay of a scheduled wake-up of the event loop.",
+                     buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+LOOP_LAG_LAST = Gauge("event_loop_lag_last_seconds", "Delay of the latest event loop wake-up probe.")
+
+
+def _threadpool_usage() -> Dict[Tuple[str, ...], float]:
+    # Sample the worker threads of FastAPI's AnyIO pool and of the asyncio.to_thread executor
+    usage = {}
+    try:
+        from anyio import to_thread
+        limiter = to_thread.current_default_thread_limiter()
+        usage[("anyio", "busy")] = limiter.borrowed_tokens
+        usage[("anyio", "capacity")] = limiter.total_tokens
+    except Exception:
+        pass
+    try:
+        executor = getattr(asyncio.get_running_loop(), "_default_executor", None)
+    except RuntimeError:  # Rendered outside of the event loop
+        executor = None
+    if executor is not None:
+        usage[("asyncio", "threads")] = len(executor._threads)
+        usage[("asyncio", "capacity")] = executor._max_workers
+        usage[("asyncio", "queued")] = executor._work_queue.qsize()
+    return usage
+
+
+THREADPOOL = Gauge("threadpool_workers", "Worker threads of the AnyIO and asyncio thread pools, sampled when scraped.",
+                   ("pool", "state"), callback=_threadpool_usage)
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    """
+    Measure how late the event loop wakes up from a sleep, forever.
+
+    A busy loop, blocked by CPU-bound work or synchronous calls, wakes up late; the
+    delay beyond the requested interval is recorded.
+
+    Args:
+        interval (float): Seconds between two probes.
+    """
+    while True:
+        began = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - began - interval)
+        LOOP_LAG.observe(lag)
+        LOOP_LAG_LAST.set(lag)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency and status of every HTTP request.
+
+    Requests are labelled with their route template (e.g. /public/product/{product_id})
+    rather than the raw path, so the number of series stays bounded; requests matching
+    no route share the "unmatched" label.
+
+    Args:
+        app: The ASGI application to wrap.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._endpoints: Optional[Dict[Callable, object]] = None  # Endpoint function -> route
+
+    def _route(self, scope) -> str:
+        route = scope.get("route")  # Set by the router on the scope of the matched request
+        if route is None and "endpoint" in scope:
+            # Starlette releases that only keep the endpoint on the scope
+            if self._endpoints is None:
+                self._endpoints = {getattr(r, "endpoint", None): r for r in scope["app"].routes}
+            route = self._endpoints.get(scope["endpoint"])
+        template = getattr(route, "path_format", None)
+        if template is None:
+            return "unmatched"
+        # Routes of included routers may only know their path relative to the router prefix:
+        # the prefix is what precedes the route path, filled with the request's parameters
+        try:
+            relative = template.format_map({name: str(value) for name, value in scope.get("path_params", {}).items()})
+        except (KeyError, ValueError):
+            return template
+        path = scope["path"]
+        return path[:len(path) - len(relative)] + template if path.endswith(relative) else template
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500  # Reported when the app fails before starting a response
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        began = time.perf_counter()
+        REQUESTS_IN_PROGRESS.labels().inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_PROGRESS.labels().dec()
+            route = self._route(scope)
+            method = scope["method"]
+            REQUEST_LATENCY.labels(method, route).observe(time.perf_counter() - began)
+            REQUESTS.labels(method, route, str(status)).inc()
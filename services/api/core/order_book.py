@@ -0,0 +1,279 @@
+import math
+import os
+import time
+from decimal import Decimal
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+from sortedcontainers import SortedDict
+
+from .ws_feed import CoinbaseFeed, get_feed
+
+# Serve order books from the live level2 feed instead of REST snapshots (opt-in)
+LIVE_ORDER_BOOKS = os.getenv("LIVE_ORDER_BOOKS", "0") == "1"
+
+# Time (in seconds) after which a live book that nobody has read is dropped and unsubscribed
+LIVE_ORDER_BOOK_IDLE = float(os.getenv("LIVE_ORDER_BOOK_IDLE", "300"))
+
+# Tolerance used when assigning prices to aggregation buckets
+_BUCKET_EPSILON = 1e-9
+
+
+class OrderBook:
+    """
+    In-memory order book for one product with sorted price levels.
+
+    Each side maps the numeric price to the original (price, size) strings, so inserts,
+    updates and deletes are O(log n) and levels are read back in price order.
+
+    Args:
+        product_id (str): The ID of the product.
+    """
+
+    def __init__(self, product_id: str):
+        self.product_id = product_id
+        self.bids = SortedDict()  # price -> (price, size), best bid is the last key
+        self.asks = SortedDict()  # price -> (price, size), best ask is the first key
+        self.time = ""  # Timestamp of the last applied event
+        self.synced = False  # Whether a snapshot was loaded since the last reset
+
+    def _side(self, side: str) -> SortedDict:
+        return self.bids if side == "bid" else self.asks
+
+    def update(self, side: str, price: str, size: str):
+        """
+        Set the size of a price level, removing it when the size is zero.
+
+        Args:
+            side (str): "bid", or "offer"/"ask" for the ask side.
+            price (str): The price of the level.
+            size (str): The new total size at that price.
+        """
+        levels = self._side(side)
+        key = float(price)
+        if float(size) == 0:
+            levels.pop(key, None)
+        else:
+            levels[key] = (price, size)
+
+    def load_snapshot(self, updates: Iterable[dict], timestamp: str = ""):
+        """
+        Replace the whole book with a level2 snapshot.
+
+        Args:
+            updates (Iterable[dict]): Level2 updates with side, price_level and new_quantity.
+            timestamp (str): Timestamp of the snapshot.
+        """
+        self.bids.clear()
+        self.asks.clear()
+        self.apply(updates, timestamp)
+        self.synced = True
+
+    def apply(self, updates: Iterable[dict], timestamp: str = ""):
+        """
+        Apply incremental level2 updates.
+
+        Args:
+            updates (Iterable[dict]): Level2 updates with side, price_level and new_quantity.
+            timestamp (str): Timestamp of the updates.
+        """
+        for update in updates:
+            self.update(update["side"], update["price_level"], update["new_quantity"])
+        if timestamp:
+            self.time = timestamp
+
+    @classmethod
+    def from_pricebook(cls, pricebook: dict) -> "OrderBook":
+        """
+        Build a book from a REST product book response.
+
+        Args:
+            pricebook (dict): The "pricebook" object of the product book response.
+
+        Returns:
+            OrderBook: The book holding the REST snapshot.
+        """
+        book = cls(pricebook["product_id"])
+        for entry in pricebook["bids"]:
+            book.update("bid", entry["price"], entry["size"])
+        for entry in pricebook["asks"]:
+            book.update("ask", entry["price"], entry["size"])
+        book.time = pricebook.get("time", "")
+        book.synced = True
+        return book
+
+    def levels(self, side: str, depth: Optional[int] = None, tick: Optional[float] = None) -> List[dict]:
+        """
+        Return the best levels of one side, optionally aggregated into price buckets.
+
+        Args:
+            side (str): "bid" or "ask".
+            depth (int, optional): Maximum number of levels (or buckets) to return.
+            tick (float, optional): Bucket size; bids are rounded down and asks up to a multiple of it.
+
+        Returns:
+            List[dict]: Levels with "price" and "size" strings, best price first.
+        """
+        levels = self._side(side)
+        ordered = reversed(levels.values()) if side == "bid" else iter(levels.values())
+        if not tick:
+            return [{"price": price, "size": size} for price, size in islice(ordered, depth)]
+
+        decimals = max(0, -Decimal(str(tick)).as_tuple().exponent)
+        round_bucket = math.floor if side == "bid" else math.ceil
+        buckets = []
+        current, total = None, 0.0
+        for price, size in ordered:
+            bucket = round_bucket(float(price) / tick + (_BUCKET_EPSILON if side == "bid" else -_BUCKET_EPSILON))
+            if bucket != current:
+                if current is not None:
+                    buckets.append({"price": f"{current * tick:.{decimals}f}", "size": f"{total:.8f}"})
+                    if depth is not None and len(buckets) == depth:
+                        return buckets
+                current, total = bucket, 0.0
+            total += float(size)
+        if current is not None:
+            buckets.append({"price": f"{current * tick:.{decimals}f}", "size": f"{total:.8f}"})
+        return buckets
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Return both sides of the book as NumPy columns, best price first.
+
+        Returns:
+            Dict[str, np.ndarray]: float64 "bid_price", "bid_size", "ask_price" and "ask_size" columns.
+        """
+        columns = {}
+        for side, levels in (("bid", self.bids), ("ask", self.asks)):
+            prices = np.fromiter(levels.keys(), dtype=np.float64, count=len(levels))
+            sizes = np.array([size for _, size in levels.values()], dtype=np.float64)
+            if side == "bid":
+                prices, sizes = prices[::-1], sizes[::-1]  # Best bid is the highest price
+            columns[f"{side}_price"], columns[f"{side}_size"] = prices, sizes
+        return columns
+
+    def to_product_book(self, depth: Optional[int] = None, tick: Optional[float] = None) -> dict:
+        """
+        Render the book in the shape of the Coinbase product book response.
+
+        Args:
+            depth (int, optional): Maximum number of levels per side.
+            tick (float, optional): Price bucket size for aggregation.
+
+        Returns:
+            dict: A product book object.
+        """
+        return {"pricebook": {
+            "product_id": self.product_id,
+            "bids": self.levels("bid", depth, tick),
+            "asks": self.levels("ask", depth, tick),
+            "time": self.time,
+        }}
+
+
+class OrderBookManager:
+    """
+    Keeps one live order book per requested product, fed by the level2 channel.
+
+    The first event for a product is a snapshot, after which incremental updates are
+    applied. When the feed disconnects or detects a sequence gap every book is marked
+    out of sync until the snapshot sent on resubscription has been loaded. Books that
+    have not been read for `idle_timeout` seconds are dropped and their level2
+    subscription released, so mistyped or one-off product IDs do not stay subscribed.
+
+    Args:
+        feed (CoinbaseFeed): The market data feed to subscribe through.
+        idle_timeout (float): Seconds without a read after which a book is dropped.
+        clock (Callable[[], float]): Monotonic clock used to measure idle time.
+    """
+
+    def __init__(self, feed: CoinbaseFeed, idle_timeout: float = LIVE_ORDER_BOOK_IDLE,
+                 clock: Callable[[], float] = time.monotonic):
+        self.feed = feed
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.books: Dict[str, OrderBook] = {}
+        self._last_read: Dict[str, float] = {}  # product id -> time of the last read
+        feed.add_handler("level2", self._on_event)
+        feed.add_reset_handler(self._on_reset)
+
+    async def track(self, product_id: str):
+        """
+        Start maintaining the book of a product if it is not tracked yet.
+
+        Books that have been idle for too long are dropped first.
+
+        Args:
+            product_id (str): The ID of the product.
+        """
+        self._last_read[product_id] = self.clock()
+        await self.evict_idle()
+        if product_id in self.books:
+            return
+        self.books[product_id] = OrderBook(product_id)
+        await self.feed.subscribe("level2", [product_id])
+
+    async def evict_idle(self) -> List[str]:
+        """
+        Drop the books that have not been read for longer than the idle timeout.
+
+        Returns:
+            List[str]: The IDs of the products whose books were dropped.
+        """
+        cutoff = self.clock() - self.idle_timeout
+        idle = [product_id for product_id in self.books if self._last_read.get(product_id, cutoff) < cutoff]
+        for product_id in idle:
+            del self.books[product_id]
+            self._last_read.pop(product_id, None)
+        if idle:
+            await self.feed.unsubscribe("level2", idle)
+        return idle
+
+    def get(self, product_id: str) -> Optional[OrderBook]:
+        """
+        Return the live book of a product if it is in sync.
+
+        Args:
+            product_id (str): The ID of the product.
+
+        Returns:
+            OrderBook: The book, or None if it is not tracked or not in sync.
+        """
+        book = self.books.get(product_id)
+        if book is None:
+            return None
+        self._last_read[product_id] = self.clock()
+        return book if book.synced else None
+
+    def _on_event(self, event: dict, timestamp: str):
+        # Load snapshots and apply updates to books that are in sync
+        book = self.books.get(event.get("product_id"))
+        if book is None:
+            return
+        if event.get("type") == "snapshot":
+            book.load_snapshot(event.get("updates", ()), timestamp)
+        elif book.synced:
+            book.apply(event.get("updates", ()), timestamp)
+
+    def _on_reset(self):
+        # Books cannot be trusted until a new snapshot arrives
+        for book in self.books.values():
+            book.synced = False
+
+
+# Shared manager, created on first use
+_manager: Optional[OrderBookManager] = None
+
+
+def get_order_books() -> OrderBookManager:
+    """
+    Return the shared order book manager, creating it on first use.
+
+    Returns:
+        OrderBookManager: The manager attached to the shared market data feed.
+    """
+    global _manager
+    if _manager is None:
+        _manager = OrderBookManager(get_feed())
+    return _manager
@@ -0,0 +1,339 @@
+import asyncio
+import functools
+import math
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from fastapi.logger import logger
+
+from .scheduler import BACKGROUND, get_scheduler, upstream_priority
+
+# Whether the prefetcher runs in the application lifespan
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+
+# Number of hottest keys kept warm, and the request rate (per second) below which a key is not prefetched
+PREFETCH_MAX_KEYS = int(os.getenv("PREFETCH_MAX_KEYS", "50"))
+PREFETCH_MIN_RATE = float(os.getenv("PREFETCH_MIN_RATE", "0.05"))
+
+# Seconds after which the weight of a past request is halved when ranking keys
+PREFETCH_HALF_LIFE = float(os.getenv("PREFETCH_HALF_LIFE", "60"))
+
+# Upstream requests per second the prefetcher may spend, whatever the popularity of the keys
+PREFETCH_BUDGET = float(os.getenv("PREFETCH_BUDGET", "3"))
+
+# Prefetching pauses while a new upstream request would be queued longer than this (seconds)
+PREFETCH_MAX_QUEUE_DELAY = float(os.getenv("PREFETCH_MAX_QUEUE_DELAY", "0.1"))
+
+# Fraction of the cache TTL left when a hot entry is refreshed
+PREFETCH_LEAD = float(os.getenv("PREFETCH_LEAD", "0.2"))
+
+# Largest factor by which the interval of a key whose data does not change is stretched
+PREFETCH_MAX_BACKOFF = float(os.getenv("PREFETCH_MAX_BACKOFF", "8"))
+
+# Seconds between two passes of the prefetcher
+PREFETCH_TICK = float(os.getenv("PREFETCH_TICK", "0.1"))
+
+# Maximum number of keys whose popularity is tracked
+PREFETCH_TRACKED_KEYS = int(os.getenv("PREFETCH_TRACKED_KEYS", "10000"))
+
+# Prefetchable sources by name: the cached function, whose cache and undecorated function are used
+_sources: Dict[str, Callable[..., Awaitable[Any]]] = {}
+
+
+class KeyState:
+    """
+    Popularity and refresh schedule of one (source, arguments) key.
+    """
+    __slots__ = ("score", "seen", "backoff", "next_due", "refreshes", "changes")
+
+    def __init__(self, now: float):
+        self.score = 0.0  # Requests, each weighted down by its age
+        self.seen = now  # Time the score was last decayed
+        self.backoff = 1.0  # Interval stretch, grown while refreshes return unchanged data
+        self.next_due = 0.0  # Earliest time of the next prefetch
+        self.refreshes = 0
+        self.changes = 0
+
+
+class Prefetcher:
+    """
+    Keeps the cache entries of the most requested keys fresh by refreshing them before they expire.
+
+    Every call of a prefetchable source records its arguments; popularity is an
+    exponentially decayed request count. On each pass the hottest keys whose entry is
+    about to go stale are refreshed in the background, so clients keep hitting fresh
+    entries instead of paying the upstream latency after each expiry.
+
+    The interval between two prefetches of a key starts just under the cache TTL and
+    adapts: keys requested less often than the TTL are refreshed about as often as they
+    are requested, and keys whose data comes back unchanged are refreshed less and less
+    often (up to the end of their stale window). A changed payload resets the interval.
+
+    Prefetches spend at most a fixed budget of upstream requests per second, run with
+    the background priority and pause while interactive requests are queued for the
+    upstream rate limit, so they never starve client traffic.
+
+    Args:
+        max_keys (int): Number of hottest keys kept warm.
+        min_rate (float): Request rate below which a key is not prefetched.
+        half_life (float): Seconds after which a request counts half.
+        budget (float): Upstream requests per second the prefetcher may spend.
+        max_queue_delay (float): Queueing delay of the scheduler above which prefetching pauses.
+        lead (float): Fraction of the TTL left when an entry is refreshed.
+        max_backoff (float): Largest stretch of the interval of unchanged data.
+        clock (Callable[[], float]): Monotonic time source, shared with the caches.
+    """
+
+    def __init__(self, max_keys: int = PREFETCH_MAX_KEYS, min_rate: float = PREFETCH_MIN_RATE,
+                 half_life: float = PREFETCH_HALF_LIFE, budget: float = PREFETCH_BUDGET,
+                 max_queue_delay: float = PREFETCH_MAX_QUEUE_DELAY, lead: float = PREFETCH_LEAD,
+                 max_backoff: float = PREFETCH_MAX_BACKOFF, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max_keys
+        self.min_rate = min_rate
+        self.half_life = half_life
+        self.budget = budget
+        self.max_queue_delay = max_queue_delay
+        self.lead = lead
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.keys: Dict[Tuple[str, Hashable], KeyState] = {}
+        self.tokens = max(1.0, budget)  # Prefetch budget, refilled at budget per second
+        self._updated = clock()
+        self._inflight: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.prefetched = 0  # Refreshes completed
+        self.unchanged = 0  # Refreshes that returned the data already cached
+        self.failures = 0  # Refreshes that failed
+        self.skipped_budget = 0  # Due refreshes postponed for lack of budget
+        self.skipped_busy = 0  # Passes skipped because interactive requests were queued
+
+    def _decay(self, state: KeyState, now: float):
+        state.score *= 0.5 ** ((now - state.seen) / self.half_life)
+        state.seen = now
+
+    def record(self, source: str, args: Hashable):
+        """
+        Count a request for a key.
+
+        Args:
+            source (str): Name of the prefetchable source.
+            args (Hashable): Arguments of the call.
+        """
+        now = self.clock()
+        state = self.keys.get((source, args))
+        if state is None:
+            if len(self.keys) >= PREFETCH_TRACKED_KEYS:
+                self._forget(now)
+            state = self.keys[(source, args)] = KeyState(now)
+        self._decay(state, now)
+        state.score += 1.0
+
+    def _forget(self, now: float):
+        # Drop the least popular half of the tracked keys
+        for state in self.keys.values():
+            self._decay(state, now)
+        ranked = sorted(self.keys, key=lambda key: self.keys[key].score)
+        for key in ranked[:len(ranked) // 2]:
+            del self.keys[key]
+
+    def rate(self, state: KeyState, now: float) -> float:
+        """
+        Estimate the request rate of a key.
+
+        Args:
+            state (KeyState): The key state.
+            now (float): Current time.
+
+        Returns:
+            float: Requests per second over the recent past.
+        """
+        return state.score * 0.5 ** ((now - state.seen) / self.half_life) * math.log(2) / self.half_life
+
+    def hot(self) -> List[Tuple[str, Hashable]]:
+        """
+        Return the keys worth prefetching, most requested first.
+
+        Returns:
+            List[Tuple[str, Hashable]]: Up to max_keys (source, arguments) keys.
+        """
+        now = self.clock()
+        rates = [(self.rate(state, now), key) for key, state in list(self.keys.items()) if key[0] in _sources]
+        rates = [item for item in rates if item[0] >= self.min_rate]
+        rates.sort(key=lambda item: item[0], reverse=True)
+        return [key for _, key in rates[:self.max_keys]]
+
+    def interval(self, source: str, state: KeyState, now: float) -> float:
+        """
+        Return the seconds between two prefetches of a key.
+
+        Args:
+            source (str): Name of the prefetchable source.
+            state (KeyState): The key state.
+            now (float): Current time.
+
+        Returns:
+            float: At least the TTL minus the lead, stretched for rarely requested or
+            unchanged data, and at most the end of the stale window.
+        """
+        cache = _sources[source].cache
+        shortest = cache.ttl * (1 - self.lead)
+        longest = max(shortest, cache.ttl + cache.stale_ttl - cache.ttl * self.lead)
+        rate = self.rate(state, now)
+        base = max(shortest, 1 / rate if rate > 0 else longest)
+        return min(base * state.backoff, longest)
+
+    def _take_token(self, now: float) -> bool:
+        # Spend one request of the prefetch budget if available
+        self.tokens = min(max(1.0, self.budget), self.tokens + (now - self._updated) * self.budget)
+        self._updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def _refresh(self, source: str, args: Hashable, state: KeyState):
+        # Refresh one cache entry and adapt the interval to whether its data changed
+        func = _sources[source]
+        previous = func.cache.peek(args)
+        try:
+            with upstream_priority(BACKGROUND):
+                value = await func.cache.refresh(args, lambda: func.__wrapped__(*args))
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Prefetch of {source}{args} failed: {e}")
+            state.next_due = self.clock() + self.interval(source, state, self.clock())
+            return
+        self.prefetched += 1
+        state.refreshes += 1
+        if value == previous:
+            self.unchanged += 1
+            state.backoff = min(state.backoff * 2, self.max_backoff)
+        else:
+            state.changes += 1
+            state.backoff = 1.0
+        now = self.clock()
+        state.next_due = now + self.interval(source, state, now)
+
+    def run_once(self) -> int:
+        """
+        Start the refreshes that are due, within the budget.
+
+        Returns:
+            int: The number of refreshes started.
+        """
+        if get_scheduler().queue_delay() > self.max_queue_delay:
+            self.skipped_busy += 1
+            return 0
+        now = self.clock()
+        started = 0
+        for key in self.hot():
+            source, args = key
+            state = self.keys[key]
+            if key in self._inflight or now < state.next_due:
+                continue
+            fresh_for = _sources[source].cache.fresh_for(args)
+            if fresh_for is not None and fresh_for > _sources[source].cache.ttl * self.lead:
+                continue  # Refreshed recently by a client request
+            if not self._take_token(now):
+                self.skipped_budget += 1
+                break
+            task = asyncio.ensure_future(self._refresh(source, args, state))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _, key=key: self._inflight.pop(key, None))
+            started += 1
+        return started
+
+    async def _run(self):
+        # Start due refreshes on every tick until cancelled
+        while True:
+            self.run_once()
+            await asyncio.sleep(PREFETCH_TICK)
+
+    def start(self):
+        """
+        Start prefetching on the running event loop.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop prefetching and cancel the refreshes in flight.
+        """
+        tasks = list(self._inflight.values())
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        """
+        Return the counters and hottest keys of the prefetcher.
+
+        Returns:
+            dict: Prefetch counters, remaining budget and the hottest keys with their rates.
+        """
+        now = self.clock()
+        hot = self.hot()
+        return {
+            "tracked_keys": len(self.keys),
+            "budget": self.budget,
+            "tokens": round(self.tokens, 3),
+            "prefetched": self.prefetched,
+            "unchanged": self.unchanged,
+            "failures": self.failures,
+            "skipped_budget": self.skipped_budget,
+            "skipped_busy": self.skipped_busy,
+            "hot": [
+                {
+                    "source": source,
+                    "args": list(args),
+                    "rate": round(self.rate(self.keys[(source, args)], now), 4),
+                    "interval": round(self.interval(source, self.keys[(source, args)], now), 3),
+                }
+                for source, args in hot[:10]
+            ],
+        }
+
+
+# Prefetcher shared by every request of the process
+_prefetcher = Prefetcher()
+
+
+def get_prefetcher() -> Prefetcher:
+    """
+    Return the shared prefetcher.
+
+    Returns:
+        Prefetcher: The prefetcher fed by every prefetchable call.
+    """
+    return _prefetcher
+
+
+def prefetchable(name: str):
+    """
+    Decorate a cached async function so its popular keys are refreshed before they expire.
+
+    Must be applied on top of @cached: the prefetcher refreshes the entries of that cache
+    by calling the function it wraps.
+
+    Args:
+        name (str): Name of the source in the prefetcher stats.
+
+    Returns:
+        Callable: The decorator.
+    """
+    def decorator(func):
+        _sources[name] = func
+
+        @functools.wraps(func)
+        async def wrapper(*args):
+            _prefetcher.record(name, args)
+            return await func(*args)
+
+        return wrapper
+
+    return decorator
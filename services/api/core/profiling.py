@@ -0,0 +1,392 @@
+import cProfile
+import hmac
+import io
+import itertools
+import marshal
+import os
+import pstats
+import random
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Deque, Dict, Optional
+
+# Requests slower than this many seconds are captured with their phase breakdown; 0 disables capture
+PROFILE_SLOW_THRESHOLD = float(os.getenv("PROFILE_SLOW_THRESHOLD", "1.0"))
+
+# Number of slow requests kept, newest first
+PROFILE_SLOW_CAPTURES = int(os.getenv("PROFILE_SLOW_CAPTURES", "100"))
+
+# Secret sent in the X-Profile-Token header to profile a request and read the admin endpoints;
+# profiling on demand and the admin endpoints are disabled when unset
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+
+# Fraction of requests profiled at random; 0 disables sampling
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+# Number of profiles kept, and number of functions listed in the text report of a profile
+PROFILE_MAX_PROFILES = int(os.getenv("PROFILE_MAX_PROFILES", "20"))
+PROFILE_TOP_FUNCTIONS = int(os.getenv("PROFILE_TOP_FUNCTIONS", "40"))
+
+# Request header carrying the profiling token, and response header naming the stored profile
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# Phases measured inside a request; the rest of its duration is reported as "other"
+PHASES = ("upstream_wait", "parse", "validate", "serialize")
+
+# Trace of the request being served, set by ProfilingMiddleware
+_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("request_trace", default=None)
+
+
+class RequestTrace:
+    """
+    Seconds spent by one request in each phase.
+
+    Phases of concurrent operations (e.g. the upstream calls of a batch request) add
+    up, so their sum may exceed the duration of the request.
+    """
+    __slots__ = ("phases", "counts")
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+
+def add_phase(name: str, seconds: float):
+    """
+    Add time to a phase of the request being served, if it is traced.
+
+    Args:
+        name (str): The phase, e.g. "parse".
+        seconds (float): The time spent.
+    """
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+class _Phase:
+    # Context manager adding the time spent in its block to a phase of the traced request
+    __slots__ = ("name", "trace", "began")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.trace = _trace.get()
+        if self.trace is not None:
+            self.began = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.trace is not None:
+            self.trace.add(self.name, time.perf_counter() - self.began)
+        return False
+
+
+def phase(name: str) -> _Phase:
+    """
+    Time a block as a phase of the request being served.
+
+    Outside of a traced request it only costs a context variable lookup.
+
+    Args:
+        name (str): The phase, e.g. "validate".
+
+    Returns:
+        _Phase: A context manager wrapping the block.
+    """
+    return _Phase(name)
+
+
+class RequestProfiler:
+    """
+    Captures slow requests and profiles requests on demand.
+
+    Every request is traced so that, when it outlasts slow_threshold, it is kept with
+    the breakdown of its duration into upstream wait, parse, validate and serialize
+    phases. Requests carrying the profiling token in the X-Profile-Token header, and a
+    random sample_rate fraction of requests, also run under cProfile; the profile is
+    stored and its ID returned in the X-Profile-Id header. cProfile follows the event
+    loop thread, so a profile also includes the requests served concurrently, and only
+    one request is profiled at a time.
+
+    Args:
+        slow_threshold (float): Seconds above which a request is captured; 0 to disable.
+        max_captures (int): Number of slow requests kept.
+        token (str): Secret of the X-Profile-Token header; empty to disable profiling on demand
+            and the admin endpoints.
+        sample_rate (float): Fraction of requests profiled at random.
+        max_profiles (int): Number of profiles kept.
+        top_functions (int): Number of functions listed in the text report of a profile.
+    """
+
+    def __init__(self, slow_threshold: float = PROFILE_SLOW_THRESHOLD, max_captures: int = PROFILE_SLOW_CAPTURES,
+                 token: str = PROFILE_TOKEN, sample_rate: float = PROFILE_SAMPLE_RATE,
+                 max_profiles: int = PROFILE_MAX_PROFILES, top_functions: int = PROFILE_TOP_FUNCTIONS):
+        self.slow_threshold = slow_threshold
+        self.token = token
+        self.sample_rate = sample_rate
+        self.max_profiles = max_profiles
+        self.top_functions = top_functions
+        self.captures: Deque[dict] = deque(maxlen=max_captures)
+        self.profiles: "OrderedDict[str, dict]" = OrderedDict()
+        self._ids = itertools.count(1)
+        self._profiling = False  # Whether a request is being profiled
+        self.traced = 0  # Requests traced
+        self.captured = 0  # Slow requests captured
+        self.profiled = 0  # Requests profiled
+        self.skipped = 0  # Profiles not taken because another request was being profiled
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether requests are traced at all.
+        """
+        return self.slow_threshold > 0 or bool(self.token) or self.sample_rate > 0
+
+    def authorized(self, token: Optional[str]) -> bool:
+        """
+        Check a profiling token.
+
+        Args:
+            token (str, optional): The token sent by the client.
+
+        Returns:
+            bool: True if a token is configured and the token matches it.
+        """
+        return self._matches(token)
+
+    def _matches(self, token: Optional[str]) -> bool:
+        # Compare in constant time; headers may hold any byte
+        return bool(self.token) and token is not None and hmac.compare_digest(token.encode(), self.token.encode())
+
+    def wants_profile(self, token: Optional[str]) -> bool:
+        """
+        Decide whether a request runs under the profiler.
+
+        Args:
+            token (str, optional): The X-Profile-Token header of the request.
+
+        Returns:
+            bool: True if the request carries the configured token or is sampled.
+        """
+        if self._matches(token):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start_profile(self) -> Optional[cProfile.Profile]:
+        """
+        Start profiling unless another request is being profiled.
+
+        Returns:
+            cProfile.Profile, optional: The running profiler, or None if it could not start.
+        """
+        if self._profiling:
+            self.skipped += 1
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # Another profiling tool is active in this process
+            self.skipped += 1
+            return None
+        self._profiling = True
+        return profiler
+
+    def store_profile(self, profile_id: str, profiler: cProfile.Profile, request: dict):
+        """
+        Stop a profiler and keep its statistics.
+
+        Args:
+            profile_id (str): The ID announced in the X-Profile-Id header.
+            profiler (cProfile.Profile): The profiler started for the request.
+            request (dict): Method, path, status and duration of the request.
+        """
+        profiler.disable()
+        self._profiling = False
+        self.profiled += 1
+        profiler.create_stats()
+        self.profiles[profile_id] = {**request, "profile_id": profile_id, "stats": profiler.stats}
+        while len(self.profiles) > self.max_profiles:
+            self.profiles.popitem(last=False)
+
+    def next_profile_id(self) -> str:
+        return f"{int(time.time())}-{next(self._ids)}"
+
+    def capture(self, request: dict, trace: RequestTrace):
+        """
+        Keep a slow request with the breakdown of its duration.
+
+        Args:
+            request (dict): Method, path, status, duration and profile ID of the request.
+            trace (RequestTrace): The phases measured while serving it.
+        """
+        phases = {name: round(seconds, 6) for name, seconds in trace.phases.items()}
+        measured = sum(seconds for name, seconds in trace.phases.items() if name in PHASES)
+        phases["other"] = round(max(0.0, request["duration"] - measured), 6)
+        self.captured += 1
+        self.captures.appendleft({**request, "phases": phases, "calls": dict(trace.counts)})
+
+    def report(self, profile_id: str) -> Optional[str]:
+        """
+        Render a stored profile as text.
+
+        Args:
+            profile_id (str): The ID of the profile.
+
+        Returns:
+            str, optional: The request line followed by the functions with the highest
+            cumulative time and their callees; None if the profile is unknown or evicted.
+        """
+        profile = self.profiles.get(profile_id)
+        if profile is None:
+            return None
+        out = io.StringIO()
+        out.write(f"{profile['method']} {profile['path']} -> {profile['status']} in {profile['duration'] * 1000:.1f} ms\n")
+        stats = pstats.Stats(_StoredProfile(profile["stats"]), stream=out)
+        stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE)
+        stats.print_stats(self.top_functions)
+        stats.print_callees(self.top_functions)
+        return out.getvalue()
+
+    def dump(self, profile_id: str) -> Optional[bytes]:
+        """
+        Serialize a stored profile in the pstats file format.
+
+        Args:
+            profile_id (str): The ID of the profile.
+
+        Returns:
+            bytes, optional: Data loadable with pstats.Stats or snakeviz; None if the
+            profile is unknown or evicted.
+        """
+        profile = self.profiles.get(profile_id)
+        return marshal.dumps(profile["stats"]) if profile is not None else None
+
+    def stats(self) -> dict:
+        """
+        Return the settings and counters of the profiler.
+
+        Returns:
+            dict: Slow threshold, sample rate, whether on-demand profiling is enabled,
+            stored profiles and trace, capture and profile counters.
+        """
+        return {
+            "slow_threshold": self.slow_threshold,
+            "sample_rate": self.sample_rate,
+            "on_demand": bool(self.token),
+            "traced": self.traced,
+            "captured": self.captured,
+            "profiled": self.profiled,
+            "skipped": self.skipped,
+            "profiles": [{key: value for key, value in profile.items() if key != "stats"}
+                         for profile in reversed(self.profiles.values())],
+        }
+
+
+class _StoredProfile:
+    # Minimal profile object accepted by pstats.Stats
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware tracing request phases, capturing slow requests and profiling on demand.
+
+    A request is timed, and its profile stopped, when its response headers are sent:
+    streamed responses (SSE, NDJSON batches, chunked columnar bodies) are measured to
+    their first byte rather than until the client disconnects. When the profiler is
+    disabled (no slow threshold, token or sample rate) requests pass straight through.
+
+    Args:
+        app: The ASGI application to wrap.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        profiler = get_profiler()
+        if scope["type"] != "http" or not profiler.enabled or scope["path"].startswith("/admin/"):
+            await self.app(scope, receive, send)
+            return
+        token = None
+        for name, value in scope["headers"]:
+            if name == b"x-profile-token":
+                token = value.decode("latin-1")
+                break
+        running = profiler.start_profile() if profiler.wants_profile(token) else None
+        profile_id = profiler.next_profile_id() if running is not None else None
+        trace = RequestTrace()
+        began = time.perf_counter()
+        finished = False
+
+        def finish(status: int):
+            # Stop the profile and capture the request once, when its headers are sent
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            duration = time.perf_counter() - began
+            profiler.traced += 1
+            request = {"method": scope["method"], "path": scope["path"],
+                       "query": scope.get("query_string", b"").decode("latin-1"), "status": status,
+                       "time": time.time(), "duration": round(duration, 6), "profile_id": profile_id}
+            if running is not None:
+                profiler.store_profile(profile_id, running, request)
+            if 0 < profiler.slow_threshold <= duration:
+                profiler.capture(request, trace)
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                if profile_id is not None:
+                    headers = list(message.get("headers", []))
+                    headers.append((PROFILE_ID_HEADER.lower().encode(), profile_id.encode()))
+                    message = {**message, "headers": headers}
+                finish(message["status"])
+            await send(message)
+
+        context_token = _trace.set(trace)
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _trace.reset(context_token)
+            finish(500)  # The app failed before starting a response
+
+
+# Shared profiler, created on first use
+_profiler: Optional[RequestProfiler] = None
+
+
+def get_profiler() -> RequestProfiler:
+    """
+    Return the shared request profiler, creating it on first use.
+
+    Returns:
+        RequestProfiler: The profiler configured from the PROFILE_* settings.
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = RequestProfiler()
+    return _profiler
+
+
+def set_profiler(profiler: Optional[RequestProfiler]):
+    """
+    Replace the shared request profiler (used by tests).
+
+    Args:
+        profiler (RequestProfiler, optional): The profiler to use, or None to create one on next use.
+    """
+    global _profiler
+    _profiler = profiler
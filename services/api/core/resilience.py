@@ -0,0 +1,457 @@
+import asyncio
+import contextvars
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+import httpx
+
+from .metrics import Counter, Gauge
+
+# Consecutive upstream failures of an endpoint after which its circuit opens
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+
+# Seconds an open circuit rejects calls before letting one probe request through
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+# Seconds one upstream exchange may take overall, on top of the connect and read timeouts of the client
+UPSTREAM_DEADLINE = float(os.getenv("UPSTREAM_DEADLINE", "10"))
+
+# Hedged requests: a second attempt is sent when the first is slower than this latency quantile of its endpoint
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "1") == "1"
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+
+# Lower bound of the hedging delay, and the latencies an endpoint needs before it is hedged at all
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+# Recent latencies kept per endpoint to estimate the quantile
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+
+# Hedges allowed per upstream request, so a slow upstream is not sent twice the load
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.1"))
+
+# Header set on responses built from a cached value because the upstream call failed
+STALE_HEADER = "X-Cache-Stale"
+
+# Circuit states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Hedged attempts, per upstream endpoint and outcome ("sent", or "won" when the hedge answered first)
+HEDGED_REQUESTS = Counter("upstream_hedged_requests_total", "Second attempts sent to slow upstream calls.",
+                          ("endpoint", "outcome"))
+
+# Requests answered with the last good cached value, per cache
+STALE_FALLBACKS = Counter("stale_fallbacks_total", "Cached values served because the upstream call failed.",
+                          ("cache",))
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream endpoint whose circuit is open.
+
+    Args:
+        endpoint (str): Name of the upstream endpoint.
+        retry_after (float): Seconds until the circuit lets a probe request through.
+    """
+
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(f"Circuit open for upstream endpoint {endpoint}")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """
+    Tell whether an exception means the upstream is unhealthy, as opposed to a bad request.
+
+    Args:
+        error (BaseException): The exception raised by an upstream call.
+
+    Returns:
+        bool: True for timeouts, transport errors, 5xx responses and open circuits; False
+        for 4xx responses (throttling included, which the scheduler handles) and anything else.
+    """
+    if isinstance(error, (CircuitOpenError, asyncio.TimeoutError, httpx.TransportError)):
+        return True
+    return isinstance(error, httpx.HTTPStatusError) and error.response.status_code >= 500
+
+
+def is_upstream_answer(error: BaseException) -> bool:
+    """
+    Tell whether an exception still shows the upstream answering normally.
+
+    Args:
+        error (BaseException): The exception raised by an upstream call.
+
+    Returns:
+        bool: True for 4xx responses other than 429, e.g. an unknown product; False for
+        throttling and for errors raised before the request reached the upstream, such
+        as a scheduler timeout.
+    """
+    return isinstance(error, httpx.HTTPStatusError) and error.response.status_code < 500 \
+        and error.response.status_code != 429
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker of one upstream endpoint.
+
+    The circuit opens after failure_threshold upstream failures in a row and rejects
+    calls with CircuitOpenError for reset_timeout seconds. It then turns half-open: a
+    single probe call is let through, closing the circuit when it succeeds and opening
+    it again when it fails, while the other calls keep being rejected.
+
+    Args:
+        name (str): Name of the upstream endpoint.
+        failure_threshold (int): Consecutive failures that open the circuit.
+        reset_timeout (float): Seconds the circuit stays open before a probe.
+        clock (Callable[[], float]): Monotonic time source, replaceable in tests.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False  # A half-open probe is in flight
+        self.failures = 0  # Consecutive failures
+        self.opened = 0  # Times the circuit opened
+        self.rejected = 0  # Calls rejected while open
+
+    @property
+    def state(self) -> str:
+        """
+        Current state, turning half-open once the open circuit has waited reset_timeout.
+        """
+        if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+        return self._state
+
+    def before_call(self):
+        """
+        Let a call through, or reject it while the circuit is open.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a probe in flight.
+        """
+        state = self.state
+        if state == CLOSED:
+            return
+        if state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return
+        self.rejected += 1
+        retry_after = max(0.0, self._opened_at + self.reset_timeout - self.clock())
+        raise CircuitOpenError(self.name, retry_after or self.reset_timeout)
+
+    def record_success(self):
+        """
+        Record a call that reached a healthy upstream, closing the circuit.
+        """
+        self._state = CLOSED
+        self._probing = False
+        self.failures = 0
+
+    def record_failure(self):
+        """
+        Record an upstream failure, opening the circuit at the threshold or after a failed probe.
+        """
+        self.failures += 1
+        if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self._state != OPEN:
+                self.opened += 1
+            self._state = OPEN
+            self._opened_at = self.clock()
+        self._probing = False
+
+    def record(self, error: Optional[BaseException]):
+        """
+        Record the outcome of a call.
+
+        Args:
+            error (BaseException, optional): What the call raised, None when it succeeded.
+            4xx responses other than 429 count as successes. Other errors (throttling,
+            scheduler timeouts, cancellation) say nothing of the upstream health and only
+            release the probe slot, leaving a half-open circuit to probe again.
+        """
+        if isinstance(error, Exception) and is_upstream_failure(error):
+            self.record_failure()
+        elif error is None or is_upstream_answer(error):
+            self.record_success()
+        else:
+            self._probing = False
+
+    def stats(self) -> dict:
+        """
+        Return the state and counters of the breaker.
+
+        Returns:
+            dict: State, consecutive failures, times opened and calls rejected.
+        """
+        return {"state": self.state, "failures": self.failures, "opened": self.opened, "rejected": self.rejected}
+
+
+class LatencyTracker:
+    """
+    Sliding window of recent upstream latencies of one endpoint, for the hedging delay.
+
+    Args:
+        window (int): Number of latencies kept.
+        quantile (float): Quantile of the window used as the hedging delay.
+        min_samples (int): Latencies needed before a delay is given.
+    """
+
+    def __init__(self, window: int = HEDGE_WINDOW, quantile: float = HEDGE_QUANTILE,
+                 min_samples: int = HEDGE_MIN_SAMPLES):
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._delay: Optional[float] = None
+        self._stale = 0  # Latencies observed since the quantile was computed
+
+    def observe(self, seconds: float):
+        """
+        Record the latency of one completed upstream exchange.
+
+        Args:
+            seconds (float): The latency.
+        """
+        self._samples.append(seconds)
+        self._stale += 1
+
+    def delay(self) -> Optional[float]:
+        """
+        Return the current hedging delay.
+
+        The quantile is recomputed at most every tenth of a window, so the cost of sorting
+        is spread over many requests.
+
+        Returns:
+            float, optional: Seconds to wait before hedging, at least HEDGE_MIN_DELAY, or
+            None while fewer than min_samples latencies are known.
+        """
+        if len(self._samples) < self.min_samples:
+            return None
+        if self._delay is None or self._stale * 10 >= len(self._samples):
+            ordered = sorted(self._samples)
+            index = min(len(ordered) - 1, math.ceil(self.quantile * len(ordered)) - 1)
+            self._delay = max(HEDGE_MIN_DELAY, ordered[index])
+            self._stale = 0
+        return self._delay
+
+
+class HedgeBudget:
+    """
+    Token bucket capping hedged attempts to a share of upstream requests.
+
+    Every request earns ratio tokens, up to burst; a hedge spends a whole one.
+
+    Args:
+        ratio (float): Hedges allowed per request.
+        burst (float): Maximum tokens saved up.
+    """
+
+    def __init__(self, ratio: float = HEDGE_BUDGET, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def earn(self):
+        """
+        Credit the budget for one upstream request.
+        """
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def take(self) -> bool:
+        """
+        Spend a token for a hedge.
+
+        Returns:
+            bool: True when the hedge may be sent.
+        """
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+# Breakers and latency windows per upstream endpoint, and the budget shared by all hedges
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyTracker] = {}
+_budget = HedgeBudget()
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    """
+    Return the circuit breaker of an upstream endpoint, creating it on first use.
+
+    Args:
+        endpoint (str): Name of the upstream endpoint.
+
+    Returns:
+        CircuitBreaker: Its breaker.
+    """
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+    return breaker
+
+
+def get_latency(endpoint: str) -> LatencyTracker:
+    """
+    Return the latency window of an upstream endpoint, creating it on first use.
+
+    Args:
+        endpoint (str): Name of the upstream endpoint.
+
+    Returns:
+        LatencyTracker: Its latency window.
+    """
+    tracker = _latencies.get(endpoint)
+    if tracker is None:
+        tracker = _latencies[endpoint] = LatencyTracker()
+    return tracker
+
+
+def reset_resilience():
+    """
+    Forget every breaker and latency window and refill the hedge budget.
+    """
+    global _budget
+    _breakers.clear()
+    _latencies.clear()
+    _budget = HedgeBudget()
+
+
+async def hedged(attempt: Callable[[], Awaitable[Any]], delay: Optional[float], endpoint: str = "other") -> Any:
+    """
+    Run an idempotent call, sending a second attempt when the first is slow.
+
+    When the first attempt has not completed after delay seconds and the hedge budget
+    allows it, a second attempt is started; whichever completes successfully first wins
+    and the other is cancelled. An attempt that fails leaves the other one running.
+
+    Args:
+        attempt (Callable[[], Awaitable[Any]]): Coroutine factory performing the call.
+        delay (float, optional): Seconds before hedging; None to never hedge.
+        endpoint (str): Name of the upstream endpoint, used as the metrics label.
+
+    Returns:
+        Any: The result of the winning attempt.
+
+    Raises:
+        Exception: What the last attempt raised when none succeeded.
+    """
+    _budget.earn()
+    first = asyncio.ensure_future(attempt())
+    if delay is None:
+        return await first
+    try:
+        done, _ = await asyncio.wait({first}, timeout=delay)
+    except BaseException:
+        first.cancel()
+        raise
+    if done or not _budget.take():
+        return await first
+
+    HEDGED_REQUESTS.labels(endpoint, "sent").inc()
+    second = asyncio.ensure_future(attempt())
+    pending = {first, second}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        HEDGED_REQUESTS.labels(endpoint, "won").inc()
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def resilience_stats() -> dict:
+    """
+    Return the state of every circuit breaker and hedging window.
+
+    Returns:
+        dict: Breaker stats and current hedging delay per upstream endpoint, and the
+        remaining hedge budget.
+    """
+    return {
+        "circuits": {name: breaker.stats() for name, breaker in _breakers.items()},
+        "hedge_delays": {name: tracker.delay() for name, tracker in _latencies.items()},
+        "hedge_tokens": round(_budget.tokens, 2),
+    }
+
+
+def _circuit_states() -> Dict[Tuple[str, ...], float]:
+    # One series per endpoint: 0 closed, 1 open, 0.5 half-open
+    return {(name,): {CLOSED: 0.0, HALF_OPEN: 0.5, OPEN: 1.0}[breaker.state] for name, breaker in _breakers.items()}
+
+
+CIRCUIT_STATE = Gauge("upstream_circuit_state", "Circuit of an upstream endpoint: 0 closed, 0.5 half-open, 1 open.",
+                      ("endpoint",), callback=_circuit_states)
+
+# Stale marker of the request being served, set by StaleMarkerMiddleware
+_stale: contextvars.ContextVar = contextvars.ContextVar("stale_marker", default=None)
+
+
+def mark_stale(cache: str, age: float):
+    """
+    Flag the response of the current request as built from a stale cached value.
+
+    Args:
+        cache (str): Name of the cache that served the value.
+        age (float): Seconds since the value was fetched.
+    """
+    STALE_FALLBACKS.labels(cache).inc()
+    marker = _stale.get()
+    if marker is not None:
+        marker["age"] = max(marker.get("age", 0.0), age)  # The oldest value used by the response
+
+
+class StaleMarkerMiddleware:
+    """
+    ASGI middleware adding the X-Cache-Stale header to responses built from a fallback value.
+
+    The header carries the age, in whole seconds, of the oldest cached value served in
+    place of a failed upstream call. Streaming responses whose headers were sent before
+    the fallback happened are not marked.
+
+    Args:
+        app: The ASGI application to wrap.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        marker: dict = {}
+
+        async def send_with_marker(message):
+            if message["type"] == "http.response.start" and "age" in marker:
+                headers = list(message.get("headers", []))
+                headers.append((STALE_HEADER.lower().encode(), str(int(marker["age"])).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _stale.set(marker)
+        try:
+            await self.app(scope, receive, send_with_marker)
+        finally:
+            _stale.reset(token)
@@ -0,0 +1,419 @@
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from fastapi.logger import logger
+
+from .columnar import CANDLE_TABLE, TRADE_TABLE
+
+# Number of recent trades kept per product
+RING_TRADES_CAPACITY = int(os.getenv("RING_TRADES_CAPACITY", "2000"))
+
+# Number of recent candles kept per product and granularity
+RING_CANDLES_CAPACITY = int(os.getenv("RING_CANDLES_CAPACITY", "1440"))
+
+# Bytes all ring buffers may use together; the least recently used products are evicted beyond it
+RING_MEMORY_BUDGET = int(os.getenv("RING_MEMORY_BUDGET", str(64 * 1024 * 1024)))
+
+# Packed records of the buffers, shared with the columnar formats so slices are encoded as they are
+TRADE_RING_DTYPE = TRADE_TABLE.dtype
+CANDLE_RING_DTYPE = CANDLE_TABLE.dtype
+
+# Buffer kind of the trades of a product; candle buffers are keyed by granularity
+TRADES = "trades"
+
+
+class Interner:
+    """
+    Two-way mapping between names (product IDs, buffer kinds) and small consecutive ints.
+    """
+    __slots__ = ("codes", "names")
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def code(self, name: str) -> int:
+        """
+        Return the code of a name, assigning the next one on first use.
+
+        Args:
+            name (str): The name.
+
+        Returns:
+            int: Its code.
+        """
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def name(self, code: int) -> str:
+        """
+        Return the name of a code.
+
+        Args:
+            code (int): A code returned by code().
+
+        Returns:
+            str: The name.
+        """
+        return self.names[code]
+
+
+class RingBuffer:
+    """
+    Fixed-capacity buffer of packed records, overwriting the oldest once full.
+
+    Records live in one preallocated structured array, so memory use is fixed when the
+    buffer is created whatever the number of appends. Reads return views of that array,
+    oldest first: one slice, or two when the requested rows wrap around the end.
+
+    Args:
+        dtype (np.dtype): The record layout.
+        capacity (int): Maximum number of records.
+    """
+    __slots__ = ("records", "capacity", "head", "count")
+
+    def __init__(self, dtype: np.dtype, capacity: int):
+        self.records = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.head = 0  # Index of the next write
+        self.count = 0  # Number of records held
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes used by the records, allocated whether or not they are filled.
+        """
+        return self.records.nbytes
+
+    def append(self, rows: np.ndarray) -> int:
+        """
+        Append records, overwriting the oldest ones once the buffer is full.
+
+        Args:
+            rows (np.ndarray): Records of the buffer dtype, oldest first.
+
+        Returns:
+            int: The number of records written.
+        """
+        if len(rows) > self.capacity:
+            rows = rows[-self.capacity:]  # Only the newest rows would survive anyway
+        n = len(rows)
+        end = self.head + n
+        if end <= self.capacity:
+            self.records[self.head:end] = rows
+        else:
+            split = self.capacity - self.head
+            self.records[self.head:] = rows[:split]
+            self.records[:n - split] = rows[split:]
+        self.head = end % self.capacity
+        self.count = min(self.capacity, self.count + n)
+        return n
+
+    def views(self, limit: Optional[int] = None) -> List[np.ndarray]:
+        """
+        Return the newest records without copying them.
+
+        Args:
+            limit (int, optional): Maximum number of records; all by default.
+
+        Returns:
+            List[np.ndarray]: One or two views of the buffer, oldest records first.
+        """
+        n = self.count if limit is None else max(0, min(limit, self.count))
+        start = (self.head - n) % self.capacity
+        if start + n <= self.capacity:
+            return [self.records[start:start + n]]
+        return [self.records[start:], self.records[:self.head]]
+
+    def latest(self, limit: Optional[int] = None) -> np.ndarray:
+        """
+        Return the newest records as one array, copied only when they wrap around.
+
+        Args:
+            limit (int, optional): Maximum number of records; all by default.
+
+        Returns:
+            np.ndarray: The records, oldest first.
+        """
+        views = self.views(limit)
+        return views[0] if len(views) == 1 else np.concatenate(views)
+
+    def last(self) -> Optional[np.void]:
+        """
+        Return the newest record, or None when empty.
+        """
+        return self.records[self.head - 1] if self.count else None
+
+
+class RecordView:
+    """
+    Lightweight view of one record of a buffer, reading fields on access.
+
+    Views hold a reference to the records and an index, so building one costs no more
+    than a tuple; subclasses expose each field of the dtype as an attribute.
+    """
+    __slots__ = ("_records", "_index")
+
+    def __init__(self, records: np.ndarray, index: int):
+        self._records = records
+        self._index = index
+
+    def as_dict(self) -> dict:
+        """
+        Return the fields of the record as Python values.
+        """
+        return dict(zip(self._records.dtype.names, self._records[self._index].item()))
+
+
+def _view_class(name: str, dtype: np.dtype) -> type:
+    # Build a RecordView subclass with one read-only attribute per field of the dtype
+    def field(column):
+        return property(lambda self: self._records[self._index][column].item())
+
+    return type(name, (RecordView,), {"__slots__": (), **{column: field(column) for column in dtype.names}})
+
+
+# Record views of trades (trade_id, time, side, price, size, bid, ask) and candles (start, low, high, open, close, volume)
+TradeView = _view_class("TradeView", TRADE_RING_DTYPE)
+CandleView = _view_class("CandleView", CANDLE_RING_DTYPE)
+
+
+class MarketDataStore:
+    """
+    Recent trades and candles of every product, held in ring buffers under a memory budget.
+
+    Each product has one trades buffer and one candles buffer per granularity, keyed by
+    interned codes. Trades are kept in arrival order, each added batch sorted by time,
+    and deduplicated by trade ID; a candle with the start of the newest one replaces it.
+    Overlapping fetches and stream messages can therefore be added as they come.
+    Products are kept in least recently used order; when a new buffer would exceed the
+    budget, the coldest products are evicted whole.
+
+    Args:
+        trades_capacity (int): Trades kept per product.
+        candles_capacity (int): Candles kept per product and granularity.
+        budget (int): Bytes all buffers may use together.
+    """
+
+    def __init__(self, trades_capacity: int = RING_TRADES_CAPACITY, candles_capacity: int = RING_CANDLES_CAPACITY,
+                 budget: int = RING_MEMORY_BUDGET):
+        self.trades_capacity = trades_capacity
+        self.candles_capacity = candles_capacity
+        self.budget = budget
+        self.products = Interner()
+        self.kinds = Interner()
+        self._buffers: "OrderedDict[int, Dict[int, RingBuffer]]" = OrderedDict()  # product -> kind -> buffer, coldest first
+        self.nbytes = 0
+        self.evictions = 0  # Products evicted to stay within the budget
+        self.errors = 0  # Batches that could not be ingested
+
+    def _buffer(self, product_id: str, kind: str, create: bool) -> Optional[RingBuffer]:
+        # Return the buffer of a product and kind, marking the product as recently used
+        if create:
+            product, code = self.products.code(product_id), self.kinds.code(kind)
+        else:
+            product, code = self.products.codes.get(product_id), self.kinds.codes.get(kind)  # Reads intern nothing
+        buffers = self._buffers.get(product)
+        if buffers is not None:
+            self._buffers.move_to_end(product)
+            if code in buffers or not create:
+                return buffers.get(code)
+        elif not create:
+            return None
+        if kind == TRADES:
+            buffer = RingBuffer(TRADE_RING_DTYPE, self.trades_capacity)
+        else:
+            buffer = RingBuffer(CANDLE_RING_DTYPE, self.candles_capacity)
+        self._evict(buffer.nbytes, keep=product)
+        self._buffers.setdefault(product, {})[code] = buffer
+        self._buffers.move_to_end(product)
+        self.nbytes += buffer.nbytes
+        return buffer
+
+    def _evict(self, needed: int, keep: int):
+        # Drop the least recently used products until the new buffer fits in the budget
+        for product in list(self._buffers):
+            if self.nbytes + needed <= self.budget:
+                return
+            if product == keep:
+                continue
+            self.nbytes -= sum(buffer.nbytes for buffer in self._buffers.pop(product).values())
+            self.evictions += 1
+        if self.nbytes + needed > self.budget:
+            logger.warning(f"Ring buffers exceed their memory budget of {self.budget} bytes")
+
+    def add_trades(self, product_id: str, trades: List[dict]) -> int:
+        """
+        Add trades of a product, skipping those already held.
+
+        Args:
+            product_id (str): The ID of the product.
+            trades (List[dict]): Trades as sent by the Coinbase API or WebSocket, in any order.
+
+        Returns:
+            int: The number of new trades.
+        """
+        if not trades:
+            return 0
+        rows = TRADE_TABLE.records(trades)
+        buffer = self._buffer(product_id, TRADES, create=True)
+        rows = rows[np.lexsort((rows["trade_id"], rows["time"]))]
+        rows = rows[np.sort(np.unique(rows["trade_id"], return_index=True)[1])]  # Duplicates within the batch
+        for view in buffer.views():
+            rows = rows[~np.isin(rows["trade_id"], view["trade_id"])]
+        return buffer.append(rows)
+
+    def add_candles(self, product_id: str, granularity: str, candles: List[dict]) -> int:
+        """
+        Add candles of a product, keeping only those not older than the newest one held.
+
+        The newest candle is still forming upstream, so a candle with the same start
+        replaces it.
+
+        Args:
+            product_id (str): The ID of the product.
+            granularity (str): The Coinbase granularity of the candles.
+            candles (List[dict]): Candles as returned by the Coinbase API, in any order.
+
+        Returns:
+            int: The number of candles added or replaced.
+        """
+        if not candles:
+            return 0
+        rows = np.empty(len(candles), dtype=CANDLE_RING_DTYPE)
+        for name in CANDLE_RING_DTYPE.names:
+            rows[name] = [candle[name] for candle in candles]
+        buffer = self._buffer(product_id, granularity, create=True)
+        rows = rows[np.argsort(rows["start"], kind="stable")]
+        last = buffer.last()
+        if last is not None:
+            rows = rows[rows["start"] >= last["start"]]
+            if len(rows) and rows["start"][0] == last["start"]:
+                buffer.records[buffer.head - 1] = rows[0]
+                return 1 + buffer.append(rows[1:])
+        return buffer.append(rows)
+
+    def trades(self, product_id: str, limit: Optional[int] = None) -> List[np.ndarray]:
+        """
+        Return the newest trades of a product without copying them.
+
+        Args:
+            product_id (str): The ID of the product.
+            limit (int, optional): Maximum number of trades.
+
+        Returns:
+            List[np.ndarray]: Views of TRADE_RING_DTYPE records in arrival order; empty when not held.
+            They alias the buffer, so they must be consumed (or copied) before the next append.
+        """
+        buffer = self._buffer(product_id, TRADES, create=False)
+        return buffer.views(limit) if buffer is not None else []
+
+    def candles(self, product_id: str, granularity: str, limit: Optional[int] = None) -> List[np.ndarray]:
+        """
+        Return the newest candles of a product without copying them.
+
+        Args:
+            product_id (str): The ID of the product.
+            granularity (str): The Coinbase granularity of the candles.
+            limit (int, optional): Maximum number of candles.
+
+        Returns:
+            List[np.ndarray]: Views of CANDLE_RING_DTYPE records, oldest first; empty when not held.
+        """
+        buffer = self._buffer(product_id, granularity, create=False)
+        return buffer.views(limit) if buffer is not None else []
+
+    def trade_views(self, product_id: str, limit: Optional[int] = None) -> List[TradeView]:
+        """
+        Return the newest trades of a product as record views.
+
+        Args:
+            product_id (str): The ID of the product.
+            limit (int, optional): Maximum number of trades.
+
+        Returns:
+            List[TradeView]: One view per trade, in arrival order.
+        """
+        return [TradeView(view, index) for view in self.trades(product_id, limit) for index in range(len(view))]
+
+    def ingest_trades(self, product_id: str, trades: List[dict]) -> int:
+        """
+        Add trades received on the way to a client, never failing the caller.
+
+        Used by the request path and the feed handlers, where a batch the buffers cannot
+        parse must not fail the response or the WebSocket feed; it is logged and skipped.
+
+        Args:
+            product_id (str): The ID of the product.
+            trades (List[dict]): The trades.
+
+        Returns:
+            int: The number of new trades, 0 if the batch was skipped.
+        """
+        try:
+            return self.add_trades(product_id, trades)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Could not keep recent trades of {product_id}: {e}")
+            return 0
+
+    def ingest_candles(self, product_id: str, granularity: str, candles: List[dict]) -> int:
+        """
+        Add candles received on the way to a client, never failing the caller.
+
+        Args:
+            product_id (str): The ID of the product.
+            granularity (str): The Coinbase granularity of the candles.
+            candles (List[dict]): The candles.
+
+        Returns:
+            int: The number of candles added or replaced, 0 if the batch was skipped.
+        """
+        try:
+            return self.add_candles(product_id, granularity, candles)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Could not keep recent {granularity} candles of {product_id}: {e}")
+            return 0
+
+    def stats(self) -> dict:
+        """
+        Return the memory use of the store.
+
+        Returns:
+            dict: Products and buffers held, bytes used against the budget, evictions and
+            batches that could not be ingested.
+        """
+        return {
+            "products": len(self._buffers),
+            "buffers": sum(len(buffers) for buffers in self._buffers.values()),
+            "bytes": self.nbytes,
+            "budget": self.budget,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
+
+
+# Shared store, created on first use
+_store: Optional[MarketDataStore] = None
+
+
+def get_market_store() -> MarketDataStore:
+    """
+    Return the shared store of recent market data, creating it on first use.
+
+    Returns:
+        MarketDataStore: The store fed by market trade fetches, streams and candle pages.
+    """
+    global _store
+    if _store is None:
+        _store = MarketDataStore()
+    return _store
@@ -0,0 +1,364 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from .candle_store import RangeTooLarge
+from .resilience import CircuitOpenError
+
+# Sustained rate of upstream requests per second (Coinbase public endpoints allow 10 per second)
+UPSTREAM_RATE_LIMIT = float(os.getenv("UPSTREAM_RATE_LIMIT", "10"))
+
+# Number of requests that may be sent back to back before the sustained rate applies
+UPSTREAM_BURST = int(os.getenv("UPSTREAM_BURST", "10"))
+
+# Retries of a request answered with 429 before the error is returned
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "3"))
+
+# Base and maximum backoff in seconds between retries of a throttled request
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "10"))
+
+# Priority classes, served in this order when requests are queued
+INTERACTIVE = 0  # Requests made on behalf of an API client
+BACKGROUND = 1  # Cache refreshes and prefetching
+BACKFILL = 2  # Bulk historical loads
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background", BACKFILL: "backfill"}
+
+# Seconds a request of each class may wait for a slot before it is rejected
+QUEUE_TIMEOUTS = {
+    INTERACTIVE: float(os.getenv("UPSTREAM_QUEUE_TIMEOUT_INTERACTIVE", "5")),
+    BACKGROUND: float(os.getenv("UPSTREAM_QUEUE_TIMEOUT_BACKGROUND", "30")),
+    BACKFILL: float(os.getenv("UPSTREAM_QUEUE_TIMEOUT_BACKFILL", "300")),
+}
+
+# Priority class and absolute deadline of the upstream calls made from the current context
+_priority: contextvars.ContextVar = contextvars.ContextVar("upstream_priority", default=INTERACTIVE)
+_deadline: contextvars.ContextVar = contextvars.ContextVar("upstream_deadline", default=None)
+
+
+class SchedulerTimeout(Exception):
+    """
+    Raised when a request could not be sent to the upstream API before its deadline.
+
+    Args:
+        message (str): Description of the timeout.
+        retry_after (float): Suggested number of seconds before trying again.
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@contextmanager
+def upstream_priority(priority: int, timeout: Optional[float] = None):
+    """
+    Run the upstream calls made inside the block with the given priority class.
+
+    Tasks created inside the block inherit the priority and deadline.
+
+    Args:
+        priority (int): INTERACTIVE, BACKGROUND or BACKFILL.
+        timeout (float, optional): Seconds from now after which queued calls give up;
+            defaults to the queue timeout of the class.
+    """
+    if priority not in PRIORITY_NAMES:
+        raise ValueError(f"Unknown priority class: {priority}")
+    priority_token = _priority.set(priority)
+    deadline_token = _deadline.set(time.monotonic() + timeout) if timeout is not None else None
+    try:
+        yield
+    finally:
+        _priority.reset(priority_token)
+        if deadline_token is not None:
+            _deadline.reset(deadline_token)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header given either in seconds or as an HTTP date.
+
+    Args:
+        value (str, optional): The header value.
+
+    Returns:
+        float: Seconds to wait, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def error_status(error: Exception) -> Tuple[int, Optional[float]]:
+    """
+    Map an exception raised by an upstream call to an HTTP status for our own clients.
+
+    Args:
+        error (Exception): The exception.
+
+    Returns:
+        Tuple[int, Optional[float]]: 429 with the upstream Retry-After when throttled,
+        503 with a retry hint when the scheduler queue timed out or the circuit of the
+        endpoint is open, 504 when the upstream did not answer in time, 400 when the
+        requested range needs more upstream pages than one request may fetch, 500 otherwise.
+    """
+    if isinstance(error, RangeTooLarge):
+        return 400, None
+    if isinstance(error, (SchedulerTimeout, CircuitOpenError)):
+        return 503, error.retry_after
+    if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException)):
+        return 504, None
+    if isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 429:
+        return 429, parse_retry_after(error.response.headers.get("Retry-After"))
+    return 500, None
+
+
+class UpstreamScheduler:
+    """
+    Token bucket in front of the upstream API with prioritized queueing and 429 handling.
+
+    Requests take a token when one is available and nobody is queued ahead of them;
+    otherwise they wait in a queue ordered by priority class, then arrival. A waiter
+    that is still queued at its deadline raises SchedulerTimeout. A 429 response pauses
+    the whole bucket for the Retry-After period and the request is retried after a
+    jittered exponential backoff.
+
+    Args:
+        rate (float): Tokens added per second; 0 disables rate limiting.
+        burst (int): Capacity of the bucket.
+        max_retries (int): Retries of a throttled request.
+        backoff_base (float): Backoff before the first retry, doubled on every attempt.
+        backoff_max (float): Upper bound of the backoff.
+        clock (Callable[[], float]): Monotonic time source.
+    """
+
+    def __init__(self, rate: float = UPSTREAM_RATE_LIMIT, burst: int = UPSTREAM_BURST,
+                 max_retries: int = UPSTREAM_MAX_RETRIES, backoff_base: float = UPSTREAM_BACKOFF_BASE,
+                 backoff_max: float = UPSTREAM_BACKOFF_MAX, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self.paused_until = 0.0  # No tokens are handed out before this time after a 429
+        self._updated = clock()
+        self._queue: List[tuple] = []  # Heap of (priority, sequence, enqueued at, future)
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.granted = {name: 0 for name in PRIORITY_NAMES.values()}  # Requests sent per class
+        self.timeouts = {name: 0 for name in PRIORITY_NAMES.values()}  # Requests rejected per class
+        self.throttled = 0  # 429 responses received
+        self.retries = 0  # Requests retried after a 429
+        self.wait_total = 0.0  # Seconds spent queued, summed over granted requests
+        self.wait_max = 0.0  # Longest time a granted request spent queued
+
+    def _refill(self, now: float):
+        # Add the tokens accumulated since the last refill, up to the bucket capacity
+        self.tokens = min(float(self.burst), self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _grant(self):
+        # Hand tokens to queued waiters in priority order and schedule the next attempt
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = self.clock()
+        self._refill(now)
+        while self._queue and now >= self.paused_until and self.tokens >= 1:
+            priority, _, enqueued, future = heapq.heappop(self._queue)
+            if future.done() or future.get_loop().is_closed():
+                continue  # The waiter timed out or its event loop is gone
+            self.tokens -= 1
+            self._record_grant(priority, now - enqueued)
+            future.set_result(None)
+        if self._queue:
+            delay = max(self.paused_until - now, (1 - self.tokens) / self.rate, 0.0)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._grant)
+
+    def _record_grant(self, priority: int, waited: float):
+        self.granted[PRIORITY_NAMES[priority]] += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    async def acquire(self, priority: int = INTERACTIVE, deadline: Optional[float] = None):
+        """
+        Wait until the request may be sent upstream.
+
+        Args:
+            priority (int): Priority class of the request.
+            deadline (float, optional): Monotonic time after which the request gives up.
+
+        Raises:
+            SchedulerTimeout: If no token was granted before the deadline.
+        """
+        if self.rate <= 0:
+            self._record_grant(priority, 0.0)
+            return
+        now = self.clock()
+        self._refill(now)
+        if not self._queue and now >= self.paused_until and self.tokens >= 1:
+            self.tokens -= 1
+            self._record_grant(priority, 0.0)
+            return
+
+        if deadline is None:
+            deadline = now + QUEUE_TIMEOUTS[priority]
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), now, future))
+        self._grant()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), max(0.0, deadline - now))
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                return  # Granted just as the deadline passed
+            future.cancel()  # Skipped by _grant when its turn comes
+            self.timeouts[PRIORITY_NAMES[priority]] += 1
+            raise SchedulerTimeout(
+                f"Upstream request queue timed out ({PRIORITY_NAMES[priority]} priority)",
+                retry_after=self.queue_delay(),
+            )
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+    def pause(self, seconds: float):
+        """
+        Stop handing out tokens for the given number of seconds, e.g. after a 429.
+
+        Args:
+            seconds (float): Length of the pause.
+        """
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+        self.tokens = min(self.tokens, 0.0)  # Do not release a burst when the pause ends
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Return a jittered exponential backoff for the given retry attempt.
+
+        Args:
+            attempt (int): Zero-based retry attempt.
+
+        Returns:
+            float: Seconds to wait, drawn uniformly up to the capped exponential delay.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def queue_delay(self) -> float:
+        """
+        Estimate how long a new request would wait for a token.
+
+        Returns:
+            float: Seconds until the queue ahead of it has drained.
+        """
+        if self.rate <= 0:
+            return 0.0
+        now = self.clock()
+        self._refill(now)
+        pending = len(self._queue) + 1 - self.tokens
+        return max(self.paused_until - now, 0.0) + max(pending, 0.0) / self.rate
+
+    async def send(self, request: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """
+        Send a request through the bucket, retrying it while upstream answers 429.
+
+        The priority class and deadline are taken from the current context.
+
+        Args:
+            request (Callable[[], Awaitable[httpx.Response]]): Coroutine factory sending the request.
+
+        Returns:
+            httpx.Response: The first response that is not a 429, or the last 429 once
+            retries are exhausted or the next attempt would miss the deadline.
+
+        Raises:
+            SchedulerTimeout: If the request waited in the queue past its deadline.
+        """
+        priority = _priority.get()
+        deadline = _deadline.get()
+        if deadline is None:
+            deadline = self.clock() + QUEUE_TIMEOUTS[priority]
+        attempt = 0
+        while True:
+            await self.acquire(priority, deadline)
+            response = await request()
+            if response.status_code != 429:
+                return response
+            self.throttled += 1
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            self.pause(retry_after if retry_after is not None else self.backoff_base)
+            delay = max(retry_after or 0.0, self.backoff(attempt))
+            if attempt >= self.max_retries or self.clock() + delay > deadline:
+                return response
+            self.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        """
+        Return the queue depth, wait times and throttling counters of the scheduler.
+
+        Returns:
+            dict: Scheduler state and counters.
+        """
+        queued: Dict[str, int] = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _, future in self._queue:
+            if not future.done():
+                queued[PRIORITY_NAMES[priority]] += 1
+        granted = sum(self.granted.values())
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "tokens": round(max(self.tokens, 0.0), 3),
+            "paused_for": round(max(self.paused_until - self.clock(), 0.0), 3),
+            "queued": queued,
+            "granted": self.granted,
+            "timeouts": self.timeouts,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "wait_avg": round(self.wait_total / granted, 6) if granted else 0.0,
+            "wait_max": round(self.wait_max, 6),
+        }
+
+
+# Shared scheduler for every upstream call
+_scheduler: UpstreamScheduler = UpstreamScheduler()
+
+
+def get_scheduler() -> UpstreamScheduler:
+    """
+    Return the shared upstream scheduler.
+
+    Returns:
+        UpstreamScheduler: The scheduler used by upstream_get.
+    """
+    return _scheduler
+
+
+def set_scheduler(scheduler: UpstreamScheduler):
+    """
+    Replace the shared upstream scheduler (used by tests and benchmarks).
+
+    Args:
+        scheduler (UpstreamScheduler): The new scheduler.
+    """
+    global _scheduler
+    _scheduler = scheduler
@@ -0,0 +1,114 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Tuple
+
+import orjson
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from .metrics import SERIALIZATION_CACHE_HITS, SERIALIZATION_LATENCY
+from .profiling import add_phase
+
+# Number of encoded payloads remembered per encoder for objects served from the caches
+ENCODED_CACHE_ENTRIES = int(os.getenv("ENCODED_CACHE_ENTRIES", "1024"))
+
+
+class JSONBytesResponse(Response):
+    """
+    Response carrying a body that is already encoded as JSON.
+    """
+    media_type = "application/json"
+
+
+class ResponseEncoder:
+    """
+    Validates payloads against a response schema and encodes them to JSON bytes.
+
+    Validation and encoding run in pydantic-core, skipping FastAPI's per-request
+    response_model pass (validation, jsonable_encoder and json.dumps). The output
+    matches what the response_model would produce, unknown fields dropped included.
+
+    Payloads served from the in-process caches are the same object on every hit, so
+    the bytes are remembered per object: a cached payload is validated and encoded
+    once, and later requests pass the stored bytes through until the cache holds a
+    new object.
+
+    Payloads built by this service in the shape of the schema (e.g. candles read
+    back from the candle store) can be marked trusted; they are encoded with orjson
+    without validation.
+
+    Encoding time and remembered-bytes hits are exported as metrics under the
+    encoder name; validation and encoding are also timed as the "validate" and
+    "serialize" phases of the request being served.
+
+    Args:
+        schema (Any): The response schema, e.g. List[Product].
+        maxsize (int): Number of payloads whose bytes are remembered; 0 to disable.
+        trusted (bool): Skip validation because payloads always match the schema.
+        name (str): Label of the encoder in the serialization metrics.
+    """
+
+    def __init__(self, schema: Any, maxsize: int = ENCODED_CACHE_ENTRIES, trusted: bool = False,
+                 name: str = "default"):
+        self.adapter = TypeAdapter(schema)
+        self.maxsize = maxsize
+        self.trusted = trusted
+        self._encoded: "OrderedDict[int, Tuple[Any, bytes]]" = OrderedDict()  # id -> (payload, bytes)
+        self.hits = 0  # Payloads served from remembered bytes
+        self.encodes = 0  # Payloads validated and encoded
+        self._latency = SERIALIZATION_LATENCY.labels(name)
+        self._hits = SERIALIZATION_CACHE_HITS.labels(name)
+
+    def encode(self, payload: Any) -> bytes:
+        """
+        Return the JSON encoding of a payload, validating it if it was not seen before.
+
+        Args:
+            payload (Any): The payload to encode.
+
+        Returns:
+            bytes: The JSON body.
+
+        Raises:
+            pydantic.ValidationError: If an untrusted payload does not match the schema.
+        """
+        key = id(payload)
+        remembered = self._encoded.get(key)
+        if remembered is not None and remembered[0] is payload:
+            self.hits += 1
+            self._hits.inc()
+            self._encoded.move_to_end(key)
+            return remembered[1]
+        began = validated = time.perf_counter()
+        if self.trusted:
+            body = orjson.dumps(payload)
+        else:
+            value = self.adapter.validate_python(payload)
+            validated = time.perf_counter()
+            body = self.adapter.dump_json(value)
+        ended = time.perf_counter()
+        self._latency.observe(ended - began)
+        if validated > began:
+            add_phase("validate", validated - began)
+        add_phase("serialize", ended - validated)
+        self.encodes += 1
+        if self.maxsize:
+            # Holding the payload keeps its id from being reused by another object
+            self._encoded[key] = (payload, body)
+            self._encoded.move_to_end(key)
+            while len(self._encoded) > self.maxsize:
+                self._encoded.popitem(last=False)
+        return body
+
+    def response(self, payload: Any) -> JSONBytesResponse:
+        """
+        Build a JSON response for a payload.
+
+        Args:
+            payload (Any): The payload to send.
+
+        Returns:
+            JSONBytesResponse: The response with the encoded body.
+        """
+        return JSONBytesResponse(content=self.encode(payload))
@@ -0,0 +1,377 @@
+import asyncio
+import functools
+import os
+import socket
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import orjson
+from fastapi.logger import logger
+
+from .scheduler import BACKGROUND, upstream_priority
+
+# Redis holding the shared snapshots; the tier is disabled when unset
+REDIS_URL = os.getenv("REDIS_URL", "")
+
+# Prefix of every key and channel written by the snapshot tier
+SNAPSHOT_PREFIX = os.getenv("SNAPSHOT_PREFIX", "mds")
+
+# Seconds the elected refresher holds its lease without renewing it
+SNAPSHOT_LEASE_TTL = float(os.getenv("SNAPSHOT_LEASE_TTL", "10"))
+
+# Seconds between two passes of the refresher (lease renewal and refresh of due snapshots)
+SNAPSHOT_REFRESH_INTERVAL = float(os.getenv("SNAPSHOT_REFRESH_INTERVAL", "0.5"))
+
+# Seconds a snapshot keeps being refreshed after the last request for it
+SNAPSHOT_DEMAND_TTL = float(os.getenv("SNAPSHOT_DEMAND_TTL", "300"))
+
+# The redis package is optional: without it the snapshot tier stays disabled
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+    REDIS_AVAILABLE = True
+except ImportError:
+    aioredis = None
+    REDIS_AVAILABLE = False
+
+    class RedisError(Exception):
+        pass
+
+# Errors of an unreachable or failing Redis, after which requests fall back to the upstream API
+REDIS_ERRORS = (RedisError, OSError, asyncio.TimeoutError)
+
+# Snapshot sources by name: the undecorated upstream function and the maximum age of its snapshots
+_sources: Dict[str, Tuple[Callable[..., Awaitable[Any]], float]] = {}
+
+
+class SharedSnapshots:
+    """
+    Snapshots of upstream responses shared by every API worker through Redis.
+
+    Each snapshot is stored under its own key as compact JSON holding the time it was
+    fetched and the payload. Workers keep a local copy of the snapshots they read, so
+    most requests do not reach Redis; whenever a snapshot is replaced, its writer
+    publishes the key on the invalidation channel and the other workers drop their copy.
+
+    One worker at a time holds the refresher lease (a key set with NX and a TTL, renewed
+    on every pass). The holder re-fetches, with background priority, every snapshot
+    requested by any worker in the last demand window before it gets too old, so the
+    other workers keep reading fresh snapshots without calling the upstream API. When
+    the holder dies, its lease expires and another worker takes over. A worker whose
+    snapshot is missing or too old (cold start, lost refresher) fetches it itself and
+    shares the result.
+
+    Redis failures never fail a request: the worker fetches from upstream directly.
+
+    Args:
+        redis: An asyncio Redis client (redis.asyncio.Redis or a compatible stand-in).
+        worker_id (str, optional): Identity written in the lease; unique per process by default.
+        prefix (str): Prefix of the keys and channel.
+        lease_ttl (float): Seconds the lease is held without renewal.
+        refresh_interval (float): Seconds between two refresher passes.
+        demand_ttl (float): Seconds a snapshot is refreshed after it was last requested.
+        clock (Callable[[], float]): Wall-clock time source shared by the workers, replaceable in tests.
+    """
+
+    def __init__(self, redis, worker_id: Optional[str] = None, prefix: str = SNAPSHOT_PREFIX,
+                 lease_ttl: float = SNAPSHOT_LEASE_TTL, refresh_interval: float = SNAPSHOT_REFRESH_INTERVAL,
+                 demand_ttl: float = SNAPSHOT_DEMAND_TTL, clock: Callable[[], float] = time.time):
+        self.redis = redis
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.prefix = prefix
+        self.lease_ttl = lease_ttl
+        self.refresh_interval = refresh_interval
+        self.demand_ttl = demand_ttl
+        self.clock = clock
+        self.channel = f"{prefix}:invalidate"
+        self.lease_key = f"{prefix}:leader"
+        self.is_leader = False
+        self._local: Dict[str, Tuple[float, Any]] = {}  # Redis key -> (fetched at, payload)
+        self._demanded: Dict[str, float] = {}  # Redis key -> time its demand was last recorded
+        self._tasks = []
+        self._subscribed: Optional[asyncio.Event] = None  # Set while the listener is subscribed
+        self.local_hits = 0  # Requests served from the local copy
+        self.shared_hits = 0  # Requests served from a snapshot read from Redis
+        self.fetches = 0  # Snapshots fetched from upstream by this worker on request
+        self.refreshes = 0  # Snapshots refreshed by this worker as the refresher
+        self.invalidations = 0  # Local copies dropped on an invalidation message
+        self.redis_errors = 0  # Redis calls that failed
+
+    def _key(self, name: str, args: Tuple) -> str:
+        return f"{self.prefix}:{name}:" + orjson.dumps(list(args)).decode()
+
+    async def _read(self, key: str) -> Optional[Tuple[float, Any]]:
+        # Return the local copy of a snapshot, loading it from Redis when there is none
+        snapshot = self._local.get(key)
+        if snapshot is not None:
+            return snapshot
+        data = await self.redis.get(key)
+        if data is None:
+            return None
+        fetched_at, payload = orjson.loads(data)
+        snapshot = self._local[key] = (fetched_at, payload)
+        return snapshot
+
+    async def _write(self, key: str, payload: Any, max_age: float):
+        # Store a snapshot, keep it locally and tell the other workers to drop their copy
+        fetched_at = self.clock()
+        self._local[key] = (fetched_at, payload)
+        # Kept twice its maximum age so a late refresh still leaves a snapshot to compare against
+        await self.redis.set(key, orjson.dumps([fetched_at, payload]), px=max(1, int(max_age * 2000)))
+        await self.redis.publish(self.channel, orjson.dumps([self.worker_id, key]))
+
+    async def _record_demand(self, name: str, key: str, args: Tuple):
+        # Register the request in the demand set of the source, at most a few times per window
+        now = self.clock()
+        if now - self._demanded.get(key, float("-inf")) < self.demand_ttl / 4:
+            return
+        await self.redis.zadd(f"{self.prefix}:wanted:{name}", {orjson.dumps(list(args)): now})
+        self._demanded[key] = now
+
+    async def get_or_fetch(self, name: str, args: Tuple, fetch: Callable[[], Awaitable[Any]], max_age: float) -> Any:
+        """
+        Return the shared snapshot of a call, fetching and sharing it when missing or too old.
+
+        Args:
+            name (str): Name of the snapshot source, e.g. "products".
+            args (Tuple): Arguments of the call, part of the snapshot key.
+            fetch (Callable[[], Awaitable[Any]]): Coroutine factory calling the upstream API.
+            max_age (float): Seconds a snapshot may be served after it was fetched.
+
+        Returns:
+            Any: The payload.
+
+        Raises:
+            Exception: Whatever the fetch raised when no fresh snapshot exists.
+        """
+        key = self._key(name, args)
+        try:
+            was_local = key in self._local
+            snapshot = await self._read(key)
+            if was_local and self.clock() - snapshot[0] >= max_age:
+                # Too old locally: Redis may hold a newer snapshot whose invalidation was missed
+                del self._local[key]
+                was_local = False
+                snapshot = await self._read(key)
+            await self._record_demand(name, key, args)
+        except REDIS_ERRORS as e:
+            self.redis_errors += 1
+            logger.warning(f"Shared snapshot {key} unavailable: {e}")
+            return await fetch()
+        if snapshot is not None and self.clock() - snapshot[0] < max_age:
+            if was_local:
+                self.local_hits += 1
+            else:
+                self.shared_hits += 1
+            return snapshot[1]
+
+        payload = await fetch()
+        self.fetches += 1
+        try:
+            await self._write(key, payload, max_age)
+        except REDIS_ERRORS as e:
+            self.redis_errors += 1
+            logger.warning(f"Could not share snapshot {key}: {e}")
+        return payload
+
+    async def elect(self) -> bool:
+        """
+        Take or renew the refresher lease.
+
+        Returns:
+            bool: True if this worker holds the lease.
+        """
+        ttl = max(1, int(self.lease_ttl * 1000))
+        if await self.redis.set(self.lease_key, self.worker_id, nx=True, px=ttl):
+            self.is_leader = True
+        else:
+            holder = await self.redis.get(self.lease_key)
+            self.is_leader = holder is not None and holder.decode() == self.worker_id
+            if self.is_leader:
+                await self.redis.pexpire(self.lease_key, ttl)
+        return self.is_leader
+
+    async def refresh(self) -> int:
+        """
+        Re-fetch the requested snapshots that would be too old before the next pass.
+
+        Demand older than the demand window is dropped first.
+
+        Returns:
+            int: The number of snapshots refreshed.
+        """
+        now = self.clock()
+        due = []
+        for name, (func, max_age) in _sources.items():
+            wanted = f"{self.prefix}:wanted:{name}"
+            await self.redis.zremrangebyscore(wanted, "-inf", now - self.demand_ttl)
+            for member in await self.redis.zrangebyscore(wanted, now - self.demand_ttl, "+inf"):
+                args = tuple(orjson.loads(member))
+                key = self._key(name, args)
+                snapshot = await self._read(key)
+                if snapshot is None or now - snapshot[0] + self.refresh_interval >= max_age:
+                    due.append((key, func, args, max_age))
+
+        async def refresh_one(key, func, args, max_age):
+            await self._write(key, await func(*args), max_age)
+
+        with upstream_priority(BACKGROUND):  # Refreshes yield to requests made by clients
+            results = await asyncio.gather(*(refresh_one(*item) for item in due), return_exceptions=True)
+        failures = [result for result in results if isinstance(result, Exception)]
+        for failure in failures:
+            logger.warning(f"Snapshot refresh failed: {failure}")
+        self.refreshes += len(results) - len(failures)
+        return len(results) - len(failures)
+
+    async def _run_refresher(self):
+        # Hold the lease and refresh due snapshots while holding it, until cancelled
+        while True:
+            try:
+                if await self.elect():
+                    await self.refresh()
+            except REDIS_ERRORS as e:
+                self.redis_errors += 1
+                self.is_leader = False
+                logger.warning(f"Snapshot refresher: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    async def _run_listener(self):
+        # Drop local copies replaced by other workers, resubscribing after Redis errors
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                self._subscribed.set()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    writer, key = orjson.loads(message["data"])
+                    if writer != self.worker_id and self._local.pop(key, None) is not None:
+                        self.invalidations += 1
+            except REDIS_ERRORS as e:
+                self.redis_errors += 1
+                self._local.clear()  # Invalidations may have been missed
+                logger.warning(f"Snapshot invalidation listener: {e}")
+                await asyncio.sleep(self.refresh_interval)
+            finally:
+                self._subscribed.clear()
+                await pubsub.aclose()
+
+    async def start(self):
+        """
+        Start the invalidation listener and the refresher on the running event loop.
+
+        Returns once the listener is subscribed, so no invalidation is missed afterwards.
+        """
+        if not self._tasks:
+            self._subscribed = asyncio.Event()
+            self._tasks = [asyncio.create_task(self._run_listener()), asyncio.create_task(self._run_refresher())]
+            await self._subscribed.wait()
+
+    async def stop(self):
+        """
+        Stop the background tasks and hand the lease over by releasing it.
+        """
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.is_leader:
+            try:
+                holder = await self.redis.get(self.lease_key)
+                if holder is not None and holder.decode() == self.worker_id:
+                    await self.redis.delete(self.lease_key)
+            except REDIS_ERRORS:
+                pass
+            self.is_leader = False
+        self._local.clear()
+
+    def stats(self) -> dict:
+        """
+        Return the state and counters of the snapshot tier.
+
+        Returns:
+            dict: Worker identity, leadership and hit, fetch, refresh and error counters.
+        """
+        return {
+            "enabled": True,
+            "worker_id": self.worker_id,
+            "leader": self.is_leader,
+            "local_snapshots": len(self._local),
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "fetches": self.fetches,
+            "refreshes": self.refreshes,
+            "invalidations": self.invalidations,
+            "redis_errors": self.redis_errors,
+        }
+
+
+# Snapshot tier of this worker, None when disabled
+_snapshots: Optional[SharedSnapshots] = None
+
+
+def get_snapshots() -> Optional[SharedSnapshots]:
+    """
+    Return the snapshot tier of this worker, connecting it to REDIS_URL on first use.
+
+    Returns:
+        SharedSnapshots, optional: The tier, or None when REDIS_URL is unset or the redis
+        package is not installed.
+    """
+    global _snapshots
+    if _snapshots is None and REDIS_URL and REDIS_AVAILABLE:
+        _snapshots = SharedSnapshots(aioredis.from_url(REDIS_URL))
+    return _snapshots
+
+
+def set_snapshots(snapshots: Optional[SharedSnapshots]):
+    """
+    Use the given snapshot tier instead of the one configured by REDIS_URL (used by tests).
+
+    Args:
+        snapshots (SharedSnapshots, optional): The tier, or None to disable it.
+    """
+    global _snapshots
+    _snapshots = snapshots
+
+
+def shared_snapshot(name: str, max_age: float):
+    """
+    Decorate an async upstream call so its results are shared by every worker.
+
+    The positional arguments of the call form the snapshot key. Without a snapshot tier
+    the call goes straight to the upstream API.
+
+    Args:
+        name (str): Name of the snapshot source.
+        max_age (float): Seconds a snapshot may be served after it was fetched.
+
+    Returns:
+        Callable: The decorator.
+    """
+    def decorator(func):
+        _sources[name] = (func, max_age)  # The refresher calls the undecorated function
+
+        @functools.wraps(func)
+        async def wrapper(*args):
+            snapshots = get_snapshots()
+            if snapshots is None:
+                return await func(*args)
+            return await snapshots.get_or_fetch(name, args, lambda: func(*args), max_age)
+
+        return wrapper
+
+    return decorator
+
+
+def snapshot_stats() -> dict:
+    """
+    Return the counters of the snapshot tier.
+
+    Returns:
+        dict: The tier stats, or {"enabled": False} when it is disabled.
+    """
+    snapshots = get_snapshots()
+    return snapshots.stats() if snapshots is not None else {"enabled": False}
@@ -0,0 +1,430 @@
+import asyncio
+import os
+import re
+from collections import deque
+from typing import Awaitable, BinaryIO, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import orjson
+from fastapi.logger import logger
+
+from .columnar import TAPE_TABLE, trades_to_columns
+from .fanout import FanoutHub, get_hub
+from .indicators import parse_interval, resample
+
+# Directory holding one sub-directory of tape partitions per product
+TRADE_TAPE_PATH = os.getenv("TRADE_TAPE_PATH", "data/trades")
+
+# Seconds of trades held by each partition file
+TRADE_TAPE_PARTITION = int(os.getenv("TRADE_TAPE_PARTITION", "3600"))
+
+# Number of recent trade IDs remembered per product to drop duplicates
+TRADE_TAPE_DEDUP_WINDOW = int(os.getenv("TRADE_TAPE_DEDUP_WINDOW", "100000"))
+
+# Products recorded continuously; recording is disabled when empty
+TRADE_TAPE_PRODUCTS = [p.strip() for p in os.getenv("TRADE_TAPE_PRODUCTS", "").split(",") if p.strip()]
+
+# Seconds between two polls of the latest trades of each recorded product; 0 disables polling
+TRADE_TAPE_POLL_INTERVAL = float(os.getenv("TRADE_TAPE_POLL_INTERVAL", "5"))
+
+# Whether recorded products are also streamed from the market_trades WebSocket channel
+TRADE_TAPE_STREAM = os.getenv("TRADE_TAPE_STREAM", "1") == "1"
+
+# Maximum number of trades returned by one range query
+TRADE_TAPE_MAX_ROWS = int(os.getenv("TRADE_TAPE_MAX_ROWS", "1000000"))
+
+# Fixed-width little-endian record of the tape: time (microseconds since the epoch), trade ID,
+# price, size and side (1 buy, -1 sell)
+TAPE_DTYPE = TAPE_TABLE.dtype
+
+# Product IDs are used as directory names
+_PRODUCT_ID = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+
+
+def parse_tape_interval(interval: str) -> int:
+    """
+    Parse a candle interval for the tape, which also accepts seconds (e.g. "15s").
+
+    Args:
+        interval (str): The interval, as a number of seconds, minutes, hours, days or weeks.
+
+    Returns:
+        int: The interval length in seconds.
+
+    Raises:
+        ValueError: If the interval is malformed or not positive.
+    """
+    match = re.fullmatch(r"(\d+)s", interval.strip().lower())
+    if match is not None:
+        if int(match.group(1)) == 0:
+            raise ValueError(f"Invalid interval: {interval}")
+        return int(match.group(1))
+    return parse_interval(interval)
+
+
+class TradeTape:
+    """
+    Append-only, time-partitioned on-disk log of the trades of each product.
+
+    Each product has a directory of partition files, one per TRADE_TAPE_PARTITION
+    seconds, named after the partition start. A file is a plain sequence of packed
+    33-byte records (TAPE_DTYPE), so it can be memory-mapped and filtered with NumPy
+    without parsing; a range query only maps the partitions overlapping the range.
+
+    Trades are deduplicated by trade ID against a window of the most recent IDs, which
+    is reloaded from the newest partitions the first time a product is written after a
+    restart. Records torn by a crash mid-write are truncated when the file is reopened.
+
+    Args:
+        path (str): Directory holding the tape.
+        partition (int): Seconds of trades per partition file.
+        dedup_window (int): Number of recent trade IDs remembered per product.
+    """
+
+    def __init__(self, path: str = TRADE_TAPE_PATH, partition: int = TRADE_TAPE_PARTITION,
+                 dedup_window: int = TRADE_TAPE_DEDUP_WINDOW):
+        self.path = path
+        self.partition = partition
+        self.dedup_window = dedup_window
+        self._seen: Dict[str, Tuple[Set[int], Deque[int]]] = {}  # product -> (recent IDs, IDs in arrival order)
+        self._files: Dict[str, Tuple[int, BinaryIO]] = {}  # product -> (partition start, file open for append)
+        self.appended = 0  # Trades written
+        self.duplicates = 0  # Trades dropped because their ID was already recorded
+
+    def _directory(self, product_id: str) -> str:
+        if not _PRODUCT_ID.fullmatch(product_id):
+            raise ValueError(f"Invalid product ID: {product_id}")
+        return os.path.join(self.path, product_id)
+
+    def partitions(self, product_id: str) -> List[int]:
+        """
+        List the partitions of a product.
+
+        Args:
+            product_id (str): The ID of the product.
+
+        Returns:
+            List[int]: Start times (seconds) of the partition files, oldest first.
+        """
+        directory = self._directory(product_id)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(int(name[:-5]) for name in os.listdir(directory) if name.endswith(".tape"))
+
+    def _partition_path(self, product_id: str, start: int) -> str:
+        return os.path.join(self._directory(product_id), f"{start}.tape")
+
+    def _map(self, product_id: str, start: int) -> Optional[np.ndarray]:
+        # Memory-map the complete records of a partition
+        path = self._partition_path(product_id, start)
+        rows = os.path.getsize(path) // TAPE_DTYPE.itemsize
+        if rows == 0:
+            return None
+        return np.memmap(path, dtype=TAPE_DTYPE, mode="r", shape=(rows,))
+
+    def _open(self, product_id: str, start: int) -> BinaryIO:
+        # Open a partition for appending, dropping a torn record left by an interrupted write
+        path = self._partition_path(product_id, start)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file = open(path, "ab")
+        torn = file.tell() % TAPE_DTYPE.itemsize
+        if torn:
+            file.truncate(file.tell() - torn)
+        return file
+
+    def _window(self, product_id: str) -> Tuple[Set[int], Deque[int]]:
+        # Return the dedup window of a product, loading it from its newest partitions
+        window = self._seen.get(product_id)
+        if window is None:
+            recent: Deque[int] = deque()
+            for start in reversed(self.partitions(product_id)[-2:]):
+                records = self._map(product_id, start)
+                if records is not None:
+                    recent.extendleft(reversed(records["trade_id"][-self.dedup_window:].tolist()))
+                if len(recent) >= self.dedup_window:
+                    break
+            while len(recent) > self.dedup_window:
+                recent.popleft()
+            window = self._seen[product_id] = (set(recent), recent)
+        return window
+
+    def append(self, product_id: str, trades: List[dict]) -> int:
+        """
+        Record trades of a product, skipping those already recorded.
+
+        Args:
+            product_id (str): The ID of the product.
+            trades (List[dict]): Trades as sent by the Coinbase API or WebSocket.
+
+        Returns:
+            int: The number of new trades written.
+
+        Raises:
+            ValueError: If the product ID cannot be used as a directory name.
+        """
+        self._directory(product_id)
+        seen, order = self._window(product_id)
+        fresh, ids = [], set()
+        for trade in trades:
+            trade_id = int(trade["trade_id"])
+            if trade_id in seen or trade_id in ids:
+                self.duplicates += 1
+                continue
+            ids.add(trade_id)
+            fresh.append(trade)
+        if not fresh:
+            return 0
+
+        columns = trades_to_columns(fresh)
+        records = np.empty(len(fresh), dtype=TAPE_DTYPE)
+        for name in TAPE_DTYPE.names:
+            records[name] = columns[name]
+        records = records[np.lexsort((records["trade_id"], records["time"]))]
+        starts = records["time"] // 1_000_000 // self.partition * self.partition
+        for start in np.unique(starts).tolist():
+            chunk = records[starts == start]
+            current = self._files.get(product_id)
+            if current is not None and current[0] == start:
+                file = current[1]
+            elif current is None or start > current[0]:
+                if current is not None:
+                    current[1].close()
+                file = self._open(product_id, start)
+                self._files[product_id] = (start, file)  # Keep the newest partition open
+            else:
+                with self._open(product_id, start) as late:  # Trades of an older partition
+                    late.write(chunk.tobytes())
+                continue
+            file.write(chunk.tobytes())
+            file.flush()
+
+        for trade_id in records["trade_id"].tolist():
+            seen.add(trade_id)
+            order.append(trade_id)
+        while len(order) > self.dedup_window:
+            seen.discard(order.popleft())
+        self.appended += len(records)
+        return len(records)
+
+    def read(self, product_id: str, start: int, end: int, limit: Optional[int] = None,
+             max_rows: Optional[int] = None) -> np.ndarray:
+        """
+        Return the recorded trades of a product within a time range.
+
+        Args:
+            product_id (str): The ID of the product.
+            start (int): Start of the range in microseconds since the epoch, inclusive.
+            end (int): End of the range in microseconds since the epoch, exclusive.
+            limit (int, optional): Maximum number of trades, the oldest being kept.
+            max_rows (int, optional): Maximum number of trades the range may hold; checked
+                before any trade is copied.
+
+        Returns:
+            np.ndarray: TAPE_DTYPE records ordered by time, then trade ID.
+
+        Raises:
+            ValueError: If the product ID is invalid or the range holds more than max_rows trades.
+        """
+        parts = []
+        rows = 0
+        for partition in self.partitions(product_id):
+            if partition * 1_000_000 >= end or (partition + self.partition) * 1_000_000 <= start:
+                continue
+            records = self._map(product_id, partition)
+            if records is None:
+                continue
+            times = records["time"]
+            matching = (times >= start) & (times < end)
+            rows += int(np.count_nonzero(matching))
+            if max_rows is not None and rows > max_rows:
+                raise ValueError(f"Range holds more than {max_rows} trades, request a shorter range")
+            parts.append(records[matching])  # Copies only the matching rows
+        if not parts:
+            return np.empty(0, dtype=TAPE_DTYPE)
+        trades = np.concatenate(parts)
+        trades = trades[np.lexsort((trades["trade_id"], trades["time"]))]
+        return trades[:limit] if limit is not None else trades
+
+    def candles(self, product_id: str, start: int, end: int, interval: int,
+                max_rows: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        Build OHLCV candles from the recorded trades of a product.
+
+        Args:
+            product_id (str): The ID of the product.
+            start (int): Start of the range in microseconds since the epoch, inclusive.
+            end (int): End of the range in microseconds since the epoch, exclusive.
+            interval (int): Candle length in seconds; candles are aligned on the epoch.
+            max_rows (int, optional): Maximum number of trades the range may hold.
+
+        Returns:
+            Dict[str, np.ndarray]: "start", "low", "high", "open", "close" and "volume"
+            columns plus the number of "trades", one row per interval holding trades.
+
+        Raises:
+            ValueError: If the product ID is invalid or the range holds more than max_rows trades.
+        """
+        trades = self.read(product_id, start, end, max_rows=max_rows)
+        prices = trades["price"]
+        # Each trade is a candle of its own, merged by the candle resampler
+        columns = resample({"start": trades["time"] // 1_000_000, "low": prices, "high": prices,
+                            "open": prices, "close": prices, "volume": trades["size"]}, interval)
+        buckets = trades["time"] // 1_000_000 // interval * interval
+        columns["trades"] = np.unique(buckets, return_counts=True)[1]
+        return columns
+
+    def close(self):
+        """
+        Close the partition files open for appending.
+        """
+        for _, file in self._files.values():
+            file.close()
+        self._files = {}
+
+    def stats(self) -> dict:
+        """
+        Return the counters of the tape.
+
+        Returns:
+            dict: Trades written and duplicates dropped.
+        """
+        return {"path": self.path, "appended": self.appended, "duplicates": self.duplicates}
+
+
+class TradeTapeRecorder:
+    """
+    Feeds the tape continuously with the trades of a set of products.
+
+    Each product is streamed from the market_trades WebSocket channel through the
+    fan-out hub, which shares the upstream subscription with the streaming endpoints,
+    and the latest trades are also polled periodically so trades missed while the
+    WebSocket was reconnecting are filled in. Both sources may overlap; the tape drops
+    the duplicates.
+
+    Args:
+        tape (TradeTape): The tape to write to.
+        product_ids (List[str]): The products to record.
+        poll_interval (float): Seconds between two polls; 0 disables polling.
+        stream (bool): Whether to stream the market_trades channel.
+        hub (FanoutHub, optional): The fan-out hub to stream through; the shared one by default.
+    """
+
+    def __init__(self, tape: TradeTape, product_ids: List[str], poll_interval: float = TRADE_TAPE_POLL_INTERVAL,
+                 stream: bool = TRADE_TAPE_STREAM, hub: Optional[FanoutHub] = None):
+        self.tape = tape
+        self.product_ids = product_ids
+        self.poll_interval = poll_interval
+        self.stream = stream
+        self.hub = hub
+        self._tasks: List[asyncio.Task] = []
+        self.polls = 0  # Polls completed
+        self.errors = 0  # Polls or writes that failed
+
+    def ingest(self, product_id: str, trades: List[dict]) -> int:
+        """
+        Write trades to the tape, counting failures instead of raising.
+
+        Args:
+            product_id (str): The ID of the product.
+            trades (List[dict]): The trades.
+
+        Returns:
+            int: The number of new trades written.
+        """
+        try:
+            return self.tape.append(product_id, trades)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Could not record trades of {product_id}: {e}")
+            return 0
+
+    async def _stream(self, product_id: str):
+        # Record every market_trades message of a product
+        hub = self.hub or get_hub()
+        subscriber = await hub.subscribe("market_trades", product_id, maxsize=1024, policy="drop_oldest")
+        try:
+            while True:
+                frame = await subscriber.get()
+                if frame is None:
+                    return
+                self.ingest(product_id, orjson.loads(frame.data).get("trades", []))
+        finally:
+            await hub.unsubscribe(subscriber)
+
+    async def _poll(self, poll: Callable[[str], Awaitable[List[dict]]]):
+        # Record the latest trades of every product on each interval
+        while True:
+            for product_id in self.product_ids:
+                try:
+                    self.ingest(product_id, await poll(product_id))
+                except Exception as e:
+                    self.errors += 1
+                    logger.warning(f"Could not poll trades of {product_id}: {e}")
+            self.polls += 1
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self, poll: Optional[Callable[[str], Awaitable[List[dict]]]] = None):
+        """
+        Start recording on the running event loop.
+
+        Args:
+            poll (Callable[[str], Awaitable[List[dict]]], optional): Coroutine function
+                returning the latest trades of a product; polling is skipped without it.
+        """
+        if self._tasks:
+            return
+        if self.stream:
+            self._tasks += [asyncio.create_task(self._stream(product_id)) for product_id in self.product_ids]
+        if poll is not None and self.poll_interval > 0:
+            self._tasks.append(asyncio.create_task(self._poll(poll)))
+
+    async def stop(self):
+        """
+        Stop recording and close the tape files.
+        """
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.tape.close()
+
+    def stats(self) -> dict:
+        """
+        Return the state of the recorder and its tape.
+
+        Returns:
+            dict: Recorded products, poll and error counters and the tape counters.
+        """
+        return {"products": self.product_ids, "recording": bool(self._tasks), "polls": self.polls,
+                "errors": self.errors, **self.tape.stats()}
+
+
+# Shared tape and recorder, created on first use
+_tape: Optional[TradeTape] = None
+_recorder: Optional[TradeTapeRecorder] = None
+
+
+def get_tape() -> TradeTape:
+    """
+    Return the shared trade tape, creating it on first use.
+
+    Returns:
+        TradeTape: The tape stored under TRADE_TAPE_PATH.
+    """
+    global _tape
+    if _tape is None:
+        _tape = TradeTape()
+    return _tape
+
+
+def get_recorder() -> TradeTapeRecorder:
+    """
+    Return the shared recorder of the TRADE_TAPE_PRODUCTS, creating it on first use.
+
+    Returns:
+        TradeTapeRecorder: The recorder writing to the shared tape.
+    """
+    global _recorder
+    if _recorder is None:
+        _recorder = TradeTapeRecorder(get_tape(), TRADE_TAPE_PRODUCTS)
+    return _recorder
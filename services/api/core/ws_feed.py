@@ -0,0 +1,232 @@
+import asyncio
+import os
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterable, List, Optional
+
+import orjson
+import websockets
+from fastapi.logger import logger
+
+# URL of the Coinbase Advanced Trade market data WebSocket
+COINBASE_WS_URL = os.getenv("COINBASE_WS_URL", "wss://advanced-trade-ws.coinbase.com")
+
+# Delays (in seconds) between reconnection attempts, doubled after each failure
+WS_RECONNECT_DELAY = float(os.getenv("WS_RECONNECT_DELAY", "1"))
+WS_MAX_RECONNECT_DELAY = float(os.getenv("WS_MAX_RECONNECT_DELAY", "30"))
+
+# Name of the channel in received messages for each subscription channel
+MESSAGE_CHANNELS = {"level2": "l2_data"}
+
+# Handler called for every event of a channel, with the event and the message timestamp
+EventHandler = Callable[[dict, str], None]
+
+
+class SequenceGap(Exception):
+    """
+    Raised when a message is missing from the feed, forcing a resync.
+    """
+
+
+class CoinbaseFeed:
+    """
+    A single multiplexed connection to the Coinbase market data WebSocket.
+
+    Subscriptions are reference counted per channel and replayed on every reconnect, so
+    each (channel, product) pair costs one upstream subscription no matter how many
+    consumers use it, and stays open until the last of them unsubscribes. Messages carry a connection-wide sequence number; when one is
+    missed the connection is re-established, which makes Coinbase send fresh snapshots.
+
+    Args:
+        url (str): The WebSocket URL to connect to.
+    """
+
+    def __init__(self, url: str = COINBASE_WS_URL):
+        self.url = url
+        self._subscriptions: Dict[str, Counter] = defaultdict(Counter)  # channel -> product id -> consumers
+        self._handlers: Dict[str, List[EventHandler]] = defaultdict(list)  # message channel -> handlers
+        self._reset_handlers: List[Callable[[], None]] = []
+        self._ws = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_sequence: Optional[int] = None
+        self.connected: Optional[asyncio.Event] = None  # Created on start, set while connected
+        self.messages = 0  # Messages received
+        self.gaps = 0  # Sequence gaps detected
+        self.reconnects = 0  # Connections re-established after the first one
+
+    def add_handler(self, channel: str, handler: EventHandler):
+        """
+        Register a handler for the events of a subscription channel.
+
+        Args:
+            channel (str): The subscription channel, e.g. "level2" or "market_trades".
+            handler (EventHandler): Called with each event and its message timestamp.
+        """
+        self._handlers[MESSAGE_CHANNELS.get(channel, channel)].append(handler)
+
+    def add_reset_handler(self, handler: Callable[[], None]):
+        """
+        Register a callback invoked whenever the connection is lost or resynchronized.
+
+        Args:
+            handler (Callable[[], None]): The callback.
+        """
+        self._reset_handlers.append(handler)
+
+    def start(self):
+        """
+        Start the connection task on the running event loop if it is not already running.
+        """
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self.connected = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        """
+        Close the connection and stop reconnecting.
+        """
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def subscribe(self, channel: str, product_ids: Iterable[str]):
+        """
+        Subscribe to a channel for the given products, starting the connection if needed.
+
+        Args:
+            channel (str): The subscription channel.
+            product_ids (Iterable[str]): The products to subscribe to.
+        """
+        self.start()
+        counts = self._subscriptions[channel]
+        new = set()
+        for product_id in set(product_ids):
+            if not counts[product_id]:
+                new.add(product_id)
+            counts[product_id] += 1
+        if not new:
+            return
+        await self._send("subscribe", channel, sorted(new))
+
+    async def unsubscribe(self, channel: str, product_ids: Iterable[str]):
+        """
+        Release a subscription to a channel for the given products.
+
+        The upstream subscription of a product is closed once every consumer that
+        subscribed to it has unsubscribed.
+
+        Args:
+            channel (str): The subscription channel.
+            product_ids (Iterable[str]): The products to unsubscribe from.
+        """
+        counts = self._subscriptions[channel]
+        removed = set()
+        for product_id in set(product_ids) & set(counts):
+            counts[product_id] -= 1
+            if not counts[product_id]:
+                del counts[product_id]
+                removed.add(product_id)
+        if not removed:
+            return
+        await self._send("unsubscribe", channel, sorted(removed))
+
+    async def _send(self, action: str, channel: str, product_ids: List[str]):
+        # Send a subscription change; when disconnected it is replayed on the next connect
+        if self._ws is None:
+            return
+        try:
+            await self._ws.send(orjson.dumps({"type": action, "channel": channel, "product_ids": product_ids}))
+        except websockets.ConnectionClosed:
+            pass
+
+    def _reset(self):
+        # Tell consumers that state derived from the feed can no longer be trusted
+        self._last_sequence = None
+        for handler in self._reset_handlers:
+            handler()
+
+    def _dispatch(self, raw):
+        # Check the sequence number and route each event to the channel handlers
+        message = orjson.loads(raw)
+        self.messages += 1
+        sequence = message.get("sequence_num")
+        if sequence is not None:
+            if self._last_sequence is not None and sequence != self._last_sequence + 1:
+                self.gaps += 1
+                raise SequenceGap(f"expected sequence {self._last_sequence + 1}, got {sequence}")
+            self._last_sequence = sequence
+        handlers = self._handlers.get(message.get("channel"))
+        if not handlers:
+            return
+        timestamp = message.get("timestamp", "")
+        for event in message.get("events", ()):
+            for handler in handlers:
+                handler(event, timestamp)
+
+    async def _run(self):
+        # Keep a connection open, replaying subscriptions after every reconnect
+        delay = WS_RECONNECT_DELAY
+        first = True
+        while True:
+            try:
+                async with websockets.connect(self.url, max_size=None) as ws:
+                    self._ws = ws
+                    if not first:
+                        self.reconnects += 1
+                    first = False
+                    for channel, product_ids in self._subscriptions.items():
+                        if product_ids:
+                            await self._send("subscribe", channel, sorted(product_ids))
+                    self.connected.set()
+                    delay = WS_RECONNECT_DELAY  # The connection works, reset the backoff
+                    async for raw in ws:
+                        self._dispatch(raw)
+            except asyncio.CancelledError:
+                raise
+            except SequenceGap as e:
+                logger.warning(f"Resynchronizing market data feed: {e}")
+                delay = 0  # Reconnect immediately to get fresh snapshots
+            except Exception as e:
+                logger.error(f"Market data feed error: {e}")
+            finally:
+                self._ws = None
+                self.connected.clear()
+                self._reset()
+            await asyncio.sleep(delay)
+            delay = min(max(delay * 2, WS_RECONNECT_DELAY), WS_MAX_RECONNECT_DELAY)
+
+    def stats(self) -> dict:
+        """
+        Return the counters of the feed.
+
+        Returns:
+            dict: Connection state, subscriptions and message, gap and reconnect counters.
+        """
+        return {
+            "connected": self.connected is not None and self.connected.is_set(),
+            "subscriptions": {channel: sorted(ids) for channel, ids in self._subscriptions.items() if ids},
+            "messages": self.messages,
+            "gaps": self.gaps,
+            "reconnects": self.reconnects,
+        }
+
+
+# Shared feed, created on first use
+_feed: Optional[CoinbaseFeed] = None
+
+
+def get_feed() -> CoinbaseFeed:
+    """
+    Return the shared market data feed, creating it on first use.
+
+    Returns:
+        CoinbaseFeed: The feed connected to COINBASE_WS_URL.
+    """
+    global _feed
+    if _feed is None:
+        _feed = CoinbaseFeed()
+    return _feed
@@ -1,45 +1,207 @@
-from fastapi import APIRouter, HTTPException, Query
+import math
+import numpy as np
+import orjson
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import AsyncIterator, List, Optional
+from ..core.batch import fan_out, parse_product_ids
+from ..core.book_analytics import DEFAULT_DEPTH_BPS, parse_numbers
+from ..core.candle_store import granularity_seconds
+from ..core.catalog import etag_matches, parse_fields
+from ..core.columnar import (
+    CANDLE_TABLE, CSV_MEDIA_TYPE, JSON_MEDIA_TYPE, TAPE_TABLE, TRADE_TABLE, ColumnarTable, chunked, negotiate,
+    offered_media_types
+)
+from ..core.indicators import parse_indicators, parse_interval
+from ..core.scheduler import error_status
+from ..core.serialization import JSONBytesResponse, ResponseEncoder
+from ..core.trade_tape import TRADE_TAPE_MAX_ROWS, parse_tape_interval
 from ..models.public_data import (
-    get_products, get_server_time, get_product_book,
-    get_product, get_candles, get_market_trades
+    get_backfill_job, get_book_analytics, get_catalog, get_server_time, get_live_product_book,
+    get_product, get_candles, get_market_trades, get_recent_candles, get_recent_trades, get_resampled_candles,
+    get_tape_candles, get_tape_trades, stream_backfill_result, stream_candles, submit_backfill, to_unix_timestamp
 )
 from ..schemas.public_data import (
-    Product, ServerTime, ProductBook, Candle, MarketTrade
+    BackfillJob, BookAnalytics, Product, ServerTime, ProductBook, Candle, MarketTrade, RecentCandles, ResampledCandles, TapeCandles, TapeTrade
 )
-from publisher import publish_message  # Import the publisher function for RabbitMQ
+from publisher import PUBLISH_MAX_BATCH, PublishError, publish_message, publish_messages  # Import the publisher functions for RabbitMQ
 
 # Initialize a new router for API endpoints
 router = APIRouter()
 
+# Encoders validating and serializing responses in place of the response_model pass
+products_encoder = ResponseEncoder(List[Product], name="products")
+product_encoder = ResponseEncoder(Product, name="product")
+server_time_encoder = ResponseEncoder(ServerTime, name="server_time")
+product_book_encoder = ResponseEncoder(ProductBook, maxsize=0, name="product_book")  # Live books rendered per request
+candles_encoder = ResponseEncoder(List[Candle], maxsize=0, trusted=True, name="candles")  # Rows rebuilt by the candle store
+market_trades_encoder = ResponseEncoder(List[MarketTrade], name="market_trades")
+
+# Binary and CSV formats of the row endpoints, documented next to the JSON schema
+COLUMNAR_RESPONSES = {200: {"content": {media_type: {} for media_type in offered_media_types()[1:]}}}
+
 # Pydantic model for the message to be published to the queue
 class Message(BaseModel):
     message: str
 
+# Pydantic model for a batch of messages to be published to the queue
+class MessageBatch(BaseModel):
+    messages: List[str]
+
+# Pydantic model for a backfill job of candle history
+class BackfillRequest(BaseModel):
+    product_ids: List[str]
+    start: str
+    end: str
+    granularity: str = "ONE_HOUR"
+
+# Function to turn an upstream failure into the HTTP error returned to the client
+def upstream_http_error(error: Exception) -> HTTPException:
+    """
+    Build the HTTP error for an exception raised while calling the upstream API.
+
+    Args:
+        error (Exception): The exception.
+
+    Returns:
+        HTTPException: 429 when Coinbase throttled us, 503 when the request timed out in
+        the scheduler queue or the upstream circuit is open (all with a Retry-After header
+        when known), 504 when Coinbase did not answer in time, 400 when a candle range is
+        too large for one request, 500 otherwise.
+    """
+    status, retry_after = error_status(error)
+    headers = {"Retry-After": str(math.ceil(retry_after))} if retry_after is not None else None
+    return HTTPException(status_code=status, detail=str(error), headers=headers)
+
+# Function to pick the format of a row endpoint response from the Accept header
+def response_format(accept: Optional[str]) -> str:
+    """
+    Negotiate the media type of a candles or market trades response.
+
+    Args:
+        accept (str, optional): The Accept header of the request.
+
+    Returns:
+        str: JSON, Arrow IPC stream, NumPy .npy or CSV media type.
+
+    Raises:
+        HTTPException: 406 if none of the formats is acceptable.
+    """
+    offered = offered_media_types()
+    media_type = negotiate(accept, offered)
+    if media_type is None:
+        raise HTTPException(status_code=406, detail=f"Acceptable formats: {', '.join(offered)}")
+    return media_type
+
+# Function to stream rows in a columnar format
+def columnar_response(table: ColumnarTable, media_type: str, rows: int, chunks) -> StreamingResponse:
+    """
+    Stream rows as Arrow IPC, NumPy or CSV, encoding one chunk at a time.
+
+    Args:
+        table (ColumnarTable): The typed layout of the rows.
+        media_type (str): The negotiated media type.
+        rows (int): The total number of rows.
+        chunks (AsyncIterator[List[dict]]): The rows, chunk by chunk.
+
+    Returns:
+        StreamingResponse: The encoded rows.
+    """
+    return StreamingResponse(table.stream(media_type, rows, chunks), media_type=media_type, headers={"Vary": "Accept"})
+
+# Function to collect the catalog filters of a products request
+def catalog_filters(values: dict) -> dict:
+    """
+    Split the comma-separated filter parameters of a products request.
+
+    Args:
+        values (dict): Filter values keyed by indexed field; None when not given.
+
+    Returns:
+        dict: The accepted values per filtered field.
+    """
+    return {
+        field: [v.strip() for v in value.split(",") if v.strip()]
+        for field, value in values.items() if value is not None
+    }
+
 # Endpoint to fetch all available products
 @router.get("/products", response_model=List[Product])
-def fetch_products():
+async def fetch_products(
+        request: Request,
+        quote_currency_id: Optional[str] = Query(None, description="Comma-separated quote currencies, e.g. USD,USDC"),
+        base_currency_id: Optional[str] = Query(None, description="Comma-separated base currencies"),
+        product_type: Optional[str] = Query(None, description="Comma-separated product types, e.g. SPOT"),
+        status: Optional[str] = Query(None, description="Comma-separated product statuses, e.g. online"),
+        product_venue: Optional[str] = Query(None, description="Comma-separated venues, e.g. CBE"),
+        fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. product_id,price"),
+        limit: Optional[int] = Query(None, ge=1, description="Maximum number of products per page"),
+        cursor: Optional[str] = Query(None, description="Cursor of the next page, from the X-Next-Cursor header"),
+        if_none_match: Optional[str] = Header(None, description="ETag of a previously received products list")
+):
     """
-    Retrieve a list of all products.
+    Retrieve a list of all products, optionally filtered, projected and paginated.
     
-    This endpoint fetches and returns a list of all available products.
+    Products come from an indexed catalog of the cached products list. Filters accept
+    comma-separated values (any of them matches) and are combined with AND. When more
+    products remain, the cursor of the next page is sent in the X-Next-Cursor and Link
+    headers. Every response carries the ETag of the catalog; a matching If-None-Match
+    is answered with 304 Not Modified.
+    
+    Args:
+        request (Request): The incoming request, used to build the next page link.
+        quote_currency_id (str, optional): Quote currencies to keep.
+        base_currency_id (str, optional): Base currencies to keep.
+        product_type (str, optional): Product types to keep.
+        status (str, optional): Product statuses to keep.
+        product_venue (str, optional): Venues to keep.
+        fields (str, optional): Fields to keep in each product.
+        limit (int, optional): Maximum number of products per page.
+        cursor (str, optional): Cursor of the page to return.
+        if_none_match (str, optional): The If-None-Match header.
     
     Returns:
         List[Product]: A list of product objects.
         
     Raises:
-        HTTPException: If an error occurs while fetching the products.
+        HTTPException: 400 if the fields or cursor are invalid, or if an error occurs while fetching the products.
     """
+    filters = catalog_filters({
+        "quote_currency_id": quote_currency_id,
+        "base_currency_id": base_currency_id,
+        "product_type": product_type,
+        "status": status,
+        "product_venue": product_venue,
+    })
+    try:
+        projection = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))  # Reject unknown fields
     try:
-        products = get_products()  # Call the function to get products
-        return products
+        catalog = await get_catalog()  # Indexed catalog of the cached products
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))  # Raise an HTTP 500 error if there's an exception
+        raise upstream_http_error(e)  # Map upstream throttling to 429/503 and anything else to HTTP 500
+
+    headers = {"ETag": catalog.etag}
+    if etag_matches(if_none_match, catalog.etag):
+        return Response(status_code=304, headers=headers)
+    if not filters and projection is None and limit is None and cursor is None:
+        response = products_encoder.response(catalog.products)  # The full list is encoded once per catalog
+        response.headers.update(headers)
+        return response
+    try:
+        body, next_cursor = catalog.query(filters, projection, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))  # Reject malformed or outdated cursors
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    return JSONBytesResponse(content=body, headers=headers)
 
 # Endpoint to fetch the current server time
 @router.get("/server-time", response_model=ServerTime)
-def fetch_server_time():
+async def fetch_server_time():
     """
     Retrieve the current server time.
     
@@ -52,19 +214,25 @@ def fetch_server_time():
         HTTPException: If an error occurs while fetching the server time.
     """
     try:
-        server_time = get_server_time()  # Call the function to get server time
-        return server_time
+        server_time = await get_server_time()  # Call the function to get server time
+        return server_time_encoder.response(server_time)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))  # Raise an HTTP 500 error if there's an exception
+        raise upstream_http_error(e)  # Map upstream throttling to 429/503 and anything else to HTTP 500
 
 # Endpoint to fetch the order book for a specific product
 @router.get("/product-book/{product_id}", response_model=ProductBook)
-def fetch_product_book(product_id: str):
+async def fetch_product_book(
+        product_id: str,
+        depth: Optional[int] = Query(None, ge=1, description="Maximum number of levels per side"),
+        aggregation: Optional[float] = Query(None, gt=0, description="Price bucket size used to aggregate levels")
+):
     """
     Retrieve the order book for a specified product.
     
     Args:
         product_id (str): The ID of the product.
+        depth (int, optional): Maximum number of levels per side.
+        aggregation (float, optional): Price bucket size; bids are rounded down and asks up.
         
     Returns:
         ProductBook: An object containing the product's order book details.
@@ -73,14 +241,68 @@ def fetch_product_book(product_id: str):
         HTTPException: If an error occurs while fetching the product book.
     """
     try:
-        product_book = get_product_book(product_id)  # Call the function to get the product order book
-        return product_book
+        product_book = await get_live_product_book(product_id, depth, aggregation)  # Call the function to get the product order book
+        return product_book_encoder.response(product_book)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))  # Raise an HTTP 500 error if there's an exception
+        raise upstream_http_error(e)  # Map upstream throttling to 429/503 and anything else to HTTP 500
+
+# Function to parse the sizes and depth bands of an analytics request
+def analytics_params(sizes: str, depth_bps: Optional[str]) -> tuple:
+    """
+    Parse the order sizes and depth bands of an order book analytics request.
+
+    Args:
+        sizes (str): Comma-separated market order sizes.
+        depth_bps (str, optional): Comma-separated depth bands in basis points.
+
+    Returns:
+        tuple: The sizes and the depth bands (the defaults when not given).
+
+    Raises:
+        HTTPException: 400 if a value is not a positive number or there are too many.
+    """
+    try:
+        bands = parse_numbers(depth_bps, "depth_bps") if depth_bps else list(DEFAULT_DEPTH_BPS)
+        return parse_numbers(sizes, "sizes"), bands
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))  # Reject malformed query parameters
+
+# Endpoint to compute order book analytics for a specific product
+@router.get("/product-book/{product_id}/analytics", responses={200: {"model": BookAnalytics}})
+async def fetch_book_analytics(
+        product_id: str,
+        sizes: str = Query("", description="Comma-separated market order sizes in base currency, e.g. 0.1,1,10"),
+        depth_bps: Optional[str] = Query(None, description="Comma-separated depth bands in basis points, e.g. 10,50,100")
+):
+    """
+    Retrieve spread, depth, imbalance and the expected cost of market orders for a product.
+
+    The order book is parsed once into NumPy arrays; depth within each band and the
+    VWAP, worst price and slippage of a buy and a sell of every requested size are
+    computed with cumulative sums and searchsorted. Values that cannot be computed,
+    such as the mid of a one-sided book, are null.
+
+    Args:
+        product_id (str): The ID of the product.
+        sizes (str): The market order sizes.
+        depth_bps (str, optional): The depth bands (default is 10, 50 and 100 bps).
+
+    Returns:
+        Response: The analytics as JSON, with per-size and per-band columns.
+
+    Raises:
+        HTTPException: 400 if the sizes or bands are invalid, or if an error occurs while fetching the product book.
+    """
+    order_sizes, bands = analytics_params(sizes, depth_bps)
+    try:
+        analytics = await get_book_analytics(product_id, order_sizes, bands)
+        return Response(content=orjson.dumps(analytics, option=orjson.OPT_SERIALIZE_NUMPY), media_type="application/json")
+    except Exception as e:
+        raise upstream_http_error(e)  # Map upstream throttling to 429/503 and anything else to HTTP 500
 
 # Endpoint to fetch details for a specific product
 @router.get("/product/{product_id}", response_model=Product)
-def fetch_product(product_id: str):
+async def fetch_product(product_id: str):
     """
     Retrieve details for a specified product.
     
@@ -94,67 +316,449 @@ def fetch_product(product_id: str):
         HTTPException: If an error occurs while fetching the product details.
     """
     try:
-        product = get_product(product_id)  # Call the function to get product details
-        return product
+        product = await get_product(product_id)  # Call the function to get product details
+        return product_encoder.response(product)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))  # Raise an HTTP 500 error if there's an exception
+        raise upstream_http_error(e)  # Map upstream throttling to 429/503 and anything else to HTTP 500
 
 # Endpoint to fetch candle data for a specific product
-@router.get("/candles/{product_id}", response_model=List[Candle])
-def fetch_candles(
+@router.get("/candles/{product_id}", response_model=List[Candle], responses=COLUMNAR_RESPONSES)
+async def fetch_candles(
         product_id: str,
         start: str = Query(..., description="Start timestamp in ISO format"),  # Required start timestamp
         end: str = Query(..., description="End timestamp in ISO format"),  # Required end timestamp
-        granularity: str = Query("ONE_HOUR", description="Granularity of the candles")  # Optional granularity parameter with a default value
+        granularity: str = Query("ONE_HOUR", description="Granularity of the candles"),  # Optional granularity parameter with a default value
+        accept: Optional[str] = Header(None, description="JSON, Arrow IPC stream, NumPy (application/x-npy) or CSV")
 ):
     """
     Retrieve candle data for a specified product within a time range.
     
+    The format follows the Accept header. Arrow and NumPy carry typed columns (int64
+    start, float64 prices and volume); they and CSV are streamed in chunks read from
+    the candle store.
+    
     Args:
         product_id (str): The ID of the product.
         start (str): The start timestamp in ISO format.
         end (str): The end timestamp in ISO format.
         granularity (str): The granularity of the candles (default is "ONE_HOUR").
+        accept (str, optional): The Accept header.
         
     Returns:
-        List[Candle]: A list of candle objects.
+        List[Candle]: A list of candle objects, or the same rows in the negotiated format.
         
     Raises:
-        HTTPException: If an error occurs while fetching the candle data.
+        HTTPException: 406 if no format is acceptable, or if an error occurs while fetching the candle data.
     """
+    media_type = response_format(accept)
     try:
-        candles = get_candles(product_id, start, end, granularity)  # Call the function to get candles data
-        return candles
+        if media_type != JSON_MEDIA_TYPE:
+            typed = media_type != CSV_MEDIA_TYPE  # CSV keeps the prices as stored
+            rows, chunks = await stream_candles(product_id, start, end, granularity, typed)  # Fill the store, then stream from it
+            return columnar_response(CANDLE_TABLE, media_type, rows, chunks)
+        candles = await get_candles(product_id, start, end, granularity)  # Call the function to get candles data
+        response = candles_encoder.response(candles)
+        response.headers["Vary"] = "Accept"
+        return response
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))  # Raise an HTTP 500 error if there's an exception
+        raise upstream_http_error(e)  # Map upstream throttling to 429/503 and anything else to HTTP 500
+
+# Endpoint to fetch candles resampled to any interval, with optional indicators
+@router.get("/candles/{product_id}/resampled", responses={200: {"model": ResampledCandles}})
+async def fetch_resampled_candles(
+        product_id: str,
+        start: str = Query(..., description="Start timestamp in ISO format"),  # Required start timestamp
+        end: str = Query(..., description="End timestamp in ISO format"),  # Required end timestamp
+        interval: str = Query("4h", description="Candle interval, e.g. 90m, 4h, 2d or 1w"),  # Target interval
+        indicators: str = Query("", description="Comma-separated indicators, e.g. ema:20,rsi:14,atr,vwap,sma:50")
+):
+    """
+    Retrieve candles resampled to an arbitrary interval, along with technical indicators.
+
+    The response is columnar: each candle field and each indicator is a list aligned
+    with the "start" column.
+
+    Args:
+        product_id (str): The ID of the product.
+        start (str): The start timestamp in ISO format.
+        end (str): The end timestamp in ISO format.
+        interval (str): The resampling interval (default is "4h").
+        indicators (str): The indicators to compute, each optionally followed by ":period".
+
+    Returns:
+        Response: The resampled candles and indicators as JSON.
+
+    Raises:
+        HTTPException: 400 if the interval or indicators are invalid, 500 if fetching fails.
+    """
+    try:
+        interval_seconds = parse_interval(interval)
+        indicator_specs = parse_indicators(indicators)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))  # Reject malformed query parameters
+    try:
+        resampled = await get_resampled_candles(product_id, start, end, interval_seconds, indicator_specs)
+        # NumPy columns are serialized directly, without building per-row objects
+        return Response(content=orjson.dumps(resampled, option=orjson.OPT_SERIALIZE_NUMPY), media_type="application/json")
+    except Exception as e:
+        raise upstream_http_error(e)  # Map upstream throttling to 429/503 and anything else to HTTP 500
 
 # Endpoint to fetch market trades for a specific product
-@router.get("/market-trades/{product_id}", response_model=List[MarketTrade])
-def fetch_market_trades(product_id: str):
+@router.get("/market-trades/{product_id}", response_model=List[MarketTrade], responses=COLUMNAR_RESPONSES)
+async def fetch_market_trades(
+        product_id: str,
+        accept: Optional[str] = Header(None, description="JSON, Arrow IPC stream, NumPy (application/x-npy) or CSV")
+):
     """
     Retrieve market trades for a specified product.
     
+    The format follows the Accept header. Arrow and NumPy carry typed columns: int64
+    trade_id and time (microseconds since the epoch, a UTC timestamp in Arrow), int8
+    side (1 buy, -1 sell) and float64 prices, with NaN for missing bid or ask.
+    
     Args:
         product_id (str): The ID of the product.
+        accept (str, optional): The Accept header.
         
     Returns:
-        List[MarketTrade]: A list of market trade objects.
+        List[MarketTrade]: A list of market trade objects, or the same rows in the negotiated format.
         
     Raises:
-        HTTPException: If an error occurs while fetching the market trades.
+        HTTPException: 406 if no format is acceptable, or if an error occurs while fetching the market trades.
     """
+    media_type = response_format(accept)
     try:
-        market_trades = get_market_trades(product_id)  # Call the function to get market trades
-        return market_trades
+        market_trades = await get_market_trades(product_id)  # Call the function to get market trades
+        if media_type != JSON_MEDIA_TYPE:
+            return columnar_response(TRADE_TABLE, media_type, len(market_trades), chunked(market_trades))
+        response = market_trades_encoder.response(market_trades)
+        response.headers["Vary"] = "Accept"
+        return response
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))  # Raise an HTTP 500 error if there's an exception
+        raise upstream_http_error(e)  # Map upstream throttling to 429/503 and anything else to HTTP 500
+
+# Function to turn trade records into JSON rows
+def trade_rows(records: np.ndarray) -> List[dict]:
+    """
+    Convert trade records, from the trade tape or the recent trades, into trade objects.
+
+    Args:
+        records (np.ndarray): Records with trade_id, time (microseconds), price, size and side fields.
+
+    Returns:
+        List[dict]: One object per trade, with the time in ISO format and the side as BUY/SELL.
+    """
+    times = np.datetime_as_string(records["time"].astype("datetime64[us]"), unit="us", timezone="UTC").tolist()
+    sides = np.where(records["side"] == 1, "BUY", np.where(records["side"] == -1, "SELL", "UNKNOWN")).tolist()
+    return [
+        {"trade_id": trade_id, "time": time, "price": price, "size": size, "side": side}
+        for trade_id, time, price, size, side in zip(records["trade_id"].tolist(), times, records["price"].tolist(),
+                                                     records["size"].tolist(), sides)
+    ]
+
+# Endpoint to fetch the recorded trades of a product within a time range
+@router.get("/trades/{product_id}", response_model=List[TapeTrade], responses=COLUMNAR_RESPONSES)
+async def fetch_tape_trades(
+        product_id: str,
+        start: str = Query(..., description="Start timestamp in ISO format, inclusive"),  # Required start timestamp
+        end: str = Query(..., description="End timestamp in ISO format, exclusive"),  # Required end timestamp
+        limit: int = Query(TRADE_TAPE_MAX_ROWS, ge=1, le=TRADE_TAPE_MAX_ROWS, description="Maximum number of trades"),
+        accept: Optional[str] = Header(None, description="JSON, Arrow IPC stream, NumPy (application/x-npy) or CSV")
+):
+    """
+    Retrieve the trades of a product recorded on the trade tape within a time range.
+
+    Only products being recorded (TRADE_TAPE_PRODUCTS) have a tape. Trades are ordered
+    by time; when more than the limit fall in the range, the oldest are returned. The
+    format follows the Accept header. Arrow, NumPy and CSV carry the packed tape
+    columns: int64 time (microseconds since the epoch, a UTC timestamp in Arrow) and
+    trade_id, float64 price and size, and int8 side (1 buy, -1 sell).
+
+    Args:
+        product_id (str): The ID of the product.
+        start (str): The start timestamp in ISO format; naive timestamps are UTC.
+        end (str): The end timestamp in ISO format.
+        limit (int): The maximum number of trades.
+        accept (str, optional): The Accept header.
+
+    Returns:
+        List[TapeTrade]: The recorded trades, or the same rows in the negotiated format.
+
+    Raises:
+        HTTPException: 400 if the product ID or timestamps are invalid, 406 if no format
+        is acceptable, 500 if reading the tape fails.
+    """
+    media_type = response_format(accept)
+    try:
+        records = await get_tape_trades(product_id, start, end, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))  # Reject malformed product IDs and timestamps
+    except Exception as e:
+        raise upstream_http_error(e)  # Map anything else to HTTP 500
+    if media_type != JSON_MEDIA_TYPE:
+        return columnar_response(TAPE_TABLE, media_type, len(records), chunked(records.tolist()))
+    return Response(content=orjson.dumps(trade_rows(records)), media_type="application/json", headers={"Vary": "Accept"})
+
+# Endpoint to build candles of any interval from the recorded trades of a product
+@router.get("/trades/{product_id}/candles", responses={200: {"model": TapeCandles}})
+async def fetch_tape_candles(
+        product_id: str,
+        start: str = Query(..., description="Start timestamp in ISO format, inclusive"),  # Required start timestamp
+        end: str = Query(..., description="End timestamp in ISO format, exclusive"),  # Required end timestamp
+        interval: str = Query("1m", description="Candle interval, e.g. 10s, 1m, 15m or 4h")  # Target interval
+):
+    """
+    Build candles of an arbitrary interval, down to one second, from the trade tape.
+
+    The response is columnar: each candle field is a list aligned with the "start"
+    column, with the number of trades of each candle. Intervals without trades are
+    omitted.
+
+    Args:
+        product_id (str): The ID of the product.
+        start (str): The start timestamp in ISO format; naive timestamps are UTC.
+        end (str): The end timestamp in ISO format.
+        interval (str): The candle interval (default is "1m").
+
+    Returns:
+        Response: The candles as JSON.
+
+    Raises:
+        HTTPException: 400 if the product ID, timestamps or interval are invalid or the range holds more
+        than TRADE_TAPE_MAX_ROWS trades, 500 if reading the tape fails.
+    """
+    try:
+        candles = await get_tape_candles(product_id, start, end, parse_tape_interval(interval))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))  # Reject malformed query parameters
+    except Exception as e:
+        raise upstream_http_error(e)  # Map anything else to HTTP 500
+    return Response(content=orjson.dumps(candles, option=orjson.OPT_SERIALIZE_NUMPY), media_type="application/json")
+
+# Endpoint to fetch the recent trades of a product kept in memory
+@router.get("/recent-trades/{product_id}", response_model=List[TapeTrade], responses=COLUMNAR_RESPONSES)
+async def fetch_recent_trades(
+        product_id: str,
+        limit: Optional[int] = Query(None, ge=1, description="Maximum number of trades, the newest being kept"),
+        accept: Optional[str] = Header(None, description="JSON, Arrow IPC stream, NumPy (application/x-npy) or CSV")
+):
+    """
+    Retrieve the recent trades of a product from its in-memory ring buffer.
+
+    The buffer accumulates every trade fetched or streamed for the product, beyond the
+    handful returned by one market trades request, up to RING_TRADES_CAPACITY trades.
+    The format follows the Accept header; the binary formats carry the market trades
+    columns.
+
+    Args:
+        product_id (str): The ID of the product.
+        limit (int, optional): The maximum number of trades.
+        accept (str, optional): The Accept header.
+
+    Returns:
+        List[TapeTrade]: The recent trades in arrival order, or the same rows in the negotiated format.
+
+    Raises:
+        HTTPException: 406 if no format is acceptable, or if an error occurs while fetching the market trades.
+    """
+    media_type = response_format(accept)
+    try:
+        records = await get_recent_trades(product_id, limit)
+    except Exception as e:
+        raise upstream_http_error(e)  # Map upstream throttling to 429/503 and anything else to HTTP 500
+    if media_type != JSON_MEDIA_TYPE:
+        return columnar_response(TRADE_TABLE, media_type, len(records), chunked(records))
+    return Response(content=orjson.dumps(trade_rows(records)), media_type="application/json", headers={"Vary": "Accept"})
+
+# Endpoint to fetch the recent candles of a product kept in memory
+@router.get("/recent-candles/{product_id}", responses={200: {"model": RecentCandles}})
+async def fetch_recent_candles(
+        product_id: str,
+        granularity: str = Query("ONE_MINUTE", description="Granularity of the candles"),
+        limit: Optional[int] = Query(None, ge=1, description="Maximum number of candles, the newest being kept")
+):
+    """
+    Retrieve the recent candles of a product from its in-memory ring buffer.
+
+    The buffer holds the newest candles of every candle page fetched for the product
+    and granularity, up to RING_CANDLES_CAPACITY candles; nothing is fetched upstream.
+    The response is columnar, oldest candle first.
+
+    Args:
+        product_id (str): The ID of the product.
+        granularity (str): The granularity of the candles (default is "ONE_MINUTE").
+        limit (int, optional): The maximum number of candles.
+
+    Returns:
+        Response: The candle columns as JSON.
+
+    Raises:
+        HTTPException: 400 if the granularity is invalid.
+    """
+    try:
+        granularity_seconds(granularity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))  # Reject unsupported granularities
+    candles = get_recent_candles(product_id, granularity, limit)
+    return Response(content=orjson.dumps(candles, option=orjson.OPT_SERIALIZE_NUMPY), media_type="application/json")
+
+# Function to parse the product list of a batch request
+def batch_product_ids(product_ids: str) -> List[str]:
+    """
+    Parse the comma-separated product IDs of a batch request.
+
+    Args:
+        product_ids (str): The product IDs, e.g. "BTC-USD,ETH-USD".
+
+    Returns:
+        List[str]: The distinct product IDs in request order.
+
+    Raises:
+        HTTPException: 400 if the list is empty or too long.
+    """
+    try:
+        return parse_product_ids(product_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))  # Reject malformed product lists
+
+# Function to stream batch results as newline-delimited JSON
+def ndjson_response(results: AsyncIterator[dict]) -> StreamingResponse:
+    """
+    Stream batch results as NDJSON, one line per product in completion order.
+
+    Args:
+        results (AsyncIterator[dict]): The results yielded by fan_out.
+
+    Returns:
+        StreamingResponse: An application/x-ndjson response.
+    """
+    async def lines():
+        async for result in results:
+            yield orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# Endpoint to fetch candle data for many products at once
+@router.get("/batch/candles")
+async def fetch_batch_candles(
+        product_ids: str = Query(..., description="Comma-separated product IDs"),  # Products to fetch
+        start: str = Query(..., description="Start timestamp in ISO format"),  # Required start timestamp
+        end: str = Query(..., description="End timestamp in ISO format"),  # Required end timestamp
+        granularity: str = Query("ONE_HOUR", description="Granularity of the candles")  # Optional granularity parameter with a default value
+):
+    """
+    Retrieve candle data for several products within a time range.
+
+    Products are fetched concurrently and streamed as NDJSON lines as they complete,
+    each line holding either "data" (the list of candles) or an inline "error".
+
+    Args:
+        product_ids (str): Comma-separated product IDs.
+        start (str): The start timestamp in ISO format.
+        end (str): The end timestamp in ISO format.
+        granularity (str): The granularity of the candles (default is "ONE_HOUR").
+
+    Returns:
+        StreamingResponse: One JSON object per product.
+
+    Raises:
+        HTTPException: 400 if the product list, timestamps or granularity are invalid.
+    """
+    ids = batch_product_ids(product_ids)
+    try:
+        to_unix_timestamp(start)
+        to_unix_timestamp(end)
+        granularity_seconds(granularity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))  # Fail once instead of once per product
+    return ndjson_response(fan_out(ids, lambda product_id: get_candles(product_id, start, end, granularity)))
+
+# Endpoint to fetch market trades for many products at once
+@router.get("/batch/market-trades")
+async def fetch_batch_market_trades(
+        product_ids: str = Query(..., description="Comma-separated product IDs")  # Products to fetch
+):
+    """
+    Retrieve market trades for several products.
+
+    Products are fetched concurrently and streamed as NDJSON lines as they complete,
+    each line holding either "data" (the list of trades) or an inline "error".
+
+    Args:
+        product_ids (str): Comma-separated product IDs.
+
+    Returns:
+        StreamingResponse: One JSON object per product.
+
+    Raises:
+        HTTPException: 400 if the product list is invalid.
+    """
+    return ndjson_response(fan_out(batch_product_ids(product_ids), get_market_trades))
+
+# Endpoint to fetch order books for many products at once
+@router.get("/batch/product-book")
+async def fetch_batch_product_book(
+        product_ids: str = Query(..., description="Comma-separated product IDs"),  # Products to fetch
+        depth: Optional[int] = Query(None, ge=1, description="Maximum number of levels per side"),
+        aggregation: Optional[float] = Query(None, gt=0, description="Price bucket size used to aggregate levels")
+):
+    """
+    Retrieve order books for several products.
+
+    Products are fetched concurrently and streamed as NDJSON lines as they complete,
+    each line holding either "data" (the product book) or an inline "error".
+
+    Args:
+        product_ids (str): Comma-separated product IDs.
+        depth (int, optional): Maximum number of levels per side.
+        aggregation (float, optional): Price bucket size; bids are rounded down and asks up.
+
+    Returns:
+        StreamingResponse: One JSON object per product.
+
+    Raises:
+        HTTPException: 400 if the product list is invalid.
+    """
+    ids = batch_product_ids(product_ids)
+    return ndjson_response(fan_out(ids, lambda product_id: get_live_product_book(product_id, depth, aggregation)))
+
+# Endpoint to compute order book analytics for many products at once
+@router.get("/batch/product-book/analytics")
+async def fetch_batch_book_analytics(
+        product_ids: str = Query(..., description="Comma-separated product IDs"),  # Products to analyze
+        sizes: str = Query("", description="Comma-separated market order sizes in base currency, e.g. 0.1,1,10"),
+        depth_bps: Optional[str] = Query(None, description="Comma-separated depth bands in basis points, e.g. 10,50,100")
+):
+    """
+    Retrieve order book analytics for several products.
+
+    Products are fetched concurrently and streamed as NDJSON lines as they complete,
+    each line holding either "data" (the analytics) or an inline "error".
+
+    Args:
+        product_ids (str): Comma-separated product IDs.
+        sizes (str): The market order sizes, shared by every product.
+        depth_bps (str, optional): The depth bands (default is 10, 50 and 100 bps).
+
+    Returns:
+        StreamingResponse: One JSON object per product.
+
+    Raises:
+        HTTPException: 400 if the product list, sizes or bands are invalid.
+    """
+    ids = batch_product_ids(product_ids)
+    order_sizes, bands = analytics_params(sizes, depth_bps)
+    return ndjson_response(fan_out(ids, lambda product_id: get_book_analytics(product_id, order_sizes, bands)))
 
 # Endpoint to publish a message to a RabbitMQ queue
 @router.post("/publish/{queue_name}")
-def publish_to_queue(queue_name: str, message: Message):
+async def publish_to_queue(queue_name: str, message: Message):
     """
     Publish a message to a specified RabbitMQ queue.
     
+    The message is sent over the shared publisher connection and the response is
+    returned once the broker has confirmed it.
+    
     Args:
         queue_name (str): The name of the queue.
         message (Message): The message to be published.
@@ -166,7 +770,106 @@ def publish_to_queue(queue_name: str, message: Message):
         HTTPException: If an error occurs while publishing the message.
     """
     try:
-        publish_message(queue_name, message.message)  # Call the function to publish a message
+        await publish_message(queue_name, message.message)  # Call the function to publish a message
         return {"status": "Message published"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))  # Raise an HTTP 500 error if there's an exception
+
+# Endpoint to publish a batch of messages to a RabbitMQ queue
+@router.post("/publish/{queue_name}/batch")
+async def publish_batch_to_queue(queue_name: str, batch: MessageBatch):
+    """
+    Publish many messages to a specified RabbitMQ queue in one request.
+    
+    The messages are published back to back, in order, and the response is returned
+    once the broker has confirmed all of them.
+    
+    Args:
+        queue_name (str): The name of the queue.
+        batch (MessageBatch): The messages to be published.
+        
+    Returns:
+        dict: The status of the operation and the number of messages published.
+        
+    Raises:
+        HTTPException: 400 if the batch is empty or too large, 500 if publishing fails.
+    """
+    if not batch.messages or len(batch.messages) > PUBLISH_MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"A batch must contain between 1 and {PUBLISH_MAX_BATCH} messages")
+    try:
+        count = await publish_messages(queue_name, batch.messages)  # Call the function to publish the batch
+        return {"status": "Messages published", "count": count}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))  # Raise an HTTP 500 error if there's an exception
+
+# Endpoint to submit a backfill job of candle history, fetched by queue workers
+@router.post("/backfill", response_model=BackfillJob, status_code=202)
+async def create_backfill(request: BackfillRequest):
+    """
+    Submit a backfill job pulling the candles of several products over a long range.
+
+    The job is split into chunks published to the backfill queue, where workers fetch
+    them in parallel into the candle store. Submitting the same job again returns its
+    progress and republishes only its unfinished chunks.
+
+    Args:
+        request (BackfillRequest): The products, range and granularity to backfill.
+
+    Returns:
+        BackfillJob: The job and its progress.
+
+    Raises:
+        HTTPException: 400 if the request is invalid, 503 if the chunks could not be queued.
+    """
+    try:
+        return await submit_backfill(request.product_ids, request.start, request.end, request.granularity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))  # Reject invalid products, ranges and granularities
+    except PublishError as e:
+        raise HTTPException(status_code=503, detail=str(e))  # The job is kept; submitting it again resumes it
+
+# Endpoint to poll the progress of a backfill job
+@router.get("/backfill/{job_id}", response_model=BackfillJob)
+async def fetch_backfill_job(job_id: str):
+    """
+    Retrieve the progress of a backfill job.
+
+    Args:
+        job_id (str): The ID of the job.
+
+    Returns:
+        BackfillJob: The job and its progress.
+
+    Raises:
+        HTTPException: 404 if the job is unknown.
+    """
+    job = await get_backfill_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown backfill job: {job_id}")
+    return job
+
+# Endpoint to download the candles of a finished backfill job
+@router.get("/backfill/{job_id}/result")
+async def fetch_backfill_result(job_id: str):
+    """
+    Download the merged candles of a finished backfill job.
+
+    The candles are streamed as NDJSON, product by product, one line per chunk of up to
+    a few thousand candles: {"product_id": ..., "candles": [...]}, newest first.
+
+    Args:
+        job_id (str): The ID of the job.
+
+    Returns:
+        StreamingResponse: The candles as NDJSON.
+
+    Raises:
+        HTTPException: 404 if the job is unknown, 409 if it is not done yet.
+    """
+    job = await get_backfill_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown backfill job: {job_id}")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Backfill job {job_id} is {job['status']} "
+                                                    f"({job['chunks_done']}/{job['chunks']} chunks)")
+    return ndjson_response(stream_backfill_result(job))
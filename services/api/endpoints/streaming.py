@@ -0,0 +1,175 @@
+import asyncio
+import math
+import os
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from ..core.fanout import (
+    SLOW_CONSUMER_POLICIES, STREAM_CHANNELS, STREAM_QUEUE_SIZE, STREAM_SLOW_CONSUMER_POLICY, get_hub
+)
+from ..core.scheduler import error_status
+from ..models.public_data import get_catalog
+
+# Seconds without messages after which an SSE comment is sent to keep the connection open
+SSE_KEEPALIVE_INTERVAL = float(os.getenv("SSE_KEEPALIVE_INTERVAL", "15"))
+
+# WebSocket close code sent to subscribers disconnected for being too slow
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+# Initialize a new router for streaming endpoints
+router = APIRouter()
+
+
+def validate_subscription(channel: str, policy: str):
+    """
+    Check the channel and slow-consumer policy requested by a subscriber.
+
+    Args:
+        channel (str): The requested channel.
+        policy (str): The requested slow-consumer policy.
+
+    Raises:
+        HTTPException: 400 if either value is not supported.
+    """
+    if channel not in STREAM_CHANNELS:
+        raise HTTPException(status_code=400, detail=f"Unsupported channel: {channel}")
+    if policy not in SLOW_CONSUMER_POLICIES:
+        raise HTTPException(status_code=400, detail=f"Unsupported slow consumer policy: {policy}")
+
+
+async def validate_product(product_id: str):
+    """
+    Check that a product is listed before an upstream subscription is opened for it.
+
+    Args:
+        product_id (str): The requested product ID.
+
+    Raises:
+        HTTPException: 404 if the product is not in the catalog, or the mapped upstream
+        error (429/503/504/500) if the catalog cannot be loaded.
+    """
+    try:
+        catalog = await get_catalog()
+    except Exception as e:
+        status, retry_after = error_status(e)
+        headers = {"Retry-After": str(math.ceil(retry_after))} if retry_after is not None else None
+        raise HTTPException(status_code=status, detail=str(e), headers=headers)
+    if catalog.get(product_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown product: {product_id}")
+
+
+# WebSocket endpoint streaming trades or tickers for a product
+@router.websocket("/ws/{channel}/{product_id}")
+async def stream_websocket(
+        websocket: WebSocket,
+        channel: str,
+        product_id: str,
+        queue_size: int = Query(STREAM_QUEUE_SIZE, ge=1, le=10000),  # Messages buffered for this client
+        policy: str = Query(STREAM_SLOW_CONSUMER_POLICY)  # Behaviour when the buffer is full
+):
+    """
+    Stream market_trades or ticker messages for a product over a WebSocket.
+
+    Unsupported subscriptions and products missing from the catalog are closed with
+    code 1008 before anything is subscribed upstream.
+
+    Args:
+        websocket (WebSocket): The client connection.
+        channel (str): "market_trades" or "ticker".
+        product_id (str): The ID of the product.
+        queue_size (int): Number of messages buffered for this client.
+        policy (str): "drop_oldest" or "disconnect" when the buffer is full.
+    """
+    if channel not in STREAM_CHANNELS or policy not in SLOW_CONSUMER_POLICIES:
+        await websocket.close(code=1008)  # Policy violation: unsupported subscription
+        return
+    try:
+        await validate_product(product_id)
+    except HTTPException as e:
+        # Unknown products are a policy violation; a catalog that cannot be loaded is a server error
+        await websocket.close(code=1008 if e.status_code == 404 else 1011, reason=str(e.detail)[:120])
+        return
+    await websocket.accept()
+    hub = get_hub()
+    subscriber = await hub.subscribe(channel, product_id, queue_size, policy)
+
+    async def watch_disconnect():
+        # Close the subscriber as soon as the client goes away
+        try:
+            while True:
+                await websocket.receive_text()
+        except (WebSocketDisconnect, RuntimeError):
+            subscriber.close()
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        while True:
+            frame = await subscriber.get()
+            if frame is None:
+                break
+            await websocket.send_text(frame.text)
+        if not watcher.done():
+            await websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)  # Dropped by the slow-consumer policy
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # The client disconnected while a message was being sent
+    finally:
+        watcher.cancel()
+        await hub.unsubscribe(subscriber)
+
+
+# Server-Sent Events endpoint streaming trades or tickers for a product
+@router.get("/sse/{channel}/{product_id}")
+async def stream_sse(
+        channel: str,
+        product_id: str,
+        queue_size: int = Query(STREAM_QUEUE_SIZE, ge=1, le=10000),  # Messages buffered for this client
+        policy: str = Query(STREAM_SLOW_CONSUMER_POLICY)  # Behaviour when the buffer is full
+):
+    """
+    Stream market_trades or ticker messages for a product as Server-Sent Events.
+
+    Args:
+        channel (str): "market_trades" or "ticker".
+        product_id (str): The ID of the product.
+        queue_size (int): Number of messages buffered for this client.
+        policy (str): "drop_oldest" or "disconnect" when the buffer is full.
+
+    Returns:
+        StreamingResponse: A text/event-stream response.
+
+    Raises:
+        HTTPException: 400 if the channel or policy is not supported, 404 if the product is
+        not listed.
+    """
+    validate_subscription(channel, policy)
+    await validate_product(product_id)
+    hub = get_hub()
+    subscriber = await hub.subscribe(channel, product_id, queue_size, policy)
+
+    async def events():
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscriber.get(), SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if frame is None:
+                    break
+                yield frame.sse
+        finally:
+            await hub.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+# Endpoint exposing subscriber counts and delivery counters of the streams
+@router.get("/stats")
+def read_stream_stats():
+    """
+    Retrieve the subscriber counts and delivery counters of the streaming hub.
+
+    Returns:
+        dict: Hub stats and the state of the upstream market data feed.
+    """
+    hub = get_hub()
+    return {"hub": hub.stats(), "feed": hub.feed.stats()}
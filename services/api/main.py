@@ -1,12 +1,80 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import Depends, FastAPI, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse, Response
+from publisher import get_publisher
+from .core.cache import cache_stats
+from .core.http_client import close_client
+from .core.market_events import get_distributor
+from .core.metrics import CONTENT_TYPE, MetricsMiddleware, monitor_loop_lag, render
+from .core.prefetch import PREFETCH_ENABLED, get_prefetcher
+from .core.profiling import PROFILE_HEADER, ProfilingMiddleware, get_profiler
+from .core.resilience import StaleMarkerMiddleware, resilience_stats
+from .core.ring_buffer import get_market_store
+from .core.scheduler import get_scheduler
+from .core.snapshots import get_snapshots, snapshot_stats
+from .core.trade_tape import get_recorder
+from .core.ws_feed import get_feed
 from .endpoints import public_data  # Import the router from the public_data module
+from .models.public_data import poll_market_trades
+from .endpoints import streaming  # Import the router for WebSocket and SSE streams
+
+
+# Lifespan handler that owns shared resources such as the upstream HTTP client
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Manage application-wide resources for the lifetime of the app.
+
+    The shared upstream HTTP client, market data feed and RabbitMQ publisher are
+    created lazily on first use and are closed when the application shuts down.
+    The event loop lag monitor and the prefetcher run for the lifetime of the app,
+    and so do the shared snapshot tier when Redis is configured, the trade tape
+    recorder when products are configured for recording and the market event
+    distributor when products are configured for distribution.
+    """
+    lag_monitor = asyncio.create_task(monitor_loop_lag())  # Probe event loop responsiveness in the background
+    snapshots = get_snapshots()
+    if snapshots is not None:
+        await snapshots.start()  # Listen for invalidations and compete for the refresher lease
+    if PREFETCH_ENABLED:
+        get_prefetcher().start()  # Keep the hottest cache entries fresh
+    recorder = get_recorder()
+    if recorder.product_ids:
+        recorder.start(poll_market_trades)  # Stream and poll the trades of the recorded products
+    distributor = get_distributor()
+    if distributor.product_ids:
+        distributor.start()  # Publish trades, tickers and book deltas to the market data exchange
+    yield
+    lag_monitor.cancel()
+    await get_prefetcher().stop()
+    await recorder.stop()  # Stop recording and close the tape partitions
+    await distributor.stop()  # Publish the buffered market events before the publisher closes
+    if snapshots is not None:
+        await snapshots.stop()  # Release the refresher lease so another worker takes over at once
+    await get_feed().stop()  # Close the market data WebSocket on shutdown
+    await close_client()  # Close pooled upstream connections on shutdown
+    await get_publisher().close()  # Close the RabbitMQ publisher connection on shutdown
 
 # Create an instance of the FastAPI application
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Record latency and status of every request, labelled by route
+app.add_middleware(MetricsMiddleware)
+
+# Flag responses served from the last good cached value while the upstream is failing
+app.add_middleware(StaleMarkerMiddleware)
+
+# Capture slow requests with their phase breakdown and profile requests on demand
+app.add_middleware(ProfilingMiddleware)
 
 # Include the router for public data endpoints with a prefix and tag
 app.include_router(public_data.router, prefix="/public", tags=["public"])
 
+# Include the router for streaming endpoints
+app.include_router(streaming.router, prefix="/stream", tags=["stream"])
+
 # Define the root endpoint of the application
 @app.get("/")
 def read_root():
@@ -18,6 +86,177 @@ def read_root():
     """
     return {"message": "Welcome to the Coinbase Public Data API"}
 
+# Endpoint exposing hit/miss/coalescing counters of the upstream caches
+@app.get("/cache/stats")
+def read_cache_stats():
+    """
+    Retrieve the counters of every upstream cache.
+
+    Returns:
+        dict: Cache stats keyed by cache name.
+    """
+    return cache_stats()
+
+# Endpoint exposing queue depth, wait times and throttling counters of the upstream scheduler
+@app.get("/upstream/stats")
+def read_upstream_stats():
+    """
+    Retrieve the state of the upstream rate-limit scheduler, circuit breakers and hedging.
+
+    Returns:
+        dict: Tokens, queued requests per priority class, wait times and 429 counters,
+        plus the circuit of every upstream endpoint and its hedging delay.
+    """
+    return {**get_scheduler().stats(), **resilience_stats()}
+
+# Endpoint exposing the connection state and message counters of the RabbitMQ publisher
+@app.get("/publisher/stats")
+def read_publisher_stats():
+    """
+    Retrieve the state of the RabbitMQ publisher.
+
+    Returns:
+        dict: Connection state, declared queues and published/confirmed counters.
+    """
+    return get_publisher().stats()
+
+# Endpoint exposing leadership and hit counters of the shared snapshot tier
+@app.get("/snapshots/stats")
+def read_snapshot_stats():
+    """
+    Retrieve the state of the Redis snapshot tier shared by the workers.
+
+    Returns:
+        dict: Worker identity, refresher leadership and hit, fetch and refresh counters.
+    """
+    return snapshot_stats()
+
+# Endpoint exposing the hottest keys and counters of the prefetcher
+@app.get("/prefetch/stats")
+def read_prefetch_stats():
+    """
+    Retrieve the state of the background prefetcher.
+
+    Returns:
+        dict: Prefetch counters, remaining budget and the hottest keys with their intervals.
+    """
+    return get_prefetcher().stats()
+
+# Endpoint exposing the recorded products and counters of the trade tape
+@app.get("/tape/stats")
+def read_tape_stats():
+    """
+    Retrieve the state of the trade tape and its recorder.
+
+    Returns:
+        dict: Recorded products, poll and error counters, trades written and duplicates dropped.
+    """
+    return get_recorder().stats()
+
+# Endpoint exposing the counters of the market event distributor
+@app.get("/events/stats")
+def read_event_stats():
+    """
+    Retrieve the state of the market event distributor.
+
+    Returns:
+        dict: Distributed products, exchange and encoding, frames published, bytes per
+        event and events dropped.
+    """
+    return get_distributor().stats()
+
+# Endpoint exposing the memory use of the recent market data ring buffers
+@app.get("/ring/stats")
+def read_ring_stats():
+    """
+    Retrieve the memory use of the in-memory recent trades and candles.
+
+    Returns:
+        dict: Products and buffers held, bytes used against the budget, evictions and
+        batches that could not be ingested.
+    """
+    return get_market_store().stats()
+
+# Function to reject admin requests without the profiling token
+def require_profile_token(x_profile_token: Optional[str] = Header(None, description="The PROFILE_TOKEN secret")):
+    """
+    Check the X-Profile-Token header of an admin request.
+
+    Args:
+        x_profile_token (str, optional): The token sent by the client.
+
+    Raises:
+        HTTPException: 403 if no token is configured or the header does not match it.
+    """
+    if not get_profiler().authorized(x_profile_token):
+        raise HTTPException(status_code=403, detail=f"Missing or invalid {PROFILE_HEADER} header")
+
+# Endpoint listing the slow requests captured with their phase breakdown
+@app.get("/admin/slow-requests", dependencies=[Depends(require_profile_token)])
+def read_slow_requests(limit: int = Query(100, ge=1, description="Maximum number of requests returned")):
+    """
+    Retrieve the latest requests slower than the slow-request threshold.
+
+    Returns:
+        dict: The threshold and the captured requests, newest first, each with the
+        seconds spent in upstream wait, parse, validate, serialize and other work.
+    """
+    profiler = get_profiler()
+    return {"threshold": profiler.slow_threshold, "requests": list(profiler.captures)[:limit]}
+
+# Endpoint listing the stored request profiles
+@app.get("/admin/profiles", dependencies=[Depends(require_profile_token)])
+def read_profiles():
+    """
+    Retrieve the settings and counters of the request profiler and its stored profiles.
+
+    Returns:
+        dict: Slow threshold, sample rate, trace and profile counters and the stored
+        profiles, newest first.
+    """
+    return get_profiler().stats()
+
+# Endpoint returning one stored request profile
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_profile_token)])
+def read_profile(profile_id: str, format: str = Query("text", pattern="^(text|pstats)$",
+                                                      description="text report or pstats file")):
+    """
+    Retrieve the profile of a request, as announced in its X-Profile-Id header.
+
+    Args:
+        profile_id (str): The ID of the profile.
+        format (str): "text" for the functions with the highest cumulative time and their
+            callees, "pstats" for a file loadable with pstats or snakeviz.
+
+    Returns:
+        Response: The profile.
+
+    Raises:
+        HTTPException: 404 if the profile is unknown or was evicted.
+    """
+    profiler = get_profiler()
+    if format == "pstats":
+        data = profiler.dump(profile_id)
+        if data is not None:
+            return Response(content=data, media_type="application/octet-stream",
+                            headers={"Content-Disposition": f'attachment; filename="{profile_id}.pstats"'})
+    else:
+        report = profiler.report(profile_id)
+        if report is not None:
+            return PlainTextResponse(report)
+    raise HTTPException(status_code=404, detail=f"Unknown profile: {profile_id}")
+
+# Endpoint exposing every metric in the Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    """
+    Retrieve the request, upstream, serialization, publishing, thread pool and event loop metrics.
+
+    Returns:
+        PlainTextResponse: The metrics in the Prometheus text exposition format.
+    """
+    return PlainTextResponse(render(), media_type=CONTENT_TYPE)
+
 # Entry point for running the application
 if __name__ == "__main__":
     import uvicorn  # Import uvicorn for running the application
@@ -1,9 +1,80 @@
-import requests
+import asyncio
+import os
+import numpy as np
 from fastapi.logger import logger
-from datetime import datetime
+from publisher import get_publisher
+from datetime import datetime, timedelta, timezone
+from ..core.backfill import BACKFILL_QUEUE, get_backfill_jobs
+from ..core.book_analytics import analyze_book, pricebook_to_arrays
+from ..core.cache import TTLCache, cached
+from ..core.candle_store import CANDLE_FIELDS, granularity_seconds, get_store
+from ..core.catalog import catalog_for
+from ..core.columnar import COLUMNAR_CHUNK_ROWS, chunked
+from ..core.http_client import read_json, upstream_get
+from ..core.indicators import base_granularity, compute_indicators, resample, rows_to_arrays
+from ..core.order_book import LIVE_ORDER_BOOKS, OrderBook, get_order_books
+from ..core.prefetch import prefetchable
+from ..core.ring_buffer import CANDLE_RING_DTYPE, TRADE_RING_DTYPE, get_market_store
+from ..core.scheduler import BACKFILL, BACKGROUND, upstream_priority
+from ..core.snapshots import shared_snapshot
+from ..core.trade_tape import TRADE_TAPE_MAX_ROWS, get_tape
 
-# Base URL for the Coinbase API
-BASE_URL = "https://api.coinbase.com/api/v3/brokerage"
+# Base URL for the Coinbase API, overridable to point at a local stand-in
+BASE_URL = os.getenv("COINBASE_BASE_URL", "https://api.coinbase.com/api/v3/brokerage")
+
+# Maximum number of entries kept by each per-endpoint cache
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+
+# Start of UNIX time, used to convert dates to microseconds without float rounding
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# In-process caches in front of the upstream calls, each with its own TTL and stale window (seconds)
+products_cache = TTLCache(
+    "products",
+    ttl=float(os.getenv("CACHE_TTL_PRODUCTS", "30")),
+    stale_ttl=float(os.getenv("CACHE_STALE_PRODUCTS", "60")),
+    maxsize=CACHE_MAX_ENTRIES,
+)
+product_cache = TTLCache(
+    "product",
+    ttl=float(os.getenv("CACHE_TTL_PRODUCT", "10")),
+    stale_ttl=float(os.getenv("CACHE_STALE_PRODUCT", "30")),
+    maxsize=CACHE_MAX_ENTRIES,
+)
+server_time_cache = TTLCache(
+    "server_time",
+    ttl=float(os.getenv("CACHE_TTL_SERVER_TIME", "1")),
+    stale_ttl=float(os.getenv("CACHE_STALE_SERVER_TIME", "0")),
+    maxsize=1,
+)
+product_book_cache = TTLCache(
+    "product_book",
+    ttl=float(os.getenv("CACHE_TTL_PRODUCT_BOOK", "1")),
+    stale_ttl=float(os.getenv("CACHE_STALE_PRODUCT_BOOK", "2")),
+    maxsize=CACHE_MAX_ENTRIES,
+)
+market_trades_cache = TTLCache(
+    "market_trades",
+    ttl=float(os.getenv("CACHE_TTL_MARKET_TRADES", "1")),
+    stale_ttl=float(os.getenv("CACHE_STALE_MARKET_TRADES", "1")),
+    maxsize=CACHE_MAX_ENTRIES,
+)
+
+
+# Utility function to parse an ISO date string, reading naive dates as UTC
+def parse_iso_datetime(date_str: str) -> datetime:
+    """
+    Parse an ISO 8601 formatted date string into a timezone-aware datetime.
+
+    Args:
+        date_str (str): The date string in ISO 8601 format; naive dates are read as UTC,
+            whatever the time zone of the server.
+
+    Returns:
+        datetime: The parsed date, with its time zone.
+    """
+    dt = datetime.fromisoformat(date_str)  # Convert ISO date string to datetime object
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
 
 
 # Utility function to convert ISO date string to UNIX timestamp
@@ -12,17 +83,32 @@ def to_unix_timestamp(date_str: str) -> int:
     Convert an ISO 8601 formatted date string to a UNIX timestamp.
     
     Args:
-        date_str (str): The date string in ISO 8601 format.
+        date_str (str): The date string in ISO 8601 format; naive dates are read as UTC.
         
     Returns:
         int: The UNIX timestamp corresponding to the date string.
     """
-    dt = datetime.fromisoformat(date_str)  # Convert ISO date string to datetime object
-    return int(dt.timestamp())  # Return the UNIX timestamp
+    return int(parse_iso_datetime(date_str).timestamp())  # Return the UNIX timestamp
+
+
+# Utility function to convert ISO date string to microseconds since the epoch
+def to_unix_micros(date_str: str) -> int:
+    """
+    Convert an ISO 8601 formatted date string to microseconds since the epoch.
+
+    Args:
+        date_str (str): The date string in ISO 8601 format; naive dates are read as UTC.
+
+    Returns:
+        int: The number of microseconds since the epoch.
+    """
+    return (parse_iso_datetime(date_str) - EPOCH) // timedelta(microseconds=1)
 
 
 # Function to fetch all products from the API
-def get_products():
+@cached(products_cache)
+@shared_snapshot("products", max_age=products_cache.ttl)
+async def get_products():
     """
     Retrieve all products from the Coinbase API.
     
@@ -33,16 +119,16 @@ def get_products():
         Exception: If an error occurs while fetching the products.
     """
     try:
-        response = requests.get(f"{BASE_URL}/market/products")  # Make a GET request to the products endpoint
-        response.raise_for_status()  # Raise an exception if the request was unsuccessful
-        return response.json()["products"]  # Return the products from the JSON response
+        response = await upstream_get(f"{BASE_URL}/market/products", endpoint="products")  # Make a GET request to the products endpoint
+        return read_json(response)["products"]  # Return the products from the JSON response
     except Exception as e:
         logger.error(f"Error fetching products: {e}")  # Log an error message if an exception occurs
         raise  # Reraise the exception
 
 
 # Function to fetch the server time from the API
-def get_server_time():
+@cached(server_time_cache)
+async def get_server_time():
     """
     Retrieve the current server time from the Coinbase API.
     
@@ -53,16 +139,18 @@ def get_server_time():
         Exception: If an error occurs while fetching the server time.
     """
     try:
-        response = requests.get(f"{BASE_URL}/time")  # Make a GET request to the server time endpoint
-        response.raise_for_status()  # Raise an exception if the request was unsuccessful
-        return response.json()  # Return the server time from the JSON response
+        response = await upstream_get(f"{BASE_URL}/time", endpoint="time")  # Make a GET request to the server time endpoint
+        return read_json(response)  # Return the server time from the JSON response
     except Exception as e:
         logger.error(f"Error fetching server time: {e}")  # Log an error message if an exception occurs
         raise  # Reraise the exception
 
 
 # Function to fetch the order book for a specific product from the API
-def get_product_book(product_id: str):
+@prefetchable("product_book")
+@cached(product_book_cache)
+@shared_snapshot("product_book", max_age=product_book_cache.ttl)
+async def get_product_book(product_id: str):
     """
     Retrieve the order book for a specified product from the Coinbase API.
     
@@ -76,9 +164,9 @@ def get_product_book(product_id: str):
         Exception: If an error occurs while fetching the product book.
     """
     try:
-        response = requests.get(f"{BASE_URL}/market/product_book", params={"product_id": product_id})
-        response.raise_for_status()  # Raise an exception if the request was unsuccessful
-        product_book_data = response.json()  # Get the product book data from the JSON response
+        response = await upstream_get(f"{BASE_URL}/market/product_book", params={"product_id": product_id},
+                                      endpoint="product_book")
+        product_book_data = read_json(response)  # Get the product book data from the JSON response
 
         # Adjust the structure to fit the expected schema if needed
         if "pricebook" not in product_book_data:
@@ -95,8 +183,115 @@ def get_product_book(product_id: str):
         raise  # Reraise the exception
 
 
+# Function to fetch the order book for a specific product, preferring the live in-memory book
+async def get_live_product_book(product_id: str, depth: int = None, aggregation: float = None):
+    """
+    Retrieve the order book for a specified product, limited and aggregated as requested.
+
+    The book is served from memory once the level2 feed has delivered its snapshot.
+    Until then (or when live books are disabled) the cached REST snapshot is used, and
+    the product starts being tracked after the REST call confirmed it exists.
+
+    Args:
+        product_id (str): The ID of the product.
+        depth (int, optional): Maximum number of levels per side.
+        aggregation (float, optional): Price bucket size used to aggregate levels.
+
+    Returns:
+        dict: An object containing the product's order book details.
+
+    Raises:
+        Exception: If an error occurs while fetching the product book.
+    """
+    manager = get_order_books() if LIVE_ORDER_BOOKS else None
+    book = manager.get(product_id) if manager is not None else None
+    if book is not None:
+        return book.to_product_book(depth, aggregation)
+
+    product_book = await get_product_book(product_id)
+    if manager is not None:
+        await manager.track(product_id)  # Later requests are served from the live book
+    if depth is None and aggregation is None:
+        return product_book
+    return OrderBook.from_pricebook(product_book["pricebook"]).to_product_book(depth, aggregation)
+
+
+# Function to compute order book analytics for a specific product
+async def get_book_analytics(product_id: str, sizes: list, depth_bps: list):
+    """
+    Compute spread, depth, imbalance and market order costs from the order book of a product.
+
+    The book comes from the same source as get_live_product_book and is parsed once into
+    NumPy columns; every metric is vectorized over the levels, sizes and depth bands.
+
+    Args:
+        product_id (str): The ID of the product.
+        sizes (list): Market order sizes in base currency.
+        depth_bps (list): Depth bands in basis points around the mid price.
+
+    Returns:
+        dict: The product ID, the book time and the metrics returned by analyze_book.
+
+    Raises:
+        Exception: If an error occurs while fetching the product book.
+    """
+    manager = get_order_books() if LIVE_ORDER_BOOKS else None
+    book = manager.get(product_id) if manager is not None else None
+    if book is not None:
+        columns, time = book.to_arrays(), book.time
+    else:
+        pricebook = (await get_product_book(product_id))["pricebook"]
+        if manager is not None:
+            await manager.track(product_id)  # Later requests are served from the live book
+        columns, time = pricebook_to_arrays(pricebook), pricebook.get("time", "")
+    return {"product_id": product_id, "time": time, **analyze_book(columns, sizes, depth_bps)}
+
+
+# Function to build the product catalog from the cached products list
+async def get_catalog():
+    """
+    Retrieve the indexed product catalog.
+
+    The catalog is rebuilt only when the products cache holds a new products list.
+
+    Returns:
+        ProductCatalog: The catalog of the current products.
+
+    Raises:
+        Exception: If an error occurs while fetching the products.
+    """
+    return catalog_for(await get_products())
+
+
+# Function to fetch details for a specific product, preferring the product catalog
+async def get_product(product_id: str):
+    """
+    Retrieve details for a specified product.
+
+    While the products list is fresh, listed products are answered from the catalog;
+    otherwise the product is fetched from the Coinbase API.
+
+    Args:
+        product_id (str): The ID of the product.
+
+    Returns:
+        dict: An object containing the product details.
+
+    Raises:
+        Exception: If an error occurs while fetching the product details.
+    """
+    products = products_cache.peek((), fresh_only=True)  # get_products takes no arguments
+    if products is not None:
+        product = catalog_for(products).get(product_id)
+        if product is not None:
+            return product
+    return await fetch_product(product_id)
+
+
 # Function to fetch details for a specific product from the API
-def get_product(product_id: str):
+@prefetchable("product")
+@cached(product_cache)
+async def fetch_product(product_id: str):
     """
     Retrieve details for a specified product from the Coinbase API.
     
@@ -110,9 +305,8 @@ def get_product(product_id: str):
         Exception: If an error occurs while fetching the product details.
     """
     try:
-        response = requests.get(f"{BASE_URL}/market/products/{product_id}")
-        response.raise_for_status()  # Raise an exception if the request was unsuccessful
-        product_data = response.json()  # Get the product data from the JSON response
+        response = await upstream_get(f"{BASE_URL}/market/products/{product_id}", endpoint="product")
+        product_data = read_json(response)  # Get the product data from the JSON response
 
         # Handle missing or unexpected 'future_product_details' by setting it to None if not present
         if "future_product_details" not in product_data:
@@ -124,42 +318,151 @@ def get_product(product_id: str):
         raise  # Reraise the exception
 
 
-# Function to fetch candle data for a specific product from the API
-def get_candles(product_id: str, start: str, end: str, granularity: str = "ONE_HOUR"):
+# Function to fetch a single page of candle data from the API
+async def get_candle_page(product_id: str, granularity: str, start: int, end: int):
     """
-    Retrieve candle data for a specified product within a time range from the Coinbase API.
-    
+    Retrieve one page of candle data for a product directly from the Coinbase API.
+
+    The range must not exceed the number of candles Coinbase returns per request.
+
+    Args:
+        product_id (str): The ID of the product.
+        granularity (str): The granularity of the candles.
+        start (int): The start of the page as a UNIX timestamp.
+        end (int): The end of the page as a UNIX timestamp.
+
+    Returns:
+        list: A list of candle objects, newest first.
+
+    Raises:
+        Exception: If an error occurs while fetching the candle data.
+    """
+    params = {
+        "start": start,
+        "end": end,
+        "granularity": granularity
+    }
+    response = await upstream_get(f"{BASE_URL}/market/products/{product_id}/candles", params=params,
+                                  endpoint="candles")
+    candles = read_json(response)["candles"]
+    get_market_store().ingest_candles(product_id, granularity, candles)  # Keep the newest candles in memory
+    return candles  # Return the candles data from the JSON response
+
+
+# Function to fetch candle data for a specific product
+async def get_candles(product_id: str, start: str, end: str, granularity: str = "ONE_HOUR"):
+    """
+    Retrieve candle data for a specified product within a time range.
+
+    Candles are served from the local candle store; only the intervals missing from
+    the store are fetched from the Coinbase API, page by page.
+
     Args:
         product_id (str): The ID of the product.
         start (str): The start timestamp in ISO format.
         end (str): The end timestamp in ISO format.
         granularity (str): The granularity of the candles (default is "ONE_HOUR").
-        
+
     Returns:
-        list: A list of candle objects.
-        
+        list: A list of candle objects, newest first.
+
     Raises:
         Exception: If an error occurs while fetching the candle data.
     """
     try:
         start_timestamp = to_unix_timestamp(start)  # Convert start time from ISO format to UNIX timestamp
         end_timestamp = to_unix_timestamp(end)  # Convert end time from ISO format to UNIX timestamp
+        return await get_store().get_candles(product_id, granularity, start_timestamp, end_timestamp, get_candle_page)
+    except Exception as e:
+        logger.error(f"Error fetching candles for {product_id}: {e}")  # Log an error message if an exception occurs
+        raise  # Reraise the exception
 
-        params = {
-            "start": start_timestamp,
-            "end": end_timestamp,
-            "granularity": granularity
-        }
-        response = requests.get(f"{BASE_URL}/market/products/{product_id}/candles", params=params)
-        response.raise_for_status()  # Raise an exception if the request was unsuccessful
-        return response.json()["candles"]  # Return the candles data from the JSON response
+
+# Function to stream candle data for a specific product in chunks
+async def stream_candles(product_id: str, start: str, end: str, granularity: str = "ONE_HOUR",
+                         typed: bool = False, chunk_size: int = COLUMNAR_CHUNK_ROWS):
+    """
+    Retrieve candle data for a specified product as chunks read from the candle store.
+
+    Missing intervals are fetched before returning, so upstream errors are raised here;
+    the chunks are then read from the store one query at a time while they are sent.
+
+    Args:
+        product_id (str): The ID of the product.
+        start (str): The start timestamp in ISO format.
+        end (str): The end timestamp in ISO format.
+        granularity (str): The granularity of the candles (default is "ONE_HOUR").
+        typed (bool): Read prices and volume as floats instead of the stored strings.
+        chunk_size (int): Maximum number of candles per chunk.
+
+    Returns:
+        tuple: The number of candles and an async iterator of lists of candle tuples
+        (start, low, high, open, close, volume), newest first.
+
+    Raises:
+        Exception: If an error occurs while fetching the candle data.
+    """
+    try:
+        start_timestamp = to_unix_timestamp(start)  # Convert start time from ISO format to UNIX timestamp
+        end_timestamp = to_unix_timestamp(end)  # Convert end time from ISO format to UNIX timestamp
+        store = get_store()
+        span = await store.fill(product_id, granularity, start_timestamp, end_timestamp, get_candle_page)
+        if span is None:
+            return 0, chunked([])
+        count = await asyncio.to_thread(store.count, product_id, *span)
+        return count, store.iter_chunks(product_id, *span, chunk_size, limit=count, typed=typed)
     except Exception as e:
         logger.error(f"Error fetching candles for {product_id}: {e}")  # Log an error message if an exception occurs
         raise  # Reraise the exception
 
 
+# Function to resample candle data and compute indicators for a specific product
+async def get_resampled_candles(product_id: str, start: str, end: str, interval: int, indicators: list):
+    """
+    Resample candle data for a product to an arbitrary interval and compute indicators.
+
+    Candles are fetched at the coarsest Coinbase granularity dividing the interval and
+    read from the candle store as typed rows straight into NumPy columns; all
+    aggregation is vectorized.
+
+    Args:
+        product_id (str): The ID of the product.
+        start (str): The start timestamp in ISO format.
+        end (str): The end timestamp in ISO format.
+        interval (int): The length of each resampled candle in seconds.
+        indicators (list): (name, period) pairs as returned by parse_indicators.
+
+    Returns:
+        dict: The resampled candle columns and the indicator series, as NumPy arrays.
+
+    Raises:
+        Exception: If an error occurs while fetching the candle data.
+    """
+    granularity = base_granularity(interval)
+    try:
+        start_timestamp = to_unix_timestamp(start)  # Convert start time from ISO format to UNIX timestamp
+        end_timestamp = to_unix_timestamp(end)  # Convert end time from ISO format to UNIX timestamp
+        store = get_store()
+        span = await store.fill(product_id, granularity, start_timestamp, end_timestamp, get_candle_page)
+        rows = await asyncio.to_thread(store.read_rows, product_id, *span, typed=True) if span is not None else []
+    except Exception as e:
+        logger.error(f"Error fetching candles for {product_id}: {e}")  # Log an error message if an exception occurs
+        raise  # Reraise the exception
+    columns = resample(rows_to_arrays(rows), interval)
+    return {
+        "product_id": product_id,
+        "interval": interval,
+        "granularity": granularity,
+        **columns,
+        "indicators": compute_indicators(columns, indicators),
+    }
+
+
 # Function to fetch market trades for a specific product from the API
-def get_market_trades(product_id: str):
+@prefetchable("market_trades")
+@cached(market_trades_cache)
+@shared_snapshot("market_trades", max_age=market_trades_cache.ttl)
+async def get_market_trades(product_id: str):
     """
     Retrieve market trades for a specified product from the Coinbase API.
     
@@ -173,9 +476,232 @@ def get_market_trades(product_id: str):
         Exception: If an error occurs while fetching the market trades.
     """
     try:
-        response = requests.get(f"{BASE_URL}/market/products/{product_id}/ticker")
-        response.raise_for_status()  # Raise an exception if the request was unsuccessful
-        return response.json().get("trades", [])  # Return the trades data from the JSON response, defaulting to an empty list if not present
+        response = await upstream_get(f"{BASE_URL}/market/products/{product_id}/ticker", endpoint="ticker")
+        trades = read_json(response).get("trades", [])  # Get the trades data from the JSON response, defaulting to an empty list if not present
+        get_market_store().ingest_trades(product_id, trades)  # Keep them in the recent trades
+        return trades
     except Exception as e:
         logger.error(f"Error fetching market trades for {product_id}: {e}")  # Log an error message if an exception occurs
         raise  # Reraise the exception
+
+
+# Function to poll the latest market trades of a product for the trade tape
+async def poll_market_trades(product_id: str):
+    """
+    Retrieve the latest market trades of a product on behalf of the trade tape recorder.
+
+    The trades cache is shared with client requests, but the polls are not counted as
+    client demand by the prefetcher and wait behind interactive upstream requests.
+
+    Args:
+        product_id (str): The ID of the product.
+
+    Returns:
+        list: A list of market trade objects.
+    """
+    with upstream_priority(BACKGROUND):
+        return await get_market_trades.__wrapped__(product_id)
+
+
+# Function to read recorded trades of a product within a time range
+async def get_tape_trades(product_id: str, start: str, end: str, limit: int = TRADE_TAPE_MAX_ROWS):
+    """
+    Retrieve the trades of a product recorded on the trade tape within a time range.
+
+    Args:
+        product_id (str): The ID of the product.
+        start (str): The start timestamp in ISO format, inclusive.
+        end (str): The end timestamp in ISO format, exclusive.
+        limit (int): Maximum number of trades, the oldest being kept.
+
+    Returns:
+        np.ndarray: Tape records (time in microseconds, trade_id, price, size, side) ordered by time.
+
+    Raises:
+        ValueError: If the timestamps or the product ID are invalid.
+    """
+    return await asyncio.to_thread(get_tape().read, product_id, to_unix_micros(start), to_unix_micros(end), limit)
+
+
+# Function to build candles of any interval from the recorded trades of a product
+async def get_tape_candles(product_id: str, start: str, end: str, interval: int, max_rows: int = TRADE_TAPE_MAX_ROWS):
+    """
+    Build OHLCV candles of an arbitrary interval from the trades recorded on the trade tape.
+
+    Args:
+        product_id (str): The ID of the product.
+        start (str): The start timestamp in ISO format, inclusive.
+        end (str): The end timestamp in ISO format, exclusive.
+        interval (int): The length of each candle in seconds.
+        max_rows (int): Maximum number of trades the range may hold.
+
+    Returns:
+        dict: The candle columns, with the number of trades per candle, as NumPy arrays.
+
+    Raises:
+        ValueError: If the timestamps or the product ID are invalid, or the range holds more than max_rows trades.
+    """
+    columns = await asyncio.to_thread(get_tape().candles, product_id, to_unix_micros(start), to_unix_micros(end),
+                                      interval, max_rows)
+    return {"product_id": product_id, "interval": interval, **columns}
+
+
+# Function to read the recent trades of a product kept in memory
+async def get_recent_trades(product_id: str, limit: int = None):
+    """
+    Retrieve the recent trades of a product from its in-memory ring buffer.
+
+    Trades accumulate from every market trades fetch and stream message. When none are
+    held yet, the latest trades are fetched first.
+
+    Args:
+        product_id (str): The ID of the product.
+        limit (int, optional): Maximum number of trades, the newest being kept.
+
+    Returns:
+        np.ndarray: Trade records (trade_id, time in microseconds, side, price, size, bid, ask), in arrival order.
+
+    Raises:
+        Exception: If an error occurs while fetching the market trades.
+    """
+    store = get_market_store()
+    if not store.trades(product_id):
+        store.ingest_trades(product_id, await get_market_trades(product_id))  # Also refills a product evicted while cached
+    return np.concatenate(store.trades(product_id, limit) or [np.empty(0, dtype=TRADE_RING_DTYPE)])  # Copied, as the response outlives the next append
+
+
+# Function to read the recent candles of a product kept in memory
+def get_recent_candles(product_id: str, granularity: str, limit: int = None):
+    """
+    Retrieve the recent candles of a product from its in-memory ring buffer.
+
+    Candles accumulate from every candle page fetched from the Coinbase API; nothing is
+    fetched here.
+
+    Args:
+        product_id (str): The ID of the product.
+        granularity (str): The granularity of the candles.
+        limit (int, optional): Maximum number of candles, the newest being kept.
+
+    Returns:
+        dict: The candle columns, oldest first.
+    """
+    records = np.concatenate(get_market_store().candles(product_id, granularity, limit)
+                             or [np.empty(0, dtype=CANDLE_RING_DTYPE)])
+    return {"product_id": product_id, "granularity": granularity, **{name: records[name] for name in CANDLE_RING_DTYPE.names}}
+
+
+# Backfill chunks being fetched by this process, keyed by (job_id, chunk)
+_backfill_inflight = {}
+
+
+# Function to submit a backfill job of candle history for several products
+async def submit_backfill(product_ids: list, start: str, end: str, granularity: str = "ONE_HOUR"):
+    """
+    Record a backfill job and publish its unfinished chunks to the backfill queue.
+
+    Submitting the same products, range and granularity again returns the same job and
+    republishes only the chunks not done yet; chunks are idempotent, so a chunk
+    delivered twice is fetched at most once.
+
+    Args:
+        product_ids (list): The IDs of the products.
+        start (str): The start timestamp in ISO format.
+        end (str): The end timestamp in ISO format.
+        granularity (str): The granularity of the candles (default is "ONE_HOUR").
+
+    Returns:
+        dict: The job and its progress.
+
+    Raises:
+        ValueError: If the timestamps, the granularity or a product ID are invalid.
+        PublishError: If the broker did not confirm the chunks.
+    """
+    jobs = get_backfill_jobs()
+    job_id, messages = await asyncio.to_thread(jobs.submit, product_ids, granularity,
+                                               to_unix_timestamp(start), to_unix_timestamp(end))
+    if messages:
+        await get_publisher().publish_many(BACKFILL_QUEUE, messages)
+    return await asyncio.to_thread(jobs.job, job_id)
+
+
+# Function to read the progress of a backfill job
+async def get_backfill_job(job_id: str):
+    """
+    Retrieve a backfill job and its progress.
+
+    Args:
+        job_id (str): The ID of the job.
+
+    Returns:
+        dict: The job and its progress, or None if the job is unknown.
+    """
+    return await asyncio.to_thread(get_backfill_jobs().job, job_id)
+
+
+# Function to fetch one chunk of a backfill job into the candle store
+async def run_backfill_chunk(chunk: dict) -> int:
+    """
+    Fetch the candles of one backfill chunk into the candle store and mark it done.
+
+    Already completed chunks are skipped, copies delivered while a chunk is being fetched
+    share that fetch, and the candle store only fetches intervals it does not hold, so
+    redelivered chunks cost no upstream request. Upstream calls run
+    with the backfill priority, behind interactive and background requests.
+
+    Args:
+        chunk (dict): The chunk, as returned by decode_chunk.
+
+    Returns:
+        int: The number of candles stored for the range of the chunk.
+
+    Raises:
+        Exception: If an error occurs while fetching the candle data; the failure is recorded on the job.
+    """
+    key = (chunk["job_id"], chunk["chunk"])
+    task = _backfill_inflight.get(key)
+    if task is None:  # A copy delivered while the chunk is being fetched joins that fetch
+        task = _backfill_inflight[key] = asyncio.ensure_future(_fetch_backfill_chunk(chunk))
+        task.add_done_callback(lambda _: _backfill_inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def _fetch_backfill_chunk(chunk: dict) -> int:
+    # Fetch a chunk unless a previous delivery already completed it
+    jobs = get_backfill_jobs()
+    job_id, index, product_id = chunk["job_id"], chunk["chunk"], chunk["product_id"]
+    if await asyncio.to_thread(jobs.is_done, job_id, index):
+        return 0
+    store = get_store()
+    try:
+        with upstream_priority(BACKFILL):
+            span = await store.fill(product_id, chunk["granularity"], chunk["start"], chunk["end"], get_candle_page,
+                                    capped=False)
+        candles = await asyncio.to_thread(store.count, product_id, *span) if span is not None else 0
+    except Exception as e:
+        logger.error(f"Error backfilling chunk {index} of job {job_id} ({product_id}): {e}")
+        await asyncio.to_thread(jobs.fail, job_id, index, str(e) or type(e).__name__)
+        raise
+    await asyncio.to_thread(jobs.complete, job_id, index, candles)
+    return candles
+
+
+# Function to read the merged candles of a finished backfill job
+async def stream_backfill_result(job: dict, chunk_size: int = COLUMNAR_CHUNK_ROWS):
+    """
+    Read the candles of every product of a backfill job from the candle store, in chunks.
+
+    Args:
+        job (dict): The job, as returned by get_backfill_job.
+        chunk_size (int): Maximum number of candles per chunk.
+
+    Yields:
+        dict: The product ID and a list of candle objects, newest first; a product with
+        many candles spans several consecutive chunks.
+    """
+    store = get_store()
+    step = granularity_seconds(job["granularity"])
+    for product_id in job["product_ids"]:
+        async for rows in store.iter_chunks(product_id, step, job["start"], job["end"], chunk_size):
+            yield {"product_id": product_id,
+                   "candles": [dict(zip(CANDLE_FIELDS, (str(row[0]),) + row[1:])) for row in rows]}
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 
 
 # Model representing the server time details
@@ -119,3 +119,108 @@ class MarketTrade(BaseModel):
     side: str  # Side of the trade (buy/sell)
     bid: str  # Bid price at the time of the trade
     ask: str  # Ask price at the time of the trade
+
+
+# Model representing resampled candles and indicators as parallel columns
+class ResampledCandles(BaseModel):
+    product_id: str  # ID of the product
+    interval: int  # Length of each resampled candle in seconds
+    granularity: str  # Coinbase granularity the candles were built from
+    start: List[int]  # Start time of each candle as a UNIX timestamp
+    low: List[float]  # Low price of each candle
+    high: List[float]  # High price of each candle
+    open: List[float]  # Opening price of each candle
+    close: List[float]  # Closing price of each candle
+    volume: List[float]  # Volume of each candle
+    indicators: Dict[str, List[Optional[float]]]  # Indicator series aligned with the candles (null during warm-up)
+
+
+# Model representing a trade read back from the trade tape
+class TapeTrade(BaseModel):
+    trade_id: int  # ID of the trade
+    time: str  # Time at which the trade occurred, in ISO format with microseconds
+    price: float  # Price at which the trade occurred
+    size: float  # Size of the trade
+    side: str  # Side of the trade (BUY/SELL)
+
+
+# Model representing candles built from the trade tape as parallel columns
+class TapeCandles(BaseModel):
+    product_id: str  # ID of the product
+    interval: int  # Length of each candle in seconds
+    start: List[int]  # Start time of each candle as a UNIX timestamp
+    low: List[float]  # Low price of each candle
+    high: List[float]  # High price of each candle
+    open: List[float]  # Opening price of each candle
+    close: List[float]  # Closing price of each candle
+    volume: List[float]  # Volume of each candle
+    trades: List[int]  # Number of trades in each candle
+
+
+# Model representing the cumulative size within each depth band around the mid price
+class BookDepth(BaseModel):
+    bps: List[float]  # Distance from the mid price in basis points
+    bid: List[Optional[float]]  # Bid size priced within each band
+    ask: List[Optional[float]]  # Ask size priced within each band
+    imbalance: List[Optional[float]]  # (bid - ask) / (bid + ask) within each band
+
+
+# Model representing the fill of market orders of several sizes against one side of the book
+class BookFill(BaseModel):
+    filled: List[float]  # Size filled, less than requested when the book is too thin
+    vwap: List[Optional[float]]  # Volume-weighted average price of the fill
+    worst_price: List[Optional[float]]  # Price of the last level reached
+    slippage_bps: List[Optional[float]]  # Distance of the VWAP from the mid price, in basis points
+
+
+# Model representing order book analytics for a product
+class BookAnalytics(BaseModel):
+    product_id: str  # ID of the product
+    time: str  # Time of the order book
+    best_bid: Optional[float]  # Highest bid price
+    best_ask: Optional[float]  # Lowest ask price
+    mid: Optional[float]  # Average of the best bid and ask
+    spread: Optional[float]  # Best ask minus best bid
+    spread_bps: Optional[float]  # Spread relative to the mid price, in basis points
+    bid_levels: int  # Number of bid levels
+    ask_levels: int  # Number of ask levels
+    top_imbalance: Optional[float]  # Imbalance of the sizes at the best bid and ask
+    depth: BookDepth  # Depth and imbalance per band
+    sizes: List[float]  # Market order sizes, in base currency
+    buy: BookFill  # Market buys, filled against the asks
+    sell: BookFill  # Market sells, filled against the bids
+
+
+# Model representing the recent candles kept in memory as parallel columns
+class RecentCandles(BaseModel):
+    product_id: str  # ID of the product
+    granularity: str  # Coinbase granularity of the candles
+    start: List[int]  # Start time of each candle as a UNIX timestamp
+    low: List[float]  # Low price of each candle
+    high: List[float]  # High price of each candle
+    open: List[float]  # Opening price of each candle
+    close: List[float]  # Closing price of each candle
+    volume: List[float]  # Volume of each candle
+
+
+# Model representing a chunk of a backfill job whose last attempt failed
+class BackfillError(BaseModel):
+    chunk: int  # Index of the chunk within the job
+    product_id: str  # ID of the product of the chunk
+    error: str  # Description of the failure
+
+
+# Model representing a backfill job and its progress
+class BackfillJob(BaseModel):
+    job_id: str  # ID of the job, derived from its products, range and granularity
+    status: str  # queued, running, done or failed (submit the job again to retry)
+    product_ids: List[str]  # IDs of the products
+    granularity: str  # Coinbase granularity of the candles
+    start: int  # Start of the range as a UNIX timestamp
+    end: int  # End of the range as a UNIX timestamp
+    created: float  # Time the job was first submitted, as a UNIX timestamp
+    chunks: int  # Number of chunks of the job
+    chunks_done: int  # Number of chunks fetched
+    progress: float  # Share of the chunks fetched, from 0 to 1
+    candles: int  # Candles stored for the chunks fetched
+    errors: List[BackfillError]  # Chunks not done yet whose last attempt failed
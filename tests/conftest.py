@@ -0,0 +1,31 @@
+import httpx
+import pytest
+
+from benchmarks.fake_upstream import FakeUpstream
+from services.api.core import http_client
+from services.api.core.cache import clear_caches
+from services.api.core.candle_store import CandleStore, set_store
+from services.api.core.resilience import reset_resilience
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    # Route upstream calls to a fresh fake Coinbase API, with empty caches and closed circuits.
+    # Live order books stay off so no test opens the real market data WebSocket.
+    monkeypatch.setattr("services.api.models.public_data.LIVE_ORDER_BOOKS", False)
+    clear_caches()
+    reset_resilience()
+    fake = FakeUpstream()
+    http_client.set_transport(httpx.ASGITransport(app=fake))
+    yield fake
+    http_client.set_transport(None)
+    reset_resilience()
+
+
+@pytest.fixture
+def candle_store():
+    # Serve candles from an empty in-memory store instead of the one on disk
+    store = CandleStore(":memory:")
+    set_store(store)
+    yield store
+    set_store(None)
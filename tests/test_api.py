@@ -1,8 +1,17 @@
+import asyncio
+
+import httpx
+import pytest
 from fastapi.testclient import TestClient
+
+from benchmarks.fake_upstream import FakeUpstream
 from services.api.main import app
 
 client = TestClient(app)
 
+# Every test talks to the fake upstream
+pytestmark = pytest.mark.usefixtures("upstream")
+
 
 def test_read_root():
     response = client.get("/")
@@ -18,3 +27,16 @@ def test_get_products():
 def test_get_server_time():
     response = client.get("/public/server-time")
     assert response.status_code == 200
+
+
+def test_fake_upstream_injects_throttling_and_errors():
+    async def scenario():
+        fake = FakeUpstream(throttle_rate=0.5, error_rate=0.5, retry_after=2, seed=1)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=fake), base_url="http://upstream") as upstream:
+            return fake, [await upstream.get("/api/v3/brokerage/time") for _ in range(20)]
+
+    fake, responses = asyncio.run(scenario())
+    statuses = {response.status_code for response in responses}
+    assert statuses == {429, 500}
+    assert fake.throttled + fake.errors == 20
+    assert all(r.headers["retry-after"] == "2" for r in responses if r.status_code == 429)
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import orjson
+import pika
+import pytest
+from fastapi.testclient import TestClient
+
+import backfill_worker as backfill_worker_module
+import publisher
+from backfill_worker import backfill_worker, handle_chunk
+from benchmarks.fake_broker import FakeBroker
+from consumer import RejectMessage
+from publisher import Publisher
+from services.api.core import backfill
+from services.api.core.backfill import BACKFILL_QUEUE, BackfillJobs, decode_chunk
+from services.api.main import app
+
+client = TestClient(app)
+
+HOUR = 3600
+START = 1704067200  # 2024-01-01T00:00:00Z
+
+
+def test_resubmitted_job_only_republishes_unfinished_chunks():
+    jobs = BackfillJobs(":memory:", chunk_candles=10)
+    job_id, messages = jobs.submit(["BTC-USD", "ETH-USD", "BTC-USD"], "ONE_HOUR", START + 1, START + 24 * HOUR)
+    chunks = [decode_chunk(message) for message in messages]
+    assert [(c["product_id"], c["start"], c["end"]) for c in chunks[:3]] == [
+        ("BTC-USD", START + HOUR, START + 10 * HOUR), ("BTC-USD", START + 11 * HOUR, START + 20 * HOUR),
+        ("BTC-USD", START + 21 * HOUR, START + 24 * HOUR)]
+    assert len(chunks) == 6 and jobs.job(job_id)["status"] == "queued"
+
+    jobs.fail(job_id, 1, "upstream timeout")
+    jobs.complete(job_id, 0, 10)
+    jobs.complete(job_id, 0, 10)  # Duplicate delivery
+    job = jobs.job(job_id)
+    assert job["status"] == "running" and job["chunks_done"] == 1 and job["candles"] == 10
+    assert job["errors"] == [{"chunk": 1, "product_id": "BTC-USD", "error": "upstream timeout"}]
+
+    same_id, messages = jobs.submit(["ETH-USD", "BTC-USD"], "ONE_HOUR", START + 1, START + 24 * HOUR)
+    assert same_id == job_id and [decode_chunk(m)["chunk"] for m in messages] == [1, 2, 3, 4, 5]
+
+    for chunk in range(1, 6):  # Every unfinished chunk out of attempts
+        for _ in range(jobs.max_attempts - (chunk == 1)):
+            jobs.fail(job_id, chunk, "circuit open")
+    assert jobs.job(job_id)["status"] == "failed" and jobs.attempts(job_id, 1) == jobs.max_attempts
+    jobs.submit(["BTC-USD", "ETH-USD"], "ONE_HOUR", START + 1, START + 24 * HOUR)  # Retries the given up chunks
+    assert jobs.job(job_id)["status"] == "running" and jobs.attempts(job_id, 1) == 0
+    assert jobs.attempts(job_id, 0) == 2 and jobs.attempts("unknown", 0) is None
+    with pytest.raises(ValueError):
+        jobs.submit(["BTC-USD"], "TEN_HOURS", START, START + HOUR)
+    with pytest.raises(ValueError):
+        BackfillJobs(":memory:", chunk_candles=10, max_chunks=2).submit(["BTC-USD"], "ONE_HOUR", START, START + 24 * HOUR)
+
+
+def test_failed_chunks_are_requeued_until_out_of_attempts(monkeypatch, upstream, candle_store):
+    monkeypatch.setattr(backfill_worker_module, "BACKFILL_RETRY_DELAY", 0)
+    upstream.error_rate = 1.0
+    jobs_before = backfill._jobs
+    jobs = BackfillJobs(":memory:", max_attempts=2)
+    backfill.set_backfill_jobs(jobs)
+    try:
+        job_id, messages = jobs.submit(["BTC-USD"], "ONE_HOUR", START, START + 10 * HOUR)
+        with pytest.raises(Exception) as first:
+            handle_chunk(messages[0], BACKFILL_QUEUE)
+        assert not isinstance(first.value, RejectMessage)  # Requeued by the worker
+        assert jobs.job(job_id)["status"] == "running"
+        with pytest.raises(RejectMessage):  # Out of attempts: discarded
+            handle_chunk(messages[0], BACKFILL_QUEUE)
+        assert jobs.job(job_id)["status"] == "failed" and len(jobs.job(job_id)["errors"]) == 1
+        with pytest.raises(RejectMessage):
+            handle_chunk(b"not a chunk", BACKFILL_QUEUE)
+    finally:
+        backfill.set_backfill_jobs(jobs_before)
+
+
+def test_workers_fetch_chunks_once_and_serve_the_merged_result(tmp_path, upstream, candle_store):
+    broker = FakeBroker()
+    port = broker.start_in_thread()
+    parameters = pika.ConnectionParameters(host="127.0.0.1", port=port,
+                                           credentials=pika.PlainCredentials("user", "password"))
+    publisher.set_publisher(Publisher(parameters))
+    jobs_before = backfill._jobs
+    backfill.set_backfill_jobs(BackfillJobs(str(tmp_path / "backfill.sqlite3"), chunk_candles=20))
+    try:
+        request = {"product_ids": ["BTC-USD", "ETH-USD"], "start": "2024-01-01T00:00:00", "end": "2024-01-03T00:00:00"}
+        response = client.post("/public/backfill", json=request)
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] == "queued" and job["chunks"] == 6
+        assert client.get(f"/public/backfill/{job['job_id']}/result").status_code == 409
+        assert client.post("/public/backfill", json={**request, "granularity": "TEN_HOURS"}).status_code == 400
+        assert client.get("/public/backfill/unknown").status_code == 404
+
+        connection = pika.BlockingConnection(parameters)
+        duplicate = broker.queues[BACKFILL_QUEUE][0][1]
+        connection.channel().basic_publish(exchange="", routing_key=BACKFILL_QUEUE, body=duplicate)
+        connection.close()
+
+        worker = backfill_worker(parameters=parameters, workers=4, stats_interval=0.05)
+        thread = threading.Thread(target=worker.run)
+        thread.start()
+        deadline = time.monotonic() + 10
+        while worker.processed + worker.failed < 7 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        worker.stop()
+        thread.join(5)
+        assert worker.processed == 7 and upstream.request_count == 6  # The duplicate fetched nothing
+
+        job = client.get(f"/public/backfill/{job['job_id']}").json()
+        assert job["status"] == "done" and job["progress"] == 1.0 and job["candles"] == 2 * 49
+        response = client.get(f"/public/backfill/{job['job_id']}/result")
+        lines = [orjson.loads(line) for line in response.content.splitlines()]
+        assert [line["product_id"] for line in lines] == ["BTC-USD", "ETH-USD"]
+        assert [len(line["candles"]) for line in lines] == [49, 49]
+        assert lines[0]["candles"][0]["start"] == str(START + 48 * HOUR)
+    finally:
+        backfill.set_backfill_jobs(jobs_before)
+        publisher.set_publisher(None)
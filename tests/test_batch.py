@@ -0,0 +1,61 @@
+import asyncio
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from services.api.core.batch import fan_out, parse_product_ids
+from services.api.main import app
+
+client = TestClient(app)
+
+
+def test_parse_product_ids():
+    assert parse_product_ids(" BTC-USD,ETH-USD,,BTC-USD ") == ["BTC-USD", "ETH-USD"]
+    with pytest.raises(ValueError):
+        parse_product_ids(",")
+    with pytest.raises(ValueError):
+        parse_product_ids("A,B,C", limit=2)
+
+
+def test_fan_out_bounds_concurrency_and_yields_in_completion_order():
+    running = 0
+    peak = 0
+
+    async def fetch(product_id):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05 if product_id == "SLOW" else 0.01)
+        running -= 1
+        if product_id == "BAD":
+            raise RuntimeError("boom")
+        return product_id.lower()
+
+    async def scenario():
+        return [result async for result in fan_out(["SLOW", "A", "BAD", "B"], fetch, concurrency=2)]
+
+    results = asyncio.run(scenario())
+    assert peak == 2
+    assert results[-1] == {"product_id": "SLOW", "data": "slow"}
+    assert {"product_id": "BAD", "error": "boom", "status": 500} in results
+    assert len(results) == 4
+
+
+def test_batch_market_trades_reports_errors_inline(upstream):
+    response = client.get("/public/batch/market-trades", params={"product_ids": "BTC-USD,NOPE-USD,ETH-USD"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = {line["product_id"]: line for line in map(orjson.loads, response.content.splitlines())}
+    assert len(lines["BTC-USD"]["data"]) == 10
+    assert len(lines["ETH-USD"]["data"]) == 10
+    assert lines["NOPE-USD"]["status"] == 404 and "data" not in lines["NOPE-USD"]
+
+
+def test_batch_rejects_invalid_requests(upstream):
+    response = client.get("/public/batch/candles", params={
+        "product_ids": "BTC-USD", "start": "yesterday", "end": "2024-01-02T00:00:00",
+    })
+    assert response.status_code == 400
+    response = client.get("/public/batch/product-book", params={"product_ids": ","})
+    assert response.status_code == 400
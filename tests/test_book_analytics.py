@@ -0,0 +1,56 @@
+import math
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from services.api.core.book_analytics import analyze_book, parse_numbers, pricebook_to_arrays
+from services.api.core.order_book import OrderBook
+from services.api.main import app
+
+client = TestClient(app)
+
+PRICEBOOK = {
+    "product_id": "BTC-USD",
+    "bids": [{"price": "99", "size": "1"}, {"price": "100", "size": "2"}, {"price": "98", "size": "3"}],
+    "asks": [{"price": "101", "size": "1"}, {"price": "102", "size": "1"}, {"price": "110", "size": "5"}],
+    "time": "",
+}
+
+
+def test_analytics_from_cumulative_sums():
+    columns = pricebook_to_arrays(PRICEBOOK)
+    assert columns["bid_price"].tolist() == [100, 99, 98]
+    live = OrderBook.from_pricebook(PRICEBOOK).to_arrays()
+    assert all(live[name].tolist() == columns[name].tolist() for name in columns)
+
+    result = analyze_book(columns, [1, 2.5, 100], [100, 250])
+    assert (result["mid"], result["spread"]) == (100.5, 1.0)
+    assert result["top_imbalance"] == pytest.approx(1 / 3)
+    # Within 1% of 100.5: bids >= 99.495 and asks <= 101.505; within 2.5%: bids >= 97.99, asks <= 103.01
+    assert result["depth"]["bid"].tolist() == [2, 6] and result["depth"]["ask"].tolist() == [1, 2]
+    assert result["depth"]["imbalance"].tolist() == pytest.approx([1 / 3, 0.5])
+
+    buy, sell = result["buy"], result["sell"]
+    assert buy["vwap"].tolist() == pytest.approx([101, (101 + 102 + 0.5 * 110) / 2.5, (101 + 102 + 550) / 7])
+    assert buy["worst_price"].tolist() == [101, 110, 110] and buy["filled"].tolist() == [1, 2.5, 7]
+    assert sell["vwap"].tolist() == pytest.approx([100, (200 + 0.5 * 99) / 2.5, (200 + 99 + 294) / 6])
+    assert buy["slippage_bps"][0] == pytest.approx(0.5 / 100.5 * 10_000)
+
+    one_sided = analyze_book(pricebook_to_arrays({"bids": PRICEBOOK["bids"], "asks": []}), [1], [10])
+    assert math.isnan(one_sided["mid"]) and one_sided["buy"]["filled"].tolist() == [0]
+    with pytest.raises(ValueError):
+        parse_numbers("1,-2", "sizes")
+
+
+def test_batch_analytics_streams_one_line_per_product(upstream):
+    response = client.get("/public/batch/product-book/analytics",
+                          params={"product_ids": "BTC-USD,NOPE-USD", "sizes": "0.1,1000"})
+    assert response.status_code == 200
+    lines = {line["product_id"]: line for line in map(orjson.loads, response.content.splitlines())}
+    data = lines["BTC-USD"]["data"]
+    assert data["spread"] == pytest.approx(0.02) and data["depth"]["bps"] == [10, 50, 100]
+    assert data["buy"]["filled"][0] == 0.1 and data["buy"]["filled"][1] < 1000
+    assert lines["NOPE-USD"]["status"] == 404
+    response = client.get("/public/product-book/BTC-USD/analytics", params={"sizes": "abc"})
+    assert response.status_code == 400
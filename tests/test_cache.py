@@ -0,0 +1,64 @@
+import asyncio
+
+from services.api.core.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_concurrent_misses_share_one_fetch():
+    cache = TTLCache("test_coalesce", ttl=10)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_fetch("key", fetch) for _ in range(50)))
+
+    results = asyncio.run(scenario())
+    assert results == ["value"] * 50
+    assert len(calls) == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["coalesced"] == 49
+
+
+def test_stale_entry_is_served_while_refreshing():
+    clock = FakeClock()
+    cache = TTLCache("test_stale", ttl=1, stale_ttl=5, clock=clock)
+    values = iter(["old", "new"])
+
+    async def fetch():
+        return next(values)
+
+    async def scenario():
+        first = await cache.get_or_fetch("key", fetch)
+        clock.now = 2  # Past the TTL but inside the stale window
+        stale = await cache.get_or_fetch("key", fetch)
+        await asyncio.sleep(0)  # Let the background refresh complete
+        await asyncio.sleep(0)
+        fresh = await cache.get_or_fetch("key", fetch)
+        return first, stale, fresh
+
+    assert asyncio.run(scenario()) == ("old", "old", "new")
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache("test_lru", ttl=10, maxsize=2)
+
+    async def scenario():
+        for key in ("a", "b", "a", "c"):
+            await cache.get_or_fetch(key, lambda key=key: asyncio.sleep(0, result=key))
+
+    asyncio.run(scenario())
+    assert cache.peek("b") is None
+    assert cache.peek("a") == "a"
+    assert cache.stats()["evictions"] == 1
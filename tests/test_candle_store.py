@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from services.api.core.candle_store import CandleStore, RangeTooLarge, subtract_intervals
+
+HOUR = 3600
+NOW = 1000 * HOUR + 1800  # Half way through the candle starting at 1000h
+
+
+class FakeUpstream:
+    def __init__(self):
+        self.pages = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def fetch_page(self, product_id, granularity, start, end):
+        self.pages.append((start, end))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        return [
+            {"start": str(ts), "low": "1", "high": "2", "open": "1.5", "close": "1.5", "volume": "10"}
+            for ts in range(start - start % HOUR, end + 1, HOUR) if ts >= start
+        ][::-1]
+
+
+def make_store():
+    return CandleStore(":memory:", per_page=10, concurrency=2, clock=lambda: NOW)
+
+
+def test_subtract_intervals():
+    covered = [(10, 20), (40, 50)]
+    assert subtract_intervals(0, 60, covered, 10) == [(0, 0), (30, 30), (60, 60)]
+    assert subtract_intervals(10, 50, [(0, 60)], 10) == []
+
+
+def test_long_range_is_paginated_in_parallel_and_cached():
+    store = make_store()
+    upstream = FakeUpstream()
+    start, end = 900 * HOUR, 949 * HOUR
+
+    candles = asyncio.run(store.get_candles("BTC-USD", "ONE_HOUR", start, end, upstream.fetch_page))
+    assert len(candles) == 50
+    assert int(candles[0]["start"]) == end  # Newest first
+    assert len(upstream.pages) == 5
+    assert upstream.max_in_flight == 2
+
+    upstream.pages.clear()
+    again = asyncio.run(store.get_candles("BTC-USD", "ONE_HOUR", start, end, upstream.fetch_page))
+    assert again == candles
+    assert upstream.pages == []
+
+
+def test_only_missing_intervals_are_fetched():
+    store = make_store()
+    upstream = FakeUpstream()
+    asyncio.run(store.get_candles("BTC-USD", "ONE_HOUR", 910 * HOUR, 919 * HOUR, upstream.fetch_page))
+    upstream.pages.clear()
+
+    candles = asyncio.run(store.get_candles("BTC-USD", "ONE_HOUR", 905 * HOUR, 924 * HOUR, upstream.fetch_page))
+    assert len(candles) == 20
+    assert [(s // HOUR, e // HOUR) for s, e in upstream.pages] == [(905, 909), (920, 924)]
+
+
+def test_candle_in_progress_is_always_refreshed():
+    store = make_store()
+    upstream = FakeUpstream()
+    for _ in range(2):
+        asyncio.run(store.get_candles("BTC-USD", "ONE_HOUR", 995 * HOUR, 1005 * HOUR, upstream.fetch_page))
+    assert [(s // HOUR, e // HOUR) for s, e in upstream.pages] == [(995, 1000), (1000, 1000)]
+
+
+def test_ranges_needing_too_many_pages_are_refused_unless_uncapped():
+    store = CandleStore(":memory:", per_page=10, max_pages=4, clock=lambda: NOW)
+    upstream = FakeUpstream()
+    start, end = 900 * HOUR, 949 * HOUR
+    with pytest.raises(RangeTooLarge, match="backfill"):
+        asyncio.run(store.fill("BTC-USD", "ONE_HOUR", start, end, upstream.fetch_page))
+    assert upstream.pages == []
+
+    asyncio.run(store.fill("BTC-USD", "ONE_HOUR", start, end, upstream.fetch_page, capped=False))
+    assert len(upstream.pages) == 5
+    candles = asyncio.run(store.get_candles("BTC-USD", "ONE_HOUR", start, end, upstream.fetch_page))
+    assert len(candles) == 50 and len(upstream.pages) == 5  # Stored ranges do not count against the cap
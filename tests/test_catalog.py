@@ -0,0 +1,57 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.fake_upstream import make_product
+from services.api.core.catalog import ProductCatalog, decode_cursor, encode_cursor, etag_matches, parse_fields
+from services.api.main import app
+
+client = TestClient(app)
+
+
+def test_catalog_indexes_filters_and_pages():
+    products = [make_product(base, quote, 1.0) for base, quote in
+                [("BTC", "USD"), ("ETH", "USD"), ("ETH", "BTC"), ("SOL", "USDC"), ("SOL", "USD")]]
+    products[4]["status"] = "delisted"
+    catalog = ProductCatalog(products)
+    assert catalog.get("ETH-BTC")["base_currency_id"] == "ETH" and catalog.get("XRP-USD") is None
+    assert catalog.select({"quote_currency_id": ["USD", "USDC"], "status": ["online"]}) == [0, 1, 3]
+    assert catalog.select({"base_currency_id": ["DOGE"]}) == []
+
+    body, cursor = catalog.query({"quote_currency_id": ["USD"]}, ("product_id",), limit=2)
+    assert body == b'[{"product_id":"BTC-USD"},{"product_id":"ETH-USD"}]'
+    assert decode_cursor(cursor) == "ETH-USD"
+    assert catalog.query({"quote_currency_id": ["USD"]}, ("product_id",), cursor, 2) == (b'[{"product_id":"SOL-USD"}]', None)
+    assert catalog.query({"quote_currency_id": ["USD"]}, ("product_id",), limit=2)[0] is body  # Encoded once
+
+    with pytest.raises(ValueError):
+        catalog.query({}, cursor=encode_cursor("XRP-USD"))
+    with pytest.raises(ValueError):
+        parse_fields("product_id,nope")
+    assert ProductCatalog([dict(p) for p in products]).etag == catalog.etag
+    assert etag_matches(f"W/{catalog.etag}, \"other\"", catalog.etag) and not etag_matches(None, catalog.etag)
+
+
+def test_products_endpoint_filters_projects_and_revalidates(upstream):
+    full = client.get("/public/products")
+    assert full.status_code == 200 and len(full.json()) == 10
+    etag = full.headers["etag"]
+
+    page = client.get("/public/products", params={"quote_currency_id": "USD", "fields": "product_id,price", "limit": 3})
+    assert page.json() == [{"product_id": p["product_id"], "price": p["price"]} for p in full.json()[:3]]
+    assert page.headers["etag"] == etag and 'rel="next"' in page.headers["link"]
+    rest = client.get("/public/products", params={"quote_currency_id": "USD", "fields": "product_id",
+                                                  "cursor": page.headers["x-next-cursor"]})
+    assert "x-next-cursor" not in rest.headers
+    assert len(page.json()) + len(rest.json()) == sum(p["quote_currency_id"] == "USD" for p in full.json())
+
+    assert client.get("/public/products", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/public/products", params={"fields": "bogus"}).status_code == 400
+    assert client.get("/public/products", params={"cursor": "%%%"}).status_code == 400
+
+
+def test_product_answered_from_fresh_catalog(upstream):
+    client.get("/public/products")
+    requests = upstream.request_count
+    response = client.get("/public/product/ETH-USD")
+    assert response.status_code == 200 and response.json()["product_id"] == "ETH-USD"
+    assert upstream.request_count == requests
@@ -0,0 +1,113 @@
+import asyncio
+import csv
+import io
+
+import numpy as np
+import pyarrow as pa
+import pytest
+from fastapi.testclient import TestClient
+
+from services.api.core.candle_store import CandleStore, set_store
+from services.api.core.columnar import (
+    ARROW_MEDIA_TYPE, CSV_MEDIA_TYPE, JSON_MEDIA_TYPE, NPY_MEDIA_TYPE, TRADE_TABLE, chunked, negotiate
+)
+from services.api.main import app
+
+client = TestClient(app)
+
+CANDLE_PARAMS = {"start": "2024-01-01T00:00:00", "end": "2024-01-03T00:00:00", "granularity": "ONE_HOUR"}
+
+
+@pytest.fixture
+def candle_store():
+    store = CandleStore(":memory:", per_page=20)  # Several upstream pages per request
+    set_store(store)
+    yield store
+    set_store(None)
+
+
+def test_negotiate_prefers_quality_then_offer_order():
+    offered = [JSON_MEDIA_TYPE, ARROW_MEDIA_TYPE, NPY_MEDIA_TYPE, CSV_MEDIA_TYPE]
+    assert negotiate(None, offered) == JSON_MEDIA_TYPE
+    assert negotiate("text/html,*/*;q=0.8", offered) == JSON_MEDIA_TYPE
+    assert negotiate("application/json;q=0.5, text/csv", offered) == CSV_MEDIA_TYPE
+    assert negotiate("application/*;q=0.9, application/json;q=0.1", offered) == ARROW_MEDIA_TYPE
+    assert negotiate("image/png", offered) is None
+
+
+def test_candle_formats_match_json(upstream, candle_store):
+    rows = client.get("/public/candles/BTC-USD", params=CANDLE_PARAMS).json()
+    assert len(rows) == 49
+
+    arrow = client.get("/public/candles/BTC-USD", params=CANDLE_PARAMS, headers={"Accept": ARROW_MEDIA_TYPE})
+    assert arrow.headers["content-type"] == ARROW_MEDIA_TYPE and arrow.headers["vary"] == "Accept"
+    table = pa.ipc.open_stream(arrow.content).read_all()
+    assert table.schema.field("start").type == pa.int64() and table.schema.field("close").type == pa.float64()
+    assert table.column("start").to_pylist() == [int(row["start"]) for row in rows]
+    assert table.column("close").to_pylist() == [float(row["close"]) for row in rows]
+
+    npy = client.get("/public/candles/BTC-USD", params=CANDLE_PARAMS, headers={"Accept": NPY_MEDIA_TYPE})
+    records = np.load(io.BytesIO(npy.content))
+    assert records.shape == (49,)
+    assert records["start"].tolist() == [int(row["start"]) for row in rows]
+    assert records["volume"].tolist() == [float(row["volume"]) for row in rows]
+
+    text = client.get("/public/candles/BTC-USD", params=CANDLE_PARAMS, headers={"Accept": "text/csv"})
+    assert text.headers["content-type"].startswith(CSV_MEDIA_TYPE)
+    assert list(csv.DictReader(io.StringIO(text.text))) == rows
+
+
+def test_candle_range_over_the_page_cap_is_a_400(upstream, candle_store):
+    candle_store.max_pages = 2  # The range needs 3 pages of 20 candles
+    for accept in (JSON_MEDIA_TYPE, ARROW_MEDIA_TYPE):
+        response = client.get("/public/candles/BTC-USD", params=CANDLE_PARAMS, headers={"Accept": accept})
+        assert response.status_code == 400 and "backfill" in response.json()["detail"]
+    assert upstream.request_count == 0
+
+
+def test_candle_stream_reads_the_store_in_chunks():
+    store = CandleStore(":memory:")
+    store.write("BTC-USD", 60, [
+        {"start": str(60 * i), "low": "1", "high": "2", "open": "1.5", "close": str(i), "volume": "3"} for i in range(25)
+    ], None)
+
+    async def collect():
+        return [chunk async for chunk in store.iter_chunks("BTC-USD", 60, 0, 60 * 24, chunk_size=10, limit=22)]
+
+    chunks = asyncio.run(collect())
+    assert [len(chunk) for chunk in chunks] == [10, 10, 2]
+    assert [row[4] for chunk in chunks for row in chunk] == [str(i) for i in range(24, 2, -1)]
+
+    async def collect_typed():
+        return [chunk async for chunk in store.iter_chunks("BTC-USD", 60, 0, 60, chunk_size=10, typed=True)]
+
+    assert asyncio.run(collect_typed()) == [[(60, 1.0, 2.0, 1.5, 1.0, 3.0), (0, 1.0, 2.0, 1.5, 0.0, 3.0)]]
+
+
+def test_market_trades_typed_columns_and_406(upstream):
+    trades = [
+        {"trade_id": "42", "time": "2024-01-01T00:00:01.5Z", "side": "BUY", "price": "100.5", "size": "0.1",
+         "bid": "", "ask": "101"},
+        {"trade_id": "41", "time": "2024-01-01T00:00:00Z", "side": "SELL", "price": "100", "size": "2",
+         "bid": "99", "ask": ""},
+    ]
+    columns = TRADE_TABLE.to_columns(trades)
+    assert columns["trade_id"].tolist() == [42, 41]
+    assert columns["time"].tolist() == [1704067201500000, 1704067200000000]
+    assert columns["side"].tolist() == [1, -1]
+    assert np.isnan(columns["bid"][0]) and columns["ask"][0] == 101.0
+
+    response = client.get("/public/market-trades/BTC-USD", headers={"Accept": NPY_MEDIA_TYPE})
+    records = np.load(io.BytesIO(response.content))
+    assert records.dtype == TRADE_TABLE.dtype and records.shape == (10,)
+    response = client.get("/public/market-trades/BTC-USD", headers={"Accept": ARROW_MEDIA_TYPE})
+    assert pa.ipc.open_stream(response.content).read_all().schema.field("time").type == pa.timestamp("us", tz="UTC")
+
+    assert client.get("/public/market-trades/BTC-USD", headers={"Accept": "image/png"}).status_code == 406
+
+
+def test_chunked_splits_rows():
+    async def collect():
+        return [chunk async for chunk in chunked(list(range(5)), chunk_size=2)]
+
+    assert asyncio.run(collect()) == [[0, 1], [2, 3], [4]]
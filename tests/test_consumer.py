@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pika
+
+from benchmarks.fake_broker import FakeBroker
+from consumer import AckTracker, ConsumerWorker
+
+handled = []
+
+
+def record(body: bytes, routing_key: str):
+    key, sequence = body.decode().split(":")
+    if sequence == "fail":
+        raise RuntimeError("bad message")
+    time.sleep(0.001 * (3 - int(sequence) % 3))  # Finish out of order across keys
+    handled.append((key, int(sequence)))
+
+
+def test_ack_tracker_acks_contiguous_runs():
+    tracker = AckTracker()
+    for tag in (2, 3, 5):
+        tracker.settle(tag)
+    assert tracker.take() is None
+    tracker.settle(1)
+    assert tracker.pending() == 3 and tracker.take() == 3
+    assert tracker.take_out_of_order() == {5}
+
+    tracker = AckTracker()
+    for tag, nacked in ((1, False), (2, True), (3, True), (5, True), (6, False)):
+        tracker.settle(tag, nacked)
+    assert tracker.take() == 1  # Never names a nacked tag
+    tracker.settle(4)
+    assert tracker.pending() == 3 and tracker.take() == 6 and tracker.take_out_of_order() == set()
+    tracker.settle(7, nacked=True)
+    assert tracker.take() is None and tracker.pending() == 0  # Only a nacked tag is new
+
+
+def test_worker_preserves_per_key_order_and_batches_acks():
+    handled.clear()
+    broker = FakeBroker()
+    port = broker.start_in_thread()
+    parameters = pika.ConnectionParameters(host="127.0.0.1", port=port,
+                                           credentials=pika.PlainCredentials("user", "password"))
+    connection = pika.BlockingConnection(parameters)
+    channel = connection.channel()
+    channel.queue_declare(queue="jobs", durable=True)
+    bodies = [f"{key}:{sequence}" for sequence in range(30) for key in "abc"] + ["a:fail"]
+    for body in bodies:
+        channel.basic_publish(exchange="", routing_key="jobs", body=body.encode(),
+                              properties=pika.BasicProperties(headers={"key": body.split(":")[0]}))
+    connection.close()
+
+    worker = ConsumerWorker("jobs", handler=record, parameters=parameters, prefetch=20, workers=4,
+                            ordering_key="header:key", ack_batch=10, stats_interval=0.05)
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while worker.processed + worker.failed < len(bodies) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    worker.stop()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert worker.processed == 90 and worker.failed == 1
+    for key in "abc":
+        assert [sequence for k, sequence in handled if k == key] == list(range(30))
+    assert broker.acked == 90 and broker.rejected == 1
+    assert broker.ack_frames < 30
+    assert not broker.queues["jobs"]
+
+
+def test_failed_message_is_not_acked_by_a_later_multiple_ack():
+    handled.clear()
+    broker = FakeBroker()
+    port = broker.start_in_thread()
+    parameters = pika.ConnectionParameters(host="127.0.0.1", port=port,
+                                           credentials=pika.PlainCredentials("user", "password"))
+    connection = pika.BlockingConnection(parameters)
+    channel = connection.channel()
+    channel.queue_declare(queue="jobs")
+    for body in ("a:0", "a:fail", "a:1", "a:fail"):
+        channel.basic_publish(exchange="", routing_key="jobs", body=body.encode())
+    connection.close()
+
+    worker = ConsumerWorker("jobs", handler=record, parameters=parameters, prefetch=20, workers=1,
+                            ack_batch=10, ack_interval=1, stats_interval=0.05)
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while worker.processed + worker.failed < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    worker.stop()
+    thread.join(5)
+
+    assert handled == [("a", 0), ("a", 1)] and worker.failed == 2
+    assert broker.channel_errors == 0 and worker.reconnects == 0  # The nacked tags 2 and 4 were never acked
+    assert broker.acked == 2 and broker.rejected == 2 and broker.ack_frames == 1  # One multiple ack of tag 3
+    assert not broker.queues["jobs"]
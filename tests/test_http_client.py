@@ -0,0 +1,40 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from services.api.core import http_client
+from services.api.main import app
+
+client = TestClient(app)
+
+
+def test_endpoints_use_shared_client(upstream):
+    response = client.get("/public/product/BTC-USD")
+    assert response.status_code == 200
+    assert response.json()["product_id"] == "BTC-USD"
+
+    response = client.get("/public/market-trades/BTC-USD")
+    assert response.status_code == 200
+    assert len(response.json()) == 10
+
+
+def test_client_is_reused_within_a_loop(upstream):
+    async def scenario():
+        first = http_client.get_client()
+        second = http_client.get_client()
+        await http_client.close_client()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first is second
+    assert first.is_closed
+
+
+def test_product_book_depth_and_aggregation(upstream):
+    response = client.get("/public/product-book/BTC-USD", params={"depth": 3})
+    assert response.status_code == 200
+    pricebook = response.json()["pricebook"]
+    assert len(pricebook["bids"]) == 3 and len(pricebook["asks"]) == 3
+
+    response = client.get("/public/product-book/BTC-USD", params={"depth": 2, "aggregation": 0.1})
+    assert [level["price"] for level in response.json()["pricebook"]["bids"]] == ["99.9", "99.8"]
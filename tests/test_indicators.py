@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from services.api.core.indicators import (
+    base_granularity, candles_to_arrays, ema, parse_indicators, parse_interval, resample, rows_to_arrays, rsi
+)
+from services.api.main import app
+
+client = TestClient(app)
+
+
+def reference_ema(values, period):
+    alpha = 2.0 / (period + 1)
+    out = [float("nan")] * len(values)
+    out[period - 1] = sum(values[:period]) / period
+    for i in range(period, len(values)):
+        out[i] = (1 - alpha) * out[i - 1] + alpha * values[i]
+    return np.array(out)
+
+
+def test_parse_interval_and_base_granularity():
+    assert parse_interval("4h") == 14400
+    assert parse_interval("90m") == 5400
+    assert base_granularity(14400) == "TWO_HOUR"
+    assert base_granularity(2 * 86400) == "ONE_DAY"
+    assert base_granularity(5400) == "THIRTY_MINUTE"
+    with pytest.raises(ValueError):
+        parse_interval("0h")
+    with pytest.raises(ValueError):
+        parse_indicators("macd")
+
+
+def test_resample_aggregates_buckets():
+    candles = [
+        {"start": str(3600 * i), "low": str(10 - i), "high": str(20 + i), "open": str(i), "close": str(i + 0.5), "volume": "1"}
+        for i in range(6)
+    ][::-1]
+    rows = [tuple(float(c[field]) for field in ("start", "low", "high", "open", "close", "volume")) for c in candles]
+    typed = rows_to_arrays(rows)
+    assert all(typed[name].tolist() == column.tolist() for name, column in candles_to_arrays(candles).items())
+    assert typed["start"].dtype == np.int64 and rows_to_arrays([])["close"].shape == (0,)
+    columns = resample(typed, 4 * 3600)
+    assert columns["start"].tolist() == [0, 14400]
+    assert columns["open"].tolist() == [0, 4]
+    assert columns["close"].tolist() == [3.5, 5.5]
+    assert columns["low"].tolist() == [7, 5]
+    assert columns["high"].tolist() == [23, 25]
+    assert columns["volume"].tolist() == [4, 2]
+
+
+def test_vectorized_ema_matches_recursion_over_long_series():
+    values = np.random.default_rng(1).normal(100, 5, 20000)
+    for period in (2, 20, 200):
+        np.testing.assert_allclose(ema(values, period), reference_ema(values.tolist(), period), rtol=1e-9)
+
+
+def test_rsi_is_bounded():
+    close = np.cumsum(np.random.default_rng(2).normal(0, 1, 500)) + 100
+    values = rsi(close, 14)
+    assert np.isnan(values[:14]).all()
+    assert ((values[14:] >= 0) & (values[14:] <= 100)).all()
+    assert rsi(np.arange(30, dtype=float), 14)[-1] == 100.0
+    assert rsi(np.arange(30, 0, -1, dtype=float), 14)[-1] == 0.0
+
+
+def test_rsi_of_a_flat_series_is_neutral():
+    values = rsi(np.full(30, 100.0), 14)
+    assert np.isnan(values[:14]).all() and (values[14:] == 50.0).all()
+
+
+def test_resampled_endpoint_returns_columns(upstream, candle_store):
+    response = client.get("/public/candles/BTC-USD/resampled", params={
+        "start": "2024-01-01T00:00:00+00:00",
+        "end": "2024-01-10T23:59:59+00:00",
+        "interval": "1d",
+        "indicators": "ema:3,rsi:3,vwap",
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert body["granularity"] == "ONE_DAY"
+    assert len(body["start"]) == 10
+    assert set(body["indicators"]) == {"ema_3", "rsi_3", "vwap"}
+    assert body["indicators"]["ema_3"][0] is None
+
+    response = client.get("/public/candles/BTC-USD/resampled", params={
+        "start": "2024-01-01T00:00:00+00:00", "end": "2024-01-02T00:00:00+00:00", "interval": "7s",
+    })
+    assert response.status_code == 400
@@ -0,0 +1,17 @@
+from benchmarks.load_test import compare, percentile, scenarios
+from services.api.endpoints.public_data import router
+
+
+def test_scenarios_cover_every_public_route():
+    covered = {scenario.route for scenario in scenarios(["BTC-USD", "ETH-USD"])}
+    assert covered == {route.path for route in router.routes}
+
+
+def test_percentiles_and_regressions():
+    ordered = [float(i) for i in range(1, 101)]
+    assert (percentile(ordered, 50), percentile(ordered, 95), percentile(ordered, 99)) == (50.0, 95.0, 99.0)
+    assert percentile([], 99) == 0.0
+
+    baseline = {"scenarios": [{"name": "products", "p95_ms": 10.0, "rps": 100.0, "error_rate": 0.0}]}
+    current = {"scenarios": [{"name": "products", "p95_ms": 10.5, "rps": 80.0, "error_rate": 0.0}]}
+    assert [(r["name"], r["metric"]) for r in compare(baseline, current, 0.1)] == [("products", "rps")]
@@ -0,0 +1,130 @@
+import asyncio
+
+import numpy as np
+import orjson
+import pika
+
+from benchmarks.fake_broker import FakeBroker
+from publisher import Publisher
+from services.api.core.market_events import (EventBatcher, MarketEventDistributor, decode_frame, encode_frame,
+                                             normalize_book, normalize_trades)
+from services.api.core.ws_feed import CoinbaseFeed
+
+TIME = "2024-01-01T00:00:00.123456789Z"
+MICROS = 1704067200123456
+
+
+def trade(product_id: str, trade_id: int, price: str) -> dict:
+    return {"trade_id": str(trade_id), "product_id": product_id, "price": price, "size": "0.5", "side": "BUY",
+            "time": TIME}
+
+
+def test_frames_round_trip_and_batches_split_at_max_batch():
+    records = normalize_trades([trade("BTC-USD", 1, "42000.5"), trade("ETH-USD", 2, "2300"),
+                                trade("BTC-USD", 3, "42001")])["BTC-USD"]
+    for encoding in ("binary", "json"):
+        frame = decode_frame(encode_frame("trades", "BTC-USD", records, encoding), encoding)
+        assert frame["kind"] == "trades" and frame["product_id"] == "BTC-USD" and not frame["snapshot"]
+        assert frame["events"]["trade_id"].tolist() == [1, 3] and frame["events"]["price"].tolist() == [42000.5, 42001]
+        assert frame["events"]["time"].tolist() == [MICROS, MICROS] and frame["events"]["side"].tolist() == [1, 1]
+    assert len(encode_frame("trades", "BTC-USD", records, "binary")) == 10 + 7 + 2 * 33
+
+    batcher = EventBatcher("binary", max_batch=2, max_pending=7)
+    assert not batcher.add("trades", "BTC-USD", records[:1])
+    assert batcher.add("trades", "BTC-USD", records)  # Sealed into a full frame and the rest
+    book = normalize_book([{"side": "bid", "event_time": TIME, "price_level": "42000", "new_quantity": "1"},
+                           {"side": "offer", "event_time": "", "price_level": "42002", "new_quantity": "0"},
+                           {"side": "bid", "event_time": TIME, "price_level": "41999", "new_quantity": "2"}], TIME)
+    batcher.add("book", "BTC-USD", book[:1])
+    batcher.add("book", "BTC-USD", book, snapshot=True)  # Pending deltas go out first
+    batcher.add("book", "ETH-USD", book[:1])  # Buffer full: dropped
+    frames = [(key, decode_frame(body, "binary")) for _, key, body, _ in batcher.drain()]
+    assert [(key, len(frame["events"]), frame["snapshot"]) for key, frame in frames] == [
+        ("trades.BTC-USD", 2, False), ("trades.BTC-USD", 1, False), ("book.BTC-USD", 1, False),
+        ("book.BTC-USD", 2, True), ("book.BTC-USD", 1, False)]
+    assert frames[3][1]["events"]["side"].tolist() == [1, -1] and frames[3][1]["events"]["size"].tolist() == [1, 0]
+    assert batcher.dropped == 1 and batcher.pending == 0 and batcher.events == 7
+
+
+def test_distributor_publishes_to_topic_routing_keys_within_the_latency_cap():
+    broker = FakeBroker()
+    port = broker.start_in_thread()
+    parameters = pika.ConnectionParameters(host="127.0.0.1", port=port,
+                                           credentials=pika.PlainCredentials("user", "password"))
+    connection = pika.BlockingConnection(parameters)
+    channel = connection.channel()
+    channel.exchange_declare(exchange="market_data", exchange_type="topic")
+    for queue, binding in (("btc_trades", "trades.BTC-USD"), ("tickers", "ticker.*"), ("everything", "#")):
+        channel.queue_declare(queue=queue)
+        channel.queue_bind(queue=queue, exchange="market_data", routing_key=binding)
+    connection.close()
+
+    feed = CoinbaseFeed()
+
+    def dispatch(channel: str, events: list):
+        feed._dispatch(orjson.dumps({"channel": channel, "timestamp": TIME, "events": events}))
+
+    async def scenario():
+        publisher = Publisher(parameters)
+        distributor = MarketEventDistributor(feed, ["BTC-USD", "ETH-USD"], publisher=publisher, max_batch=100,
+                                             max_delay=0.02, stream=False)
+        distributor.start()
+        dispatch("market_trades", [{"type": "update", "trades": [trade("BTC-USD", 1, "42000"),
+                                                                 trade("ETH-USD", 2, "2300"),
+                                                                 trade("SOL-USD", 3, "100")]}])
+        dispatch("market_trades", [{"type": "update", "trades": [trade("BTC-USD", 4, "42001")]}])
+        dispatch("ticker", [{"type": "update", "tickers": [{"product_id": "ETH-USD", "price": "2300",
+                                                            "best_bid": "2299.9", "best_ask": "2300.1",
+                                                            "volume_24_h": "1000"}]}])
+        dispatch("l2_data", [{"type": "update", "product_id": "BTC-USD", "updates": [
+            {"side": "bid", "event_time": TIME, "price_level": "41999", "new_quantity": "0"}]}])
+        for _ in range(100):  # Published by the flusher, without waiting for a full frame
+            if broker.published >= 4:
+                break
+            await asyncio.sleep(0.01)
+        stats = distributor.stats()
+        await distributor.stop()
+        await publisher.close()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats["published_frames"] == 4 and stats["events"] == 5 and stats["failed_frames"] == 0
+
+    btc_trades = [decode_frame(body, "binary") for _, body, _, _ in broker.queues["btc_trades"]]
+    assert len(btc_trades) == 1 and btc_trades[0]["events"]["trade_id"].tolist() == [1, 4]
+    tickers = [decode_frame(body, "binary") for _, body, _, _ in broker.queues["tickers"]]
+    assert [(t["product_id"], t["events"]["best_bid"].tolist()) for t in tickers] == [("ETH-USD", [2299.9])]
+    assert np.isnan(tickers[0]["events"]["best_bid_quantity"]).all()  # Missing from the ticker
+    assert sorted(key for _, _, key, _ in broker.queues["everything"]) == [
+        "book.BTC-USD", "ticker.ETH-USD", "trades.BTC-USD", "trades.ETH-USD"]
+    assert broker.queues["everything"][0][0].content_type == "application/x-market-events"
+
+
+def test_stop_releases_the_level2_subscription():
+    class RecordingFeed(CoinbaseFeed):
+        def __init__(self):
+            super().__init__("ws://127.0.0.1:9")
+            self.sent = []
+
+        def start(self):
+            pass
+
+        async def _send(self, action, channel, product_ids):
+            self.sent.append((action, channel, tuple(product_ids)))
+
+    feed = RecordingFeed()
+
+    async def scenario():
+        await feed.subscribe("level2", ["BTC-USD"])  # A live order book shares the subscription
+        distributor = MarketEventDistributor(feed, ["BTC-USD", "ETH-USD"], kinds=["book"], max_delay=0.01)
+        distributor.start()
+        await asyncio.sleep(0.02)
+        await distributor.stop()
+
+    asyncio.run(scenario())
+    assert feed.sent == [
+        ("subscribe", "level2", ("BTC-USD",)),
+        ("subscribe", "level2", ("ETH-USD",)),
+        ("unsubscribe", "level2", ("ETH-USD",)),
+    ]
+    assert feed.stats()["subscriptions"] == {"level2": ["BTC-USD"]}
@@ -0,0 +1,38 @@
+from fastapi.testclient import TestClient
+
+from services.api.core.metrics import Counter, Histogram, _registry
+from services.api.main import app
+
+client = TestClient(app)
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test histogram.", ("route",), buckets=(0.1, 1.0))
+    counter = Counter("test_total", "Test counter.", ("route",))
+    try:
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.labels('/a"b').observe(value)
+        counter.labels("/a").inc(2)
+        text = histogram.render() + "\n" + counter.render()
+    finally:
+        _registry.remove(histogram)
+        _registry.remove(counter)
+    assert "# TYPE test_seconds histogram" in text
+    assert 'test_seconds_bucket{route="/a\\"b",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{route="/a\\"b",le="1.0"} 3' in text
+    assert 'test_seconds_bucket{route="/a\\"b",le="+Inf"} 4' in text
+    assert 'test_seconds_count{route="/a\\"b"} 4' in text
+    assert 'test_total{route="/a"} 2.0' in text
+
+
+def test_metrics_endpoint_reports_routes_and_upstream_calls(upstream):
+    client.get("/public/product/BTC-USD")
+    client.get("/nope")
+    response = client.get("/metrics")
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert 'http_requests_total{method="GET",route="/public/product/{product_id}",status="200"}' in text
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"}' in text
+    assert 'upstream_request_duration_seconds_count{endpoint="product",status="200"}' in text
+    assert 'serialization_duration_seconds_count{encoder="product"}' in text
+    assert 'threadpool_workers{pool="anyio",state="capacity"}' in text
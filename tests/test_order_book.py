@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+import websockets
+
+from services.api.core.order_book import OrderBook, OrderBookManager
+from services.api.core.ws_feed import CoinbaseFeed
+
+
+def level(side, price, quantity):
+    return {"side": side, "event_time": "", "price_level": price, "new_quantity": quantity}
+
+
+def l2_message(sequence, kind, updates, product_id="BTC-USD"):
+    return json.dumps({
+        "channel": "l2_data", "client_id": "", "timestamp": f"t{sequence}", "sequence_num": sequence,
+        "events": [{"type": kind, "product_id": product_id, "updates": updates}],
+    })
+
+
+def test_updates_and_aggregation():
+    book = OrderBook("BTC-USD")
+    book.load_snapshot([
+        level("bid", "100.00", "1"), level("bid", "99.99", "2"), level("bid", "99.50", "3"),
+        level("offer", "100.01", "1"), level("offer", "100.02", "4"), level("offer", "101.00", "5"),
+    ])
+    book.apply([level("bid", "99.99", "0"), level("offer", "100.01", "0.5")])
+
+    assert book.levels("bid") == [{"price": "100.00", "size": "1"}, {"price": "99.50", "size": "3"}]
+    assert book.levels("ask", depth=1) == [{"price": "100.01", "size": "0.5"}]
+    assert book.levels("ask", tick=1) == [{"price": "101", "size": "9.50000000"}]
+    assert book.levels("ask", tick=0.5) == [
+        {"price": "100.5", "size": "4.50000000"}, {"price": "101.0", "size": "5.00000000"}
+    ]
+    assert book.levels("bid", depth=1, tick=0.5) == [{"price": "100.0", "size": "1.00000000"}]
+
+
+def test_replayed_feed_resyncs_after_sequence_gap():
+    connections = []
+
+    async def replay(ws):
+        connections.append(ws)
+        subscribe = json.loads(await ws.recv())
+        assert subscribe == {"type": "subscribe", "channel": "level2", "product_ids": ["BTC-USD"]}
+        if len(connections) == 1:
+            await ws.send(l2_message(0, "snapshot", [level("bid", "100", "1"), level("offer", "101", "1")]))
+            await ws.send(l2_message(1, "update", [level("bid", "100", "2")]))
+            await ws.send(l2_message(3, "update", [level("bid", "100", "9")]))  # Message 2 was lost
+        else:
+            await ws.send(l2_message(0, "snapshot", [level("bid", "100.5", "7"), level("offer", "101", "1")]))
+        await ws.wait_closed()
+
+    async def scenario():
+        async with websockets.serve(replay, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            feed = CoinbaseFeed(f"ws://127.0.0.1:{port}")
+            manager = OrderBookManager(feed)
+            await manager.track("BTC-USD")
+            for _ in range(200):
+                book = manager.get("BTC-USD")
+                if book is not None and feed.reconnects == 1:
+                    break
+                await asyncio.sleep(0.01)
+            await feed.stop()
+            return book, feed
+
+    book, feed = asyncio.run(scenario())
+    assert feed.gaps == 1
+    assert book.to_product_book()["pricebook"]["bids"] == [{"price": "100.5", "size": "7"}]
+
+
+class RecordingFeed(CoinbaseFeed):
+    def __init__(self):
+        super().__init__("ws://127.0.0.1:9")
+        self.sent = []
+
+    def start(self):
+        pass
+
+    async def _send(self, action, channel, product_ids):
+        self.sent.append((action, channel, tuple(product_ids)))
+
+
+def test_feed_keeps_shared_subscriptions_until_the_last_consumer_leaves():
+    async def scenario():
+        feed = RecordingFeed()
+        await feed.subscribe("level2", ["BTC-USD"])
+        await feed.subscribe("level2", ["BTC-USD", "ETH-USD"])
+        await feed.unsubscribe("level2", ["BTC-USD"])
+        await feed.unsubscribe("level2", ["BTC-USD", "ETH-USD"])
+        await feed.unsubscribe("level2", ["BTC-USD"])
+        return feed.sent
+
+    assert asyncio.run(scenario()) == [
+        ("subscribe", "level2", ("BTC-USD",)),
+        ("subscribe", "level2", ("ETH-USD",)),
+        ("unsubscribe", "level2", ("BTC-USD", "ETH-USD")),
+    ]
+
+
+def test_books_nobody_reads_are_dropped_and_unsubscribed():
+    now = [0.0]
+
+    async def scenario():
+        feed = RecordingFeed()
+        manager = OrderBookManager(feed, idle_timeout=60, clock=lambda: now[0])
+        await manager.track("BTC-USD")
+        await manager.track("BTC-USD")
+        await manager.track("BTC-USSD")
+        now[0] = 50
+        manager.get("BTC-USD")
+        now[0] = 100
+        await manager.track("ETH-USD")
+        return manager, feed.sent
+
+    manager, sent = asyncio.run(scenario())
+    assert sorted(manager.books) == ["BTC-USD", "ETH-USD"]
+    assert sent == [
+        ("subscribe", "level2", ("BTC-USD",)),
+        ("subscribe", "level2", ("BTC-USSD",)),
+        ("unsubscribe", "level2", ("BTC-USSD",)),
+        ("subscribe", "level2", ("ETH-USD",)),
+    ]
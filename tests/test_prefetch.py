@@ -0,0 +1,56 @@
+import asyncio
+
+from services.api.core import prefetch
+from services.api.core.cache import TTLCache, cached
+from services.api.core.prefetch import Prefetcher, prefetchable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hot_keys_are_refreshed_before_expiry_within_budget():
+    clock = FakeClock()
+    prefetcher = Prefetcher(max_keys=2, min_rate=0.01, half_life=1, budget=1, clock=clock)
+    cache = TTLCache("test_prefetch", ttl=1, stale_ttl=3, clock=clock)
+    calls = []
+
+    @prefetchable("test_book")
+    @cached(cache)
+    async def fetch_book(product_id):
+        calls.append(product_id)
+        return {"product_id": product_id, "bid": 1 if product_id == "FLAT-USD" else len(calls)}
+
+    async def scenario():
+        for product_id, requests in (("BTC-USD", 30), ("FLAT-USD", 10), ("ETH-USD", 5), ("RARE-USD", 1)):
+            for _ in range(requests):
+                prefetcher.record("test_book", (product_id,))
+            await fetch_book(product_id)
+        assert prefetcher.hot()[0] == ("test_book", ("BTC-USD",)) and len(prefetcher.hot()) == 2
+
+        assert prefetcher.run_once() == 0  # Entries still fresh
+        clock.now = 0.85  # Within the lead of the TTL
+        assert prefetcher.run_once() == 1 and prefetcher.skipped_budget == 1  # One request per second
+        await asyncio.gather(*prefetcher._inflight.values())
+        assert cache.fresh_for(("BTC-USD",)) == 1.0 and calls.count("BTC-USD") == 2
+
+        prefetcher.budget = 10
+        clock.now = 2.0
+        assert prefetcher.run_once() == 2  # BTC-USD again, and FLAT-USD postponed earlier
+        await asyncio.gather(*prefetcher._inflight.values())
+        flat = prefetcher.keys[("test_book", ("FLAT-USD",))]
+        assert prefetcher.unchanged == 1 and flat.backoff == 2.0
+        assert prefetcher.interval("test_book", flat, clock.now) == 1.6  # Unchanged data: stretched
+
+    prefetcher_before = prefetch._prefetcher
+    prefetch._prefetcher = prefetcher
+    try:
+        asyncio.run(scenario())
+    finally:
+        prefetch._prefetcher = prefetcher_before
+        prefetch._sources.pop("test_book", None)
+    assert "RARE-USD" not in [args[0] for _, args in prefetcher.hot()]
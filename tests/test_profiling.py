@@ -0,0 +1,87 @@
+import asyncio
+import marshal
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services.api.core.profiling import ProfilingMiddleware, RequestProfiler, set_profiler
+from services.api.main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def reset_profiler():
+    yield
+    set_profiler(None)
+
+
+def test_slow_requests_are_captured_with_their_phase_breakdown(upstream, candle_store):
+    set_profiler(RequestProfiler(slow_threshold=1e-9, token="secret"))
+    assert client.get("/public/products").status_code == 200
+    assert client.get("/public/candles/BTC-USD", params={"start": "2024-01-01T00:00:00",
+                                                         "end": "2024-01-01T05:00:00"}).status_code == 200
+
+    captured = client.get("/admin/slow-requests", headers={"X-Profile-Token": "secret"}).json()
+    candles, products = captured["requests"]
+    assert products["path"] == "/public/products" and products["status"] == 200 and products["profile_id"] is None
+    assert set(products["phases"]) == {"upstream_wait", "parse", "validate", "serialize", "other"}
+    assert products["calls"]["upstream_wait"] == 1 and products["phases"]["upstream_wait"] > 0
+    assert candles["path"] == "/public/candles/BTC-USD" and "start=" in candles["query"]
+    assert {"upstream_wait", "parse", "serialize"} <= set(candles["phases"])
+    total = sum(candles["phases"].values())
+    assert total == pytest.approx(candles["duration"], abs=1e-4)  # Nothing measured twice
+
+    disabled = RequestProfiler(slow_threshold=0)  # Requests pass straight through
+    set_profiler(disabled)
+    client.get("/public/products")
+    assert disabled.traced == 0
+
+
+def test_token_profiles_one_request_and_guards_the_admin_endpoints(upstream):
+    set_profiler(RequestProfiler(slow_threshold=0, token="secret"))
+    response = client.get("/public/products", headers={"X-Profile-Token": "secret"})
+    profile_id = response.headers["x-profile-id"]
+    assert response.status_code == 200 and len(response.json()) > 0
+    response = client.get("/public/products", headers={"X-Profile-Token": "wrong"})
+    assert response.status_code == 200 and "x-profile-id" not in response.headers
+
+    assert client.get(f"/admin/profiles/{profile_id}").status_code == 403
+    headers = {"X-Profile-Token": "secret"}
+    report = client.get(f"/admin/profiles/{profile_id}", headers=headers)
+    assert report.status_code == 200 and report.text.startswith("GET /public/products -> 200")
+    assert "Ordered by: cumulative time" in report.text and "called..." in report.text
+    stats = marshal.loads(client.get(f"/admin/profiles/{profile_id}", params={"format": "pstats"}, headers=headers).content)
+    assert {"fetch_products", "upstream_get", "read_json"} <= {function for _, _, function in stats}
+    profiles = client.get("/admin/profiles", headers=headers).json()
+    assert profiles["profiled"] == 1 and profiles["traced"] == 2 and profiles["profiles"][0]["profile_id"] == profile_id
+    assert client.get("/admin/profiles/unknown", headers=headers).status_code == 404
+
+
+def test_admin_endpoints_are_closed_without_a_configured_token(upstream):
+    set_profiler(RequestProfiler(slow_threshold=1e-9, sample_rate=1))
+    assert "x-profile-id" in client.get("/public/products").headers
+    for path in ("/admin/slow-requests", "/admin/profiles", "/admin/profiles/unknown"):
+        assert client.get(path).status_code == 403
+        assert client.get(path, headers={"X-Profile-Token": ""}).status_code == 403
+
+
+def test_streamed_responses_are_timed_until_their_headers_are_sent():
+    profiler = RequestProfiler(slow_threshold=0.05, sample_rate=1)
+    set_profiler(profiler)
+    profiling_during_body = []
+
+    async def stream(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        profiling_during_body.append(profiler._profiling)
+        await asyncio.sleep(0.1)  # A long-lived body, e.g. an SSE connection
+        await send({"type": "http.response.body", "body": b"data: {}\n\n"})
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "GET", "path": "/stream/sse/trades", "query_string": b"", "headers": []}
+    asyncio.run(ProfilingMiddleware(stream)(scope, None, send))
+    assert profiling_during_body == [False]  # The profiler slot is free while the body streams
+    assert profiler.profiled == 1 and profiler.traced == 1 and profiler.captured == 0
+    assert next(iter(profiler.profiles.values()))["duration"] < 0.05
@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+import pika
+import pytest
+from fastapi.testclient import TestClient
+
+import publisher
+from benchmarks.fake_broker import FakeBroker
+from publisher import Publisher, PublishError
+from services.api.main import app
+
+client = TestClient(app)
+
+
+def broker_parameters(port):
+    return pika.ConnectionParameters(host="127.0.0.1", port=port, credentials=pika.PlainCredentials("user", "password"))
+
+
+def test_publisher_reuses_connection_and_declares_once():
+    broker = FakeBroker()
+
+    async def scenario():
+        port = await broker.start()
+        pub = Publisher(broker_parameters(port), channels=2)
+        await asyncio.gather(*(pub.publish("ticks", f"m{i}".encode()) for i in range(20)))
+        await pub.publish_many("ticks", [b"a", b"b", b"c"])
+        stats = pub.stats()
+        await pub.close()
+        await broker.stop()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert broker.connections == 1 and broker.declares == 1
+    assert len(broker.queues["ticks"]) == 23
+    assert [message[1] for message in broker.queues["ticks"]][-3:] == [b"a", b"b", b"c"]
+    assert broker.queues["ticks"][0][0].delivery_mode == 2
+    assert stats["confirmed"] == 23 and stats["failed"] == 0
+
+
+def test_nacked_messages_raise():
+    broker = FakeBroker(nack_queues={"rejected"})
+
+    async def scenario():
+        pub = Publisher(broker_parameters(await broker.start()), channels=1)
+        with pytest.raises(PublishError):
+            await pub.publish("rejected", b"x")
+        await pub.publish("accepted", b"y")
+        stats = pub.stats()
+        await pub.close()
+        await broker.stop()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats["failed"] == 1 and stats["confirmed"] == 1
+
+
+def test_publish_endpoints():
+    broker = FakeBroker()
+    port = broker.start_in_thread()
+    publisher.set_publisher(Publisher(broker_parameters(port)))
+    try:
+        response = client.post("/public/publish/orders", json={"message": "hello"})
+        assert response.status_code == 200
+        response = client.post("/public/publish/orders/batch", json={"messages": ["a", "b"]})
+        assert response.json() == {"status": "Messages published", "count": 2}
+        assert client.post("/public/publish/orders/batch", json={"messages": []}).status_code == 400
+    finally:
+        publisher.set_publisher(None)
+    assert [json.loads(message[1]) for message in broker.queues["orders"]] == [
+        {"message": "hello"}, {"message": "a"}, {"message": "b"}
+    ]
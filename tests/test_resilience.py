@@ -0,0 +1,82 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from services.api.core.resilience import (BREAKER_FAILURE_THRESHOLD, CLOSED, HALF_OPEN, OPEN, CircuitBreaker,
+                                          CircuitOpenError, hedged)
+from services.api.core.scheduler import SchedulerTimeout
+from services.api.main import app
+from services.api.models.public_data import product_cache
+
+client = TestClient(app)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_probes_after_reset_timeout_and_hedge_wins_over_slow_attempt():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.record(httpx.ConnectError("refused"))
+    breaker.record(httpx.HTTPStatusError("404", request=None, response=httpx.Response(404)))  # Not a failure
+    breaker.record(httpx.ConnectError("refused"))
+    breaker.record(asyncio.TimeoutError())
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock.now = 10
+    breaker.before_call()  # The probe
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(SchedulerTimeout("queued past its deadline", 1.0))  # The probe never left the rate limiter
+    breaker.before_call()
+    breaker.record(httpx.HTTPStatusError("429", request=None, response=httpx.Response(429)))  # Throttled
+    assert breaker.state == HALF_OPEN and breaker.failures == 2
+    breaker.before_call()
+    breaker.record(None)
+    assert breaker.state == CLOSED and breaker.stats()["rejected"] == 2
+
+    delays = iter([1.0, 0.0])
+    started = []
+
+    async def attempt():
+        delay = next(delays)
+        started.append(delay)
+        await asyncio.sleep(delay)
+        return delay
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        began = loop.time()
+        result = await hedged(attempt, 0.02)
+        return result, loop.time() - began
+
+    result, elapsed = asyncio.run(scenario())
+    assert result == 0.0 and started == [1.0, 0.0] and elapsed < 0.5
+
+
+def test_open_circuit_serves_last_good_value_marked_stale(upstream):
+    response = client.get("/public/product/BTC-USD")
+    assert response.status_code == 200 and "x-cache-stale" not in response.headers
+    for entry in product_cache._entries.values():
+        entry.fresh_until = entry.stale_until = entry.fresh_until - 100  # Expired 100 s ago
+    upstream.error_rate = 1.0
+
+    for _ in range(BREAKER_FAILURE_THRESHOLD + 2):
+        response = client.get("/public/product/BTC-USD")
+        assert response.status_code == 200 and response.json()["product_id"] == "BTC-USD"
+        assert int(response.headers["x-cache-stale"]) >= 100
+    assert upstream.errors == BREAKER_FAILURE_THRESHOLD  # Then the open circuit stopped calling upstream
+
+    response = client.get("/public/product/ETH-USD")  # Nothing cached to fall back on
+    assert response.status_code == 503 and "retry-after" in response.headers
+    circuit = client.get("/upstream/stats").json()["circuits"]["product"]
+    assert circuit["state"] == OPEN and circuit["rejected"] == 3
@@ -0,0 +1,75 @@
+import numpy as np
+from fastapi.testclient import TestClient
+
+from services.api.core import ring_buffer
+from services.api.core.fanout import FanoutHub
+from services.api.core.ring_buffer import TRADES, MarketDataStore, RingBuffer
+from services.api.core.ws_feed import CoinbaseFeed
+from services.api.main import app
+
+
+def trade(trade_id, second=0):
+    return {"trade_id": str(trade_id), "product_id": "BTC-USD", "price": str(100 + trade_id), "size": "1",
+            "side": "BUY", "time": f"2024-01-01T00:00:{second:02d}Z", "bid": "", "ask": ""}
+
+
+def candle(start, close):
+    return {"start": str(start), "low": "1", "high": "3", "open": "2", "close": str(close), "volume": "5"}
+
+
+def test_ring_buffers_wrap_deduplicate_and_evict_cold_products():
+    ring = RingBuffer(np.dtype([("value", "<i8")]), capacity=4)
+    ring.append(np.array([(1,), (2,), (3,)], dtype=ring.records.dtype))
+    ring.append(np.array([(4,), (5,)], dtype=ring.records.dtype))
+    views = ring.views()
+    assert [view["value"].tolist() for view in views] == [[2, 3, 4], [5]]
+    assert all(np.shares_memory(view, ring.records) for view in views)  # No copy
+    assert ring.latest(2)["value"].tolist() == [4, 5]
+
+    store = MarketDataStore(trades_capacity=3, candles_capacity=2, budget=3 * 49 + 2 * 48)
+    assert store.add_trades("BTC-USD", [trade(2, 2), trade(1, 1), trade(2, 2)]) == 2
+    assert store.add_trades("BTC-USD", [trade(3, 3), trade(2, 2), trade(4, 4)]) == 2
+    assert np.concatenate(store.trades("BTC-USD"))["trade_id"].tolist() == [2, 3, 4]
+    newest = store.trade_views("BTC-USD", 1)[0]
+    assert (newest.trade_id, newest.price, newest.side) == (4, 104.0, 1) and not hasattr(newest, "__dict__")
+
+    assert store.add_candles("BTC-USD", "ONE_MINUTE", [candle(120, 7), candle(60, 6)]) == 2
+    assert store.add_candles("BTC-USD", "ONE_MINUTE", [candle(0, 1), candle(120, 8), candle(180, 9)]) == 2
+    assert np.concatenate(store.candles("BTC-USD", "ONE_MINUTE"))["close"].tolist() == [8, 9]
+    assert store.stats()["bytes"] == store.budget
+
+    store.trades("BTC-USD")  # Reading keeps a product warm
+    store.add_trades("ETH-USD", [trade(1)])
+    assert store.trades("BTC-USD") == [] and store.evictions == 1
+    assert store.trades("NOPE-USD") == [] and "NOPE-USD" not in store.products.codes
+    assert store.kinds.name(store.kinds.code(TRADES)) == TRADES
+
+
+def test_unparsable_batches_are_skipped_without_failing_the_feed():
+    store_before, ring_buffer._store = ring_buffer._store, MarketDataStore()
+    try:
+        hub = FanoutHub(CoinbaseFeed())
+        hub._on_trades({"type": "update", "trades": [dict(trade(1), trade_id="abc")]}, "")  # Must not raise
+        store = ring_buffer.get_market_store()
+        assert store.ingest_trades("BTC-USD", [dict(trade(2), time="yesterday")]) == 0
+        assert store.ingest_candles("BTC-USD", "ONE_MINUTE", [{"start": "60"}]) == 0
+        assert store.stats()["errors"] == 3 and store.stats()["buffers"] == 0  # Nothing allocated for them
+        assert store.ingest_trades("BTC-USD", [trade(3)]) == 1
+    finally:
+        ring_buffer._store = store_before
+
+
+def test_recent_trades_accumulate_across_fetches(upstream):
+    store_before, ring_buffer._store = ring_buffer._store, MarketDataStore()
+    try:
+        client = TestClient(app)
+        response = client.get("/public/recent-trades/BTC-USD")
+        assert response.status_code == 200
+        trades = response.json()
+        assert trades and [t["time"] for t in trades] == sorted(t["time"] for t in trades)
+        assert client.get("/public/recent-trades/BTC-USD", params={"limit": 2}).json() == trades[-2:]
+        csv = client.get("/public/recent-trades/BTC-USD", headers={"Accept": "text/csv"})
+        assert csv.text.splitlines()[0] == "trade_id,time,side,price,size,bid,ask"
+        assert client.get("/public/recent-candles/BTC-USD", params={"granularity": "TEN_DAYS"}).status_code == 400
+    finally:
+        ring_buffer._store = store_before
@@ -0,0 +1,82 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from services.api.core import http_client
+from services.api.core.cache import clear_caches
+from services.api.core.scheduler import (
+    BACKFILL, BACKGROUND, INTERACTIVE, SchedulerTimeout, UpstreamScheduler, get_scheduler, set_scheduler,
+    upstream_priority
+)
+from services.api.main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def scheduler():
+    previous = get_scheduler()
+    scheduler = UpstreamScheduler(rate=100, burst=1, max_retries=2, backoff_base=0.01)
+    set_scheduler(scheduler)
+    yield scheduler
+    set_scheduler(previous)
+    http_client.set_transport(None)
+
+
+def test_queued_requests_are_served_by_priority(scheduler):
+    order = []
+
+    async def request(priority):
+        await scheduler.acquire(priority)
+        order.append(priority)
+
+    async def scenario():
+        await scheduler.acquire(INTERACTIVE)  # Empty the bucket so the next requests queue
+        await asyncio.gather(request(BACKFILL), request(BACKGROUND), request(INTERACTIVE))
+
+    asyncio.run(scenario())
+    assert order == [INTERACTIVE, BACKGROUND, BACKFILL]
+    assert scheduler.stats()["granted"] == {"interactive": 2, "background": 1, "backfill": 1}
+
+
+def test_queued_request_times_out_at_its_deadline(scheduler):
+    scheduler.rate = 1
+
+    async def scenario():
+        await scheduler.acquire(INTERACTIVE)
+        with pytest.raises(SchedulerTimeout) as raised:
+            await scheduler.acquire(BACKGROUND, deadline=scheduler.clock() + 0.05)
+        return raised.value
+
+    error = asyncio.run(scenario())
+    assert error.retry_after > 0
+    assert scheduler.stats()["timeouts"]["background"] == 1
+
+
+def test_throttled_request_is_retried(scheduler):
+    responses = iter([429, 429, 200])
+
+    def handler(request):
+        status = next(responses)
+        return httpx.Response(status, headers={"Retry-After": "0"}, json={"iso": "", "epochSeconds": "1", "epochMillis": "1"})
+
+    http_client.set_transport(httpx.MockTransport(handler))
+
+    async def scenario():
+        with upstream_priority(BACKGROUND):
+            return await http_client.upstream_get("https://upstream.test/time")
+
+    assert asyncio.run(scenario()).status_code == 200
+    assert scheduler.throttled == 2 and scheduler.retries == 2
+
+
+def test_router_maps_throttling_to_429(scheduler):
+    clear_caches()
+    scheduler.max_retries = 0
+    http_client.set_transport(httpx.MockTransport(lambda request: httpx.Response(429, headers={"Retry-After": "2"})))
+    response = client.get("/public/server-time")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+    assert client.get("/upstream/stats").json()["throttled"] == 1
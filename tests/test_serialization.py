@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+from typing import List
+
+from fastapi.testclient import TestClient
+
+from benchmarks.fake_upstream import make_product
+from services.api.core.order_book import OrderBook
+from services.api.core.serialization import ResponseEncoder
+from services.api.endpoints import public_data
+from services.api.main import app
+from services.api.schemas.public_data import Product
+
+client = TestClient(app)
+
+
+def test_encoder_matches_response_model_and_remembers_payloads():
+    encoder = ResponseEncoder(List[Product], maxsize=2)
+    products = [dict(make_product("BTC", "USD", 100.0), unexpected="dropped")]
+    body = encoder.encode(products)
+    assert b"unexpected" not in body
+    assert body == encoder.adapter.dump_json([Product(**products[0])])
+    assert encoder.encode(products) is body
+    assert encoder.hits == 1
+
+    refreshed = [dict(products[0], price="101.00")]
+    assert b'"price":"101.00"' in encoder.encode(refreshed)
+    assert encoder.encodes == 2
+
+
+def test_cached_products_are_encoded_once(upstream):
+    encodes = public_data.products_encoder.encodes
+    first = client.get("/public/products")
+    second = client.get("/public/products")
+    assert first.status_code == 200 and first.content == second.content
+    assert first.headers["content-type"] == "application/json"
+    assert len(first.json()) == 10
+    assert public_data.products_encoder.encodes == encodes + 1
+
+
+def test_live_books_are_not_remembered(monkeypatch):
+    book = OrderBook("BTC-USD")
+    book.load_snapshot([{"side": side, "event_time": "", "price_level": f"{100 + i}", "new_quantity": "1"}
+                        for side, i in (("bid", 0), ("bid", -1), ("offer", 1), ("offer", 2))])
+    monkeypatch.setattr("services.api.models.public_data.LIVE_ORDER_BOOKS", True)
+    monkeypatch.setattr("services.api.models.public_data.get_order_books", lambda: SimpleNamespace(get=lambda _: book))
+    bodies = [client.get("/public/product-book/BTC-USD").json() for _ in range(3)]
+    assert bodies[0] == bodies[2] and bodies[0]["pricebook"]["asks"] == [{"price": "101", "size": "1"},
+                                                                        {"price": "102", "size": "1"}]
+    assert len(public_data.product_book_encoder._encoded) == 0  # A new dict per request: nothing to reuse
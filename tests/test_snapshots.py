@@ -0,0 +1,81 @@
+import asyncio
+
+from benchmarks.fake_redis import FakeRedis, FakeRedisServer
+from services.api.core import snapshots
+from services.api.core.snapshots import SharedSnapshots, shared_snapshot
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_workers_share_snapshots_refreshed_by_one_leader():
+    calls = []
+
+    @shared_snapshot("test_ticker", max_age=1.0)
+    async def fetch_ticker(product_id):
+        calls.append(product_id)
+        return {"product_id": product_id, "version": len(calls)}
+
+    async def scenario():
+        clock = Clock()
+        server = FakeRedisServer(clock=clock)
+        first, second = (SharedSnapshots(FakeRedis(server), worker_id=name, refresh_interval=0.2, clock=clock)
+                         for name in ("first", "second"))
+        await first.start()
+        await second.start()
+        try:
+            assert await first.elect() and not await second.elect()
+
+            snapshots.set_snapshots(second)
+            assert (await fetch_ticker("BTC-USD"))["version"] == 1  # Cold: fetched once and shared
+            snapshots.set_snapshots(first)
+            assert (await fetch_ticker("BTC-USD"))["version"] == 1  # Read from Redis
+            assert calls == ["BTC-USD"] and first.shared_hits == 1
+
+            clock.now += 0.9  # Would be too old before the next pass: the leader refreshes it
+            assert await first.refresh() == 1 and await first.refresh() == 0
+            await asyncio.sleep(0)  # Deliver the invalidation
+            assert second.invalidations == 1
+
+            snapshots.set_snapshots(second)
+            assert (await fetch_ticker("BTC-USD"))["version"] == 2
+            assert (await fetch_ticker("BTC-USD"))["version"] == 2
+            assert len(calls) == 2 and second.shared_hits == 1 and second.local_hits == 1
+
+            await first.stop()  # Releasing the lease hands it over at once
+            assert await second.elect()
+        finally:
+            snapshots.set_snapshots(None)
+            await first.stop()
+            await second.stop()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        snapshots._sources.pop("test_ticker", None)
+
+
+def test_unavailable_redis_falls_back_to_upstream():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return {"version": len(calls)}
+
+    async def scenario():
+        server = FakeRedisServer()
+        tier = SharedSnapshots(FakeRedis(server))
+        server.available = False
+        assert await tier.get_or_fetch("products", (), fetch, max_age=30) == {"version": 1}
+        server.available = True
+        assert await tier.get_or_fetch("products", (), fetch, max_age=30) == {"version": 2}
+        assert await tier.get_or_fetch("products", (), fetch, max_age=30) == {"version": 2}
+        return tier
+
+    tier = asyncio.run(scenario())
+    assert tier.redis_errors == 1 and tier.fetches == 1 and tier.local_hits == 1
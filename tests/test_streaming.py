@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+from fastapi import WebSocketDisconnect
+from fastapi.testclient import TestClient
+
+from services.api.core.fanout import FanoutHub
+from services.api.endpoints import streaming
+from services.api.main import app
+
+TRADE = {"trade_id": "1", "product_id": "BTC-USD", "price": "100", "size": "1", "side": "BUY", "time": ""}
+
+
+class FakeFeed:
+    def __init__(self):
+        self.handlers = {}
+        self.calls = []
+        self.on_subscribe = None
+
+    def add_handler(self, channel, handler):
+        self.handlers[channel] = handler
+
+    async def subscribe(self, channel, product_ids):
+        self.calls.append(("subscribe", channel, tuple(product_ids)))
+        if self.on_subscribe is not None:
+            asyncio.get_running_loop().call_soon(self.on_subscribe)
+
+    async def unsubscribe(self, channel, product_ids):
+        self.calls.append(("unsubscribe", channel, tuple(product_ids)))
+
+    def stats(self):
+        return {}
+
+
+def test_subscribers_share_one_upstream_subscription_and_frame():
+    feed = FakeFeed()
+    hub = FanoutHub(feed)
+
+    async def scenario():
+        first = await hub.subscribe("market_trades", "BTC-USD")
+        second = await hub.subscribe("market_trades", "BTC-USD")
+        feed.handlers["market_trades"]({"type": "update", "trades": [TRADE]}, "now")
+        frames = (await first.get(), await second.get())
+        await hub.unsubscribe(first)
+        await hub.unsubscribe(second)
+        return frames
+
+    first_frame, second_frame = asyncio.run(scenario())
+    assert first_frame is second_frame
+    assert feed.calls == [
+        ("subscribe", "market_trades", ("BTC-USD",)),
+        ("unsubscribe", "market_trades", ("BTC-USD",)),
+    ]
+
+
+@pytest.mark.parametrize("policy, expected", [("drop_oldest", ["2", "3"]), ("disconnect", [])])
+def test_slow_consumer_policies(policy, expected):
+    hub = FanoutHub(FakeFeed())
+
+    async def scenario():
+        subscriber = await hub.subscribe("ticker", "ETH-USD", maxsize=2, policy=policy)
+        for price in ("1", "2", "3"):
+            hub.publish("ticker", "ETH-USD", {"price": price})
+        received = []
+        while (frame := await subscriber.get()) is not None:
+            received.append(frame.data)
+            if len(received) == 2:
+                break
+        return received, subscriber
+
+    received, subscriber = asyncio.run(scenario())
+    assert received == [f'{{"price":"{price}"}}'.encode() for price in expected]
+    assert subscriber.closed == (policy == "disconnect")
+
+
+def test_websocket_and_sse_endpoints(upstream, monkeypatch):
+    feed = FakeFeed()
+    hub = FanoutHub(feed)
+    feed.on_subscribe = lambda: feed.handlers["market_trades"]({"type": "snapshot", "trades": [TRADE]}, "now")
+    monkeypatch.setattr(streaming, "get_hub", lambda: hub)
+
+    with TestClient(app) as client:
+        with client.websocket_connect("/stream/ws/market_trades/BTC-USD") as websocket:
+            message = websocket.receive_json()
+        assert message["product_id"] == "BTC-USD"
+        assert message["trades"] == [TRADE]
+
+        def publish_and_close():
+            # The test client reads the whole body, so the stream has to end
+            feed.handlers["market_trades"]({"type": "snapshot", "trades": [TRADE]}, "now")
+            for subscriber in hub.topics[("market_trades", "BTC-USD")]:
+                subscriber.close()
+
+        feed.on_subscribe = publish_and_close
+        response = client.get("/stream/sse/market_trades/BTC-USD")
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert response.text.startswith("data: ") and '"trade_id":"1"' in response.text
+
+        assert client.get("/stream/sse/level3/BTC-USD").status_code == 400
+        assert client.get("/stream/sse/market_trades/NOPE-USD").status_code == 404
+        with pytest.raises(WebSocketDisconnect) as closed:
+            with client.websocket_connect("/stream/ws/ticker/NOPE-USD") as websocket:
+                websocket.receive_json()
+        assert closed.value.code == 1008
+    assert all("NOPE-USD" not in call[2] for call in feed.calls)  # Nothing was subscribed upstream
@@ -0,0 +1,118 @@
+import asyncio
+import io
+import os
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from services.api.core import trade_tape
+from services.api.core.fanout import FanoutHub
+from services.api.core.trade_tape import TAPE_DTYPE, TradeTape, TradeTapeRecorder
+from services.api.main import app
+from services.api.models.public_data import to_unix_micros, to_unix_timestamp
+
+
+def trade(trade_id, time, price, size="1", side="BUY"):
+    return {"trade_id": str(trade_id), "product_id": "BTC-USD", "price": str(price), "size": size,
+            "side": side, "time": time, "bid": "", "ask": ""}
+
+
+class FakeFeed:
+    def __init__(self):
+        self.handlers = {}
+
+    def add_handler(self, channel, handler):
+        self.handlers[channel] = handler
+
+    async def subscribe(self, channel, product_ids):
+        pass
+
+    async def unsubscribe(self, channel, product_ids):
+        pass
+
+
+def test_tape_deduplicates_partitions_and_survives_restart(tmp_path):
+    tape = TradeTape(str(tmp_path), partition=60)
+    trades = [trade(2, "2024-01-01T00:00:30.5Z", 101), trade(1, "2024-01-01T00:00:10Z", 100, side="SELL"),
+              trade(3, "2024-01-01T00:01:05Z", 103, size="2")]
+    assert tape.append("BTC-USD", trades) == 3
+    assert tape.append("BTC-USD", trades[1:] + [trade(3, "2024-01-01T00:01:05Z", 103)]) == 0
+    assert tape.partitions("BTC-USD") == [1704067200, 1704067260] and tape.duplicates == 3
+    tape.close()
+
+    path = os.path.join(str(tmp_path), "BTC-USD", "1704067260.tape")
+    with open(path, "ab") as file:
+        file.write(b"\x00" * 5)  # Torn record of an interrupted write
+    restarted = TradeTape(str(tmp_path), partition=60)
+    assert restarted.append("BTC-USD", [trade(3, "2024-01-01T00:01:05Z", 103), trade(4, "2024-01-01T00:01:50Z", 99)]) == 1
+    assert os.path.getsize(path) == 2 * TAPE_DTYPE.itemsize
+
+    start, end = 1704067200 * 1_000_000, 1704067320 * 1_000_000
+    records = restarted.read("BTC-USD", start, end)
+    assert records["trade_id"].tolist() == [1, 2, 3, 4] and records["side"].tolist() == [-1, 1, 1, 1]
+    assert restarted.read("BTC-USD", start + 20_000_000, start + 65_000_000)["trade_id"].tolist() == [2]
+    candles = restarted.candles("BTC-USD", start, end, 60)
+    assert candles["start"].tolist() == [1704067200, 1704067260]
+    assert candles["open"].tolist() == [100, 103] and candles["close"].tolist() == [101, 99]
+    assert candles["high"].tolist() == [101, 103] and candles["volume"].tolist() == [2, 3]
+    assert candles["trades"].tolist() == [2, 2]
+    assert restarted.candles("BTC-USD", start, end, 60, max_rows=4)["trades"].tolist() == [2, 2]
+    with pytest.raises(ValueError, match="more than 3 trades"):
+        restarted.candles("BTC-USD", start, end, 60, max_rows=3)
+    restarted.close()
+
+
+def test_recorder_streams_and_polls_into_the_tape_served_by_the_endpoint(tmp_path):
+    tape = TradeTape(str(tmp_path))
+    feed = FakeFeed()
+    recorder = TradeTapeRecorder(tape, ["BTC-USD"], poll_interval=60, hub=FanoutHub(feed))
+
+    async def poll(product_id):
+        return [trade(1, "2024-01-01T00:00:01Z", 100), trade(2, "2024-01-01T00:00:02Z", 102, side="SELL")]
+
+    async def scenario():
+        recorder.start(poll)
+        await asyncio.sleep(0.01)
+        feed.handlers["market_trades"]({"type": "update", "trades": [
+            trade(2, "2024-01-01T00:00:02Z", 102, side="SELL"), trade(3, "2024-01-01T00:00:03.25Z", 98)]}, "now")
+        await asyncio.sleep(0.01)
+        await recorder.stop()
+
+    asyncio.run(scenario())
+    assert recorder.polls == 1 and tape.appended == 3 and tape.duplicates == 1
+
+    tape_before = trade_tape._tape
+    trade_tape._tape = tape
+    try:
+        client = TestClient(app)
+        params = {"start": "2024-01-01T00:00:00", "end": "2024-01-01T01:00:00"}
+        response = client.get("/public/trades/BTC-USD", params={**params, "limit": 2})
+        assert response.status_code == 200
+        assert response.json() == [
+            {"trade_id": 1, "time": "2024-01-01T00:00:01.000000Z", "price": 100.0, "size": 1.0, "side": "BUY"},
+            {"trade_id": 2, "time": "2024-01-01T00:00:02.000000Z", "price": 102.0, "size": 1.0, "side": "SELL"},
+        ]
+        response = client.get("/public/trades/BTC-USD", params=params, headers={"Accept": "application/x-npy"})
+        records = np.load(io.BytesIO(response.content))
+        assert records["trade_id"].tolist() == [1, 2, 3] and records.dtype == TAPE_DTYPE
+        candles = client.get("/public/trades/BTC-USD/candles", params={**params, "interval": "2s"}).json()
+        assert candles["start"] == [1704067200, 1704067202] and candles["trades"] == [1, 2]
+        assert candles["low"] == [100.0, 98.0] and candles["close"] == [100.0, 98.0]
+        assert client.get("/public/trades/BTC USD", params=params).status_code == 400
+        assert client.get("/public/trades/BTC-USD/candles", params={**params, "interval": "0s"}).status_code == 400
+    finally:
+        trade_tape._tape = tape_before
+
+
+def test_naive_dates_mean_the_same_instant_on_every_endpoint(monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")  # A server outside UTC
+    time.tzset()
+    try:
+        assert to_unix_timestamp("2024-01-01T00:00:00") == 1704067200
+        assert to_unix_micros("2024-01-01T00:00:00") == 1704067200 * 1_000_000
+        assert to_unix_timestamp("2024-01-01T01:00:00+01:00") == 1704067200
+    finally:
+        monkeypatch.undo()
+        time.tzset()